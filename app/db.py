@@ -1,15 +1,47 @@
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import inspect, text
 import os
+import logging
 
 
+logger = logging.getLogger(__name__)
+
 # Use SQLite for development, but allow override for production
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./appointments.db")
 engine = create_engine(DATABASE_URL, echo=False)
 
 
+def upgrade_schema():
+    """Add nullable columns and indexes that exist on the models but not yet in the database.
+
+    create_all() only creates missing tables, so databases created by older
+    versions need new optional columns and indexes added in place.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                ))
+                logger.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
 def init_db():
+    import app.models  # noqa: F401 - register every table before creating them
     SQLModel.metadata.create_all(engine)
+    upgrade_schema()
 
 
 def get_session():
-    return Session(engine)
\ No newline at end of file
+    return Session(engine)
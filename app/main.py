@@ -1,22 +1,103 @@
 import os
+import time
+import asyncio
 import logging
-import sqlite3
+from functools import partial
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from app.routes import appointment, voice, phone
+from sqlalchemy import text
+from app.routes import admin, appointment, audio, voice, phone, dashboard, inspector, analytics
+from app.db import engine, init_db
+from app.utils import asr, connections, history, llm, metrics, overload, phone_audio, recorder, tracing, tts
+from app.utils.doctor_cache import doctor_cache
+from app.utils.events import appointment_events
+from app.utils.rollups import ensure_rollups
+from app.utils.startup import startup_state, run_phase
+from app.utils.write_behind import write_behind
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
+tracing.install_log_correlation()
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 
-app = FastAPI(title="American Dental Clinic AI Receptionist", docs_url="/docs", redoc_url="/redoc")
+# Time budgets (seconds) for each startup phase
+STARTUP_DB_BUDGET = float(os.environ.get("STARTUP_DB_BUDGET", "15"))
+STARTUP_LLM_BUDGET = float(os.environ.get("STARTUP_LLM_BUDGET", "20"))
+STARTUP_TTS_BUDGET = float(os.environ.get("STARTUP_TTS_BUDGET", "5"))
+STARTUP_ASR_BUDGET = float(os.environ.get("STARTUP_ASR_BUDGET", "30"))
+TTS_WARMUP = os.environ.get("TTS_WARMUP", "true").lower() == "true"
+
+
+def seed_doctors():
+    from seed_doctors import seed_doctors as seed
+    seed()
+
+
+async def prepare_database():
+    """Create tables, upsert the doctors, load the doctor cache and build missing rollups, in order"""
+    await run_phase("database", init_db, STARTUP_DB_BUDGET)
+    if startup_state.state("database") != "ok":
+        return
+    await run_phase("seed_doctors", seed_doctors, STARTUP_DB_BUDGET)
+    await run_phase("doctor_cache", doctor_cache.get, STARTUP_DB_BUDGET)
+    await run_phase("rollups", ensure_rollups, STARTUP_DB_BUDGET)
+
+
+def skip_tts_warm_up():
+    return False
+
+
+@asynccontextmanager
+async def lifespan(app):
+    started = time.perf_counter()
+    write_behind.start()
+    appointment_events.start()
+    lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
+    overload_control = asyncio.create_task(overload.controller.run())
+    reaper = asyncio.create_task(connections.connections.reap())
+
+    # The database chain, the LLM, TTS and speech recognition warm-ups don't depend on each other
+    await asyncio.gather(
+        prepare_database(),
+        run_phase("llm", llm.warm_up, STARTUP_LLM_BUDGET),
+        run_phase("tts", partial(tts.warm_up, voice.PRERENDERED_MESSAGES) if TTS_WARMUP else skip_tts_warm_up,
+                  STARTUP_TTS_BUDGET),
+        run_phase("asr", asr.warm_up, STARTUP_ASR_BUDGET),
+        run_phase("phone_audio", phone_audio.warm_up if TTS_WARMUP else skip_tts_warm_up, STARTUP_TTS_BUDGET),
+    )
+
+    startup_state.ready_at = datetime.now(timezone.utc)
+    phases = ", ".join(f"{name}={entry['state']} {entry.get('duration_ms', 0):.0f}ms"
+                       for name, entry in startup_state.dependencies.items())
+    logger.info(f"Startup finished in {(time.perf_counter() - started) * 1000:.0f}ms ({phases})")
+
+    yield
+
+    lag_monitor.cancel()
+    overload_control.cancel()
+    reaper.cancel()
+    # Let running history folds save their summaries, then write out queued
+    # call notes and conversation events before exiting
+    await history.drain()
+    write_behind.stop()
+    appointment_events.stop()
+    tts.shutdown()
+    llm.shutdown()
+    asr.shutdown()
+    tracing.exporter.flush()
+    recorder.writer.flush()
+
+
+app = FastAPI(title="American Dental Clinic AI Receptionist", docs_url="/docs", redoc_url="/redoc", lifespan=lifespan)
 
 
 # Add CORS middleware for production
@@ -32,18 +113,11 @@ app.add_middleware(
 app.include_router(appointment.router, prefix="/api")
 app.include_router(voice.router)
 app.include_router(phone.router, prefix="/api")
-
-
-# Initialize DB
-from app.db import init_db
-init_db()
-
-# Seed doctors data
-try:
-    from seed_doctors import seed_doctors
-    seed_doctors()
-except Exception as e:
-    logger.warning(f"Failed to seed doctors: {e}")
+app.include_router(audio.router, prefix="/api")
+app.include_router(dashboard.router)
+app.include_router(inspector.router)
+app.include_router(analytics.router, prefix="/api")
+app.include_router(admin.router)
 
 
 # Serve frontend for testing
@@ -57,7 +131,60 @@ async def home():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": "2023-12-01T00:00:00Z"}
+    return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
+
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and its event loop is answering"""
+    uptime = (datetime.now(timezone.utc) - startup_state.started_at).total_seconds()
+    return {"status": "alive", "uptime_seconds": round(uptime, 1)}
+
+
+def ping_database():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: startup finished and the database answers; reports every dependency"""
+    dependencies = {name: dict(entry) for name, entry in startup_state.dependencies.items()}
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.to_thread(ping_database), 2.0)
+        dependencies["database_ping"] = {"state": "ok", "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        dependencies["database_ping"] = {"state": "failed", "detail": str(e) or type(e).__name__}
+
+    # Warm-ups that are still running keep the worker out of rotation; a failed
+    # LLM, TTS or ASR only degrades it, since each path has a fallback
+    warming = [name for name, entry in dependencies.items() if entry["state"] in ("pending", "running", "timeout")]
+    required_ok = all(startup_state.state(name) == "ok" for name in ("database", "doctor_cache"))
+    ready = startup_state.ready_at is not None and required_ok and not warming \
+        and dependencies["database_ping"]["state"] == "ok"
+    degraded = any(entry["state"] == "failed" for entry in dependencies.values())
+
+    body = {
+        "status": "ready" if ready and not degraded else "degraded" if ready else "not_ready",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "ready_at": startup_state.ready_at.isoformat() if startup_state.ready_at else None,
+        "dependencies": dependencies,
+        # Informational: an overloaded worker sheds new sessions itself and stays in rotation
+        "overload": overload.controller.status(),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+metrics.Gauge("write_behind_queue_depth", "Rows waiting in the write-behind queue").set_function(write_behind.depth)
+metrics.Gauge("dashboard_subscribers", "Open dashboard event streams").set_function(appointment_events.subscriber_count)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Per-worker metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/config.js", response_class=HTMLResponse)
@@ -76,428 +203,7 @@ async def frontend_config():
     return config_js
 
 
-@app.get("/database", response_class=HTMLResponse)
-async def database_view():
-    """View database tables in browser"""
-    try:
-        # Connect to database
-        conn = sqlite3.connect("appointments.db")
-        cursor = conn.cursor()
-        
-        # Get all table names
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        
-        # Generate HTML
-        html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Database Viewer</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; }
-                table { border-collapse: collapse; width: 100%; margin: 10px 0; }
-                th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
-                th { background-color: #f2f2f2; }
-                .table-container { margin: 20px 0; }
-                h2 { color: #333; }
-                .no-data { color: #666; font-style: italic; }
-            </style>
-        </head>
-        <body>
-            <h1>Database Viewer</h1>
-        """
-        
-        if not tables:
-            html += "<p>No tables found in database.</p>"
-        else:
-            for table in tables:
-                table_name = table[0]
-                html += f"<h2>Table: {table_name}</h2>"
-                
-                # Get table schema
-                cursor.execute(f"PRAGMA table_info({table_name});")
-                columns = cursor.fetchall()
-                
-                html += "<h3>Schema:</h3><table><tr>"
-                for col in columns:
-                    html += f"<th>{col[1]} ({col[2]})</th>"
-                html += "</tr></table>"
-                
-                # Get row count
-                cursor.execute(f"SELECT COUNT(*) FROM {table_name};")
-                count = cursor.fetchone()[0]
-                html += f"<p><strong>Rows:</strong> {count}</p>"
-                
-                # Show sample data (first 10 rows)
-                if count > 0:
-                    html += "<h3>Sample Data:</h3>"
-                    cursor.execute(f"SELECT * FROM {table_name} LIMIT 10;")
-                    rows = cursor.fetchall()
-                    
-                    html += "<table><tr>"
-                    for col in columns:
-                        html += f"<th>{col[1]}</th>"
-                    html += "</tr>"
-                    
-                    for row in rows:
-                        html += "<tr>"
-                        for cell in row:
-                            html += f"<td>{cell}</td>"
-                        html += "</tr>"
-                    html += "</table>"
-                else:
-                    html += "<p class='no-data'>No data in this table.</p>"
-        
-        html += """
-        </body>
-        </html>
-        """
-        
-        conn.close()
-        return html
-        
-    except Exception as e:
-        return f"<h1>Error</h1><p>Failed to connect to database: {str(e)}</p>"
-
-
-@app.get("/dashboard", response_class=HTMLResponse)
-async def clinic_dashboard():
-    """Clinic management dashboard to view appointments and patient information"""
-    try:
-        # Connect to database
-        conn = sqlite3.connect("appointments.db")
-        cursor = conn.cursor()
-        
-        # Get all appointments (handle case where doctor_name column might not exist)
-        try:
-            cursor.execute("""
-                SELECT 
-                    a.id,
-                    a.patient_name,
-                    a.phone,
-                    a.date,
-                    a.time,
-                    a.purpose,
-                    a.urgency_level,
-                    a.doctor_name,
-                    a.created_at
-                FROM appointment a
-                ORDER BY a.date DESC, a.time DESC
-            """)
-            appointments = cursor.fetchall()
-        except sqlite3.OperationalError as e:
-            if "no such column: a.doctor_name" in str(e):
-                # Fallback query without doctor_name column
-                cursor.execute("""
-                    SELECT 
-                        a.id,
-                        a.patient_name,
-                        a.phone,
-                        a.date,
-                        a.time,
-                        a.purpose,
-                        a.urgency_level,
-                        NULL as doctor_name,
-                        a.created_at
-                    FROM appointment a
-                    ORDER BY a.date DESC, a.time DESC
-                """)
-                appointments = cursor.fetchall()
-            else:
-                raise e
-        
-        # Get doctor information
-        cursor.execute("SELECT name, specialty FROM doctor")
-        doctors = cursor.fetchall()
-        
-        # Get appointment statistics
-        cursor.execute("SELECT COUNT(*) FROM appointment")
-        total_appointments = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(DISTINCT patient_name) FROM appointment")
-        total_patients = cursor.fetchone()[0]
-        
-        # Generate HTML for dashboard
-        html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Clinic Management Dashboard</title>
-            <style>
-                body { 
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
-                    margin: 0; 
-                    padding: 20px; 
-                    background-color: #f5f7fa;
-                    color: #333;
-                }
-                .container { 
-                    max-width: 1200px; 
-                    margin: 0 auto; 
-                }
-                header { 
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white; 
-                    padding: 20px; 
-                    border-radius: 10px;
-                    margin-bottom: 20px;
-                    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                }
-                h1 { 
-                    margin: 0; 
-                    font-size: 2em;
-                }
-                .stats-container { 
-                    display: grid; 
-                    grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); 
-                    gap: 20px; 
-                    margin-bottom: 30px;
-                }
-                .stat-card { 
-                    background: white; 
-                    padding: 20px; 
-                    border-radius: 8px; 
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                    text-align: center;
-                }
-                .stat-number { 
-                    font-size: 2em; 
-                    font-weight: bold; 
-                    color: #667eea;
-                }
-                .stat-label { 
-                    color: #666; 
-                    margin-top: 5px;
-                }
-                .section { 
-                    background: white; 
-                    margin-bottom: 30px; 
-                    border-radius: 8px; 
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                    overflow: hidden;
-                }
-                .section-header { 
-                    background: #f8f9fa; 
-                    padding: 15px 20px; 
-                    border-bottom: 1px solid #eee;
-                    font-weight: bold;
-                    color: #495057;
-                }
-                .doctors-grid { 
-                    display: grid; 
-                    grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); 
-                    gap: 15px; 
-                    padding: 20px;
-                }
-                .doctor-card { 
-                    background: #e9ecef; 
-                    padding: 15px; 
-                    border-radius: 6px;
-                    text-align: center;
-                }
-                .doctor-name { 
-                    font-weight: bold; 
-                    color: #495057;
-                }
-                .doctor-specialty { 
-                    color: #6c757d; 
-                    font-size: 0.9em;
-                }
-                table { 
-                    width: 100%; 
-                    border-collapse: collapse;
-                }
-                th, td { 
-                    padding: 12px 15px; 
-                    text-align: left; 
-                    border-bottom: 1px solid #eee;
-                }
-                th { 
-                    background-color: #f8f9fa; 
-                    font-weight: 600;
-                    color: #495057;
-                }
-                tr:hover { 
-                    background-color: #f8f9fa;
-                }
-                .urgency-high { 
-                    color: #dc3545; 
-                    font-weight: bold;
-                }
-                .urgency-medium { 
-                    color: #ffc107; 
-                    font-weight: bold;
-                }
-                .urgency-low { 
-                    color: #28a745;
-                }
-                .no-data { 
-                    text-align: center; 
-                    padding: 40px; 
-                    color: #6c757d;
-                }
-                .refresh-btn { 
-                    background: #667eea; 
-                    color: white; 
-                    border: none; 
-                    padding: 10px 20px; 
-                    border-radius: 5px; 
-                    cursor: pointer;
-                    float: right;
-                    margin-top: 10px;
-                }
-                .refresh-btn:hover { 
-                    background: #5a6fd8;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <header>
-                    <h1>🦷 Clinic Management Dashboard</h1>
-                    <p>View appointments, patient information, and clinic statistics</p>
-                </header>
-                
-                <div class="stats-container">
-                    <div class="stat-card">
-                        <div class="stat-number">""" + str(total_appointments) + """</div>
-                        <div class="stat-label">Total Appointments</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-number">""" + str(total_patients) + """</div>
-                        <div class="stat-label">Total Patients</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-number">""" + str(len(doctors)) + """</div>
-                        <div class="stat-label">Available Doctors</div>
-                    </div>
-                </div>
-                
-                <div class="section">
-                    <div class="section-header">
-                        Available Doctors
-                    </div>
-                    <div class="doctors-grid">
-        """
-        
-        # Add doctor cards
-        if doctors:
-            for doctor in doctors:
-                html += f"""
-                <div class="doctor-card">
-                    <div class="doctor-name">{doctor[0]}</div>
-                    <div class="doctor-specialty">{doctor[1]}</div>
-                </div>
-                """
-        else:
-            html += "<p>No doctors available</p>"
-        
-        html += """
-                    </div>
-                </div>
-                
-                <div class="section">
-                    <div class="section-header">
-                        Recent Appointments
-                        <button class="refresh-btn" onclick="location.reload()">Refresh</button>
-                    </div>
-        """
-        
-        # Add appointments table
-        if appointments:
-            html += """
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Patient Name</th>
-                                <th>Phone</th>
-                                <th>Date</th>
-                                <th>Time</th>
-                                <th>Doctor</th>
-                                <th>Purpose</th>
-                                <th>Urgency</th>
-                                <th>Booked At</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-            """
-            
-            for appointment in appointments:
-                # Format urgency level with color
-                urgency_class = ""
-                if appointment[6] == "high":
-                    urgency_class = "urgency-high"
-                elif appointment[6] == "medium":
-                    urgency_class = "urgency-medium"
-                else:
-                    urgency_class = "urgency-low"
-                
-                doctor_name = appointment[7] if appointment[7] else 'Not assigned'
-                
-                html += f"""
-                            <tr>
-                                <td>{appointment[1]}</td>
-                                <td>{appointment[2]}</td>
-                                <td>{appointment[3]}</td>
-                                <td>{appointment[4]}</td>
-                                <td>{doctor_name}</td>
-                                <td>{appointment[5] if appointment[5] else 'Not specified'}</td>
-                                <td class="{urgency_class}">{appointment[6].title()}</td>
-                                <td>{appointment[8][:16]}</td>
-                            </tr>
-                """
-            
-            html += """
-                        </tbody>
-                    </table>
-            """
-        else:
-            html += """
-                    <div class="no-data">
-                        <h3>No appointments found</h3>
-                        <p>Patients will appear here after booking appointments</p>
-                    </div>
-            """
-        
-        html += """
-                </div>
-            </div>
-            
-            <script>
-                // Auto-refresh every 30 seconds
-                setTimeout(function(){
-                    location.reload();
-                }, 30000);
-            </script>
-        </body>
-        </html>
-        """
-        
-        conn.close()
-        return html
-        
-    except Exception as e:
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Dashboard Error</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 40px; }}
-                .error {{ color: #dc3545; }}
-            </style>
-        </head>
-        <body>
-            <h1>Dashboard Error</h1>
-            <p class="error">Failed to load dashboard: {str(e)}</p>
-            <p>Please make sure the database is initialized and contains data.</p>
-        </body>
-        </html>
-        """
-
-
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=port, ws_max_size=connections.WS_MAX_MESSAGE_BYTES)
\ No newline at end of file
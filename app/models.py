@@ -1,26 +1,35 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from typing import Optional
 from datetime import datetime
 
 
 class Appointment(SQLModel, table=True):
+    __table_args__ = (Index("ix_appointment_date_time", "date", "time"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    patient_name: str
+    patient_name: str = Field(index=True)
     phone: str
     date: str
     time: str
     purpose: Optional[str] = None
     urgency_level: Optional[str] = "low"
     doctor_name: Optional[str] = None  # Add doctor name
+    status: Optional[str] = "booked"  # "booked", "rescheduled" or "cancelled"
+    clinic_id: Optional[str] = Field(default=None, index=True)  # None for the default clinic
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class CallNote(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: Optional[str] = Field(default=None, index=True, unique=True)  # CallSid or web session id; one note per call
     appointment_id: Optional[int] = None
     bangla_text: str
     english_text: str
-    raw_transcript: Optional[str] = None
+    raw_transcript: Optional[str] = None  # Legacy inline transcript; new notes use transcript_ref
+    transcript_ref: Optional[str] = None  # Reference into the compressed transcript store
+    channel: Optional[str] = None  # "web" or "phone"
+    clinic_id: Optional[str] = Field(default=None, index=True)  # None for the default clinic
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -29,4 +38,67 @@ class Doctor(SQLModel, table=True):
     name: str
     specialty: str
     availability: str  # JSON string of availability schedule
-    created_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    clinic_id: Optional[str] = Field(default=None, index=True)  # None for the default clinic
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class Clinic(SQLModel, table=True):
+    """A tenant sharing this deployment; the default clinic has no row"""
+    id: str = Field(primary_key=True)  # used in /ws/ai/{id}
+    name: str
+    phone_number: Optional[str] = Field(default=None, index=True)  # the Twilio number callers dial, E.164
+    prompt: Optional[str] = None  # replaces the standard receptionist rules when set
+    timezone: Optional[str] = None  # IANA name, e.g. America/Chicago; CLINIC_TIMEZONE when unset
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+def clinic_scope(column, clinic_id):
+    """Filter on a clinic_id column; None matches the default clinic's rows"""
+    return column.is_(None) if clinic_id is None else column == clinic_id
+
+
+class ConversationEvent(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: str = Field(index=True)  # CallSid for phone calls, generated id for web sessions
+    channel: str  # "web" or "phone"
+    turn: int = 0
+    role: str  # "user" or "model"
+    text: str
+    latency_ms: Optional[float] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class CacheVersion(SQLModel, table=True):
+    name: str = Field(primary_key=True)  # e.g. "doctors"
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class AppointmentSummary(SQLModel, table=True):
+    """Dashboard counters of one clinic, kept current by every appointment write; id 1 is the default clinic"""
+    id: int = Field(default=1, primary_key=True)
+    clinic_id: Optional[str] = Field(default=None, index=True, unique=True)
+    total_appointments: int = 0
+    total_patients: int = 0
+    version: int = 0  # bumped on every appointment insert/update/delete
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BookingRollup(SQLModel, table=True):
+    """Appointment counts per clinic, slot date, hour, doctor and urgency, maintained on every booking"""
+    clinic_id: str = Field(default="", primary_key=True)  # "" for the default clinic
+    date: str = Field(primary_key=True)  # appointment date, YYYY-MM-DD
+    hour: int = Field(primary_key=True)  # appointment hour, 0-23
+    doctor_name: str = Field(default="", primary_key=True)
+    urgency_level: str = Field(default="low", primary_key=True)
+    bookings: int = 0
+
+
+class CallRollup(SQLModel, table=True):
+    """Call counts per clinic, day, hour and channel, maintained on every call note"""
+    clinic_id: str = Field(default="", primary_key=True)  # "" for the default clinic
+    date: str = Field(primary_key=True)  # call date, YYYY-MM-DD (UTC)
+    hour: int = Field(primary_key=True)
+    channel: str = Field(default="", primary_key=True)
+    calls: int = 0
+    booked_calls: int = 0
@@ -0,0 +1,89 @@
+import os
+import asyncio
+import secrets
+import logging
+from fastapi import APIRouter, Body, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.utils.profiler import profiler
+from app.utils.tenants import save_clinic
+
+
+logger = logging.getLogger(__name__)
+
+# Admin endpoints only exist when a token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    header = request.headers.get("authorization", "")
+    token = header[7:] if header.lower().startswith("bearer ") else request.headers.get("x-admin-token", "")
+    if not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.post("/profile")
+async def start_profile(mode: str = "sampling", seconds: float = 30, turns: int = 0, interval_ms: float = 5,
+                        block_threshold_ms: float = 50, include_idle: bool = False):
+    """Start a profiling session for `seconds`, or until `turns` conversation turns finish"""
+    try:
+        session = profiler.start(mode, seconds, turns, interval_ms, block_threshold_ms, include_idle)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(session.summary(), status_code=202)
+
+
+@router.get("/profile")
+async def get_profile(format: str = "json"):
+    """The running session's progress, or the last finished session's results.
+
+    format=folded returns collapsed stacks for flamegraph.pl or speedscope.
+    """
+    session = profiler.session or profiler.last
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session has run")
+    if format == "folded":
+        if session.mode != "sampling":
+            raise HTTPException(status_code=400, detail="Folded stacks are only collected in sampling mode")
+        return PlainTextResponse(session.folded_text())
+    return session.summary()
+
+
+@router.delete("/profile")
+async def stop_profile():
+    """Stop the running session early"""
+    session = profiler.stop()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session is running")
+    return session.summary()
+
+
+@router.put("/clinics/{clinic_id}")
+async def put_clinic(clinic_id: str, clinic: dict = Body(...)):
+    """Create or update a clinic that shares this deployment.
+
+    Body: {"name", "phone_number" (the Twilio number it answers), "prompt"
+    (optional, replaces the standard rules), "timezone" (optional, IANA
+    name for resolving "tomorrow" and weekdays), "doctors": [{"name",
+    "specialty", "availability": {weekday: ["HH:MM-HH:MM"]}}]}. Omitting
+    "doctors" keeps the current list.
+    """
+    if not clinic.get("name"):
+        raise HTTPException(status_code=400, detail="name is required")
+    doctors = clinic.get("doctors")
+    if doctors is not None and not all(isinstance(doctor, dict) and doctor.get("name") and doctor.get("specialty")
+                                       and "availability" in doctor for doctor in doctors):
+        raise HTTPException(status_code=400, detail="every doctor needs name, specialty and availability")
+    try:
+        await asyncio.to_thread(save_clinic, clinic_id, clinic["name"], clinic.get("phone_number"),
+                                clinic.get("prompt"), doctors, clinic.get("timezone"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"id": clinic_id, "name": clinic["name"], "phone_number": clinic.get("phone_number"),
+            "doctors": len(doctors) if doctors is not None else None}
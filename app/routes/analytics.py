@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from collections import OrderedDict
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import func, select
+from app.db import engine
+from app.models import BookingRollup, CallRollup
+from app.utils.doctor_cache import WEEKDAYS
+from app.utils.tenants import resolve_clinic
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+ANALYTICS_CACHE_SECONDS = int(os.environ.get("ANALYTICS_CACHE_SECONDS", "60"))
+ANALYTICS_SLOT_MINUTES = int(os.environ.get("ANALYTICS_SLOT_MINUTES", "30"))
+CACHE_MAX_ENTRIES = 256
+MAX_RANGE_DAYS = 3660
+
+bookings = BookingRollup.__table__
+calls = CallRollup.__table__
+
+
+class TimeBucketCache:
+    """Cache results per (key, time bucket): entries expire when the wall-clock bucket rolls over"""
+
+    def __init__(self, bucket_seconds, max_entries=CACHE_MAX_ENTRIES):
+        self.bucket_seconds = max(bucket_seconds, 1)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        bucket = int(time.time() // self.bucket_seconds)
+        cache_key = (key, bucket)
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                return self._entries[cache_key]
+        value = compute()
+        with self._lock:
+            self._entries[cache_key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+analytics_cache = TimeBucketCache(ANALYTICS_CACHE_SECONDS)
+
+
+def parse_range(start, end):
+    """Validate optional YYYY-MM-DD bounds"""
+    try:
+        start_date = datetime.strptime(start, "%Y-%m-%d").date() if start else None
+        end_date = datetime.strptime(end, "%Y-%m-%d").date() if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    if start_date and end_date and (end_date < start_date or (end_date - start_date).days > MAX_RANGE_DAYS):
+        raise HTTPException(status_code=400, detail="invalid date range")
+    return start_date, end_date
+
+
+def parse_clinic(clinic_id):
+    """The clinic's id (None for the default clinic) and doctors, or a 404"""
+    try:
+        return resolve_clinic(clinic_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def in_range(stmt, table, clinic_id, start, end):
+    # Rollups key the default clinic as ""
+    stmt = stmt.where(table.c.clinic_id == (clinic_id or ""))
+    if start:
+        stmt = stmt.where(table.c.date >= start.isoformat())
+    if end:
+        stmt = stmt.where(table.c.date <= end.isoformat())
+    return stmt
+
+
+def available_slots(doctor, start, end):
+    """Bookable slots for one doctor between two dates, from the cached availability"""
+    minutes = 0
+    day = start
+    while day <= end:
+        minutes += sum(window_end - window_start for window_start, window_end in doctor["availability"][WEEKDAYS[day.weekday()]])
+        day += timedelta(days=1)
+    return minutes // ANALYTICS_SLOT_MINUTES
+
+
+def booking_series(conn, clinic_id, start, end, granularity):
+    column = bookings.c.date if granularity == "day" else bookings.c.hour
+    stmt = in_range(select(column, func.sum(bookings.c.bookings)).group_by(column).order_by(column),
+                    bookings, clinic_id, start, end)
+    return [{granularity: key, "bookings": int(total)} for key, total in conn.execute(stmt)]
+
+
+def urgency_mix(conn, clinic_id, start, end):
+    stmt = in_range(select(bookings.c.urgency_level, func.sum(bookings.c.bookings)).group_by(bookings.c.urgency_level),
+                    bookings, clinic_id, start, end)
+    return {urgency: int(total) for urgency, total in conn.execute(stmt)}
+
+
+def doctor_utilization(conn, clinic_id, doctors, start, end):
+    stmt = in_range(select(bookings.c.doctor_name, func.sum(bookings.c.bookings), func.min(bookings.c.date),
+                           func.max(bookings.c.date)).group_by(bookings.c.doctor_name), bookings, clinic_id, start, end)
+    rows = conn.execute(stmt).all()
+    booked = {name: int(total) for name, total, _, _ in rows}
+
+    # Open-ended ranges are bounded by the booked dates themselves
+    first = start or min((date.fromisoformat(low) for _, _, low, _ in rows), default=None)
+    last = end or max((date.fromisoformat(high) for _, _, _, high in rows), default=None)
+
+    result = []
+    for doctor in doctors.doctors:
+        slots = available_slots(doctor, first, last) if first and last else 0
+        count = booked.pop(doctor["name"], 0)
+        result.append({
+            "doctor_name": doctor["name"],
+            "specialty": doctor["specialty"],
+            "bookings": count,
+            "available_slots": slots,
+            "utilization": round(count / slots, 4) if slots else None,
+        })
+    for name, count in booked.items():
+        result.append({"doctor_name": name or None, "specialty": None, "bookings": count,
+                       "available_slots": None, "utilization": None})
+    return result
+
+
+def call_series(conn, clinic_id, start, end, granularity):
+    column = calls.c.date if granularity == "day" else calls.c.hour
+    stmt = in_range(select(column, func.sum(calls.c.calls), func.sum(calls.c.booked_calls))
+                    .group_by(column).order_by(column), calls, clinic_id, start, end)
+    return [
+        {granularity: key, "calls": int(total), "booked_calls": int(booked),
+         "no_booking_rate": round(1 - booked / total, 4) if total else None}
+        for key, total, booked in conn.execute(stmt)
+    ]
+
+
+def call_totals(conn, clinic_id, start, end):
+    stmt = in_range(select(calls.c.channel, func.sum(calls.c.calls), func.sum(calls.c.booked_calls))
+                    .group_by(calls.c.channel), calls, clinic_id, start, end)
+    by_channel = {}
+    total_calls = total_booked = 0
+    for channel, total, booked in conn.execute(stmt):
+        by_channel[channel or "unknown"] = {"calls": int(total), "booked_calls": int(booked)}
+        total_calls += int(total)
+        total_booked += int(booked)
+    return {
+        "calls": total_calls,
+        "booked_calls": total_booked,
+        "no_booking_rate": round(1 - total_booked / total_calls, 4) if total_calls else None,
+        "by_channel": by_channel,
+    }
+
+
+def cached_query(name, clinic_id, start, end, build, *extra):
+    """Run an analytics query through the time-bucketed cache"""
+    key = (name, clinic_id, start, end) + extra
+
+    def compute():
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            result = build(conn)
+        logger.info(f"Analytics {name} computed in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return result
+
+    return analytics_cache.get_or_compute(key, compute)
+
+
+def range_info(clinic_id, start, end):
+    return {"clinic_id": clinic_id, "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None}
+
+
+@router.get("/analytics/overview")
+def analytics_overview(start: str = None, end: str = None, clinic_id: str = None):
+    """Booking totals, urgency mix and call outcomes of one clinic for a date range"""
+    start_date, end_date = parse_range(start, end)
+    clinic_id, _ = parse_clinic(clinic_id)
+
+    def build(conn):
+        mix = urgency_mix(conn, clinic_id, start_date, end_date)
+        return {
+            **range_info(clinic_id, start_date, end_date),
+            "bookings": sum(mix.values()),
+            "urgency_mix": mix,
+            "calls": call_totals(conn, clinic_id, start_date, end_date),
+        }
+
+    return cached_query("overview", clinic_id, start_date, end_date, build)
+
+
+@router.get("/analytics/bookings")
+def analytics_bookings(start: str = None, end: str = None, granularity: str = "day", clinic_id: str = None):
+    """Bookings per appointment day, or per hour of day"""
+    if granularity not in ("day", "hour"):
+        raise HTTPException(status_code=400, detail="granularity must be day or hour")
+    start_date, end_date = parse_range(start, end)
+    clinic_id, _ = parse_clinic(clinic_id)
+    return cached_query("bookings", clinic_id, start_date, end_date,
+                        lambda conn: {**range_info(clinic_id, start_date, end_date), "granularity": granularity,
+                                      "series": booking_series(conn, clinic_id, start_date, end_date, granularity)},
+                        granularity)
+
+
+@router.get("/analytics/doctors")
+def analytics_doctors(start: str = None, end: str = None, clinic_id: str = None):
+    """Per-doctor bookings against available slots, for the clinic's own doctors"""
+    start_date, end_date = parse_range(start, end)
+    clinic_id, doctors = parse_clinic(clinic_id)
+    return cached_query("doctors", clinic_id, start_date, end_date,
+                        lambda conn: {**range_info(clinic_id, start_date, end_date),
+                                      "slot_minutes": ANALYTICS_SLOT_MINUTES,
+                                      "doctors": doctor_utilization(conn, clinic_id, doctors, start_date, end_date)},
+                        doctors.version)
+
+
+@router.get("/analytics/calls")
+def analytics_calls(start: str = None, end: str = None, granularity: str = "day", clinic_id: str = None):
+    """Calls and no-booking rate per day, or per hour of day"""
+    if granularity not in ("day", "hour"):
+        raise HTTPException(status_code=400, detail="granularity must be day or hour")
+    start_date, end_date = parse_range(start, end)
+    clinic_id, _ = parse_clinic(clinic_id)
+    return cached_query("calls", clinic_id, start_date, end_date,
+                        lambda conn: {**range_info(clinic_id, start_date, end_date), "granularity": granularity,
+                                      "totals": call_totals(conn, clinic_id, start_date, end_date),
+                                      "series": call_series(conn, clinic_id, start_date, end_date, granularity)},
+                        granularity)
@@ -1,19 +1,27 @@
-from fastapi import APIRouter, HTTPException
+import io
+from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlmodel import select
 from app.db import get_session
 from app.models import Appointment, CallNote
+from app.utils.booking import create_appointment
+from app.utils.transcript_store import transcript_store, load_transcript
+from app.utils.metrics import DB_WRITE_SECONDS
+from app.utils.rollups import record_calls
+from app.utils.bulk import guess_format, iter_records, import_appointments, export_appointments
+from app.utils.tenants import DEFAULT_CLINIC, resolve_clinic
 
 
 router = APIRouter()
 
+BULK_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
 
 @router.post("/book-appointment")
 async def book_appointment(payload: Appointment):
-    with get_session() as session:
-        session.add(payload)
-        session.commit()
-        session.refresh(payload)
-        return {"status": "ok", "data": payload}
+    appointment = create_appointment(payload)
+    return {"status": "ok", "data": appointment}
 
 
 @router.get("/appointments")
@@ -24,12 +32,72 @@ async def list_appointments():
         return results
 
 
+@router.post("/appointments/import")
+async def import_appointments_file(file: UploadFile = File(...), format: str = None, chunk_size: int = 1000, dry_run: bool = False,
+                                   clinic_id: str = None):
+    """Bulk import appointments from a CSV or NDJSON upload; rows without a clinic_id go to `clinic_id`"""
+    fmt = format or guess_format(file.filename)
+    if fmt not in BULK_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    try:
+        clinic_id, _ = await run_in_threadpool(resolve_clinic, clinic_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    # Read the spooled upload line by line instead of loading it into memory
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        result = await run_in_threadpool(import_appointments, iter_records(lines, fmt), chunk_size, dry_run, clinic_id)
+    finally:
+        lines.detach()
+    return {"status": "ok", "format": fmt, **result}
+
+
+@router.get("/appointments/export")
+async def export_appointments_file(format: str = "csv", clinic_id: str = None):
+    """Stream one clinic's appointments, or every clinic's without `clinic_id`, as CSV or NDJSON"""
+    if format not in BULK_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    if clinic_id is not None:
+        try:
+            await run_in_threadpool(resolve_clinic, clinic_id)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    filename = f"appointments.{format}" if clinic_id is None else f"appointments-{clinic_id}.{format}"
+    return StreamingResponse(
+        export_appointments(format, clinic_id=clinic_id),
+        media_type=BULK_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.post("/save-note")
-async def save_note(note: dict):
+def save_note(note: dict):
+    # Not async: FastAPI runs it in the threadpool, off the event loop, since compression, the append and the commit block
     # expected keys: bangla_text, english_text, raw_transcript, appointment_id
     n = CallNote(**note)
-    with get_session() as session:
+    if n.raw_transcript:
+        # Transcripts live in the compressed store; the row keeps only a reference
+        n.transcript_ref = transcript_store.append(n.raw_transcript)
+        n.raw_transcript = None
+    with DB_WRITE_SECONDS.labels("call_note").time(), get_session() as session:
         session.add(n)
+        session.flush()
+        record_calls(session, [{"created_at": n.created_at, "channel": n.channel, "appointment_id": n.appointment_id,
+                                "clinic_id": n.clinic_id}])
         session.commit()
         session.refresh(n)
-        return {"status":"ok","note_id": n.id}
\ No newline at end of file
+        return {"status":"ok","note_id": n.id}
+
+
+@router.get("/notes/{note_id}/transcript")
+def get_note_transcript(note_id: int):
+    """Return one call note's full transcript"""
+    # Not async: the lookup and the store read and decompression block, so FastAPI runs it in the threadpool
+    with get_session() as session:
+        note = session.get(CallNote, note_id)
+    if not note:
+        raise HTTPException(status_code=404, detail="Call note not found")
+    return {"note_id": note_id, "transcript": load_transcript(note)}
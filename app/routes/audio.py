@@ -0,0 +1,56 @@
+import logging
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+from app.utils import phone_audio
+from app.utils.metrics import PHONE_AUDIO_REQUESTS
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def clip_response(status, body, headers, head):
+    PHONE_AUDIO_REQUESTS.labels(str(status)).inc()
+    if body is not None:
+        headers["Content-Length"] = str(len(body))
+    return Response(content=b"" if head or body is None else body, status_code=status, headers=headers)
+
+
+@router.api_route("/audio/{name}", methods=["GET", "HEAD"])
+async def phone_audio_clip(name: str, request: Request):
+    """Pre-rendered audio of a fixed phone line, for Twilio's <Play>.
+
+    The URL names the clip's content, so it is cached as immutable under a
+    strong ETag, and byte ranges are served for players that seek or resume.
+    """
+    head = request.method == "HEAD"
+    key, _, extension = name.partition(".")
+    clip = await phone_audio.get(key)
+    if clip is None or extension != clip.format:
+        return clip_response(404, None, {}, head)
+    headers = {
+        "ETag": clip.etag,
+        "Cache-Control": f"public, max-age={phone_audio.AUDIO_MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes",
+        "Content-Type": clip.media_type,
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or clip.etag in (tag.strip() for tag in if_none_match.split(",")):
+        return clip_response(304, None, headers, head)
+
+    # If-Range: only send part of the clip the client already holds the start of
+    range_header = request.headers.get("range")
+    if request.headers.get("if-range", clip.etag) != clip.etag:
+        range_header = None
+    size = len(clip.audio)
+    try:
+        span = phone_audio.byte_range(range_header, size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{size}"
+        return clip_response(416, None, headers, head)
+    if span is None:
+        return clip_response(200, clip.audio, headers, head)
+    first, last = span
+    headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    return clip_response(206, clip.audio[first:last + 1], headers, head)
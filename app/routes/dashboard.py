@@ -0,0 +1,296 @@
+import os
+import html
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from string import Template
+from collections import OrderedDict
+from urllib.parse import urlencode
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from sqlalchemy import and_, or_, select
+from app.db import engine
+from app.models import Appointment, clinic_scope
+from app.utils.appointment_stats import get_summary
+from app.utils.events import appointment_events, for_clinic, format_sse
+from app.utils.tenants import DEFAULT_CLINIC, resolve_clinic
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+with open(os.path.join(TEMPLATE_DIR, "dashboard.html"), encoding="utf-8") as f:
+    DASHBOARD_TEMPLATE = Template(f.read())
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+RENDER_CACHE_SIZE = 32
+SSE_HEARTBEAT_SECONDS = 15
+
+URGENCY_CLASSES = {"high": "urgency-high", "medium": "urgency-medium"}
+
+# Rendered pages keyed by ETag; an ETag only changes when the data behind it does
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+
+def _cache_get(etag):
+    with _render_cache_lock:
+        page = _render_cache.get(etag)
+        if page is not None:
+            _render_cache.move_to_end(etag)
+        return page
+
+
+def _cache_put(etag, page):
+    with _render_cache_lock:
+        _render_cache[etag] = page
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+
+
+def parse_cursor(cursor):
+    """Decode a "date|time|id" keyset cursor, ignoring malformed ones"""
+    if not cursor:
+        return None
+    try:
+        date, time_, appointment_id = cursor.split("|")
+        return date, time_, int(appointment_id)
+    except ValueError:
+        return None
+
+
+def fetch_page(conn, cursor, page_size, clinic_id=None):
+    """Fetch one page of a clinic's appointments, newest first, with keyset pagination"""
+    table = Appointment.__table__
+    stmt = select(
+        table.c.id, table.c.patient_name, table.c.phone, table.c.date, table.c.time,
+        table.c.purpose, table.c.urgency_level, table.c.doctor_name, table.c.status, table.c.created_at,
+    ).where(clinic_scope(table.c.clinic_id, clinic_id)) \
+        .order_by(table.c.date.desc(), table.c.time.desc(), table.c.id.desc()).limit(page_size + 1)
+
+    if cursor:
+        date, time_, appointment_id = cursor
+        stmt = stmt.where(or_(
+            table.c.date < date,
+            and_(table.c.date == date, table.c.time < time_),
+            and_(table.c.date == date, table.c.time == time_, table.c.id < appointment_id),
+        ))
+
+    rows = conn.execute(stmt).all()
+    return rows[:page_size], len(rows) > page_size
+
+
+def render_doctor_cards(doctors):
+    if not doctors:
+        return "<p>No doctors available</p>"
+    return "".join(
+        f"""
+                <div class="doctor-card">
+                    <div class="doctor-name">{html.escape(doctor['name'])}</div>
+                    <div class="doctor-specialty">{html.escape(doctor['specialty'])}</div>
+                </div>"""
+        for doctor in doctors
+    )
+
+
+def render_appointment_row(appointment):
+    urgency = appointment.urgency_level or "low"
+    booked_at = str(appointment.created_at).replace("T", " ")[:16]
+    sort_key = f"{appointment.date}|{appointment.time}|{appointment.id:012d}"
+    status = appointment.status or "booked"
+    return f"""
+                    <tr data-id="{appointment.id}" data-sort="{html.escape(sort_key)}" class="status-{html.escape(status)}">
+                        <td>{html.escape(appointment.patient_name)}</td>
+                        <td>{html.escape(appointment.phone)}</td>
+                        <td>{html.escape(appointment.date)}</td>
+                        <td>{html.escape(appointment.time)}</td>
+                        <td>{html.escape(appointment.doctor_name or 'Not assigned')}</td>
+                        <td>{html.escape(appointment.purpose or 'Not specified')}</td>
+                        <td class="{URGENCY_CLASSES.get(urgency, 'urgency-low')}">{html.escape(urgency.title())}</td>
+                        <td>{html.escape(booked_at)}</td>
+                    </tr>"""
+
+
+def render_appointments(rows):
+    if not rows:
+        return """
+            <div class="no-data">
+                <h3>No appointments found</h3>
+                <p>Patients will appear here after booking appointments</p>
+            </div>"""
+    body = "".join(render_appointment_row(row) for row in rows)
+    return f"""
+            <table>
+                <thead>
+                    <tr>
+                        <th>Patient Name</th>
+                        <th>Phone</th>
+                        <th>Date</th>
+                        <th>Time</th>
+                        <th>Doctor</th>
+                        <th>Purpose</th>
+                        <th>Urgency</th>
+                        <th>Booked At</th>
+                    </tr>
+                </thead>
+                <tbody id="appointment-rows">{body}
+                </tbody>
+            </table>"""
+
+
+def clinic_query(clinic_id):
+    """Query parameters that keep links on the same clinic's dashboard"""
+    return {"clinic_id": clinic_id} if clinic_id else {}
+
+
+def render_pagination(rows, has_more, cursor, page_size, clinic_id=None):
+    links = []
+    if cursor:
+        newest = urlencode({**clinic_query(clinic_id), "page_size": page_size})
+        links.append(f'<a href="/dashboard?{newest}">&larr; Newest</a>')
+    if has_more:
+        last = rows[-1]
+        older = urlencode({**clinic_query(clinic_id), "cursor": f"{last.date}|{last.time}|{last.id}",
+                           "page_size": page_size})
+        links.append(f'<a href="/dashboard?{older}">Older &rarr;</a>')
+    if not links:
+        return ""
+    return f'            <div class="pagination">{"".join(f"<span>{link}</span>" for link in links)}</div>'
+
+
+def render_dashboard(conn, summary, doctors, cursor, page_size, clinic_id=None):
+    rows, has_more = fetch_page(conn, cursor, page_size, clinic_id)
+    events_url = "/dashboard/events"
+    if clinic_id:
+        events_url += "?" + urlencode(clinic_query(clinic_id))
+    return DASHBOARD_TEMPLATE.substitute(
+        total_appointments=summary[0],
+        total_patients=summary[1],
+        total_doctors=len(doctors.doctors),
+        doctor_cards=render_doctor_cards(doctors.doctors),
+        appointments=render_appointments(rows),
+        pagination=render_pagination(rows, has_more, cursor, page_size, clinic_id),
+        page_size=page_size,
+        events_url=json.dumps(events_url),
+    )
+
+
+def render_error(error):
+    return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Dashboard Error</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 40px; }}
+                .error {{ color: #dc3545; }}
+            </style>
+        </head>
+        <body>
+            <h1>Dashboard Error</h1>
+            <p class="error">Failed to load dashboard: {html.escape(str(error))}</p>
+            <p>Please make sure the database is initialized and contains data.</p>
+        </body>
+        </html>
+        """
+
+
+@router.get("/dashboard", response_class=HTMLResponse)
+def clinic_dashboard(request: Request, cursor: str = None, page_size: int = DEFAULT_PAGE_SIZE,
+                     clinic_id: str = None):
+    """Clinic management dashboard to view one clinic's appointments and patient information"""
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    parsed_cursor = parse_cursor(cursor)
+    try:
+        clinic_id, doctors = resolve_clinic(clinic_id)
+    except LookupError as e:
+        return HTMLResponse(render_error(e), status_code=404)
+    try:
+        with engine.connect() as conn:
+            summary = get_summary(conn, clinic_id)
+
+            # The summary version changes on every appointment write, so it
+            # identifies the page content without touching the appointment table
+            fingerprint = f"{clinic_id or ''}:{summary[2]}:{doctors.version}:" \
+                          f"{cursor if parsed_cursor else ''}:{page_size}"
+            etag = '"' + hashlib.sha1(fingerprint.encode()).hexdigest() + '"'
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers=headers)
+
+            page = _cache_get(etag)
+            if page is None:
+                page = render_dashboard(conn, summary, doctors, parsed_cursor, page_size, clinic_id)
+                _cache_put(etag, page)
+        return HTMLResponse(page, headers=headers)
+    except Exception as e:
+        logger.error(f"Error rendering dashboard: {e}")
+        return HTMLResponse(render_error(e))
+
+
+class _RowView:
+    """Attribute access over an event's appointment dict, for render_appointment_row"""
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+
+
+def encode_dashboard_event(event):
+    """SSE frame for the dashboard; rendered once per event and shared by every tab"""
+    payload = dict(event.data)
+    if "appointment" in payload:
+        payload["row_html"] = render_appointment_row(_RowView(payload["appointment"]))
+    return format_sse(event, payload)
+
+
+async def dashboard_event_stream(request, subscription, backlog):
+    try:
+        yield "retry: 5000\n\n"
+        for event in backlog:
+            yield event.encoded("dashboard", encode_dashboard_event)
+        while True:
+            event = await subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+            if event is None:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            yield event.encoded("dashboard", encode_dashboard_event)
+            if event.type == "resync":
+                break
+    except asyncio.CancelledError:
+        pass
+    finally:
+        subscription.close()
+
+
+@router.get("/dashboard/events")
+async def dashboard_events(request: Request, clinic_id: str = None):
+    """Server-Sent Events feed of one clinic's appointment changes for its open dashboards"""
+    clinic_id = None if clinic_id == DEFAULT_CLINIC else clinic_id
+    match = for_clinic(clinic_id)
+    subscription = appointment_events.subscribe(match)
+
+    # Replay what a reconnecting tab missed, or ask it to reload if that's gone
+    backlog = []
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        backlog = appointment_events.replay_since(int(last_event_id))
+        if backlog is not None:
+            backlog = [event for event in backlog if match(event)]
+    if backlog is None:
+        subscription.close()
+        resync = f"retry: 5000\nid: {appointment_events.last_id}\nevent: resync\ndata: {{}}\n\n"
+        return StreamingResponse(iter([resync]), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    return StreamingResponse(
+        dashboard_event_stream(request, subscription, backlog),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,181 @@
+import html
+import logging
+from urllib.parse import urlencode
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from sqlalchemy import column, func, inspect, select, table as sql_table, text
+from app.db import engine
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+OVERVIEW_SAMPLE_ROWS = 10
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Tables are counted exactly up to this many rows; beyond it the count is estimated
+EXACT_COUNT_LIMIT = 10000
+FLUSH_EVERY_ROWS = 50
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Database Viewer</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        table { border-collapse: collapse; width: 100%; margin: 10px 0; }
+        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+        th { background-color: #f2f2f2; }
+        .table-container { margin: 20px 0; }
+        h2 { color: #333; }
+        .no-data { color: #666; font-style: italic; }
+    </style>
+</head>
+<body>
+    <h1>Database Viewer</h1>
+"""
+PAGE_TAIL = """
+</body>
+</html>
+"""
+
+
+def describe_tables():
+    """Return {table name: ([(column name, type)], single-column primary key or None)}"""
+    inspector = inspect(engine)
+    tables = {}
+    for name in inspector.get_table_names():
+        columns = inspector.get_columns(name)
+        pk = inspector.get_pk_constraint(name).get("constrained_columns") or []
+        tables[name] = ([(col["name"], str(col["type"])) for col in columns], pk[0] if len(pk) == 1 else None)
+    return tables
+
+
+def estimate_row_count(conn, tbl, pk):
+    """Count rows exactly for small tables, estimate cheaply for big ones.
+
+    Returns (count, is_estimate). The bounded subquery stops scanning after
+    EXACT_COUNT_LIMIT rows; past that we fall back to planner statistics on
+    PostgreSQL or the integer primary key range on SQLite.
+    """
+    bounded = select(func.count()).select_from(select(text("1")).select_from(tbl).limit(EXACT_COUNT_LIMIT + 1).subquery())
+    count = conn.execute(bounded).scalar()
+    if count <= EXACT_COUNT_LIMIT:
+        return count, False
+
+    if engine.dialect.name == "postgresql":
+        estimate = conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"),
+                                {"name": tbl.name}).scalar()
+        if estimate and estimate > 0:
+            return int(estimate), True
+    if pk is not None:
+        low, high = conn.execute(select(func.min(tbl.c[pk]), func.max(tbl.c[pk]))).one()
+        if isinstance(low, int) and isinstance(high, int):
+            return max(high - low + 1, count), True
+    return count, True
+
+
+def render_row(row):
+    return "<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>\n"
+
+
+def stream_rows(conn, stmt):
+    """Yield rendered rows in small batches straight from a server-side cursor"""
+    result = conn.execution_options(stream_results=True, yield_per=FLUSH_EVERY_ROWS).execute(stmt)
+    buffer = []
+    last_row = None
+    for row in result:
+        buffer.append(render_row(row))
+        last_row = row
+        if len(buffer) >= FLUSH_EVERY_ROWS:
+            yield "".join(buffer), last_row
+            buffer = []
+    if buffer:
+        yield "".join(buffer), last_row
+
+
+def render_table(conn, name, columns, pk, after=None, limit=OVERVIEW_SAMPLE_ROWS, browse=False):
+    """Yield the HTML for one table: schema, row count and one keyset page of rows"""
+    tbl = sql_table(name, *[column(col_name) for col_name, _ in columns])
+
+    yield f"<h2>Table: {html.escape(name)}</h2>"
+    yield "<h3>Schema:</h3><table><tr>"
+    yield "".join(f"<th>{html.escape(col_name)} ({html.escape(col_type)})</th>" for col_name, col_type in columns)
+    yield "</tr></table>"
+
+    count, is_estimate = estimate_row_count(conn, tbl, pk)
+    yield f"<p><strong>Rows:</strong> {'~' if is_estimate else ''}{count}</p>"
+    if count == 0:
+        yield "<p class='no-data'>No data in this table.</p>"
+        return
+
+    stmt = select(tbl).limit(limit)
+    if pk is not None:
+        stmt = stmt.order_by(tbl.c[pk])
+        if after is not None:
+            stmt = stmt.where(tbl.c[pk] > after)
+
+    yield "<h3>Data:</h3>" if browse else "<h3>Sample Data:</h3>"
+    yield "<table><tr>" + "".join(f"<th>{html.escape(col_name)}</th>" for col_name, _ in columns) + "</tr>\n"
+    rendered = 0
+    last_row = None
+    for chunk, last_row in stream_rows(conn, stmt):
+        rendered += chunk.count("<tr>")
+        yield chunk
+    yield "</table>"
+
+    pk_index = [col_name for col_name, _ in columns].index(pk) if pk is not None else None
+    links = []
+    if not browse:
+        links.append(f'<a href="/database?{urlencode({"table": name})}">Browse all rows</a>')
+    elif pk is not None and rendered == limit and last_row is not None:
+        query = {"table": name, "after": last_row[pk_index], "limit": limit}
+        links.append(f'<a href="/database?{urlencode(query)}">Next page &rarr;</a>')
+    if browse:
+        links.append('<a href="/database">All tables</a>')
+    yield "<p>" + " | ".join(links) + "</p>"
+
+
+def coerce_after(value, columns, pk):
+    """Convert the keyset cursor to the primary key's Python type"""
+    if value is None or pk is None:
+        return None
+    pk_type = dict(columns).get(pk, "").upper()
+    if "INT" in pk_type:
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return value
+
+
+def render_database(table_name=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    """Generate the inspector page piece by piece; nothing is buffered past one row batch"""
+    yield PAGE_HEAD
+    try:
+        tables = describe_tables()
+        with engine.connect() as conn:
+            if table_name is not None:
+                if table_name not in tables:
+                    yield f"<p>Unknown table {html.escape(table_name)}.</p><p><a href=\"/database\">All tables</a></p>"
+                else:
+                    columns, pk = tables[table_name]
+                    yield from render_table(conn, table_name, columns, pk, coerce_after(after, columns, pk),
+                                            limit, browse=True)
+            elif not tables:
+                yield "<p>No tables found in database.</p>"
+            else:
+                for name, (columns, pk) in tables.items():
+                    yield from render_table(conn, name, columns, pk)
+    except Exception as e:
+        logger.error(f"Database viewer error: {e}")
+        yield f"<h1>Error</h1><p>Failed to read database: {html.escape(str(e))}</p>"
+    yield PAGE_TAIL
+
+
+@router.get("/database")
+def database_view(table: str = None, after: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """View database tables in browser"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return StreamingResponse(render_database(table, after, limit), media_type="text/html; charset=utf-8")
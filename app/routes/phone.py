@@ -1,18 +1,23 @@
 import os
-import re
-import json
 import time
+import asyncio
 import logging
-from functools import lru_cache
 from dotenv import load_dotenv
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import Response
 from twilio.twiml.voice_response import VoiceResponse
 from twilio.rest import Client
-import google.generativeai as genai
-from app.utils.ai_prompt import SYSTEM_PROMPT
-from app.models import Appointment, Doctor
-from app.db import get_session
-from sqlmodel import select
+from app.utils import phone_audio, recorder
+from app.utils.tenants import tenants
+from app.utils.llm import get_model, parse_reply, send_async, start_conversation
+from app.utils.tools import apply_results, history_entries, run_tool_calls, spoken_reply
+from app.utils.session_store import session_store
+from app.utils.history import count_prompt, prompt_history, schedule_fold
+from app.utils.slots import clinic_now, plan, settle, with_context
+from app.utils.overload import HOLDING_MESSAGE, controller
+from app.utils.call_log import record_call, record_turn_event
+from app.utils.metrics import ACTIVE_CALLS, LOCAL_TURNS, TURN_ERRORS, TurnTimer
+from app.utils.tracing import start_trace
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,9 +30,6 @@ TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER")
 
-# Gemini configuration
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-
 # Initialize Twilio client
 if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
     twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
@@ -35,60 +37,83 @@ else:
     twilio_client = None
     logger.warning("Twilio credentials not found. Phone functionality will be disabled.")
 
-# Configure Gemini with error handling
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
-    logger.warning("Gemini API key not found. AI functionality will be disabled.")
+PHONE_INSTRUCTIONS = "This is a phone call. Respond appropriately in English."
 
-# Try different models in order of preference
-model_names = ['gemini-2.0-flash', 'models/gemini-2.0-flash', 'gemini-flash-latest', 'models/gemini-flash-latest', 'gemini-pro-latest', 'models/gemini-pro-latest']
-model = None
+# Fixed lines; with PHONE_AUDIO=play they are played from pre-rendered clips
+GREETING = "Hello! I'm the dental clinic's voice receptionist. How can I help you today?"
+NOT_UNDERSTOOD = "Sorry, I didn't understand what you said. Please try again."
+PROCESSING = "I'm processing your request, please wait..."
+ANYTHING_ELSE = "Is there anything else I can help you with?"
+ERROR_MESSAGE = "Sorry, there was an issue. We'll try to fix it soon."
+VOICEMAIL_MESSAGE = "We couldn't connect your call. Please try again later."
+phone_audio.register(GREETING, NOT_UNDERSTOOD, PROCESSING, ANYTHING_ELSE, ERROR_MESSAGE, VOICEMAIL_MESSAGE,
+                     HOLDING_MESSAGE)
 
-if GEMINI_API_KEY:
-    for model_name in model_names:
-        try:
-            model = genai.GenerativeModel(model_name)
-            # Test the model with a simple prompt
-            test_response = model.generate_content("Hello, this is a test.")
-            logger.info(f"Gemini model {model_name} initialized successfully")
-            break
-        except Exception as e:
-            logger.warning(f"Error initializing Gemini model {model_name}: {e}")
-            continue
+# Final CallStatus values of Twilio's status callback
+CALL_ENDED = ("completed", "busy", "failed", "no-answer", "canceled")
+
+# A phone call counts as active while Twilio keeps sending it webhooks
+PHONE_CALL_IDLE_SECONDS = float(os.environ.get("PHONE_CALL_IDLE_SECONDS", "120"))
+_call_last_seen = {}
+
+
+def touch_call(call_sid):
+    if call_sid:
+        _call_last_seen[call_sid] = time.monotonic()
+
+
+def end_call(call_sid):
+    _call_last_seen.pop(call_sid, None)
+
+
+def finish_call(call_sid, dialed):
+    """Log a call that ended, once, and drop its conversation state; blocking"""
+    state = session_store.load(call_sid)
+    record_call(call_sid, "phone", tenants.for_number(dialed), state.slots)
+    session_store.delete(call_sid)
+
+
+def count_active_calls():
+    cutoff = time.monotonic() - PHONE_CALL_IDLE_SECONDS
+    for call_sid, last_seen in list(_call_last_seen.items()):
+        if last_seen < cutoff:
+            _call_last_seen.pop(call_sid, None)
+    return len(_call_last_seen)
+
+
+ACTIVE_CALLS.set_function(count_active_calls)
 
-    if not model:
-        logger.error("Failed to initialize any Gemini model")
-else:
-    logger.info("Skipping Gemini model initialization due to missing API key")
 
-router = APIRouter()
+def speak(verb, text):
+    """<Play> a fixed line's cached clip, or <Say> it while the clip is not rendered yet"""
+    url = phone_audio.url_for(text)
+    if url:
+        verb.play(url)
+    else:
+        verb.say(text, language="en-US", voice="Polly.Joanna")
 
-@lru_cache(maxsize=1)
-def get_cached_doctor_list():
-    """Get list of doctors from database with caching"""
+
+def twiml(resp):
+    """Serialize a VoiceResponse as the XML document Twilio expects"""
+    return Response(content=str(resp), media_type="application/xml")
+
+
+async def trace_webhook(request: Request):
+    """Open a span for one Twilio webhook, in the trace of its CallSid"""
+    if request.method == "POST":
+        params = await request.form()
+    else:
+        params = request.query_params
+    span = start_trace(f"twilio{request.url.path}", params.get("CallSid"), channel="phone",
+                       call_status=params.get("CallStatus"))
     try:
-        with get_session() as session:
-            doctors = session.exec(select(Doctor)).all()
-            logger.info(f"Retrieved {len(doctors)} doctors from database")
-            return doctors
-    except Exception as e:
-        logger.error(f"Error fetching doctors: {e}")
-        return []
+        yield span
+    finally:
+        if span is not None:
+            span.end()
 
-def get_doctor_list():
-    """Get list of doctors from database"""
-    return get_cached_doctor_list()
 
-def format_doctor_info(doctors):
-    """Format doctor information for the AI prompt"""
-    if not doctors:
-        return "No doctors available at the moment."
-    
-    doctor_info = "Available Doctors:\n"
-    for doctor in doctors:
-        doctor_info += f"- {doctor.name}: {doctor.specialty}\n"
-    return doctor_info
+router = APIRouter(dependencies=[Depends(trace_webhook)])
 
 @router.post("/voice")
 async def voice(request: Request):
@@ -99,6 +124,7 @@ async def voice(request: Request):
     call_sid = form_data.get("CallSid", "")
     
     logger.info(f"Incoming call from {from_number} with CallSid {call_sid}")
+    touch_call(call_sid)
     
     # Create TwiML response
     resp = VoiceResponse()
@@ -107,14 +133,13 @@ async def voice(request: Request):
     if not twilio_client:
         resp.say("Sorry, phone service is currently unavailable.", language="en-US", voice="Polly.Joanna")
         resp.hangup()
-        return resp
-    
-    # Get doctor information
-    doctors = get_doctor_list()
-    doctor_info = format_doctor_info(doctors)
+        return twiml(resp)
     
-    # Update the system prompt with current doctor information
-    enhanced_system_prompt = SYSTEM_PROMPT + f"\n\nCurrent Doctor Information:\n{doctor_info}"
+    # Overloaded: new calls go to voicemail, calls already connected keep going
+    if controller.shed("phone"):
+        logger.warning(f"Sending call {call_sid} to voicemail: overloaded")
+        resp.redirect("/api/voicemail", method="GET")
+        return twiml(resp)
     
     # Gather input from caller with a longer timeout
     gather = resp.gather(
@@ -126,13 +151,12 @@ async def voice(request: Request):
     )
     
     # Play welcome message with natural speed
-    gather.say("Hello! I'm the dental clinic's voice receptionist. How can I help you today?", 
-               language="en-US", voice="Polly.Joanna")
+    speak(gather, GREETING)
     
     # If no input received, redirect to voicemail
     resp.redirect("/api/voicemail", method="GET")
     
-    return resp
+    return twiml(resp)
 
 @router.post("/process_speech")
 async def process_speech(request: Request):
@@ -140,8 +164,11 @@ async def process_speech(request: Request):
     form_data = await request.form()
     speech_result = form_data.get("SpeechResult", "")
     from_number = form_data.get("From", "")
+    call_sid = form_data.get("CallSid", "")
     
     logger.info(f"Speech result: {speech_result}")
+    touch_call(call_sid)
+    timer = TurnTimer("phone", call_sid)
     
     resp = VoiceResponse()
     
@@ -149,98 +176,104 @@ async def process_speech(request: Request):
     if not twilio_client:
         resp.say("Sorry, phone service is currently unavailable.", language="en-US", voice="Polly.Odia Female")
         resp.hangup()
-        return resp
+        return twiml(resp)
     
     if not speech_result:
-        resp.say("Sorry, I didn't understand what you said. Please try again.", 
-                 language="en-US", voice="Polly.Joanna")
+        speak(resp, NOT_UNDERSTOOD)
         resp.redirect("/api/voice", method="POST")
-        return resp
+        return twiml(resp)
     
-    # Get doctor information
-    doctors = get_doctor_list()
-    doctor_info = format_doctor_info(doctors)
+    # The dialed number picks the clinic; numbers that belong to no clinic reach the default one.
+    # A cache miss or version check reads the database, so keep it off the event loop
+    clinic_id, doctors = await asyncio.to_thread(tenants.for_call, form_data.get("To"))
     
-    # Update the system prompt with current doctor information
-    enhanced_system_prompt = SYSTEM_PROMPT + f"\n\nCurrent Doctor Information:\n{doctor_info}"
+    # Get the prompt with current doctor information
+    enhanced_system_prompt = doctors.system_prompt
     
     try:
-        # Process the speech with Gemini AI
-        full_prompt = f"{enhanced_system_prompt}\n\nCaller said: {speech_result}\n\nRespond appropriately in English."
+        # Earlier turns of this call may have been handled by another worker
+        with timer.stage("session"):
+            state = await asyncio.to_thread(session_store.load, call_sid)
+        turn = state.slots.get("turn", 0) + 1
+        timer.turn = turn
+        if timer.span is not None:
+            timer.span.set("turn", turn)
+        record_turn_event(call_sid, "phone", turn, "user", speech_result)
+        record = recorder.begin(timer, speech_result, clinic=clinic_id, caller=from_number, dialed=form_data.get("To"))
         
-        if model:
+        # Booking details come out of every utterance locally; a complete booking needs no model turn
+        with timer.stage("slots"):
+            now = clinic_now(doctors)
+            booking, local = plan(state.slots.get("booking"), speech_result, doctors, from_number, now)
+        
+        model = get_model(fast=controller.at_least("fast_model"))
+        if local is None and controller.at_least("holding"):
+            # Overloaded: ask the caller to repeat instead of waiting on the model
+            record_turn_event(call_sid, "phone", turn, "model", HOLDING_MESSAGE)
+            record.reply(HOLDING_MESSAGE, [], HOLDING_MESSAGE, "holding")
+            gather = resp.gather(input="speech", action="/api/process_speech", method="POST", timeout=3,
+                                 language="en-US")
+            speak(gather, HOLDING_MESSAGE)
+            timer.first_audio()
+            timer.finish()
+            return twiml(resp)
+        if local is not None:
+            action, reply_text, calls = local
+            LOCAL_TURNS.labels("phone", action).inc()
+            timer.annotate("local", action)
+            llm_latency_ms = None
+        elif model:
             # Send immediate acknowledgment to show we're processing the request
-            resp.say("I'm processing your request, please wait...", language="en-US", voice="Polly.Joanna")
+            speak(resp, PROCESSING)
             
             # Reduce delay to help with rate limiting while improving response time
-            time.sleep(0.1)  # Reduced from 1 second to 0.1 second
+            await asyncio.sleep(0.1)  # Reduced from 1 second to 0.1 second
+            
+            # Process the speech with Gemini AI, continuing the call's conversation
+            system_prompt = f"{enhanced_system_prompt}\n\n{PHONE_INSTRUCTIONS}"
+            history = prompt_history(state, short=controller.at_least("short_prompt"))
+            message = with_context(speech_result, booking, now)
+            timer.annotate("prompt_tokens", count_prompt("phone", system_prompt, history, message))
+            with timer.stage("llm"):
+                chat = start_conversation(model, system_prompt, history)
+                response = await send_async(chat.send_message, message)
+            llm_latency_ms = timer.stage_ms("llm")
             
-            response = model.generate_content(full_prompt)
-            ai_response = response.text
+            # Spoken text and booking actions come back as separate parts
+            with timer.stage("parse"):
+                reply_text, calls = parse_reply(response)
         else:
             # Fallback response if model is not available
-            ai_response = "Sorry, I'm unable to help at the moment. Please try again."
+            reply_text, calls = "Sorry, I'm unable to help at the moment. Please try again.", []
+            llm_latency_ms = None
         
-        logger.info(f"AI Response: {ai_response}")
+        # Run actions before answering; the caller's own number fills in a missing phone
+        results = []
+        if calls:
+            with timer.stage("booking"):
+                results = await asyncio.to_thread(run_tool_calls, calls,
+                                                  defaults={"phone": from_number} if from_number else None,
+                                                  clinic_id=clinic_id)
+        display_text = spoken_reply(reply_text, results)
+        booking = settle(booking, results)
         
-        # Parse JSON from AI response if present
-        appointment_data = None
-        try:
-            # Extract JSON from the response
-            json_match = re.search(r'\{[^}]+\}', ai_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                parsed_data = json.loads(json_str)
-                appointment_data = parsed_data.get("appointment_data")
-                
-                # Save appointment if data is present
-                if appointment_data and isinstance(appointment_data, dict):
-                    with get_session() as session:
-                        appointment = Appointment(**appointment_data)
-                        session.add(appointment)
-                        session.commit()
-                        session.refresh(appointment)
-                    logger.info(f"Appointment booked: {appointment_data}")
-        except Exception as e:
-            logger.error(f"Error parsing appointment data: {e}")
+        logger.info(f"AI Response: {display_text} (calls: {[name for name, _ in calls]})")
+        record_turn_event(call_sid, "phone", turn, "model", display_text, llm_latency_ms)
+        record.reply(reply_text, calls, display_text, "local" if local else "model" if model else "fallback")
         
-        # Extract the text message (remove JSON part if present)
-        display_text = ai_response
-        if appointment_data is not None:
-            # Remove JSON part from the display text
-            json_start = ai_response.find('{')
-            if json_start != -1:
-                json_end = ai_response.rfind('}') + 1
-                if json_end > json_start:
-                    # Remove JSON block from the response
-                    before_json = ai_response[:json_start].strip()
-                    after_json = ai_response[json_end:].strip()
-                    display_text = (before_json + " " + after_json).strip()
-                    # If both parts are empty, just use a generic response
-                    if not display_text:
-                        display_text = "Great! Your appointment has been confirmed."
-                    # Ensure we don't speak just whitespace or newlines
-                    display_text = display_text.strip()
-                    if not display_text:
-                        display_text = "Great! Your appointment has been confirmed."
+        # Save the turn; if another webhook for this call saved first, it is added on top of that
+        entries = [{"role": "user", "parts": [speech_result]}] + \
+            history_entries(reply_text, calls, results, display_text)
         
-        # Additional cleanup to remove any JSON code blocks with backticks
-        while '```' in display_text:
-            first_index = display_text.find('```')
-            if first_index != -1:
-                last_index = display_text.find('```', first_index + 3)
-                if last_index != -1:
-                    display_text = display_text[:first_index] + display_text[last_index + 3:]
-                else:
-                    break
-            else:
-                break
+        def add_turn(current):
+            current.history.extend(entries)
+            current.slots["turn"] = max(current.slots.get("turn", 0), turn)
+            current.slots["booking"] = booking
+            apply_results(current.slots, results)
         
-        # Remove any remaining backticks
-        display_text = display_text.replace('```', '').strip()
-        
-        # Log the display text for debugging
-        logger.info(f"Display text: {display_text}")
+        with timer.stage("session"):
+            state = await asyncio.to_thread(session_store.update, call_sid, add_turn, state)
+        schedule_fold(call_sid, state)
         
         # Play AI response with natural speed (fallback when ffmpeg is not available)
         resp.say(display_text, language="en-US", voice="Polly.Joanna")
@@ -253,27 +286,45 @@ async def process_speech(request: Request):
             timeout=3,
             language="en-US"
         )
-        gather.say("Is there anything else I can help you with?", language="en-US", voice="Polly.Joanna")
+        speak(gather, ANYTHING_ELSE)
         
     except Exception as e:
+        TURN_ERRORS.labels("phone").inc()
         logger.error(f"Error processing speech: {e}")
-        resp.say("Sorry, there was an issue. We'll try to fix it soon.", 
-                 language="en-US", voice="Polly.Joanna")
+        speak(resp, ERROR_MESSAGE)
     
-    return resp
+    # Twilio starts speaking as soon as it has the TwiML, so that is our first audio
+    timer.first_audio()
+    timer.finish()
+    return twiml(resp)
 
 @router.get("/voicemail")
-async def voicemail():
+async def voicemail(request: Request):
     """Handle voicemail"""
+    # The call ends here; Twilio sends the CallSid as a query parameter on GET
+    call_sid = request.query_params.get("CallSid")
+    end_call(call_sid)
+    if call_sid:
+        await asyncio.to_thread(finish_call, call_sid, request.query_params.get("To"))
     resp = VoiceResponse()
     
     # Check if Twilio is configured
     if not twilio_client:
         resp.say("Sorry, phone service is currently unavailable.", language="en-US", voice="Polly.Joanna")
         resp.hangup()
-        return resp
+        return twiml(resp)
     
-    resp.say("We couldn't connect your call. Please try again later.", 
-             language="en-US", voice="Polly.Joanna")
+    speak(resp, VOICEMAIL_MESSAGE)
     resp.hangup()
-    return resp
\ No newline at end of file
+    return twiml(resp)
+
+
+@router.post("/call_status")
+async def call_status(request: Request):
+    """Twilio status callback: log the call once it has ended, however it ended"""
+    form_data = await request.form()
+    call_sid = form_data.get("CallSid", "")
+    if call_sid and form_data.get("CallStatus") in CALL_ENDED:
+        end_call(call_sid)
+        await asyncio.to_thread(finish_call, call_sid, form_data.get("To"))
+    return Response(status_code=204)
@@ -1,101 +1,46 @@
 import os
+import re
 import asyncio
 import json
 import base64
 import io
-import time
+import uuid
 import logging
 import warnings
-from functools import lru_cache
-from dotenv import load_dotenv
-import google.generativeai as genai
-from gtts import gTTS
 from pydub import AudioSegment
 from pydub.utils import which
-from app.utils.ai_prompt import SYSTEM_PROMPT
-from app.utils.helpers import safe_parse_json_block
+from app.utils.tenants import DEFAULT_CLINIC, tenants
+from app.utils.llm import ai_enabled, get_model, start_conversation, stream_reply
+from app.utils import recorder
+from app.utils.tts import prerendered, synthesize_async
+from app.utils.asr import CODECS, SAMPLE_RATES, VAD_FRAME_MS, SpeechStream, asr_enabled, feed_async, finish_async
+from app.utils.tools import apply_results, calls_from_json, history_entries, run_tool_calls, spoken_reply
+from app.utils.session_store import session_store
+from app.utils.history import count_prompt, prompt_history, schedule_fold
+from app.utils.slots import clinic_now, plan, settle, with_context
+from app.utils.overload import HOLDING_MESSAGE, controller
+from app.utils.connections import CLOSE_TOO_BIG, CLOSE_TRY_LATER, WS_MAX_MESSAGE_BYTES, connections
+from app.utils.speech_stream import SentenceSplitter, SpeechStreamParser, clean_speech
+from app.utils.call_log import record_call, record_turn_event
+from app.utils.metrics import ACTIVE_SESSIONS, LOCAL_TURNS, TTS_SECONDS, TURN_ERRORS, WS_CLOSED, TurnTimer
+from app.utils.tracing import start_trace
+from app.utils.ws_protocol import (AUDIO_FORMAT, ProtocolError, audio_frames, control, negotiate,
+                                   parse_client_message)
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from app.models import Doctor
-from app.db import get_session
-from sqlmodel import select
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-logger.info(f"GEMINI_API_KEY present: {bool(GEMINI_API_KEY)}")
-
-# Configure Gemini with error handling
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
-    logger.warning("Gemini API key not found. AI functionality will be disabled.")
-
-# Try different models in order of preference
-model_names = ['gemini-2.0-flash', 'models/gemini-2.0-flash', 'gemini-flash-latest', 'models/gemini-flash-latest', 'gemini-pro-latest', 'models/gemini-pro-latest']
-model = None
-
-if GEMINI_API_KEY:
-    for model_name in model_names:
-        try:
-            model = genai.GenerativeModel(model_name)
-            # Test the model with a simple prompt
-            test_response = model.generate_content("Hello, this is a test.")
-            logger.info(f"Gemini model {model_name} initialized successfully")
-            break
-        except Exception as e:
-            logger.warning(f"Error initializing Gemini model {model_name}: {e}")
-            continue
-
-    if not model:
-        logger.error("Failed to initialize any Gemini model")
-else:
-    logger.info("Skipping Gemini model initialization due to missing API key")
-
 router = APIRouter()
 
-@lru_cache(maxsize=1)
-def get_cached_doctor_list():
-    """Get list of doctors from database with caching"""
-    try:
-        with get_session() as session:
-            doctors = session.exec(select(Doctor)).all()
-            logger.info(f"Retrieved {len(doctors)} doctors from database")
-            return doctors
-    except Exception as e:
-        logger.error(f"Error fetching doctors: {e}")
-        return []
-
-def get_doctor_list():
-    """Get list of doctors from database"""
-    return get_cached_doctor_list()
-
-def format_doctor_info(doctors):
-    """Format doctor information for the AI prompt"""
-    if not doctors:
-        return "No doctors available at the moment."
-    
-    doctor_info = "Available Doctors:\n"
-    for doctor in doctors:
-        doctor_info += f"- {doctor.name}: {doctor.specialty}\n"
-    return doctor_info
-
-def get_doctor_info_json(doctors):
-    """Get doctor information as JSON for frontend"""
-    if not doctors:
-        return "[]"
-    
-    doctor_list = []
-    for doctor in doctors:
-        doctor_list.append({
-            "name": doctor.name,
-            "specialty": doctor.specialty
-        })
-    
-    return json.dumps(doctor_list)
+SESSION_ID = re.compile(r"[0-9a-f]{32}")
+# Microphone chunks waiting for the recognizer before new ones are dropped (about 10 s of 20 ms chunks)
+MIC_QUEUE_FRAMES = 500
+WELCOME_MESSAGE = "Hello! I'm the dental clinic's voice receptionist. How can I help you today?"
+# Rendered by the TTS warm-up so they never wait on the TTS pool
+PRERENDERED_MESSAGES = (WELCOME_MESSAGE, HOLDING_MESSAGE)
 
 def change_audio_speed(audio_data, speed=1.0):
     """Change the speed of audio data"""
@@ -127,31 +72,36 @@ def change_audio_speed(audio_data, speed=1.0):
         # Return original audio if we can't change speed
         return audio_data  
 
-async def send_text_to_speech(websocket, text, speed=1.0):
-    """Convert text to speech and send as audio data"""
+async def join_audio(tasks):
+    """Concatenate per-sentence MP3 clips in order; MP3 frames play back-to-back as one file"""
+    return b"".join(await asyncio.gather(*tasks))
+
+
+async def send_text_to_speech(websocket, text, speed=1.0, timer=None, audio=None):
+    """Convert text to speech and send as audio data.
+
+    `audio` is an awaitable of audio already being synthesized for this text.
+    """
+    timer = timer or TurnTimer("web")
     try:
-        # Generate speech from text using gTTS
-        tts = gTTS(text=text, lang='en')  
-        
-        # Save to BytesIO object
-        audio_buffer = io.BytesIO()
-        tts.write_to_fp(audio_buffer)
-        audio_buffer.seek(0)
-        
-        # Read the audio data
-        audio_data = audio_buffer.read()
+        # Generate speech from text using gTTS on the TTS thread pool
+        with timer.stage("tts"):
+            audio_data = await (audio if audio is not None else synthesize_async(text))
         
         # Change speed if needed and if not using default speed
         if speed != 1.0:
             original_size = len(audio_data)
-            audio_data = change_audio_speed(audio_data, speed)
+            with timer.stage("audio_speed"), TTS_SECONDS.labels("speed").time():
+                audio_data = change_audio_speed(audio_data, speed)
             if len(audio_data) == original_size:
                 logger.info("Audio speed adjustment was skipped (ffmpeg not available)")
             else:
                 logger.info("Audio speed adjusted successfully")
         
         # Send the audio data to the client
-        await websocket.send_bytes(audio_data)
+        with timer.stage("send"):
+            await websocket.send_bytes(audio_data)
+        timer.first_audio()
         logger.info(f"Sent audio data: {len(audio_data)} bytes")
         
         # Also send the text for display
@@ -160,146 +110,540 @@ async def send_text_to_speech(websocket, text, speed=1.0):
         logger.error(f"Error generating speech: {e}")
         await websocket.send_text(f"AI: {text}")  # Fallback to text only
 
-@router.websocket("/ws/ai")
-async def websocket_ai(websocket: WebSocket):
+async def stream_turn(chat, message, synthesize=True):
+    """Stream one model reply through the speech parser.
+
+    Returns (speech, function calls, sentence audio tasks). Speech is
+    synthesized sentence by sentence as soon as each one is complete, unless
+    `synthesize` is off.
+    """
+    parser = SpeechStreamParser()
+    sentences = SentenceSplitter()
+    speech = []
+    calls = []
+    audio = []
+
+    def speak(finished):
+        if synthesize:
+            audio.extend(asyncio.create_task(synthesize_async(sentence)) for sentence in finished)
+
+    def handle(events):
+        for kind, value in events:
+            if kind == "speech":
+                speech.append(value)
+                speak(sentences.feed(value))
+            elif kind == "json":
+                calls.extend(calls_from_json(value))
+            else:
+                logger.info(f"Dropped a code block from the reply ({len(value)} chars)")
+
+    try:
+        async for kind, value in stream_reply(chat.send_message, message):
+            if kind == "call":
+                calls.append(value)
+            else:
+                handle(parser.feed(value))
+        handle(parser.finish())
+        speak(sentences.finish())
+    except BaseException:
+        for task in audio:
+            task.cancel()
+        raise
+    return clean_speech("".join(speech)), calls, audio
 
-    await websocket.accept()
-    logger.info("WebSocket connection accepted")
+
+class VoiceSession:
+    """One /ws/ai conversation: its saved state plus this connection's transcript.
+
+    Both protocol versions run turns through respond(); they only differ in
+    how the reply reaches the client.
+    """
+
+    def __init__(self, session_id, state, doctors, clinic_id=None):
+        self.session_id = session_id
+        self.state = state
+        self.doctors = doctors
+        self.clinic_id = clinic_id
+        self.turn = state.slots.get("turn", 0)
+        self.transcript = []
+
+    def start_turn(self, user_message):
+        self.turn += 1
+        record_turn_event(self.session_id, "web", self.turn, "user", user_message)
+        self.transcript.append(("user", user_message))
+        return self.turn
+
+    async def respond(self, user_message, turn, timer, synthesize=True):
+        """Stream the model's reply (or answer from the booking slots), run its function calls and save the turn.
+
+        Returns (display_text, sentence audio tasks). The tasks are None when
+        there is no early audio for display_text, e.g. because an action failed
+        and the reply changed. Cancelling during the model stream leaves no
+        trace; once the actions have run the turn is saved regardless.
+        """
+        record = recorder.begin(timer, user_message, clinic=self.clinic_id)
+        # Booking details come out of every utterance locally; a complete booking needs no model turn
+        with timer.stage("slots"):
+            now = clinic_now(self.doctors)
+            booking, local = plan(self.state.slots.get("booking"), user_message, self.doctors, now=now)
+        if local is None and controller.at_least("holding"):
+            # Overloaded: skip the model entirely and play the ready-made holding message
+            record_turn_event(self.session_id, "web", turn, "model", HOLDING_MESSAGE)
+            record.reply(HOLDING_MESSAGE, [], HOLDING_MESSAGE, "holding")
+            self.transcript.append(("model", HOLDING_MESSAGE))
+            return HOLDING_MESSAGE, [asyncio.ensure_future(prerendered(HOLDING_MESSAGE))] if synthesize else None
+        # Under load: fewer turns in the prompt, a faster model, then no synthesized audio
+        synthesize = synthesize and not controller.at_least("text_only")
+        audio = []
+        try:
+            model = get_model(fast=controller.at_least("fast_model"))
+            if local is not None:
+                action, reply_text, calls = local
+                LOCAL_TURNS.labels("web", action).inc()
+                timer.annotate("local", action)
+                llm_latency_ms = None
+            elif model:
+                # Space requests out a little to help with Gemini rate limits
+                await asyncio.sleep(0.1)
+                
+                # Stream the reply: speech is split off as it arrives and each
+                # finished sentence starts synthesizing while the model keeps going
+                history = prompt_history(self.state, short=controller.at_least("short_prompt"))
+                message = with_context(user_message, booking, now)
+                timer.annotate("prompt_tokens", count_prompt("web", self.doctors.system_prompt, history, message))
+                with timer.stage("llm"):
+                    chat = start_conversation(model, self.doctors.system_prompt, history)
+                    reply_text, calls, audio = await stream_turn(chat, message, synthesize)
+                llm_latency_ms = timer.stage_ms("llm")
+            else:
+                # Fallback response if model is not available
+                reply_text, calls = "Sorry, I'm unable to help at the moment. Please try again.", []
+                llm_latency_ms = None
+            
+            async def finish():
+                # Run actions before speaking so a confirmation is only spoken once it is true
+                results = []
+                if calls:
+                    with timer.stage("booking"):
+                        results = await asyncio.to_thread(run_tool_calls, calls, clinic_id=self.clinic_id)
+                display_text = spoken_reply(reply_text, results)
+                settled = settle(booking, results)
+
+                logger.info(f"AI Response: {display_text} (calls: {[name for name, _ in calls]})")
+                record_turn_event(self.session_id, "web", turn, "model", display_text, llm_latency_ms)
+                record.reply(reply_text, calls, display_text, "local" if local else "model" if model else "fallback")
+                self.transcript.append(("model", display_text))
+
+                # Save the turn so the session can continue elsewhere; function calls are followed by their results
+                entries = [{"role": "user", "parts": [user_message]}] + \
+                    history_entries(reply_text, calls, results, display_text)
+
+                def add_turn(current):
+                    current.history.extend(entries)
+                    current.slots["turn"] = max(current.slots.get("turn", 0), turn)
+                    current.slots["booking"] = settled
+                    apply_results(current.slots, results)
+
+                with timer.stage("session"):
+                    self.state = await asyncio.to_thread(session_store.update, self.session_id, add_turn, self.state)
+                folding = schedule_fold(self.session_id, self.state)
+                if folding is not None:
+                    folding.add_done_callback(self.folded)
+                return display_text
+
+            # The booking thread can't be stopped, so from here on a cancelled turn still finishes and is saved
+            display_text = await asyncio.shield(asyncio.ensure_future(finish()))
+        except BaseException:
+            for task in audio:
+                task.cancel()
+            raise
+        if audio and display_text == reply_text:
+            return display_text, audio
+        # The early audio, if any, is stale
+        for task in audio:
+            task.cancel()
+        return display_text, None
+
+    def folded(self, task):
+        # Carry on from the folded state so the next turn sends the shorter history and saves without a conflict
+        state = None if task.cancelled() else task.result()
+        if state is not None and state.version > self.state.version:
+            self.state = state
+
+    def memory_bytes(self):
+        """Rough size of what the session holds: its state as JSON plus this connection's transcript"""
+        state = json.dumps({"h": self.state.history, "s": self.state.slots}, separators=(",", ":"), ensure_ascii=False)
+        return len(state) + sum(len(text) for _, text in self.transcript)
+    
+    def close(self):
+        """Log the conversation once its connection is gone; the state stays so the session can be resumed"""
+        if self.transcript:
+            # Not awaited: the write finishes on the executor after the socket is gone
+            asyncio.get_running_loop().run_in_executor(None, record_call, self.session_id, "web", self.clinic_id,
+                                                       dict(self.state.slots))
+
+
+async def open_session(websocket, doctors, clinic_id):
+    """Load (or start) the conversation named by ?session=<id>; None if the store is unreachable"""
+    # A client that lost its connection can pick the conversation up again
+    # with ?session=<id>, on this or any other worker
+    resume_id = websocket.query_params.get("session", "")
+    session_id = resume_id if SESSION_ID.fullmatch(resume_id) else uuid.uuid4().hex
+    try:
+        state = await asyncio.to_thread(session_store.load, session_id)
+    except Exception as e:
+        logger.error(f"Session store unavailable: {e}")
+        return None
+    if state.version:
+        logger.info(f"Resuming session {session_id} at turn {state.slots.get('turn', 0)}")
+    return VoiceSession(session_id, state, doctors, clinic_id)
+
+
+@router.websocket("/ws/ai")
+@router.websocket("/ws/ai/{clinic_id}")
+async def websocket_ai(websocket: WebSocket, clinic_id: str = None):
+    version, subprotocol = negotiate(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    if controller.shed("web"):
+        # Sessions already open keep their capacity
+        logger.warning("Refused a WebSocket session: overloaded")
+        await websocket.send_text("Error: the receptionist is busy, please try again shortly" if version == 1 else
+                                  control("error", code="overloaded", message="busy, please try again shortly"))
+        await websocket.close(code=CLOSE_TRY_LATER)
+        return
+    connection = connections.admit(websocket)
+    if connection is None:
+        await websocket.send_text("Error: too many connections, please try again shortly" if version == 1 else
+                                  control("error", code="overloaded", message="too many connections"))
+        await websocket.close(code=CLOSE_TRY_LATER)
+        return
+    logger.info(f"WebSocket connection accepted (protocol v{version})")
+    ACTIVE_SESSIONS.inc()
     
     # Check if Gemini is configured
-    if not GEMINI_API_KEY:
-        await websocket.send_text("Error: Gemini API key not configured")
+    if not ai_enabled():
+        await websocket.send_text("Error: Gemini API key not configured" if version == 1 else
+                                  control("error", code="unavailable", message="Gemini API key not configured"))
         await websocket.close()
+        ACTIVE_SESSIONS.dec()
+        connections.release(connection)
         return
     
-    # Get doctor information
-    doctors = get_doctor_list()
-    doctor_info = format_doctor_info(doctors)
-    doctor_info_json = get_doctor_info_json(doctors)
-    
-    # Update the system prompt with current doctor information
-    enhanced_system_prompt = SYSTEM_PROMPT + f"\n\nCurrent Doctor Information:\n{doctor_info}"
+    # /ws/ai/{clinic_id} talks to one clinic of a shared deployment, /ws/ai to the default clinic
+    clinic_id = None if clinic_id == DEFAULT_CLINIC else clinic_id
+    # A cache miss or version check reads the database
+    doctors = await asyncio.to_thread(tenants.snapshot, clinic_id)
+    if doctors is None:
+        await websocket.send_text("Error: unknown clinic" if version == 1 else
+                                  control("error", code="not_found", message=f"unknown clinic {clinic_id!r}"))
+        await websocket.close(code=1008)
+        ACTIVE_SESSIONS.dec()
+        connections.release(connection)
+        return
     
-    # Initialize conversation history
-    conversation_history = [
-        {"role": "user", "parts": [enhanced_system_prompt]},
-        {"role": "model", "parts": ["I understand. I'm ready to help as a dental receptionist."]}
-    ]
+    session = await open_session(websocket, doctors, clinic_id)
+    if session is None:
+        await websocket.send_text("Error: session store unavailable" if version == 1 else
+                                  control("error", code="unavailable", message="session store unavailable"))
+        await websocket.close()
+        ACTIVE_SESSIONS.dec()
+        connections.release(connection)
+        return
+    session_span = start_trace("ws.session", session.session_id, channel="web")
+    connection.session = session
     
+    try:
+        if version == 2:
+            await ConnectionV2(websocket, session, connection).run()
+        else:
+            await run_v1(websocket, session, connection)
+    except WebSocketDisconnect:
+        logger.info("WebSocket connection closed")
+    except asyncio.CancelledError:
+        if connection.reaped is None:
+            raise
+        # The reaper gave up on the close handshake (a half-open socket)
+        logger.info(f"Dropped {connection.reaped} session {session.session_id}")
+    except Exception as e:
+        logger.error(f"WebSocket error: {e}")
+    finally:
+        ACTIVE_SESSIONS.dec()
+        connections.release(connection)
+        session.close()
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # already closed by the client
+        logger.info("WebSocket connection closed")
+        if session_span is not None:
+            session_span.set("turns", session.turn)
+            session_span.set("appointment_id", session.state.slots.get("appointment_id"))
+            session_span.end()
+
+
+async def run_v1(websocket, session, connection):
+    """The original line protocol, kept for frontend/index.html"""
     # Send welcome message with natural speed (fallback when ffmpeg is not available)
-    welcome_message = "Hello! I'm the dental clinic's voice receptionist. How can I help you today?"
-    await send_text_to_speech(websocket, welcome_message, speed=1.0)
+    greeting_timer = TurnTimer("web", session.session_id, 0)
+    await send_text_to_speech(websocket, WELCOME_MESSAGE, speed=1.0, timer=greeting_timer,
+                              audio=prerendered(WELCOME_MESSAGE))
+    greeting_timer.finish()
     
     # Send doctor information to frontend
-    await websocket.send_text(f"DOCTORS: {doctor_info_json}")
+    await websocket.send_text(f"DOCTORS: {session.doctors.doctor_info_json}")
     
-    try:
-        while True:
-            # Receive message from client
-            data = await websocket.receive_text()
-            logger.info(f"Received: {data}")
+    while True:
+        # Receive message from client
+        data = await websocket.receive_text()
+        connection.touch()
+        if len(data.encode()) > WS_MAX_MESSAGE_BYTES:
+            logger.warning(f"Closing session {session.session_id}: {len(data)} character message")
+            WS_CLOSED.labels("too_large").inc()
+            await websocket.close(code=CLOSE_TOO_BIG)
+            return
+        logger.info(f"Received: {data}")
+        
+        if data.startswith("User: "):
+            # Send immediate acknowledgment
+            await websocket.send_text("AI: I've received your message and am processing it now...")
             
-            if data.startswith("User: "):
-                # Send immediate acknowledgment
-                await websocket.send_text("AI: I've received your message and am processing it now...")
+            user_message = data[6:]  # Remove "User: " prefix
+            connection.turn_started()
+            turn = session.start_turn(user_message)
+            timer = TurnTimer("web", session.session_id, turn)
+            try:
+                if get_model():
+                    # Send immediate acknowledgment to show we're processing the request
+                    await websocket.send_text("AI: I'm processing your request, please wait...")
+                display_text, sentence_audio = await session.respond(user_message, turn, timer)
                 
-                user_message = data[6:]  # Remove "User: " prefix
+                # Send AI response with natural speed (fallback when ffmpeg is not available)
+                if display_text and (sentence_audio or not controller.at_least("text_only")):
+                    audio = join_audio(sentence_audio) if sentence_audio else None
+                    await send_text_to_speech(websocket, display_text, speed=1.0, timer=timer, audio=audio)
+                elif display_text:
+                    # Overloaded: text only
+                    await websocket.send_text(f"AI: {display_text}")
                 
-                # Add user message to conversation history
-                conversation_history.append({"role": "user", "parts": [user_message]})
-                
-                try:
-                    # Generate response using Gemini
-                    if model:
-                        # Send immediate acknowledgment to show we're processing the request
-                        await websocket.send_text("AI: I'm processing your request, please wait...")
-                        
-                        # Reduce delay to help with rate limiting while improving response time
-                        time.sleep(0.1)  # Reduced from 1 second to 0.1 second
-                        
-                        chat = model.start_chat(history=conversation_history)
-                        response = chat.send_message(user_message)
-                        ai_response = response.text
-                    else:
-                        # Fallback response if model is not available
-                        ai_response = "Sorry, I'm unable to help at the moment. Please try again."
-                    
-                    logger.info(f"AI Response: {ai_response}")
-                    
-                    # Add AI response to conversation history
-                    conversation_history.append({"role": "model", "parts": [ai_response]})
-                    
-                    # Check if there's appointment data in the response
-                    appointment_data = safe_parse_json_block(ai_response)
-                    
-                    # Extract the text message (remove JSON part if present)
-                    display_text = ai_response
-                    if appointment_data is not None:
-                        # Remove JSON part from the display text
-                        json_start = ai_response.find('{')
-                        if json_start != -1:
-                            json_end = ai_response.rfind('}') + 1
-                            if json_end > json_start:
-                                # Remove JSON block from the response
-                                before_json = ai_response[:json_start].strip()
-                                after_json = ai_response[json_end:].strip()
-                                display_text = (before_json + " " + after_json).strip()
-                                # If both parts are empty, just use a generic response
-                                if not display_text:
-                                    display_text = "Great! Your appointment has been confirmed."
-                                # Ensure we don't speak just whitespace or newlines
-                                display_text = display_text.strip()
-                                if not display_text:
-                                    display_text = "Great! Your appointment has been confirmed."
-                    
-                    # Additional cleanup to remove any JSON code blocks with backticks
-                    while '```' in display_text:
-                        first_index = display_text.find('```')
-                        if first_index != -1:
-                            last_index = display_text.find('```', first_index + 3)
-                            if last_index != -1:
-                                display_text = display_text[:first_index] + display_text[last_index + 3:]
-                            else:
-                                break
-                        else:
-                            break
-                    
-                    # Remove any remaining backticks
-                    display_text = display_text.replace('```', '').strip()
-                    
-                    # Log the display text for debugging
-                    logger.info(f"Display text: {display_text}")
-                    
-                    # Send AI response with natural speed (fallback when ffmpeg is not available)
-                    if display_text:
-                        await send_text_to_speech(websocket, display_text, speed=1.0)
-                    
-                    # If we have appointment data, save it to database
-                    if appointment_data and "appointment_data" in appointment_data:
-                        appt_data = appointment_data["appointment_data"]
-                        if appt_data:
-                            # Save appointment to database
-                            try:
-                                with get_session() as session:
-                                    appointment = Appointment(**appt_data)
-                                    session.add(appointment)
-                                    session.commit()
-                                    session.refresh(appointment)
-                                logger.info(f"Appointment booked: {appt_data}")
-                            except Exception as e:
-                                logger.error(f"Error saving appointment: {e}")
-                    
-                except Exception as e:
-                    error_msg = f"Error processing message: {str(e)}"
-                    logger.error(error_msg)
-                    await websocket.send_text(error_msg)
-                    # Send error message to user with natural speed (fallback when ffmpeg is not available)
-                    await send_text_to_speech(websocket, "Sorry, I'm unable to help at the moment. Please try again.", speed=1.0)
-            
-    except WebSocketDisconnect:
-        logger.info("WebSocket connection closed")
+            except Exception as e:
+                TURN_ERRORS.labels("web").inc()
+                error_msg = f"Error processing message: {str(e)}"
+                logger.error(error_msg)
+                await websocket.send_text(error_msg)
+                # Send error message to user with natural speed (fallback when ffmpeg is not available)
+                await send_text_to_speech(websocket, "Sorry, I'm unable to help at the moment. Please try again.", speed=1.0,
+                                          timer=timer)
+            finally:
+                connection.turn_finished()
+            timer.finish()
+
+
+async def send_audio_v2(websocket, turn, clips, timer):
+    """Send a turn's audio clips in order as sequenced frames; returns the number of frames"""
+    seq = 0
+    for clip in clips:
+        with timer.stage("tts"):
+            data = await clip
+        frames, seq = audio_frames(turn, data, seq)
+        with timer.stage("send"):
+            for frame in frames:
+                await websocket.send_bytes(frame)
+                timer.first_audio()
+    return seq
+
+
+async def run_turn_v2(websocket, session, turn, user_message, audio_enabled):
+    """One v2 turn: the reply text, then its audio frames, then turn.end.
+
+    Runs as a task so the client can cancel it with {"type": "cancel"}.
+    """
+    timer = TurnTimer("web", session.session_id, turn)
+    clips = []
+    try:
+        display_text, clips = await session.respond(user_message, turn, timer, synthesize=audio_enabled)
+        await websocket.send_text(control("reply", turn=turn, text=display_text))
+        frames = 0
+        # Ready audio is always sent; synthesizing it afresh stops under overload
+        if audio_enabled and display_text and (clips or not controller.at_least("text_only")):
+            clips = clips or [asyncio.create_task(synthesize_async(display_text))]
+            frames = await send_audio_v2(websocket, turn, clips, timer)
+        await websocket.send_text(control("turn.end", turn=turn, audio_frames=frames))
+    except asyncio.CancelledError:
+        for task in clips or []:
+            task.cancel()
+        logger.info(f"Turn {turn} of session {session.session_id} cancelled")
+        try:
+            await websocket.send_text(control("turn.cancelled", turn=turn))
+        except Exception:
+            pass  # the connection is gone
     except Exception as e:
-        logger.error(f"WebSocket error: {e}")
+        for task in clips or []:
+            task.cancel()
+        TURN_ERRORS.labels("web").inc()
+        logger.error(f"Error processing message: {e}")
+        try:
+            await websocket.send_text(control("error", turn=turn, code="turn_failed",
+                                              message="Sorry, I'm unable to help at the moment. Please try again."))
+        except Exception:
+            pass
     finally:
-        await websocket.close()
-        logger.info("WebSocket connection closed")
+        timer.finish()
+
+
+class ConnectionV2:
+    """Typed JSON control frames plus sequenced binary audio; see app/utils/ws_protocol.py.
+
+    Turns come from "user" text frames or from the microphone: after
+    audio.start, binary frames from the client are audio, endpointed and
+    transcribed on the ASR pool, and each final transcript starts a turn.
+    """
+
+    def __init__(self, websocket, session, connection):
+        self.websocket = websocket
+        self.session = session
+        self.connection = connection
+        self.audio_enabled = websocket.query_params.get("audio", "1") not in ("0", "false", "off")
+        self.running = None
+        self.mic = None
+        self.listener = None
+
+    async def send(self, kind, **fields):
+        await self.websocket.send_text(control(kind, **fields))
+
+    async def run(self):
+        await self.send("hello", protocol=2, session_id=self.session.session_id, turn=self.session.turn,
+                        audio=self.audio_enabled, audio_format=AUDIO_FORMAT,
+                        doctors=json.loads(self.session.doctors.doctor_info_json),
+                        speech_input={"codecs": CODECS, "sample_rates": SAMPLE_RATES} if asr_enabled() else None)
+        
+        # The greeting is turn 0
+        greeting_timer = TurnTimer("web", self.session.session_id, 0)
+        await self.send("reply", turn=0, text=WELCOME_MESSAGE)
+        frames = 0
+        if self.audio_enabled:
+            greeting = [asyncio.create_task(prerendered(WELCOME_MESSAGE))]
+            frames = await send_audio_v2(self.websocket, 0, greeting, greeting_timer)
+        await self.send("turn.end", turn=0, audio_frames=frames)
+        greeting_timer.finish()
+        
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                self.connection.touch()
+                data = message.get("bytes")
+                size = len(data) if data is not None else len((message.get("text") or "").encode())
+                if size > WS_MAX_MESSAGE_BYTES:
+                    WS_CLOSED.labels("too_large").inc()
+                    await self.send("error", code="too_large", message=f"frames are limited to {WS_MAX_MESSAGE_BYTES} bytes")
+                    await self.websocket.close(code=CLOSE_TOO_BIG)
+                    return
+                if message.get("bytes") is not None:
+                    await self.on_audio(message["bytes"])
+                    continue
+                try:
+                    await self.handle(parse_client_message(message.get("text") or ""))
+                except ProtocolError as e:
+                    await self.send("error", code="bad_request", message=str(e))
+        finally:
+            for task in (self.running, self.listener):
+                if task is not None and not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+
+    async def handle(self, message):
+        kind = message["type"]
+        if kind == "user":
+            await self.start_turn(message["text"], message.get("id"), "text")
+        elif kind == "cancel":
+            if self.turn_running() and message.get("turn") in (None, self.session.turn):
+                self.running.cancel()
+        elif kind == "configure":
+            self.audio_enabled = message["audio"]
+            await self.send("configured", audio=self.audio_enabled)
+        elif kind == "audio.start":
+            await self.start_mic(message)
+        elif kind == "audio.stop":
+            if self.mic is not None:
+                self.mic.put_nowait(None)
+                self.mic = None
+        elif kind == "ping":
+            await self.send("pong")
+
+    def turn_running(self):
+        return self.running is not None and not self.running.done()
+
+    async def start_turn(self, text, message_id, source):
+        if self.turn_running():
+            await self.send("error", id=message_id, code="busy", message=f"turn {self.session.turn} is still running")
+            return
+        turn = self.session.start_turn(text)
+        await self.send("turn.start", turn=turn, id=message_id, source=source)
+        self.running = asyncio.create_task(run_turn_v2(self.websocket, self.session, turn, text, self.audio_enabled))
+        # A turn in progress is never idle
+        self.connection.turn_started()
+        self.running.add_done_callback(lambda _: self.connection.turn_finished())
+
+    async def start_mic(self, message):
+        if not asr_enabled():
+            await self.send("error", code="unavailable", message="speech input is not configured")
+            return
+        if self.mic is not None:
+            raise ProtocolError("the microphone stream is already open")
+        try:
+            stream = SpeechStream(message.get("sample_rate", 16000), message.get("codec", "pcm16"))
+        except ValueError as e:
+            raise ProtocolError(str(e))
+        except Exception as e:
+            # e.g. the recognizer's model is missing; the session carries on with text input
+            logger.error(f"Speech input unavailable for session {self.session.session_id}: {e}")
+            await self.send("error", code="unavailable", message="speech input is not available")
+            return
+        if self.listener is not None and not self.listener.done():
+            # The previous stream is still finishing; let it deliver its transcript first
+            await self.listener
+        # Audio is capped at MIC_QUEUE_FRAMES in on_audio(); the stop marker must always fit
+        self.mic = asyncio.Queue()
+        self.listener = asyncio.create_task(self.listen(stream, self.mic))
+        await self.send("audio.started", sample_rate=stream.sample_rate, frame_ms=VAD_FRAME_MS)
+
+    async def on_audio(self, data):
+        if self.mic is None:
+            await self.send("error", code="bad_request", message="send audio.start before audio")
+            return
+        if self.mic.qsize() >= MIC_QUEUE_FRAMES:
+            # Recognition can't keep up; dropping audio beats letting the delay grow without bound
+            await self.send("error", code="overloaded", message="speech recognition is behind; audio dropped")
+            return
+        self.mic.put_nowait(data)
+
+    async def listen(self, stream, queue):
+        """Feed one microphone stream through the recognizer, in order, until audio.stop"""
+        while True:
+            # Take everything that queued up while the last batch was recognized: one pool hop per batch
+            batch = [await queue.get()]
+            while batch[-1] is not None and not queue.empty():
+                batch.append(queue.get_nowait())
+            stopped = batch[-1] is None
+            chunks = batch[:-1] if stopped else batch
+            events = []
+            try:
+                if chunks:
+                    events = await feed_async(stream, chunks)
+            except Exception as e:
+                logger.warning(f"Dropped undecodable audio from session {self.session.session_id}: {e}")
+            if stopped:
+                events += await finish_async(stream)
+            for kind, fields in events:
+                if kind == "final":
+                    await self.send("transcript.final", **fields)
+                    if fields["text"]:
+                        await self.start_turn(fields["text"], None, "speech")
+                elif kind == "partial":
+                    await self.send("transcript.partial", **fields)
+                else:
+                    await self.send(kind)
+            if stopped:
+                await self.send("audio.stopped")
+                return
@@ -0,0 +1,80 @@
+import logging
+from datetime import datetime
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from app.models import Appointment, AppointmentSummary, clinic_scope
+
+
+logger = logging.getLogger(__name__)
+
+summary_table = AppointmentSummary.__table__
+appointment_table = Appointment.__table__
+
+
+def count_new_patients(conn, names, clinic_id=None):
+    """Count distinct names with no appointment at the clinic yet; call before inserting them"""
+    names = {name for name in names if name}
+    if not names:
+        return 0
+    existing = conn.execute(
+        select(appointment_table.c.patient_name).where(
+            appointment_table.c.patient_name.in_(names),
+            clinic_scope(appointment_table.c.clinic_id, clinic_id),
+        ).distinct()
+    ).scalars().all()
+    return len(names - set(existing))
+
+
+def update_summary(conn, appointments=0, patients=0, clinic_id=None):
+    """Apply a clinic's counter delta and bump its version inside the caller's transaction.
+
+    If the summary row doesn't exist yet this is a no-op; get_summary() builds
+    it from the table, which by then includes the caller's rows.
+    """
+    conn.execute(
+        update(summary_table).where(clinic_scope(summary_table.c.clinic_id, clinic_id)).values(
+            total_appointments=summary_table.c.total_appointments + appointments,
+            total_patients=summary_table.c.total_patients + patients,
+            version=summary_table.c.version + 1,
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+def _read_summary(conn, clinic_id):
+    row = conn.execute(
+        select(summary_table.c.total_appointments, summary_table.c.total_patients, summary_table.c.version)
+        .where(clinic_scope(summary_table.c.clinic_id, clinic_id))
+    ).first()
+    return tuple(row) if row else None
+
+
+def get_summary(conn, clinic_id=None, attempts=5):
+    """Return a clinic's (total_appointments, total_patients, version), building its row on first use"""
+    for _ in range(attempts):
+        row = _read_summary(conn, clinic_id)
+        if row:
+            return row
+
+        # One aggregate pass to backfill the counters for an existing table
+        total, patients = conn.execute(
+            select(func.count(), func.count(appointment_table.c.patient_name.distinct()))
+            .where(clinic_scope(appointment_table.c.clinic_id, clinic_id))
+        ).one()
+        # The default clinic keeps row 1; other clinics take the next free id
+        row_id = 1 if clinic_id is None else \
+            select(func.coalesce(func.max(summary_table.c.id), 1) + 1).scalar_subquery()
+        try:
+            conn.execute(summary_table.insert().values(
+                id=row_id, clinic_id=clinic_id, total_appointments=total, total_patients=patients, version=1,
+                updated_at=datetime.utcnow(),
+            ))
+            conn.commit()
+        except IntegrityError:
+            # Another request built this clinic's row first, or took the id for another clinic's; look again
+            conn.rollback()
+            continue
+        logger.info(f"Built appointment summary for clinic {clinic_id or 'default'}: "
+                    f"{total} appointments, {patients} patients")
+        return total, patients, 1
+    raise RuntimeError(f"Could not build the appointment summary of clinic {clinic_id or 'default'}")
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.metrics import QUEUE_WAIT_SECONDS, SPEECH_FINAL_SECONDS
+
+try:
+    import webrtcvad
+except ImportError:  # the energy detector below is used instead
+    webrtcvad = None
+
+try:
+    import opuslib
+except ImportError:  # only PCM input is accepted
+    opuslib = None
+
+try:
+    import vosk
+except ImportError:
+    vosk = None
+
+
+logger = logging.getLogger(__name__)
+
+# "vosk" runs a local Kaldi model on the CPU; "stub" hears STUB_ASR_TEXT whatever is said, for load tests
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "vosk").lower()
+VOSK_MODEL_PATH = os.environ.get("VOSK_MODEL_PATH", "./models/vosk-model-small-en-us-0.15")
+ASR_POOL_SIZE = int(os.environ.get("ASR_POOL_SIZE", "4"))
+STUB_ASR_TEXT = os.environ.get("STUB_ASR_TEXT", "I would like to book a cleaning with Dr. Smith on Monday.")
+STUB_ASR_LATENCY_MS = float(os.environ.get("STUB_ASR_LATENCY_MS", "30"))
+
+# Endpointing: an utterance starts after VAD_MIN_SPEECH_MS of speech and ends
+# after ENDPOINT_SILENCE_MS of silence, or at MAX_UTTERANCE_MS
+VAD_BACKEND = os.environ.get("VAD_BACKEND", "webrtc" if webrtcvad is not None else "energy").lower()
+VAD_FRAME_MS = 20
+VAD_MIN_SPEECH_MS = int(os.environ.get("VAD_MIN_SPEECH_MS", "60"))
+ENDPOINT_SILENCE_MS = int(os.environ.get("ENDPOINT_SILENCE_MS", "300"))
+MAX_UTTERANCE_MS = int(os.environ.get("MAX_UTTERANCE_MS", "15000"))
+PRE_ROLL_MS = 200
+PARTIAL_INTERVAL_MS = 200
+
+SAMPLE_RATES = (8000, 16000, 24000, 48000)
+CODECS = ("pcm16",) + (("opus",) if opuslib is not None else ())
+
+
+class EnergyVad:
+    """Frame classifier on RMS energy against an adaptive noise floor.
+
+    Needs no native code. The floor is measured over the first frames of the
+    stream and then tracked while nobody speaks, so a noisy room raises the
+    threshold instead of holding the endpoint open.
+    """
+
+    MIN_RMS = 300.0   # about -40 dBFS
+    RATIO = 3.0       # speech has to be this many times louder than the noise floor
+    CALIBRATION_FRAMES = 5
+
+    def __init__(self, sample_rate):
+        self.noise = 0.0
+        self.calibrating = self.CALIBRATION_FRAMES
+
+    def is_speech(self, frame):
+        samples = array("h", frame)
+        rms = (sum(sample * sample for sample in samples) / max(len(samples), 1)) ** 0.5
+        if self.calibrating:
+            # Clients open the mic before the caller talks; the first 100 ms are the room
+            self.noise += rms / self.CALIBRATION_FRAMES
+            self.calibrating -= 1
+            return False
+        speech = rms > max(self.MIN_RMS, self.noise * self.RATIO)
+        if not speech:
+            # Fall quickly, rise slowly: quiet syllables under the threshold must not drag the floor up
+            self.noise += (0.05 if rms < self.noise else 0.005) * (rms - self.noise)
+        return speech
+
+
+class WebRtcVad:
+    def __init__(self, sample_rate, aggressiveness=2):
+        self.sample_rate = sample_rate
+        self._vad = webrtcvad.Vad(aggressiveness)
+
+    def is_speech(self, frame):
+        return self._vad.is_speech(frame, self.sample_rate)
+
+
+def create_vad(sample_rate):
+    # webrtcvad has no 24 kHz mode
+    if VAD_BACKEND == "webrtc" and webrtcvad is not None and sample_rate != 24000:
+        return WebRtcVad(sample_rate)
+    return EnergyVad(sample_rate)
+
+
+class StubRecognizer:
+    """Stand-in recognizer: "hears" STUB_ASR_TEXT, a word per 250 ms of speech"""
+
+    def __init__(self, sample_rate):
+        self.bytes_per_ms = sample_rate * 2 / 1000
+        self.words = STUB_ASR_TEXT.split()
+        self.received = 0
+
+    def accept(self, pcm):
+        self.received += len(pcm)
+        return " ".join(self.words[:int(self.received / self.bytes_per_ms / 250)])
+
+    def final(self):
+        time.sleep(STUB_ASR_LATENCY_MS / 1000.0)
+        self.received = 0
+        return STUB_ASR_TEXT
+
+
+class VoskRecognizer:
+    """Streaming Kaldi recognizer from the vosk package; the model is loaded once per process"""
+
+    _model = None
+    _model_lock = threading.Lock()
+
+    def __init__(self, sample_rate):
+        self._recognizer = vosk.KaldiRecognizer(self.model(), sample_rate)
+        self._segments = []
+
+    @classmethod
+    def model(cls):
+        with cls._model_lock:
+            if cls._model is None:
+                if vosk is None:
+                    raise RuntimeError("ASR_BACKEND=vosk needs the vosk package")
+                vosk.SetLogLevel(-1)
+                cls._model = vosk.Model(VOSK_MODEL_PATH)
+        return cls._model
+
+    def accept(self, pcm):
+        if self._recognizer.AcceptWaveform(pcm):
+            # Vosk found a pause of its own; keep the segment, our endpointer decides when the turn ends
+            self._segments.append(json.loads(self._recognizer.Result()).get("text", ""))
+            partial = ""
+        else:
+            partial = json.loads(self._recognizer.PartialResult()).get("partial", "")
+        return " ".join(segment for segment in self._segments + [partial] if segment)
+
+    def final(self):
+        last = json.loads(self._recognizer.FinalResult()).get("text", "")
+        text = " ".join(segment for segment in self._segments + [last] if segment)
+        self._segments = []
+        return text
+
+
+RECOGNIZERS = {"stub": StubRecognizer, "vosk": VoskRecognizer}
+
+
+def asr_enabled():
+    """Whether microphone input can be transcribed at all"""
+    return ASR_BACKEND == "stub" or (ASR_BACKEND == "vosk" and vosk is not None)
+
+
+def create_recognizer(sample_rate):
+    return RECOGNIZERS[ASR_BACKEND](sample_rate)
+
+
+class SpeechStream:
+    """Endpointing and recognition for one microphone stream.
+
+    feed() takes raw PCM16 (or Opus packets) as they arrive and returns
+    events: ("speech.start", {}), ("partial", {"text"}) while the caller
+    talks, and ("final", {"text", ...}) once they stop. Not thread-safe; one
+    stream is only ever fed from one place at a time.
+    """
+
+    def __init__(self, sample_rate=16000, codec="pcm16"):
+        if sample_rate not in SAMPLE_RATES:
+            raise ValueError(f"sample_rate must be one of {SAMPLE_RATES}")
+        if codec not in CODECS:
+            raise ValueError(f"codec must be one of {CODECS}")
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * VAD_FRAME_MS // 1000 * 2
+        self._decoder = opuslib.Decoder(sample_rate, 1) if codec == "opus" else None
+        self._vad = create_vad(sample_rate)
+        self._recognizer = create_recognizer(sample_rate)
+        self._pending = b""
+        self._pre_roll = deque(maxlen=PRE_ROLL_MS // VAD_FRAME_MS)
+        self._in_speech = False
+        self._voiced_run = 0
+        self._silence_ms = 0
+        self._utterance_ms = 0
+        self._since_partial_ms = 0
+        self._partial = ""
+        self.last_voiced_at = None
+
+    def feed(self, data):
+        if self._decoder is not None:
+            # One Opus packet per frame; 120 ms is the longest packet Opus allows
+            data = self._decoder.decode(data, self.sample_rate * 120 // 1000)
+        data = self._pending + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        events = []
+        for start in range(0, usable, self.frame_bytes):
+            self._frame(data[start:start + self.frame_bytes], events)
+        return events
+
+    def feed_all(self, chunks):
+        """feed() each chunk in order (one Opus packet per chunk); returns all their events"""
+        events = []
+        for chunk in chunks:
+            events.extend(self.feed(chunk))
+        return events
+
+    def finish(self):
+        """End of input (the client stopped the mic): finalize any utterance in progress"""
+        events = []
+        if self._in_speech:
+            self._end(events)
+        self._pending = b""
+        return events
+
+    def _frame(self, frame, events):
+        voiced = self._vad.is_speech(frame)
+        if voiced:
+            self.last_voiced_at = time.perf_counter()
+        if not self._in_speech:
+            self._pre_roll.append(frame)
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run * VAD_FRAME_MS >= VAD_MIN_SPEECH_MS:
+                self._in_speech = True
+                self._silence_ms = 0
+                self._utterance_ms = len(self._pre_roll) * VAD_FRAME_MS
+                events.append(("speech.start", {}))
+                self._recognize(b"".join(self._pre_roll), events)
+                self._pre_roll.clear()
+            return
+
+        self._utterance_ms += VAD_FRAME_MS
+        self._silence_ms = 0 if voiced else self._silence_ms + VAD_FRAME_MS
+        self._recognize(frame, events)
+        if self._silence_ms >= ENDPOINT_SILENCE_MS or self._utterance_ms >= MAX_UTTERANCE_MS:
+            self._end(events)
+
+    def _recognize(self, pcm, events):
+        partial = self._recognizer.accept(pcm)
+        self._since_partial_ms += len(pcm) // (self.frame_bytes // VAD_FRAME_MS)
+        if partial and partial != self._partial and self._since_partial_ms >= PARTIAL_INTERVAL_MS:
+            self._partial = partial
+            self._since_partial_ms = 0
+            events.append(("partial", {"text": partial}))
+
+    def _end(self, events):
+        text = " ".join(self._recognizer.final().split())
+        speech_ms = self._utterance_ms - self._silence_ms
+        since_speech_end = time.perf_counter() - self.last_voiced_at if self.last_voiced_at else 0.0
+        SPEECH_FINAL_SECONDS.observe(since_speech_end)
+        events.append(("final", {
+            "text": text,
+            "speech_ms": speech_ms,
+            # Wall time from the last voiced frame arriving to the transcript being ready
+            "endpoint_ms": round(since_speech_end * 1000, 1),
+        }))
+        self._in_speech = False
+        self._voiced_run = 0
+        self._silence_ms = 0
+        self._utterance_ms = 0
+        self._since_partial_ms = 0
+        self._partial = ""
+
+
+# Recognition is CPU-bound; keep it off the event loop
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ASR_POOL_SIZE, thread_name_prefix="asr")
+    return _executor
+
+
+def _run_queued(fn, data, submitted):
+    QUEUE_WAIT_SECONDS.labels("asr").observe(time.perf_counter() - submitted)
+    return fn(data) if data is not None else fn()
+
+
+async def feed_async(stream, chunks):
+    """Feed a list of chunks to a stream on the ASR pool; one stream must never be fed concurrently"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _run_queued, stream.feed_all, chunks, time.perf_counter())
+
+
+async def finish_async(stream):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _run_queued, stream.finish, None, time.perf_counter())
+
+
+def warm_up():
+    """Startup phase: load the Vosk model up front; skipped for the stub or without vosk"""
+    if ASR_BACKEND != "vosk":
+        return False
+    if vosk is None:
+        logger.warning("vosk is not installed; speech input is disabled")
+        return False
+    VoskRecognizer.model()
+    return True
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,92 @@
+import logging
+from collections import Counter
+from sqlalchemy import or_
+from sqlmodel import select
+from app.db import get_session
+from app.models import Appointment, clinic_scope
+from app.utils.appointment_stats import count_new_patients, update_summary
+from app.utils.events import appointment_events, appointment_payload
+from app.utils.metrics import DB_WRITE_SECONDS
+from app.utils.tracing import span
+from app.utils.rollups import apply_booking_deltas, booking_key, record_bookings
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("booked", "rescheduled")
+
+
+def create_appointment(appt_data):
+    """Save an appointment synchronously and return it once committed"""
+    appointment = appt_data if isinstance(appt_data, Appointment) else Appointment(**appt_data)
+    with span("db.create_appointment"), DB_WRITE_SECONDS.labels("booking").time(), get_session() as session:
+        new_patients = count_new_patients(session, [appointment.patient_name], appointment.clinic_id)
+        session.add(appointment)
+        session.flush()
+        update_summary(session, appointments=1, patients=new_patients, clinic_id=appointment.clinic_id)
+        record_bookings(session, [appointment_payload(appointment)])
+        session.commit()
+        session.refresh(appointment)
+    appointment_events.publish("appointment.created", {
+        "appointment": appointment_payload(appointment),
+        "new_patient": bool(new_patients),
+        "clinic_id": appointment.clinic_id,
+    })
+    logger.info(f"Appointment booked: id={appointment.id} {appointment.patient_name} {appointment.date} {appointment.time}")
+    return appointment
+
+
+def find_active_appointment(session, phone, date=None, time=None, clinic_id=None):
+    """The caller's booked appointment at a clinic, matched on phone number and optionally its date and time.
+
+    Without a date, the earliest upcoming one is picked.
+    """
+    stmt = select(Appointment).where(
+        Appointment.phone == phone,
+        clinic_scope(Appointment.clinic_id, clinic_id),
+        or_(Appointment.status.is_(None), Appointment.status.in_(ACTIVE_STATUSES)),
+    )
+    if date:
+        stmt = stmt.where(Appointment.date == date)
+    if time:
+        stmt = stmt.where(Appointment.time == time)
+    return session.exec(stmt.order_by(Appointment.date, Appointment.time).limit(1)).first()
+
+
+def _update_appointment(phone, date, time, changes, operation, clinic_id=None):
+    """Apply changes to the caller's appointment and keep the rollups and live views in step.
+
+    Returns the updated appointment, or None when no matching booking exists.
+    """
+    with span(f"db.{operation}_appointment"), DB_WRITE_SECONDS.labels(operation).time(), get_session() as session:
+        appointment = find_active_appointment(session, phone, date, time, clinic_id)
+        if appointment is None:
+            return None
+        deltas = Counter({booking_key(appointment_payload(appointment)): -1})
+        for key, value in changes.items():
+            setattr(appointment, key, value)
+        if appointment.status != "cancelled":
+            deltas[booking_key(appointment_payload(appointment))] += 1
+        session.add(appointment)
+        update_summary(session, clinic_id=clinic_id)
+        apply_booking_deltas(session, deltas)
+        session.commit()
+        session.refresh(appointment)
+    appointment_events.publish("appointment.updated", {"appointment": appointment_payload(appointment),
+                                                       "clinic_id": clinic_id})
+    logger.info(f"Appointment {appointment.status}: id={appointment.id} {appointment.patient_name} "
+                f"{appointment.date} {appointment.time}")
+    return appointment
+
+
+def reschedule_appointment(phone, new_date, new_time, date=None, time=None, doctor_name=None, clinic_id=None):
+    """Move the caller's appointment to a new slot"""
+    changes = {"date": new_date, "time": new_time, "status": "rescheduled"}
+    if doctor_name:
+        changes["doctor_name"] = doctor_name
+    return _update_appointment(phone, date, time, changes, "reschedule", clinic_id)
+
+
+def cancel_appointment(phone, date=None, time=None, clinic_id=None):
+    """Cancel the caller's appointment; the row is kept with status "cancelled" """
+    return _update_appointment(phone, date, time, {"status": "cancelled"}, "cancel", clinic_id)
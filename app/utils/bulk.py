@@ -0,0 +1,261 @@
+import csv
+import io
+import json
+import time
+import logging
+from itertools import groupby
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import insert, select
+from app.db import engine
+from app.models import Appointment, Clinic, clinic_scope
+from app.utils.appointment_stats import count_new_patients, update_summary
+from app.utils.events import appointment_events
+from app.utils.rollups import record_bookings
+from app.utils.tenants import DEFAULT_CLINIC
+
+
+logger = logging.getLogger(__name__)
+
+# Columns accepted on import and written on export, in file order; clinic_id is DEFAULT_CLINIC
+# for the default clinic's rows, and rows imported without one go to the import's clinic
+APPOINTMENT_FIELDS = ["patient_name", "phone", "date", "time", "purpose", "urgency_level", "doctor_name"]
+EXPORT_FIELDS = ["id"] + APPOINTMENT_FIELDS + ["status", "clinic_id", "created_at"]
+REQUIRED_FIELDS = ("patient_name", "phone", "date", "time")
+URGENCY_LEVELS = ("low", "medium", "high")
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+
+def iter_csv_records(lines):
+    """Yield (line_number, record) pairs from CSV text lines with a header row"""
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def iter_ndjson_records(lines):
+    """Yield (line_number, record) pairs from newline-delimited JSON text"""
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"invalid JSON: {e}")
+
+
+def iter_records(lines, fmt):
+    """Pick the record reader for an import format"""
+    if fmt == "csv":
+        return iter_csv_records(lines)
+    if fmt == "ndjson":
+        return iter_ndjson_records(lines)
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def guess_format(filename, default="csv"):
+    """Guess the bulk format from a file name"""
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def known_clinics():
+    """Ids of every clinic besides the default one"""
+    with engine.connect() as conn:
+        return set(conn.execute(select(Clinic.__table__.c.id)).scalars())
+
+
+def validate_record(record, created_at, clinic_id=None, clinics=()):
+    """Validate one raw record and return an insertable row, or raise ValueError.
+
+    A record's own clinic_id must be DEFAULT_CLINIC or one of `clinics`; without
+    one the row goes to `clinic_id`.
+    """
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+
+    row = {}
+    for field in APPOINTMENT_FIELDS:
+        value = record.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        row[field] = value if value not in ("", None) else None
+
+    missing = [field for field in REQUIRED_FIELDS if not row[field]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    try:
+        datetime.strptime(row["date"], "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError(f"bad date {row['date']!r}, expected YYYY-MM-DD")
+    try:
+        datetime.strptime(row["time"], "%H:%M")
+    except (TypeError, ValueError):
+        raise ValueError(f"bad time {row['time']!r}, expected HH:MM")
+
+    urgency = (row["urgency_level"] or "low").lower()
+    if urgency not in URGENCY_LEVELS:
+        raise ValueError(f"bad urgency_level {row['urgency_level']!r}")
+    row["urgency_level"] = urgency
+
+    clinic = record.get("clinic_id")
+    clinic = clinic.strip() if isinstance(clinic, str) else clinic
+    if clinic in ("", None):
+        clinic = clinic_id
+    elif clinic == DEFAULT_CLINIC:
+        clinic = None
+    elif clinic not in clinics:
+        raise ValueError(f"unknown clinic_id {clinic!r}")
+    row["clinic_id"] = clinic
+    row["status"] = "booked"
+    row["created_at"] = created_at
+    return row
+
+
+def _clinic_key(row):
+    return row["clinic_id"] or ""
+
+
+def _insert_chunk(rows):
+    """Insert one chunk with a single executemany in its own transaction"""
+    with engine.begin() as conn:
+        # Patients and summary counters are per clinic
+        by_clinic = [list(group) for _, group in groupby(sorted(rows, key=_clinic_key), key=_clinic_key)]
+        new_patients = [count_new_patients(conn, [row["patient_name"] for row in group], group[0]["clinic_id"])
+                        for group in by_clinic]
+        conn.execute(insert(Appointment.__table__), rows)
+        for group, patients in zip(by_clinic, new_patients):
+            update_summary(conn, appointments=len(group), patients=patients, clinic_id=group[0]["clinic_id"])
+        record_bookings(conn, rows)
+
+
+def import_appointments(records, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, clinic_id=None):
+    """Validate records as they stream in and insert them in chunked transactions.
+
+    Invalid records are skipped and reported; valid ones are committed one
+    chunk at a time so a bad row never rolls back rows around it. Records
+    without a clinic_id go to `clinic_id` (None for the default clinic).
+    """
+    started = time.perf_counter()
+    created_at = datetime.utcnow()
+    clinics = known_clinics()
+    if clinic_id is not None and clinic_id not in clinics:
+        raise ValueError(f"unknown clinic {clinic_id!r}")
+    imported = 0
+    rejected = 0
+    errors = []
+    chunk = []
+    per_clinic = Counter()
+
+    for line_number, record in records:
+        try:
+            chunk.append(validate_record(record, created_at, clinic_id, clinics))
+        except ValueError as e:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": line_number, "error": str(e)})
+            continue
+
+        if len(chunk) >= chunk_size:
+            if not dry_run:
+                _insert_chunk(chunk)
+            imported += len(chunk)
+            per_clinic.update(row["clinic_id"] for row in chunk)
+            chunk = []
+
+    if chunk:
+        if not dry_run:
+            _insert_chunk(chunk)
+        imported += len(chunk)
+        per_clinic.update(row["clinic_id"] for row in chunk)
+
+    if not dry_run:
+        # Too many rows to patch in place; the live views of each clinic imported into reload instead
+        for clinic, count in per_clinic.items():
+            appointment_events.publish("resync", {"reason": "bulk_import", "imported": count, "clinic_id": clinic})
+
+    elapsed = time.perf_counter() - started
+    rows_per_second = round(imported / elapsed, 1) if elapsed > 0 else 0.0
+    logger.info(f"Bulk import: {imported} rows imported, {rejected} rejected in {elapsed:.2f}s ({rows_per_second} rows/s)")
+    return {
+        "imported": imported,
+        "rejected": rejected,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": rows_per_second,
+        "dry_run": dry_run,
+    }
+
+
+def _iter_appointment_batches(batch_size, clinic_id=None):
+    """Yield appointment rows in id order using keyset pagination, of one clinic or all of them"""
+    table = Appointment.__table__
+    columns = [table.c[field] for field in EXPORT_FIELDS]
+    last_id = 0
+    with engine.connect() as conn:
+        while True:
+            stmt = select(*columns).where(table.c.id > last_id)
+            if clinic_id is not None:
+                stmt = stmt.where(clinic_scope(table.c.clinic_id, None if clinic_id == DEFAULT_CLINIC else clinic_id))
+            stmt = stmt.order_by(table.c.id).limit(batch_size)
+            rows = conn.execute(stmt).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+
+def _format_value(field, value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if field == "clinic_id" and value is None:
+        return DEFAULT_CLINIC
+    return value
+
+
+def export_appointments(fmt="csv", batch_size=DEFAULT_CHUNK_SIZE, clinic_id=None):
+    """Stream appointments as CSV or NDJSON text chunks, one chunk per batch.
+
+    `clinic_id` limits the export to one clinic (DEFAULT_CLINIC for the default
+    one); without it every clinic's appointments are exported.
+    """
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    started = time.perf_counter()
+    exported = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+
+    try:
+        for rows in _iter_appointment_batches(batch_size, clinic_id):
+            for row in rows:
+                values = [_format_value(field, value) for field, value in zip(EXPORT_FIELDS, row)]
+                if writer:
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, values))))
+                    buffer.write("\n")
+            exported += len(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        elapsed = time.perf_counter() - started
+        rows_per_second = round(exported / elapsed, 1) if elapsed > 0 else 0.0
+        logger.info(f"Bulk export: {exported} rows in {elapsed:.2f}s ({rows_per_second} rows/s)")
@@ -0,0 +1,108 @@
+import logging
+from datetime import datetime
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app.db import engine
+from app.models import CallNote, ConversationEvent
+from app.utils.write_behind import write_behind
+from app.utils.transcript_store import transcript_store
+from app.utils.rollups import record_call_booked, record_calls
+
+
+logger = logging.getLogger(__name__)
+
+
+def record_turn_event(session_id, channel, turn, role, text, latency_ms=None):
+    """Queue one conversation turn event for a background group commit"""
+    write_behind.enqueue(ConversationEvent, {
+        "session_id": session_id,
+        "channel": channel,
+        "turn": turn,
+        "role": role,
+        "text": text,
+        "latency_ms": latency_ms,
+        "created_at": datetime.utcnow(),
+    })
+
+
+def call_transcript(conn, session_id):
+    """The whole conversation of a call or web session, from its turn events"""
+    events = ConversationEvent.__table__
+    rows = conn.execute(select(events.c.role, events.c.text).where(events.c.session_id == session_id)
+                        .order_by(events.c.turn, events.c.id)).all()
+    return format_transcript(rows)
+
+
+def _stored_transcript(note):
+    if note["transcript_ref"]:
+        return transcript_store.read(note["transcript_ref"])
+    return note["raw_transcript"]
+
+
+def _write_call(session_id, channel, clinic_id, slots):
+    note = CallNote.__table__
+    with engine.begin() as conn:
+        transcript = call_transcript(conn, session_id)
+        existing = conn.execute(select(note).where(note.c.session_id == session_id)).mappings().first()
+        if existing is None:
+            row = {
+                "session_id": session_id,
+                "appointment_id": slots.get("appointment_id"),
+                "bangla_text": slots.get("bangla_notes") or "",
+                "english_text": slots.get("english_notes") or "",
+                "raw_transcript": None,
+                "transcript_ref": transcript_store.append(transcript) if transcript else None,
+                "channel": channel,
+                "clinic_id": clinic_id,
+                "created_at": datetime.utcnow(),
+            }
+            conn.execute(insert(note), row)
+            # The call counts once in the analytics rollup, in the same transaction
+            record_calls(conn, [row])
+            return
+
+        # Logged before: keep what is known and add what this part of the session brought
+        changes = {}
+        if slots.get("appointment_id"):
+            changes["appointment_id"] = slots["appointment_id"]
+        if slots.get("english_notes"):
+            changes["english_text"] = slots["english_notes"]
+        if slots.get("bangla_notes"):
+            changes["bangla_text"] = slots["bangla_notes"]
+        if transcript and transcript != _stored_transcript(existing):
+            changes["transcript_ref"] = transcript_store.append(transcript)
+            changes["raw_transcript"] = None
+        if changes:
+            conn.execute(update(note).where(note.c.id == existing["id"]).values(changes))
+        if slots.get("appointment_id") and not existing["appointment_id"]:
+            # The call was rolled up when first logged; now it counts as booked too
+            record_call_booked(conn, existing)
+
+
+def record_call(session_id, channel, clinic_id=None, slots=None):
+    """Write the call note of a call or web session that ended. Blocking; run it off the event loop.
+
+    Each session id has one note, holding the whole conversation from its
+    turn events plus the summaries and booking from its slots, whether or
+    not anything was booked. Logging a session again (a resumed web
+    session, a repeated Twilio callback) updates that note.
+    """
+    # This worker's turn events may still be queued; other workers' were written while the caller listened
+    write_behind.flush()
+    for attempt in range(2):
+        try:
+            _write_call(session_id, channel, clinic_id, slots or {})
+            return
+        except IntegrityError as e:
+            # Another worker logged the same session first; the retry updates its note instead
+            if attempt:
+                logger.error(f"Could not log {channel} session {session_id}: {e}")
+        except Exception as e:
+            logger.error(f"Could not log {channel} session {session_id}: {e}")
+            return
+
+
+def format_transcript(turns):
+    """Render (role, text) pairs as a plain-text transcript"""
+    labels = {"user": "Caller", "model": "AI"}
+    return "\n".join(f"{labels.get(role, role)}: {text}" for role, text in turns)
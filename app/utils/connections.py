@@ -0,0 +1,173 @@
+import os
+import time
+import asyncio
+import logging
+import ipaddress
+from app.utils.metrics import OPEN_WEBSOCKETS, SESSION_MEMORY_BYTES, WS_CLOSED
+
+
+logger = logging.getLogger(__name__)
+
+# Limits for /ws/ai, per worker. Idle means no frame from the client and no
+# turn running; the session lifetime is counted from the handshake.
+WS_MAX_CONNECTIONS = int(os.environ.get("WS_MAX_CONNECTIONS", "500"))
+WS_MAX_CONNECTIONS_PER_IP = int(os.environ.get("WS_MAX_CONNECTIONS_PER_IP", "20"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.environ.get("WS_IDLE_TIMEOUT_SECONDS", "300"))
+WS_MAX_SESSION_SECONDS = float(os.environ.get("WS_MAX_SESSION_SECONDS", "3600"))
+# Largest client frame: text frames and microphone audio frames (20 ms of PCM16 is well under 1 KB)
+WS_MAX_MESSAGE_BYTES = int(os.environ.get("WS_MAX_MESSAGE_BYTES", str(64 * 1024)))
+WS_REAP_INTERVAL = float(os.environ.get("WS_REAP_INTERVAL", "10"))
+# How long a reaped socket gets for the close handshake before its handler is cancelled
+WS_CLOSE_TIMEOUT = 5.0
+
+# Proxies (addresses or CIDR ranges, comma-separated) whose X-Forwarded-For hops are believed
+TRUSTED_PROXIES = [ipaddress.ip_network(value.strip(), strict=False)
+                   for value in os.environ.get("TRUSTED_PROXIES", "").split(",") if value.strip()]
+
+# Close codes: 1001 going away (reaped), 1009 message too big, 1013 try again later
+CLOSE_REAPED = 1001
+CLOSE_TOO_BIG = 1009
+CLOSE_TRY_LATER = 1013
+
+
+def _trusted(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_ip(websocket):
+    """The caller's address, for the per-IP cap.
+
+    X-Forwarded-For is only read when the peer is a trusted proxy, and then
+    from the right: the first hop no trusted proxy vouches for is the
+    client. Hops to its left are whatever the client sent.
+    """
+    peer = websocket.client.host if websocket.client else "unknown"
+    if not _trusted(peer):
+        return peer
+    hops = [hop.strip() for hop in websocket.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+class Connection:
+    """One open /ws/ai socket as the reaper sees it"""
+
+    def __init__(self, websocket, ip):
+        self.websocket = websocket
+        self.ip = ip
+        self.task = asyncio.current_task()
+        self.opened = self.last_active = time.monotonic()
+        self.session = None
+        self.busy = 0
+        self.reaped = None
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def turn_started(self):
+        self.busy += 1
+        self.touch()
+
+    def turn_finished(self):
+        self.busy -= 1
+        self.touch()
+
+
+class ConnectionRegistry:
+    """Caps and tracks open /ws/ai sockets and closes the stale ones.
+
+    The reaper runs every WS_REAP_INTERVAL seconds. A connection is stale
+    when it has been idle longer than WS_IDLE_TIMEOUT_SECONDS or open longer
+    than WS_MAX_SESSION_SECONDS. It is closed with code 1001; if the close
+    handshake doesn't finish (a half-open socket), its handler is cancelled
+    so the session's state is released either way.
+    """
+
+    def __init__(self, max_connections=WS_MAX_CONNECTIONS, max_per_ip=WS_MAX_CONNECTIONS_PER_IP):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.open = set()
+        self.per_ip = {}
+        self.memory = {"total": 0, "max": 0}
+        OPEN_WEBSOCKETS.set_function(lambda: len(self.open))
+        SESSION_MEMORY_BYTES.labels("total").set_function(lambda: self.memory["total"])
+        SESSION_MEMORY_BYTES.labels("max").set_function(lambda: self.memory["max"])
+
+    def admit(self, websocket):
+        """Register a new socket; returns its Connection, or None when a cap is reached"""
+        ip = client_ip(websocket)
+        if len(self.open) >= self.max_connections:
+            WS_CLOSED.labels("capacity").inc()
+            logger.warning(f"Refused a WebSocket from {ip}: {len(self.open)} connections open")
+            return None
+        if self.per_ip.get(ip, 0) >= self.max_per_ip:
+            WS_CLOSED.labels("per_ip").inc()
+            logger.warning(f"Refused a WebSocket from {ip}: {self.per_ip[ip]} connections from that address")
+            return None
+        connection = Connection(websocket, ip)
+        self.open.add(connection)
+        self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+        return connection
+
+    def release(self, connection):
+        if connection not in self.open:
+            return
+        self.open.discard(connection)
+        remaining = self.per_ip[connection.ip] - 1
+        if remaining:
+            self.per_ip[connection.ip] = remaining
+        else:
+            del self.per_ip[connection.ip]
+
+    def stale(self, now=None):
+        """(connection, reason) for every connection due to be closed"""
+        now = time.monotonic() if now is None else now
+        due = []
+        for connection in self.open:
+            if connection.reaped:
+                continue
+            if now - connection.opened > WS_MAX_SESSION_SECONDS:
+                due.append((connection, "lifetime"))
+            elif not connection.busy and now - connection.last_active > WS_IDLE_TIMEOUT_SECONDS:
+                due.append((connection, "idle"))
+        return due
+
+    def measure(self):
+        """Estimated bytes each open session holds; exported as session_memory_bytes"""
+        sizes = [connection.session.memory_bytes() for connection in self.open if connection.session is not None]
+        self.memory = {"total": sum(sizes), "max": max(sizes, default=0)}
+
+    async def close(self, connection, reason):
+        connection.reaped = reason
+        WS_CLOSED.labels(reason).inc()
+        logger.info(f"Closing {reason} WebSocket session from {connection.ip} "
+                    f"(open {time.monotonic() - connection.opened:.0f}s)")
+        try:
+            await asyncio.wait_for(connection.websocket.close(code=CLOSE_REAPED, reason=reason), WS_CLOSE_TIMEOUT)
+        except Exception:
+            pass  # already closing, or the peer is gone
+        if connection.task is not None and not connection.task.done():
+            # Give the handler a moment to see the disconnect before forcing it
+            await asyncio.wait([connection.task], timeout=WS_CLOSE_TIMEOUT)
+            if not connection.task.done():
+                connection.task.cancel()
+
+    async def reap(self, interval=WS_REAP_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                due = self.stale()
+                if due:
+                    await asyncio.gather(*(self.close(connection, reason) for connection, reason in due))
+                self.measure()
+            except Exception as e:
+                logger.error(f"WebSocket reaper failed: {e}")
+
+
+connections = ConnectionRegistry()
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from app.db import get_session
+from app.models import CacheVersion, Clinic, Doctor, clinic_scope
+from app.utils.ai_prompt import RECEPTIONIST_RULES, SYSTEM_PROMPT
+
+
+logger = logging.getLogger(__name__)
+
+DOCTOR_CACHE_TTL = float(os.environ.get("DOCTOR_CACHE_TTL", "300"))
+DOCTOR_CACHE_CHECK_INTERVAL = float(os.environ.get("DOCTOR_CACHE_CHECK_INTERVAL", "1"))
+
+# Where relative dates ("tomorrow", "next Monday") are resolved, unless a clinic sets its own
+CLINIC_TIMEZONE = os.environ.get("CLINIC_TIMEZONE", "America/New_York")
+
+CACHE_NAME = "doctors"
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def parse_availability(availability):
+    """Parse a doctor's availability JSON into {weekday: [(start_minute, end_minute)]}"""
+    try:
+        schedule = json.loads(availability) if availability else {}
+    except ValueError:
+        logger.warning(f"Unparseable doctor availability: {availability!r}")
+        schedule = {}
+
+    parsed = {}
+    for day in WEEKDAYS:
+        ranges = []
+        for window in schedule.get(day, []):
+            try:
+                start, end = window.split("-")
+                start_hour, start_minute = (int(part) for part in start.split(":"))
+                end_hour, end_minute = (int(part) for part in end.split(":"))
+                ranges.append((start_hour * 60 + start_minute, end_hour * 60 + end_minute))
+            except ValueError:
+                logger.warning(f"Skipping bad availability window {window!r}")
+        parsed[day] = tuple(ranges)
+    return parsed
+
+
+def format_doctor_info(doctors):
+    """Format doctor information for the AI prompt"""
+    if not doctors:
+        return "No doctors available at the moment."
+    
+    doctor_info = "Available Doctors:\n"
+    for doctor in doctors:
+        doctor_info += f"- {doctor['name']}: {doctor['specialty']}\n"
+    return doctor_info
+
+
+def get_doctor_info_json(doctors):
+    """Get doctor information as JSON for frontend"""
+    return json.dumps([{"name": doctor["name"], "specialty": doctor["specialty"]} for doctor in doctors])
+
+
+def clinic_prompt(clinic_id, clinic):
+    """The system prompt before the doctor list: the default clinic's, or a tenant's own"""
+    if clinic_id is None:
+        return SYSTEM_PROMPT
+    rules = clinic.prompt if clinic is not None and clinic.prompt else RECEPTIONIST_RULES
+    return f"{rules}\nYou are answering for {clinic.name if clinic is not None else clinic_id}.\n"
+
+
+def cache_name(clinic_id):
+    """CacheVersion row bumped when a clinic's doctors or settings change"""
+    return CACHE_NAME if clinic_id is None else f"{CACHE_NAME}:{clinic_id}"
+
+
+class DoctorSnapshot:
+    """Immutable view of the doctor table plus everything derived from it"""
+
+    def __init__(self, doctors, version, loaded_at, prompt=SYSTEM_PROMPT, timezone=CLINIC_TIMEZONE):
+        self.version = version
+        self.loaded_at = loaded_at
+        self.timezone = timezone
+        self.doctors = tuple(doctors)
+        self.by_name = {doctor["name"].lower(): doctor for doctor in self.doctors}
+        # Weekday -> doctor name -> available minute ranges
+        self.slot_index = {
+            day: {doctor["name"]: doctor["availability"][day] for doctor in self.doctors if doctor["availability"][day]}
+            for day in WEEKDAYS
+        }
+        self.doctor_info = format_doctor_info(self.doctors)
+        self.doctor_info_json = get_doctor_info_json(self.doctors)
+        self.system_prompt = prompt + f"\n\nCurrent Doctor Information:\n{self.doctor_info}"
+
+    def find(self, name):
+        """Look up a doctor by name, with or without the "Dr." prefix"""
+        if not name:
+            return None
+        key = name.strip().lower()
+        return self.by_name.get(key) or self.by_name.get(f"dr. {key}")
+
+    def is_available(self, doctor_name, date, time_str):
+        """Check whether a doctor works at a YYYY-MM-DD date and HH:MM time"""
+        doctor = self.find(doctor_name)
+        if not doctor:
+            return False
+        day = WEEKDAYS[datetime.strptime(date, "%Y-%m-%d").weekday()]
+        hour, minute = (int(part) for part in time_str.split(":"))
+        minute_of_day = hour * 60 + minute
+        return any(start <= minute_of_day < end for start, end in doctor["availability"][day])
+
+
+def read_cache_version(session, name=CACHE_NAME):
+    row = session.get(CacheVersion, name)
+    return row.version if row else 0
+
+
+def lock_cache_version(session, name=CACHE_NAME):
+    """Hold a reference-data version row until the caller's transaction ends.
+
+    Writers that take it first run one at a time, across workers and hosts:
+    PostgreSQL queues them on the row lock, SQLite on its write lock.
+    """
+    table = CacheVersion.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        session.execute(insert(table).values(name=name, version=0, updated_at=datetime.utcnow())
+                        .on_conflict_do_nothing(index_elements=["name"]))
+    elif session.get(CacheVersion, name) is None:
+        session.add(CacheVersion(name=name, version=0))
+        session.flush()
+    session.execute(update(table).where(table.c.name == name).values(version=table.c.version))
+
+
+def bump_cache_version(session, name=CACHE_NAME):
+    """Bump a reference-data version inside the caller's transaction"""
+    row = session.get(CacheVersion, name) or CacheVersion(name=name, version=0)
+    row.version += 1
+    row.updated_at = datetime.utcnow()
+    session.add(row)
+    return row.version
+
+
+class DoctorCache:
+    """Process-wide doctor cache for one clinic, shared by every route.
+
+    Writers bump the clinic's row in CacheVersion ("doctors" for the default
+    clinic); every worker polls that row at most once per check interval and
+    reloads when it changed, with a TTL as a fallback. A failed reload keeps
+    serving the previous snapshot and is retried on the next request instead
+    of being cached.
+    """
+
+    def __init__(self, clinic_id=None, ttl=DOCTOR_CACHE_TTL, check_interval=DOCTOR_CACHE_CHECK_INTERVAL):
+        self.clinic_id = clinic_id
+        self.cache_name = cache_name(clinic_id)
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with get_session() as session:
+            version = read_cache_version(session, self.cache_name)
+            clinic = session.get(Clinic, self.clinic_id) if self.clinic_id is not None else None
+            rows = session.exec(select(Doctor).where(clinic_scope(Doctor.clinic_id, self.clinic_id))
+                                .order_by(Doctor.id)).all()
+            doctors = [
+                {
+                    "id": row.id,
+                    "name": row.name,
+                    "specialty": row.specialty,
+                    "availability": parse_availability(row.availability),
+                }
+                for row in rows
+            ]
+            prompt = clinic_prompt(self.clinic_id, clinic)
+            timezone = clinic.timezone if clinic is not None and clinic.timezone else CLINIC_TIMEZONE
+        logger.info(f"Loaded {len(doctors)} doctors{f' of {self.clinic_id}' if self.clinic_id else ''} "
+                    f"into cache (version {version})")
+        return DoctorSnapshot(doctors, version, time.monotonic(), prompt, timezone)
+
+    def get(self):
+        """Return the current snapshot, reloading it if stale"""
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot and now - snapshot.loaded_at < self.ttl and now - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            now = time.monotonic()
+            try:
+                if snapshot and now - snapshot.loaded_at < self.ttl:
+                    if now - self._checked_at < self.check_interval:
+                        return snapshot
+                    with get_session() as session:
+                        version = read_cache_version(session, self.cache_name)
+                    self._checked_at = now
+                    if version == snapshot.version:
+                        return snapshot
+                self._snapshot = self._load()
+                self._checked_at = now
+                return self._snapshot
+            except Exception as e:
+                logger.error(f"Error refreshing doctor cache: {e}")
+                return snapshot or DoctorSnapshot([], -1, now, clinic_prompt(self.clinic_id, None))
+
+    def invalidate(self):
+        """Drop this worker's snapshot so the next get() reloads it"""
+        with self._lock:
+            self._snapshot = None
+
+
+doctor_cache = DoctorCache()
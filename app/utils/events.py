@@ -0,0 +1,278 @@
+import os
+import json
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from app.utils.redis_protocol import RedisConnection, RedisError
+
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 256
+REPLAY_BUFFER_SIZE = 512
+
+# "redis" relays events through Redis pub/sub so every worker's dashboards see
+# every change; "local" keeps them in the worker that made the change
+EVENT_BUS = os.environ.get(
+    "EVENT_BUS", "redis" if os.environ.get("SESSION_STORE", "").lower() == "redis" else "local").lower()
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+RELAY_RETRY_SECONDS = 1.0
+
+
+class Event:
+    """One published event; derived encodings are computed once and shared by all subscribers"""
+
+    __slots__ = ("id", "type", "data", "cache")
+
+    def __init__(self, event_id, event_type, data):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+        self.cache = {}
+
+    def encoded(self, key, encoder):
+        """Return encoder(self), computed on first use for this key"""
+        value = self.cache.get(key)
+        if value is None:
+            value = self.cache[key] = encoder(self)
+        return value
+
+
+class Subscription:
+    def __init__(self, bus, maxsize, match=None):
+        self.bus = bus
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.match = match
+        self.overflowed = False
+
+    def wants(self, event):
+        return self.match is None or self.match(event)
+
+    async def get(self, timeout=None):
+        """Wait for the next event; returns None on timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class RedisRelay:
+    """Carries a bus's events between workers through Redis pub/sub.
+
+    publish() hands events to a background thread, which numbers them from
+    one Redis counter and publishes them. A listener thread in every worker,
+    the publishing one included, feeds them into its own bus, so event ids
+    are the same everywhere and Last-Event-ID replay works on whichever
+    worker a dashboard reconnects to. An event that can't be relayed, or
+    that may have been missed while the listener reconnected, becomes a
+    "resync" for this worker's subscribers.
+    """
+
+    CHANNEL = "receptionist:events"
+    COUNTER = "receptionist:events:id"
+
+    def __init__(self, url=REDIS_URL):
+        self.url = url
+        self.bus = None
+        self.running = False
+        self._outbox = queue.SimpleQueue()
+        self._listener = None
+
+    def start(self, bus):
+        self.bus = bus
+        self.running = True
+        threading.Thread(target=self._publish_loop, name="events-publish", daemon=True).start()
+        threading.Thread(target=self._listen_loop, name="events-listen", daemon=True).start()
+        logger.info(f"Relaying appointment events through Redis at {self.url.rsplit('@', 1)[-1]}")
+
+    def stop(self):
+        self.running = False
+        self._outbox.put(None)
+        if self._listener is not None:
+            self._listener.close()
+
+    def send(self, event_type, data):
+        self._outbox.put((event_type, data))
+
+    def _publish_loop(self):
+        conn = RedisConnection(self.url)
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                break
+            event_type, data = item
+            try:
+                event_id = conn.execute("INCR", self.COUNTER)
+                conn.execute("PUBLISH", self.CHANNEL, json.dumps({"id": event_id, "type": event_type, "data": data}))
+            except (OSError, ConnectionError, RedisError) as e:
+                logger.error(f"Could not relay a {event_type} event: {e}")
+                self.bus.resync_local()
+        conn.close()
+
+    def _listen_loop(self):
+        subscribed_before = False
+        while self.running:
+            conn = self._listener = RedisConnection(self.url)
+            try:
+                if subscribed_before:
+                    # Whatever was published while we were away is lost to this worker
+                    self.bus.resync_local()
+                subscribed_before = True
+                for _, payload in conn.subscribe(self.CHANNEL):
+                    message = json.loads(payload)
+                    self.bus.deliver(Event(message["id"], message["type"], message["data"]))
+            except (OSError, ConnectionError, RedisError, ValueError) as e:
+                if self.running:
+                    logger.warning(f"Event relay subscription lost: {e}; reconnecting")
+            finally:
+                conn.close()
+            if self.running:
+                threading.Event().wait(RELAY_RETRY_SECONDS)
+
+
+class EventBus:
+    """In-process pub/sub for appointment changes.
+
+    publish() may be called from the event loop or from worker threads; fan-out
+    always happens on the loop. Each subscriber has a bounded queue, and a
+    subscriber that falls behind is sent a single "resync" event instead of
+    slowing publishers down. Recent events are kept for Last-Event-ID replay.
+    A subscriber may pass a `match` predicate to only be sent some events.
+    With a relay, started by start(), events go through it to every worker.
+    """
+
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE, replay_size=REPLAY_BUFFER_SIZE, relay=None):
+        self.queue_size = queue_size
+        self.relay = relay
+        self._subscribers = set()
+        self._recent = deque(maxlen=replay_size)
+        self._next_id = 1
+        self._id_lock = threading.Lock()
+        self._loop = None
+        self.stats = {"published": 0, "delivered": 0, "overflows": 0}
+
+    def start(self):
+        """Startup: bind to the running loop and start the relay, if any"""
+        self._loop = asyncio.get_running_loop()
+        if self.relay is not None:
+            self.relay.start(self)
+
+    def stop(self):
+        if self.relay is not None:
+            self.relay.stop()
+
+    def subscribe(self, match=None):
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self, self.queue_size, match)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    @property
+    def last_id(self):
+        return self._next_id - 1
+
+    def replay_since(self, last_id):
+        """Events after last_id, or None if some of them are no longer buffered"""
+        if last_id >= self.last_id:
+            return []
+        if not self._recent or self._recent[0].id > last_id + 1:
+            return None
+        return [event for event in self._recent if event.id > last_id]
+
+    def publish(self, event_type, data):
+        """Publish an event; `data` must be JSON-serializable. Returns it, or None when it goes through the relay"""
+        self.stats["published"] += 1
+        if self.relay is not None and self.relay.running:
+            self.relay.send(event_type, data)
+            return None
+        with self._id_lock:
+            event = Event(self._next_id, event_type, data)
+            self._next_id += 1
+        return self.deliver(event)
+
+    def resync_local(self):
+        """Tell this worker's subscribers to reload"""
+        self.deliver(Event(self.last_id, "resync", {}))
+
+    def deliver(self, event):
+        """Hand an event to this worker's subscribers, from any thread"""
+        with self._id_lock:
+            # Relayed events are numbered by Redis
+            self._next_id = max(self._next_id, event.id + 1)
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # Nobody has subscribed yet; keep the event for replay only
+            self._recent.append(event)
+            return event
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fan_out(event)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, event)
+        return event
+
+    def _fan_out(self, event):
+        self._recent.append(event)
+        for subscription in list(self._subscribers):
+            if subscription.overflowed or not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+                self.stats["delivered"] += 1
+            except asyncio.QueueFull:
+                # Too far behind to patch incrementally; tell it to reload
+                subscription.overflowed = True
+                self.stats["overflows"] += 1
+                subscription.queue.get_nowait()
+                subscription.queue.put_nowait(Event(event.id, "resync", {}))
+
+
+appointment_events = EventBus(relay=RedisRelay() if EVENT_BUS == "redis" else None)
+if EVENT_BUS != "redis" and int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+    logger.warning("EVENT_BUS=local with several workers: dashboards only see the changes made by their own "
+                   "worker. Use EVENT_BUS=redis.")
+
+
+def for_clinic(clinic_id):
+    """Event filter for one clinic's views; events that carry no clinic_id concern every clinic"""
+    return lambda event: event.data.get("clinic_id", clinic_id) == clinic_id
+
+
+def appointment_payload(appointment):
+    """Plain-dict view of an Appointment for event payloads"""
+    data = {
+        "id": appointment.id,
+        "patient_name": appointment.patient_name,
+        "phone": appointment.phone,
+        "date": appointment.date,
+        "time": appointment.time,
+        "purpose": appointment.purpose,
+        "urgency_level": appointment.urgency_level,
+        "doctor_name": appointment.doctor_name,
+        "status": appointment.status,
+        "clinic_id": appointment.clinic_id,
+        "created_at": appointment.created_at,
+    }
+    if isinstance(data["created_at"], datetime):
+        data["created_at"] = data["created_at"].isoformat()
+    return data
+
+
+def format_sse(event, payload):
+    """Encode one Server-Sent Events frame"""
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(payload)}\n\n"
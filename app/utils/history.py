@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from app.utils import llm
+from app.utils.metrics import HISTORY_FOLDS, PROMPT_TOKENS, SUMMARY_SECONDS
+from app.utils.session_store import session_store
+
+
+logger = logging.getLogger(__name__)
+
+# The prompt keeps the last HISTORY_RECENT_TURNS turns verbatim (fewer if they
+# exceed HISTORY_TOKEN_BUDGET); older turns are folded into a running summary
+# once HISTORY_FOLD_TURNS of them have piled up, so the summarizer runs once
+# every few turns instead of on every one
+HISTORY_RECENT_TURNS = int(os.environ.get("HISTORY_RECENT_TURNS", "6"))
+HISTORY_FOLD_TURNS = int(os.environ.get("HISTORY_FOLD_TURNS", "4"))
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "2000"))
+SUMMARY_MAX_TOKENS = int(os.environ.get("SUMMARY_MAX_TOKENS", "250"))
+# Under overload ("short_prompt" and beyond) only this many turns are sent verbatim
+HISTORY_SHORT_TURNS = int(os.environ.get("HISTORY_SHORT_TURNS", "2"))
+
+# Rough English/JSON average for Gemini's tokenizer; counting exactly would be a network call
+CHARS_PER_TOKEN = 4
+
+# Slots repeated next to the summary so the model never loses them to summarization
+CONTEXT_SLOTS = (("appointment_id", "Appointment id"), ("english_notes", "Call notes"))
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a dental clinic's receptionist and a patient.
+Keep every name, phone number, date, time, doctor, appointment id and decision, and what the patient still needs.
+Write plain sentences, at most {words} words, no preamble.
+
+Summary so far:
+{summary}
+
+Conversation since then:
+{transcript}"""
+
+
+def _chars(value):
+    if isinstance(value, str):
+        return len(value)
+    return len(json.dumps(value, separators=(",", ":"), ensure_ascii=False))
+
+
+def estimate_tokens(*values):
+    """Approximate token count of prompt text and history entries"""
+    return sum(_chars(value) for value in values) // CHARS_PER_TOKEN
+
+
+def _is_turn_start(entry):
+    # A turn starts with the caller's words; function results are "user" entries too, but not strings
+    return entry["role"] == "user" and any(isinstance(part, str) for part in entry["parts"])
+
+
+def turn_starts(history):
+    return [index for index, entry in enumerate(history) if _is_turn_start(entry)]
+
+
+def recent_start(history, max_turns=HISTORY_RECENT_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """Index where the verbatim window starts: the last max_turns turns, fewer if over budget (at least one)"""
+    starts = turn_starts(history)[-max_turns:]
+    if not starts:
+        return 0
+    for start in starts[:-1]:
+        if estimate_tokens(*history[start:]) <= budget:
+            return start
+    return starts[-1]
+
+
+def context_entries(slots):
+    """The summary of folded turns and the slots worth keeping next to it, as a user/model exchange"""
+    summary = slots.get("summary")
+    if not summary:
+        return []
+    lines = [f"Summary of the conversation so far: {summary}"]
+    known = [f"{label}: {slots[key]}" for key, label in CONTEXT_SLOTS if slots.get(key)]
+    if known:
+        lines.append("; ".join(known))
+    return [
+        {"role": "user", "parts": ["\n".join(lines)]},
+        {"role": "model", "parts": ["Understood, I'll continue from there."]},
+    ]
+
+
+def prompt_history(state, short=False):
+    """History to send with a turn: context for folded turns, then the recent turns verbatim.
+
+    Folding runs in the background, so up to HISTORY_FOLD_TURNS extra turns
+    may still be here; the window covers them rather than dropping turns the
+    summary doesn't have yet. `short` keeps only HISTORY_SHORT_TURNS turns
+    and accepts losing detail to save model time.
+    """
+    turns = HISTORY_SHORT_TURNS if short else HISTORY_RECENT_TURNS + HISTORY_FOLD_TURNS
+    start = recent_start(state.history, turns)
+    return context_entries(state.slots) + state.history[start:]
+
+
+def count_prompt(channel, system_prompt, history, message):
+    """Estimate the input tokens of one turn and record them"""
+    tokens = estimate_tokens(system_prompt, message, *history)
+    PROMPT_TOKENS.labels(channel).observe(tokens)
+    return tokens
+
+
+def fold_point(history):
+    """How many leading entries are due to be folded into the summary; 0 when none are yet"""
+    starts = turn_starts(history)
+    start = recent_start(history)
+    if not start:
+        return 0
+    # Over budget, prompt_history() already leaves turns out; they must reach the summary
+    overdue = len(starts) >= HISTORY_RECENT_TURNS + HISTORY_FOLD_TURNS
+    return start if overdue or estimate_tokens(*history) > HISTORY_TOKEN_BUDGET else 0
+
+
+def transcript_lines(entries):
+    lines = []
+    for entry in entries:
+        for part in entry["parts"]:
+            if isinstance(part, str):
+                lines.append(f"{'Patient' if entry['role'] == 'user' else 'Receptionist'}: {part}")
+            elif "function_call" in part:
+                call = part["function_call"]
+                lines.append(f"Action {call['name']}: {json.dumps(call['args'], ensure_ascii=False)}")
+            elif "function_response" in part:
+                response = part["function_response"]["response"]
+                lines.append(f"Result: {response.get('message') or ('ok' if response.get('ok') else 'failed')}")
+            elif part.get("text"):
+                lines.append(f"Receptionist: {part['text']}")
+    return lines
+
+
+def extractive_summary(summary, entries):
+    """Summary without a model: the old summary plus the folded lines, trimmed to the newest SUMMARY_MAX_TOKENS"""
+    text = " ".join(([summary] if summary else []) + transcript_lines(entries))
+    limit = SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return "..." + text[-limit:].split(" ", 1)[-1]
+
+
+def summarize(summary, entries):
+    """New running summary covering `summary` and `entries`; returns (text, how it was made)"""
+    prompt = SUMMARY_PROMPT.format(words=SUMMARY_MAX_TOKENS * 3 // 4, summary=summary or "(none)",
+                                   transcript="\n".join(transcript_lines(entries)))
+    try:
+        text = llm.summarize(prompt)
+    except Exception as e:
+        logger.warning(f"Summarizing history failed, keeping an extract instead: {e}")
+        text = None
+    if text:
+        return text[:SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN * 2], "model"
+    return extractive_summary(summary, entries), "extract"
+
+
+class _Stale(Exception):
+    """The history changed under the fold (another worker folded first)"""
+
+
+# Session id -> its fold task; one fold per session at a time
+_folding = {}
+
+
+def schedule_fold(session_id, state):
+    """Fold old turns of a just-saved state into its summary in the background, if any are due"""
+    if session_id in _folding or not fold_point(state.history):
+        return None
+    task = asyncio.get_running_loop().create_task(fold(session_id, list(state.history), state.slots.get("summary")))
+    _folding[session_id] = task
+    task.add_done_callback(lambda _: _folding.pop(session_id, None))
+    return task
+
+
+async def fold(session_id, history, summary):
+    """Summarize the turns before the recent window and drop them from the stored history.
+
+    Returns the saved state, or None if nothing was saved.
+    """
+    count = fold_point(history)
+    folded = history[:count]
+    started = time.perf_counter()
+    try:
+        new_summary, source = await asyncio.to_thread(summarize, summary, folded)
+        SUMMARY_SECONDS.observe(time.perf_counter() - started)
+
+        def replace(current):
+            if current.history[:count] != folded:
+                raise _Stale()
+            del current.history[:count]
+            current.slots["summary"] = new_summary
+            current.slots["folded_turns"] = current.slots.get("folded_turns", 0) + len(turn_starts(folded))
+
+        state = await asyncio.to_thread(session_store.update, session_id, replace)
+        HISTORY_FOLDS.labels(source).inc()
+        logger.info(f"Folded {len(turn_starts(folded))} turns of session {session_id} into its summary ({source})")
+        return state
+    except _Stale:
+        HISTORY_FOLDS.labels("stale").inc()
+    except Exception as e:
+        HISTORY_FOLDS.labels("error").inc()
+        logger.error(f"Folding history of session {session_id} failed: {e}")
+    return None
+
+
+async def drain():
+    """Wait for folds still running; used at shutdown so summaries aren't lost"""
+    if _folding:
+        await asyncio.gather(*list(_folding.values()), return_exceptions=True)
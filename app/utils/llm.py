@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import google.generativeai as genai
+from app.utils import recorder
+from app.utils.tools import TOOL_DECLARATIONS, calls_from_json
+from app.utils.speech_stream import split_reply
+
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+# "stub" swaps Gemini for an offline model with fixed latency, for load tests;
+# "replay" plays back the model turns recorded in REPLAY_FILE (see app/utils/recorder.py)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini").lower()
+STUB_LLM_LATENCY_MS = float(os.environ.get("STUB_LLM_LATENCY_MS", "400"))
+# The stub's stand-in for the fast model answers in this fraction of the time
+STUB_FAST_LATENCY_FACTOR = float(os.environ.get("STUB_FAST_LATENCY_FACTOR", "0.6"))
+REPLAY_FILE = os.environ.get("REPLAY_FILE")
+# Replayed latency = recorded latency * scale + (prompt tokens now - recorded prompt tokens) * ms per token
+REPLAY_LATENCY_SCALE = float(os.environ.get("REPLAY_LATENCY_SCALE", "1.0"))
+REPLAY_MS_PER_TOKEN = float(os.environ.get("REPLAY_MS_PER_TOKEN", "0"))
+
+# Model calls hold a thread while they wait on the API, so they get their own pool; this many run at once
+LLM_THREADS = int(os.environ.get("LLM_THREADS", "32"))
+
+# Try different models in order of preference
+model_names = ['gemini-2.0-flash', 'models/gemini-2.0-flash', 'gemini-flash-latest', 'models/gemini-flash-latest', 'gemini-pro-latest', 'models/gemini-pro-latest', 'gemini-2.0-flash-lite', 'models/gemini-2.0-flash-lite']
+model = None
+model_name = None
+# Used instead of `model` while the overload controller asks for speed
+fast_model = None
+fast_model_name = None
+
+_executor = None
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+class StubResponse:
+    def __init__(self, text, calls=()):
+        self.text = text
+        self.calls = list(calls)
+
+
+class StubChat:
+    def __init__(self, model):
+        self.model = model
+
+    def send_message(self, message, stream=False):
+        return self.model.reply(message, stream)
+
+
+class StubModel:
+    """Offline stand-in for a Gemini model: blocks for a fixed latency like the real SDK does.
+
+    Messages mentioning "book" get a book_appointment function call so the
+    booking path is exercised too. Streamed replies spend most of the latency
+    before the first chunk, as Gemini does.
+    """
+
+    def __init__(self, latency_ms=STUB_LLM_LATENCY_MS):
+        self.latency = latency_ms / 1000.0
+        self.bookings = 0
+
+    def reply(self, message, stream=False):
+        text, calls = self._answer(message)
+        return self._respond(text, calls, self.latency, stream)
+
+    def _respond(self, text, calls, latency, stream):
+        if stream:
+            return self._stream(text, calls, latency)
+        time.sleep(latency)
+        return StubResponse(text, calls)
+
+    def _stream(self, text, calls, latency):
+        pieces = [text[i:i + 24] for i in range(0, len(text), 24)]
+        time.sleep(latency * 0.6)
+        for piece in pieces:
+            yield StubResponse(piece)
+            time.sleep(latency * 0.4 / len(pieces))
+        if calls:
+            yield StubResponse("", calls)
+
+    def _answer(self, message):
+        if "book" not in message.lower():
+            return "Sure, I can help with that. Which day works best for you?", []
+        self.bookings += 1
+        appointment = {
+            "patient_name": f"Load Test {self.bookings}",
+            "phone": f"555-{random.randint(1000, 9999)}",
+            "date": "2030-01-07",
+            "time": f"{random.randint(9, 16):02d}:{random.choice(['00', '30'])}",
+            "purpose": "Cleaning",
+            "urgency_level": "low",
+            "doctor_name": "Dr. Smith",
+        }
+        return "Your appointment is confirmed.", [
+            ("book_appointment", appointment),
+            ("save_call_notes", {"english_notes": "Booked a cleaning."}),
+        ]
+
+    def start_chat(self, history=None):
+        return StubChat(self)
+
+
+class ReplayChat:
+    def __init__(self, model, record, prompt_tokens):
+        self.model = model
+        self.record = record
+        self.prompt_tokens = prompt_tokens
+
+    def send_message(self, message, stream=False):
+        return self.model.replay(self, message, stream)
+
+
+class ReplayModel(StubModel):
+    """Plays back recorded turns instead of calling Gemini, for offline A/B runs of the pipeline.
+
+    A turn's recording is found by the current turn record's channel and
+    session id and by position, so a session replayed from its start gets
+    its recorded turns in order. Turns answered without the model when they
+    were recorded replay what was said then, at the median model latency.
+    Turns with no recording fall back to the stub's answers.
+    """
+
+    def __init__(self, path, scale=REPLAY_LATENCY_SCALE, ms_per_token=REPLAY_MS_PER_TOKEN):
+        super().__init__()
+        self.sessions = recorder.load(path)
+        self.scale = scale
+        self.ms_per_token = ms_per_token
+        model_ms = sorted(turn["model_ms"] for turns in self.sessions.values() for turn in turns
+                          if turn.get("src") == "model" and turn.get("model_ms"))
+        self.default_ms = model_ms[len(model_ms) // 2] if model_ms else STUB_LLM_LATENCY_MS
+        self.misses = 0
+        logger.info(f"Replaying {sum(map(len, self.sessions.values()))} recorded turns "
+                    f"of {len(self.sessions)} sessions from {path}")
+
+    def start_chat(self, history=None):
+        # Called on the event loop, where the turn's record is current; the reply runs on a worker thread
+        chars = sum(len(json.dumps(entry, default=str)) for entry in history or [])
+        return ReplayChat(self, recorder.current(), chars // 4)
+
+    def recorded(self, record):
+        if record is None:
+            return None
+        turns = self.sessions.get((record.channel, record.session_id), [])
+        position = (record.turn or 0) - 1
+        return turns[position] if 0 <= position < len(turns) and "out" in turns[position] else None
+
+    def replay(self, chat, message, stream):
+        turn = self.recorded(chat.record)
+        if turn is None:
+            self.misses += 1
+            return self.reply(message, stream)
+        latency_ms = (turn.get("model_ms") if turn.get("src") == "model" else None) or self.default_ms
+        latency_ms *= self.scale
+        if turn.get("tok") is not None:
+            latency_ms += self.ms_per_token * (chat.prompt_tokens + len(message) // 4 - turn["tok"])
+        calls = [(name, args) for name, args in turn.get("calls", [])]
+        return self._respond(turn["out"], calls, max(latency_ms, 0.0) / 1000.0, stream)
+
+
+def start_conversation(model, system_prompt, history):
+    """A chat primed with the system prompt and a session's saved history.
+
+    The prompt is rebuilt from the doctor snapshot on every turn rather than
+    stored with the session, so saved state stays small.
+    """
+    preamble = [
+        {"role": "user", "parts": [system_prompt]},
+        {"role": "model", "parts": ["I understand. I'm ready to help as a dental receptionist."]},
+    ]
+    return model.start_chat(history=preamble + history)
+
+
+_summary_model = None
+
+
+def summarize(prompt):
+    """Plain-text completion for history summaries; None when there is no real model.
+
+    Uses the chosen Gemini model without tools, so it can't answer with a function call.
+    """
+    global _summary_model
+    if model is None or LLM_BACKEND in ("stub", "replay"):
+        return None
+    if _summary_model is None:
+        _summary_model = genai.GenerativeModel(model_name)
+    return _summary_model.generate_content(prompt).text.strip()
+
+
+def reply_parts(response):
+    """("text", str) and ("call", (function name, args)) items of a response or streamed chunk"""
+    if isinstance(response, StubResponse):
+        parts = [("text", response.text)] if response.text else []
+        return parts + [("call", call) for call in response.calls]
+    parts = []
+    for part in response.candidates[0].content.parts if response.candidates else []:
+        if "function_call" in part:
+            call = genai.protos.FunctionCall.to_dict(part.function_call)
+            parts.append(("call", (call["name"], call.get("args") or {})))
+        elif part.text:
+            parts.append(("text", part.text))
+    return parts
+
+
+def parse_reply(response):
+    """Split a complete model response into its spoken text and a list of (function name, args) calls.
+
+    The text goes through the speech parser too, so a JSON block or code fence
+    the model wrote despite the prompt is never spoken.
+    """
+    texts = []
+    calls = []
+    for kind, value in reply_parts(response):
+        if kind == "call":
+            calls.append(value)
+        else:
+            texts.append(value)
+    speech, blocks = split_reply("".join(texts))
+    for block in blocks:
+        calls.extend(calls_from_json(block))
+    return speech, calls
+
+
+def _started():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+
+
+def _finished():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+def in_flight():
+    """Model requests queued or running, for the overload controller"""
+    return _in_flight
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=LLM_THREADS, thread_name_prefix="llm")
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def send_async(send, *args):
+    """Run a blocking model call on the model pool; it counts in in_flight() from the moment it is queued"""
+    # The worker thread doesn't see this context's turn record
+    record = recorder.current()
+
+    def call():
+        started = time.perf_counter()
+        try:
+            return send(*args)
+        finally:
+            _finished()
+            if record is not None:
+                record.model_time(time.perf_counter() - started)
+
+    _started()
+    try:
+        future = get_executor().submit(call)
+    except Exception:
+        _finished()
+        raise
+    return await asyncio.wrap_future(future)
+
+
+async def stream_reply(send, *args):
+    """Run a streaming model call on a worker thread and yield its reply parts as they arrive.
+
+    `send` is chat.send_message or model.generate_content; the SDK blocks while
+    it waits for each chunk, so the event loop only ever awaits a queue.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    # The worker thread doesn't see this context's turn record
+    record = recorder.current()
+
+    def pump():
+        started = time.perf_counter()
+        try:
+            for chunk in send(*args, stream=True):
+                for part in reply_parts(chunk):
+                    loop.call_soon_threadsafe(queue.put_nowait, part)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            _finished()
+            if record is not None:
+                record.model_time(time.perf_counter() - started)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    _started()
+    get_executor().submit(pump)
+    while True:
+        item = await queue.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def ai_enabled():
+    """Whether an AI backend is configured at all"""
+    return LLM_BACKEND in ("stub", "replay") or bool(GEMINI_API_KEY)
+
+
+def init_model():
+    """Configure Gemini and pick the first model that answers a test prompt.
+
+    Called once from the application lifespan rather than at import time, so
+    importing the routes never makes network calls.
+    """
+    global model, model_name, fast_model, fast_model_name
+
+    if LLM_BACKEND == "stub":
+        model, model_name = StubModel(), "stub"
+        fast_model, fast_model_name = StubModel(STUB_LLM_LATENCY_MS * STUB_FAST_LATENCY_FACTOR), "stub-fast"
+        logger.info(f"Using stub LLM backend ({STUB_LLM_LATENCY_MS:.0f}ms per reply)")
+        return model
+
+    if LLM_BACKEND == "replay":
+        if not REPLAY_FILE:
+            raise RuntimeError("LLM_BACKEND=replay needs REPLAY_FILE")
+        # Recorded latencies already include whichever model answered
+        model, model_name = ReplayModel(REPLAY_FILE), "replay"
+        fast_model, fast_model_name = model, model_name
+        return model
+
+    if not GEMINI_API_KEY:
+        logger.warning("Gemini API key not found. AI functionality will be disabled.")
+        return None
+
+    genai.configure(api_key=GEMINI_API_KEY)
+    for name in model_names:
+        try:
+            candidate = genai.GenerativeModel(name, tools=TOOL_DECLARATIONS)
+            # Test the model with a simple prompt
+            candidate.generate_content("Hello, this is a test.")
+            model, model_name = candidate, name
+            logger.info(f"Gemini model {name} initialized successfully")
+            fast_model, fast_model_name = pick_fast_model()
+            return model
+        except Exception as e:
+            logger.warning(f"Error initializing Gemini model {name}: {e}")
+
+    logger.error("Failed to initialize any Gemini model")
+    return None
+
+
+def pick_fast_model():
+    """The fastest model in model_names that answers, and its name: "lite" beats "flash" beats the rest.
+
+    Falls back to the main model, so get_model(fast=True) always works.
+    """
+    speed = lambda name: 0 if "lite" in name else 1 if "flash" in name else 2
+    for name in sorted(model_names, key=speed):
+        if name == model_name or speed(name) >= speed(model_name):
+            break
+        try:
+            candidate = genai.GenerativeModel(name, tools=TOOL_DECLARATIONS)
+            candidate.generate_content("Hello, this is a test.")
+            logger.info(f"Gemini model {name} will be used under overload")
+            return candidate, name
+        except Exception as e:
+            logger.warning(f"Error initializing fast Gemini model {name}: {e}")
+    return model, model_name
+
+
+def get_model(fast=False):
+    """Return the warmed-up Gemini model (or the fast one), or None if AI is unavailable"""
+    if fast and fast_model is not None:
+        return fast_model
+    return model
+
+
+def warm_up():
+    """Startup phase: returns False when AI is disabled, raises if no model works"""
+    if not ai_enabled():
+        return False
+    if init_model() is None:
+        raise RuntimeError("No Gemini model could be initialized")
+    return True
@@ -0,0 +1,334 @@
+import time
+import bisect
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from app.utils import tracing
+from app.utils.profiler import profiler
+
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "receptionist_"
+
+# Seconds; covers a fast DB write up to a slow Gemini turn
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    """Base for labelled metrics; children are created once per label set and reused"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "function", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def set_function(self, function):
+        """Compute the value at scrape time instead of tracking it"""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception as e:
+                logger.warning(f"Metric callback failed: {e}")
+                return float("nan")
+        return self.value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _samples(self, values, child):
+        return [f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def _samples(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum", "lock")
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _samples(self, values, child):
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.upper_bounds + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+TURN_STAGE_SECONDS = Histogram("turn_stage_seconds", "Time spent in each stage of a conversation turn",
+                               ["channel", "stage"])
+TURN_SECONDS = Histogram("turn_seconds", "Total time to handle one conversation turn", ["channel"])
+TIME_TO_FIRST_AUDIO_SECONDS = Histogram("time_to_first_audio_seconds",
+                                        "Time from receiving a turn to the first reply audio leaving the server",
+                                        ["channel"])
+SPEECH_FINAL_SECONDS = Histogram("speech_final_seconds",
+                                 "Time from the last voiced microphone frame to its final transcript")
+TTS_SECONDS = Histogram("tts_seconds", "Speech synthesis and post-processing time", ["stage"])
+DB_WRITE_SECONDS = Histogram("db_write_seconds", "Database write transaction time", ["operation"])
+SESSION_STORE_SECONDS = Histogram("session_store_seconds", "Session state load and save time", ["operation"])
+SESSION_CONFLICTS = Counter("session_conflicts", "Session saves retried because another worker saved first")
+QUEUE_WAIT_SECONDS = Histogram("queue_wait_seconds", "Time work waited in a queue before it started", ["queue"])
+PROMPT_TOKENS = Histogram("prompt_tokens", "Estimated input tokens sent to the model per turn", ["channel"],
+                          buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000))
+SUMMARY_SECONDS = Histogram("summary_seconds", "Time to fold old turns into a session's running summary")
+HISTORY_FOLDS = Counter("history_folds", "Background history folds by outcome", ["result"])
+OVERLOAD_MODE = Gauge("overload_mode", "Current degraded mode: 0 normal, 1 short_prompt, 2 fast_model, "
+                      "3 text_only, 4 holding, 5 shed")
+OVERLOAD_MODE_CHANGES = Counter("overload_mode_changes", "Changes of degraded mode, by the mode entered", ["mode"])
+OVERLOAD_PRESSURE = Gauge("overload_pressure", "Load on each watched resource; 1 is fully used", ["signal"])
+OVERLOAD_SHED = Counter("overload_shed", "New sessions and calls turned away under overload", ["channel"])
+LOCAL_TURNS = Counter("local_turns", "Turns answered by the slot extractor without the model, by action",
+                      ["channel", "action"])
+TURN_ERRORS = Counter("turn_errors", "Conversation turns that failed", ["channel"])
+ACTIVE_SESSIONS = Gauge("active_sessions", "Open browser voice sessions")
+OPEN_WEBSOCKETS = Gauge("open_websockets", "Open /ws/ai sockets, including ones still setting up a session")
+SESSION_MEMORY_BYTES = Gauge("session_memory_bytes", "Estimated state held by open browser sessions: "
+                             "total, and the largest session", ["stat"])
+TENANTS_CACHED = Gauge("tenants_cached", "Clinics with a warm doctor cache in this worker, besides the default one")
+TENANT_CACHE = Counter("tenant_cache", "Clinic cache lookups: hit, load, evict or unknown", ["result"])
+WS_CLOSED = Counter("ws_closed", "/ws/ai sockets refused or closed by the server, by reason", ["reason"])
+PHONE_AUDIO_REQUESTS = Counter("phone_audio_requests", "Phone audio clip requests by response status", ["status"])
+ACTIVE_CALLS = Gauge("active_calls", "Phone calls with recent activity")
+EVENT_LOOP_LAG_SECONDS = Histogram("event_loop_lag_seconds", "How late the event loop woke up for a scheduled timer",
+                                   buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+EVENT_LOOP_LAG_INTERVAL = 0.1
+
+# The last second of lag samples, for the overload controller
+_recent_lag = deque(maxlen=10)
+
+
+def recent_event_loop_lag():
+    """Worst event-loop lag over the last second"""
+    return max(_recent_lag, default=0.0)
+
+
+async def monitor_event_loop_lag(interval=EVENT_LOOP_LAG_INTERVAL):
+    """Sleep in a loop and record how late each wake-up is; blocking calls show up as lag"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+        _recent_lag.append(lag)
+
+
+class TurnTimer:
+    """Stage-level timing for one conversation turn.
+
+    Each stage is observed into turn_stage_seconds as it finishes; finish()
+    records the whole turn and logs a one-line breakdown.
+    """
+
+    def __init__(self, channel, session_id=None, turn=None):
+        self.channel = channel
+        self.session_id = session_id
+        self.turn = turn
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.annotations = {}
+        self.first_audio_ms = None
+        # Set by recorder.begin() when the turn may be recorded for replay
+        self.replay_record = None
+        # Inside a traced call or session, the turn and each stage are spans too
+        self.span = tracing.start_span("turn", channel=channel, turn=turn)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            with tracing.span(name):
+                yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        TURN_STAGE_SECONDS.labels(self.channel, name).observe(seconds)
+
+    def stage_ms(self, name):
+        seconds = self.stages.get(name)
+        return seconds * 1000 if seconds is not None else None
+
+    def annotate(self, name, value):
+        """A per-turn figure that isn't a duration (e.g. prompt_tokens), for the log line and the trace"""
+        self.annotations[name] = value
+        if self.span is not None:
+            self.span.set(name, value)
+
+    def first_audio(self):
+        """Mark the first reply audio of this turn as sent"""
+        if self.first_audio_ms is None:
+            elapsed = time.perf_counter() - self.started
+            self.first_audio_ms = elapsed * 1000
+            TIME_TO_FIRST_AUDIO_SECONDS.labels(self.channel).observe(elapsed)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        TURN_SECONDS.labels(self.channel).observe(elapsed)
+        breakdown = " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items())
+        first_audio = f" first_audio={self.first_audio_ms:.0f}ms" if self.first_audio_ms is not None else ""
+        annotations = "".join(f" {name}={value}" for name, value in self.annotations.items())
+        logger.info(f"Turn {self.turn} ({self.channel} {self.session_id}): {breakdown}{first_audio} "
+                    f"total={elapsed * 1000:.0f}ms{annotations}")
+        if self.span is not None:
+            self.span.set("first_audio_ms", round(self.first_audio_ms, 1) if self.first_audio_ms is not None else None)
+            self.span.end()
+        if profiler.session is not None:
+            profiler.on_turn()
+        if self.replay_record is not None:
+            self.replay_record.write(self, elapsed)
+        return elapsed
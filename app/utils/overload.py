@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import logging
+from app.utils import llm, tts
+from app.utils.metrics import OVERLOAD_MODE, OVERLOAD_MODE_CHANGES, OVERLOAD_PRESSURE, OVERLOAD_SHED, recent_event_loop_lag
+
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_CONTROL = os.environ.get("OVERLOAD_CONTROL", "true").lower() == "true"
+# What counts as fully loaded for each signal: event-loop lag in seconds,
+# model requests in flight (by default as many as the executor running them
+# has threads) and TTS jobs per TTS pool thread
+OVERLOAD_LAG_TARGET = float(os.environ.get("OVERLOAD_LAG_TARGET", "0.1"))
+OVERLOAD_LLM_CAPACITY = int(os.environ.get("OVERLOAD_LLM_CAPACITY", str(llm.LLM_THREADS)))
+OVERLOAD_INTERVAL = float(os.environ.get("OVERLOAD_INTERVAL", "0.5"))
+OVERLOAD_COOLDOWN_SECONDS = float(os.environ.get("OVERLOAD_COOLDOWN_SECONDS", "5"))
+
+# Degraded modes in the order they are entered, and the pressure that enters
+# each one. A mode is left once pressure stays under HYSTERESIS times its
+# threshold for OVERLOAD_COOLDOWN_SECONDS; modes change one step at a time.
+MODES = ("normal", "short_prompt", "fast_model", "text_only", "holding", "shed")
+THRESHOLDS = (0.0,) + tuple(float(value) for value in
+                            os.environ.get("OVERLOAD_THRESHOLDS", "1.0,1.5,2.0,3.0,4.0").split(","))
+HYSTERESIS = 0.7
+
+# Said instead of a model reply in "holding" mode; its audio is rendered once at startup
+HOLDING_MESSAGE = "Sorry, we're helping a lot of patients right now. Could you say that again in a moment?"
+
+
+class OverloadController:
+    """Steps the worker through degraded modes as its resources saturate.
+
+    Pressure is sampled per signal, where 1.0 means that resource is fully
+    used, and the worst signal drives the mode:
+    - short_prompt: fewer verbatim turns in each prompt
+    - fast_model: the fastest model from llm.model_names
+    - text_only: browser replies without synthesized audio
+    - holding: turns get a pre-rendered holding message instead of a model reply
+    - shed: new /ws/ai sessions are refused and new calls go to voicemail
+    Sessions already admitted keep going in every mode.
+    """
+
+    def __init__(self, enabled=OVERLOAD_CONTROL):
+        self.enabled = enabled
+        self.level = 0
+        self.pressure = {}
+        self.calm_since = None
+        OVERLOAD_MODE.set(0)
+
+    @property
+    def mode(self):
+        return MODES[self.level]
+
+    def at_least(self, mode):
+        return self.level >= MODES.index(mode)
+
+    def sample(self):
+        return {
+            "event_loop": recent_event_loop_lag() / OVERLOAD_LAG_TARGET,
+            "llm": llm.in_flight() / OVERLOAD_LLM_CAPACITY,
+            "tts": tts.pending() / tts.TTS_POOL_SIZE,
+        }
+
+    def update(self, pressure, now=None):
+        """Move at most one mode up or down for this pressure sample; returns the mode"""
+        now = time.monotonic() if now is None else now
+        self.pressure = pressure
+        for signal, value in pressure.items():
+            OVERLOAD_PRESSURE.labels(signal).set(round(value, 3))
+        worst = max(pressure.values(), default=0.0)
+        if self.level + 1 < len(MODES) and worst >= THRESHOLDS[self.level + 1]:
+            self._enter(self.level + 1, worst)
+            self.calm_since = None
+        elif self.level and worst < THRESHOLDS[self.level] * HYSTERESIS:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= OVERLOAD_COOLDOWN_SECONDS:
+                self._enter(self.level - 1, worst)
+                # Each further step down needs its own calm period
+                self.calm_since = now
+        else:
+            self.calm_since = None
+        return self.mode
+
+    def _enter(self, level, worst):
+        previous = self.mode
+        self.level = level
+        OVERLOAD_MODE.set(level)
+        OVERLOAD_MODE_CHANGES.labels(self.mode).inc()
+        signals = ", ".join(f"{signal}={value:.2f}" for signal, value in self.pressure.items())
+        message = f"Overload mode {previous} -> {self.mode} (pressure {worst:.2f}: {signals})"
+        if level > MODES.index(previous):
+            logger.warning(message)
+        else:
+            logger.info(message)
+
+    def shed(self, channel):
+        """Whether to turn a new session or call away; counted in overload_shed when so"""
+        if self.at_least("shed"):
+            OVERLOAD_SHED.labels(channel).inc()
+            return True
+        return False
+
+    def status(self):
+        return {"mode": self.mode, "pressure": {signal: round(value, 2) for signal, value in self.pressure.items()}}
+
+    async def run(self, interval=OVERLOAD_INTERVAL):
+        if not self.enabled:
+            logger.info("Overload control is off")
+            return
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.update(self.sample())
+            except Exception as e:
+                logger.error(f"Overload controller failed to sample: {e}")
+
+
+controller = OverloadController()
@@ -0,0 +1,157 @@
+import io
+import os
+import asyncio
+import hashlib
+import logging
+import warnings
+from pydub import AudioSegment
+from pydub.utils import which
+from app.utils import tts
+
+
+logger = logging.getLogger(__name__)
+
+# "play" answers calls with our own pre-rendered audio for fixed lines (greeting,
+# "anything else?", voicemail...) instead of having Twilio synthesize them with <Say>
+PHONE_AUDIO = os.environ.get("PHONE_AUDIO", "say").lower()
+# mp3 as rendered, or wav: 8 kHz mono mu-law, the phone network's own format, which Twilio plays without transcoding
+PHONE_AUDIO_FORMAT = os.environ.get("PHONE_AUDIO_FORMAT", "mp3").lower()
+# Prefix for clip URLs, e.g. a CDN in front of the app; relative URLs resolve against the webhook's URL
+AUDIO_BASE_URL = os.environ.get("AUDIO_BASE_URL", "").rstrip("/")
+# A clip URL names its content, so caches may keep it forever
+AUDIO_MAX_AGE = 31536000
+
+MEDIA_TYPES = {"mp3": "audio/mpeg", "wav": "audio/wav"}
+
+_format = None
+# Every fixed line by clip key, so any worker can render a clip another worker linked to
+_texts = {}
+_clips = {}
+_rendering = {}
+
+
+class Clip:
+    """A rendered line in its served format, with a strong ETag over its bytes"""
+
+    def __init__(self, audio, audio_format):
+        self.audio = audio
+        self.format = audio_format
+        self.media_type = MEDIA_TYPES[audio_format]
+        self.etag = '"' + hashlib.sha256(audio).hexdigest()[:32] + '"'
+
+
+def enabled():
+    return PHONE_AUDIO == "play"
+
+
+def audio_format():
+    """The format clips are served in; wav needs ffmpeg to convert, so falls back to mp3 without it"""
+    global _format
+    if _format is None:
+        _format = PHONE_AUDIO_FORMAT if PHONE_AUDIO_FORMAT in MEDIA_TYPES else "mp3"
+        if _format == "wav" and tts.TTS_BACKEND != "stub" and which("ffmpeg") is None and which("avconv") is None:
+            logger.warning("ffmpeg/avconv not found; phone audio is served as MP3 instead of WAV")
+            _format = "mp3"
+    return _format
+
+
+def key_for(text):
+    """Clip key of a line: a hash of everything that decides its audio, the same in every worker"""
+    return hashlib.sha256(f"{tts.TTS_BACKEND}\n{audio_format()}\n{text}".encode()).hexdigest()[:24]
+
+
+def register(*texts):
+    """Declare fixed lines that may be played; call at import so every worker knows them"""
+    for text in texts:
+        _texts[key_for(text)] = text
+
+
+def encode(mp3):
+    if audio_format() == "mp3" or tts.TTS_BACKEND == "stub":
+        return mp3
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        audio = AudioSegment.from_mp3(io.BytesIO(mp3)).set_frame_rate(8000).set_channels(1)
+        buffer = io.BytesIO()
+        audio.export(buffer, format="wav", codec="pcm_mulaw")
+    return buffer.getvalue()
+
+
+def _render(key, text):
+    clip = Clip(encode(tts.synthesize(text)), audio_format())
+    _clips[key] = clip
+    return clip
+
+
+async def _render_async(key):
+    """Render a clip once on the TTS pool, however many requests ask for it meanwhile"""
+    task = _rendering.get(key)
+    if task is None:
+        loop = asyncio.get_running_loop()
+        task = _rendering[key] = asyncio.ensure_future(
+            loop.run_in_executor(tts.get_executor(), _render, key, _texts[key]))
+        task.add_done_callback(lambda _: _rendering.pop(key, None))
+    try:
+        return await asyncio.shield(task)
+    except Exception as e:
+        logger.warning(f"Rendering phone audio for {_texts[key]!r} failed: {e}")
+        return None
+
+
+def url_for(text):
+    """URL of the line's clip, or None until it is rendered; a miss starts rendering it in the background"""
+    if not enabled():
+        return None
+    key = key_for(text)
+    if key in _clips:
+        return f"{AUDIO_BASE_URL}/api/audio/{key}.{audio_format()}"
+    _texts.setdefault(key, text)
+    if key not in _rendering:
+        asyncio.ensure_future(_render_async(key))
+    return None
+
+
+async def get(key):
+    """The clip for a key, rendered on demand when it is a known line; None for unknown keys"""
+    if not enabled():
+        return None
+    clip = _clips.get(key)
+    if clip is None and key in _texts:
+        clip = await _render_async(key)
+    return clip
+
+
+def warm_up():
+    """Render every registered line so the first calls already get <Play>"""
+    if not enabled():
+        return False
+    for key, text in list(_texts.items()):
+        if key not in _clips:
+            _render(key, text)
+    logger.info(f"Phone audio warm-up rendered {len(_clips)} {audio_format()} clips, "
+                f"{sum(len(clip.audio) for clip in _clips.values())} bytes")
+    return True
+
+
+def byte_range(header, size):
+    """(first, last) byte of a single "bytes=" Range header, or None to send everything.
+
+    Raises ValueError when the range can't be satisfied. Several ranges in one
+    header are answered with the whole clip, which HTTP allows.
+    """
+    unit, _, spec = (header or "").partition("=")
+    first, dash, last = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or "," in spec or not dash or not (first + last).isdigit():
+        return None
+    if not first:
+        # "bytes=-500": the last 500 bytes
+        if int(last) == 0:
+            raise ValueError("empty suffix range")
+        return max(size - int(last), 0), size - 1
+    first, last = int(first), int(last) if last else None
+    if last is not None and last < first:
+        # Malformed, so ignored like any other unreadable Range
+        return None
+    if first >= size:
+        raise ValueError(f"range {spec} outside {size} bytes")
+    return first, size - 1 if last is None else min(last, size - 1)
@@ -0,0 +1,275 @@
+import io
+import os
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAX_PROFILE_SECONDS = 300
+MAX_STACK_DEPTH = 64
+HEARTBEAT_INTERVAL = 0.01
+MAX_BLOCK_REPORTS = 200
+
+# Leaf functions that mean a thread is parked rather than using CPU
+IDLE_LEAVES = {"select", "poll", "epoll", "wait", "acquire", "sleep", "get", "_worker", "accept", "recv", "read"}
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame):
+    """Outermost-first list of frame labels, capped at MAX_STACK_DEPTH"""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def innermost_app_frame(frame):
+    """The deepest line of this application's own code (not a library) in a stack"""
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(APP_ROOT) and "site-packages" not in code.co_filename:
+            return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        frame = frame.f_back
+    return None
+
+
+def describe_task(task):
+    if task is None:
+        return None, None
+    coro = task.get_coro()
+    return task.get_name(), getattr(coro, "__qualname__", repr(coro))
+
+
+class ProfileSession:
+    """One profiling run: folded stack samples, optional cProfile stats and loop-blocking episodes"""
+
+    def __init__(self, mode, seconds, turns, interval, block_threshold, include_idle):
+        self.mode = mode
+        self.seconds = seconds
+        self.turns = turns
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.include_idle = include_idle
+        self.started_at = datetime.now(timezone.utc)
+        self.ended_at = None
+        self.state = "running"
+        self.turns_seen = 0
+        self.samples = 0
+        self.folded = Counter()
+        self.blocks = []
+        self.cprofile_stats = None
+
+    def folded_text(self):
+        """Brendan Gregg's folded format: one "frame;frame;frame count" line per stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.folded.most_common())
+
+    def top_frames(self, limit=25):
+        """Leaf frames by sample count, i.e. where the sampled time was actually spent"""
+        leaves = Counter()
+        for stack, count in self.folded.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [{"frame": frame, "samples": count, "percent": round(count * 100 / total, 1)}
+                for frame, count in leaves.most_common(limit)]
+
+    def blocking_report(self):
+        """Loop-blocking episodes grouped by the coroutine and frame that held the loop"""
+        groups = {}
+        for block in self.blocks:
+            key = (block["coroutine"], block["frame"])
+            group = groups.setdefault(key, {"coroutine": block["coroutine"], "task": block["task"],
+                                            "frame": block["frame"], "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                            "stack": block["stack"]})
+            group["count"] += 1
+            group["total_ms"] = round(group["total_ms"] + block["duration_ms"], 1)
+            group["max_ms"] = max(group["max_ms"], block["duration_ms"])
+        return sorted(groups.values(), key=lambda group: group["total_ms"], reverse=True)
+
+    def summary(self):
+        return {
+            "mode": self.mode,
+            "state": self.state,
+            "started_at": self.started_at.isoformat(),
+            "ended_at": self.ended_at.isoformat() if self.ended_at else None,
+            "seconds": self.seconds,
+            "turns": self.turns,
+            "turns_seen": self.turns_seen,
+            "interval_ms": round(self.interval * 1000, 2),
+            "block_threshold_ms": round(self.block_threshold * 1000, 1),
+            "samples": self.samples,
+            "top_frames": self.top_frames(),
+            "loop_blocking": self.blocking_report(),
+            "cprofile": self.cprofile_stats,
+        }
+
+
+class Profiler:
+    """Admin-triggered profiling; nothing runs and nothing is hooked until start() is called.
+
+    A sampler thread reads every thread's stack from sys._current_frames()
+    each interval. In "cprofile" mode the event-loop thread is also profiled
+    deterministically. In both modes a heartbeat task ticks on the loop and
+    the sampler thread watches it: when the heartbeat stalls past the block
+    threshold, the loop thread's stack and current task are recorded.
+    """
+
+    def __init__(self):
+        self.session = None
+        self.last = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread = None
+        self._beat = 0.0
+        self._stop_event = None
+        self._cprofile = None
+        self._timer = None
+
+    def start(self, mode="sampling", seconds=30.0, turns=0, interval_ms=5.0, block_threshold_ms=50.0,
+              include_idle=False):
+        """Begin a session; must be called from the event loop"""
+        if mode not in ("sampling", "cprofile"):
+            raise ValueError("mode must be sampling or cprofile")
+        seconds = max(0.1, min(float(seconds), MAX_PROFILE_SECONDS))
+        with self._lock:
+            if self.session is not None:
+                raise RuntimeError("a profiling session is already running")
+            session = ProfileSession(mode, seconds, int(turns or 0), max(interval_ms, 1.0) / 1000.0,
+                                     max(block_threshold_ms, 5.0) / 1000.0, include_idle)
+            self.session = session
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop_event = threading.Event()
+        self._loop.create_task(self._heartbeat(session), name="profiler-heartbeat")
+        threading.Thread(target=self._sample, args=(session, self._stop_event), name="profiler", daemon=True).start()
+        if mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._timer = self._loop.call_later(seconds, self.stop, "duration")
+        logger.warning(f"Profiling started: mode={mode} seconds={seconds} turns={session.turns}")
+        return session
+
+    def on_turn(self):
+        """Called when a conversation turn finishes; ends turn-limited sessions"""
+        session = self.session
+        if session is None:
+            return
+        session.turns_seen += 1
+        if session.turns and session.turns_seen >= session.turns:
+            self._call_on_loop(self.stop, "turns")
+
+    def _call_on_loop(self, fn, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            fn(*args)
+        else:
+            self._loop.call_soon_threadsafe(fn, *args)
+
+    def stop(self, reason="stopped"):
+        """End the running session; runs on the event loop so cProfile is disabled on its own thread"""
+        with self._lock:
+            session = self.session
+            if session is None:
+                return None
+            self.session = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._stop_event.set()
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            output = io.StringIO()
+            stats = pstats.Stats(self._cprofile, stream=output).sort_stats("cumulative")
+            stats.print_stats(40)
+            session.cprofile_stats = output.getvalue()
+            self._cprofile = None
+        session.state = reason
+        session.ended_at = datetime.now(timezone.utc)
+        self.last = session
+        logger.warning(f"Profiling finished ({reason}): {session.samples} samples, {len(session.blocks)} loop blocks")
+        return session
+
+    async def _heartbeat(self, session):
+        while self.session is session:
+            self._beat = time.perf_counter()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def _sample(self, session, stop_event):
+        own_thread = threading.get_ident()
+        names = {}
+        blocked_since = None
+        blocked_stacks = Counter()
+        blocked_task = (None, None)
+
+        while not stop_event.wait(session.interval):
+            frames = sys._current_frames()
+
+            # Loop watchdog: a stale heartbeat means something is holding the loop
+            stall = time.perf_counter() - self._beat
+            loop_frame = frames.get(self._loop_thread)
+            if stall > session.block_threshold + HEARTBEAT_INTERVAL and loop_frame is not None:
+                if blocked_since is None:
+                    blocked_since = self._beat
+                    blocked_task = describe_task(asyncio.current_task(self._loop))
+                    blocked_stacks.clear()
+                stack = collapse(loop_frame)
+                blocked_stacks[(innermost_app_frame(loop_frame) or stack[-1], tuple(stack))] += 1
+            elif blocked_since is not None:
+                if len(session.blocks) < MAX_BLOCK_REPORTS and blocked_stacks:
+                    # The stack seen most often while stalled is what held the loop
+                    (frame, stack), _ = blocked_stacks.most_common(1)[0]
+                    session.blocks.append(self._block_record(blocked_task, frame, stack,
+                                                             self._beat - blocked_since - HEARTBEAT_INTERVAL))
+                blocked_since = None
+
+            if session.mode != "sampling":
+                continue
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id == own_thread:
+                    continue
+                stack = collapse(frame)
+                if not session.include_idle and stack and stack[-1].split(" ", 1)[0] in IDLE_LEAVES:
+                    continue
+                root = names.get(thread_id, str(thread_id))
+                if thread_id == self._loop_thread:
+                    _, coroutine = describe_task(asyncio.current_task(self._loop))
+                    root = f"event-loop;task:{coroutine}" if coroutine else "event-loop"
+                session.folded[";".join([root] + stack)] += 1
+            session.samples += 1
+
+    @staticmethod
+    def _block_record(task, frame, stack, duration):
+        task_name, coroutine = task
+        return {
+            "task": task_name,
+            "coroutine": coroutine,
+            # The innermost line of our own code is the most useful single pointer
+            "frame": frame,
+            "duration_ms": round(max(duration, 0.0) * 1000, 1),
+            "stack": list(stack[-12:]),
+        }
+
+
+profiler = Profiler()
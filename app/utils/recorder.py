@@ -0,0 +1,180 @@
+import os
+import gzip
+import json
+import time
+import queue
+import logging
+import threading
+import contextvars
+from app.utils import tracing
+
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: every sampled turn is appended here as one JSON line (gzipped when the name ends in .gz).
+# Recordings hold what callers said, including names and phone numbers; keep them as private as call logs.
+RECORD_FILE = os.environ.get("RECORD_FILE")
+# Fraction of sessions and calls recorded; a session is recorded in full or not at all
+RECORD_SAMPLE_RATE = float(os.environ.get("RECORD_SAMPLE_RATE", "1.0"))
+
+WRITE_BATCH_SIZE = 256
+WRITE_INTERVAL = 1.0
+WRITE_MAX_QUEUE = 10000
+
+_current = contextvars.ContextVar("recorded_turn", default=None)
+
+
+def enabled():
+    return bool(RECORD_FILE)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class TurnRecord:
+    """One turn as the replayer needs it: what came in, what the model (or the slots) answered, and how long it took.
+
+    Every turn gets one, recorded or not: the replay model looks its turn
+    up by the current record's channel, session id and turn number.
+    """
+
+    def __init__(self, channel, session_id, turn, text, sampled, **context):
+        self.channel = channel
+        self.session_id = session_id
+        self.turn = turn
+        self.sampled = sampled
+        self.data = {"ch": channel, "sid": session_id, "turn": turn, "in": text,
+                     **{key: value for key, value in context.items() if value}}
+        self.tts = []
+
+    def reply(self, text, calls, said, source):
+        """What answered the turn ("model", "local", "holding" or "fallback"), its function calls and what was spoken"""
+        if self.sampled:
+            self.data.update({"src": source, "out": text, "calls": [[name, args] for name, args in calls],
+                              "say": said})
+
+    def model_time(self, seconds):
+        """The model call itself, without the wait for a worker thread that the "llm" stage includes"""
+        if self.sampled:
+            self.data["model_ms"] = _ms(seconds)
+
+    def synthesized(self, text, seconds):
+        if self.sampled:
+            self.tts.append([len(text), _ms(seconds)])
+
+    def write(self, timer, elapsed):
+        """Called by TurnTimer.finish() with the turn's timings"""
+        if not self.sampled:
+            return
+        self.data["ts"] = round(time.time() - elapsed, 3)
+        self.data["ms"] = {**{name: _ms(seconds) for name, seconds in timer.stages.items()},
+                           "first_audio": round(timer.first_audio_ms, 1) if timer.first_audio_ms is not None else None,
+                           "total": _ms(elapsed)}
+        if "prompt_tokens" in timer.annotations:
+            self.data["tok"] = timer.annotations["prompt_tokens"]
+        if self.tts:
+            self.data["tts"] = self.tts
+        writer.write(self.data)
+
+
+def begin(timer, text, **context):
+    """Start the record of the turn `timer` is timing and make it current; context is e.g. clinic or caller number"""
+    sampled = enabled() and tracing.is_sampled(tracing.trace_id_for(timer.session_id), RECORD_SAMPLE_RATE)
+    record = TurnRecord(timer.channel, timer.session_id, timer.turn, text, sampled, **context)
+    timer.replay_record = record
+    _current.set(record)
+    return record
+
+
+def current():
+    """The record of the turn running in this context, or None"""
+    return _current.get()
+
+
+class RecordWriter:
+    """Appends records from a background thread so turns never wait on the disk"""
+
+    def __init__(self, max_queue=WRITE_MAX_QUEUE):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"written": 0, "dropped": 0}
+
+    def write(self, data):
+        if not self._thread or not self._thread.is_alive():
+            self.start()
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="turn-recorder", daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout=5.0):
+        """Write everything queued so far"""
+        if not self._thread or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = []
+            waiters = []
+            item = self._queue.get()
+            deadline = time.monotonic() + WRITE_INTERVAL
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if batch:
+                self._append(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _append(self, batch):
+        lines = "".join(json.dumps(item, separators=(",", ":"), ensure_ascii=False) + "\n" for item in batch)
+        try:
+            opener = gzip.open if RECORD_FILE.endswith(".gz") else open
+            with opener(RECORD_FILE, "at", encoding="utf-8") as f:
+                f.write(lines)
+            self.stats["written"] += len(batch)
+        except Exception as e:
+            self.stats["dropped"] += len(batch)
+            logger.warning(f"Writing {len(batch)} turn records failed: {e}")
+
+
+writer = RecordWriter()
+
+
+def load(path):
+    """Recorded turns grouped by (channel, session id), each session in turn order"""
+    sessions = {}
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable record on line {line_number} of {path}")
+                continue
+            sessions.setdefault((record["ch"], record["sid"]), []).append(record)
+    for turns in sessions.values():
+        turns.sort(key=lambda record: record["turn"])
+    return sessions
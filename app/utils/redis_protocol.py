@@ -0,0 +1,361 @@
+import time
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from urllib.parse import urlparse
+
+
+logger = logging.getLogger(__name__)
+
+
+class RedisError(Exception):
+    """An error reply from the server"""
+
+
+def encode_command(*args):
+    """A command as a RESP array of bulk strings"""
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(out)
+
+
+def read_reply(stream):
+    """Read one RESP reply from a binary file object; error replies are returned as RedisError"""
+    line = stream.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RedisError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        size = int(body)
+        if size < 0:
+            return None
+        data = stream.read(size + 2)
+        if len(data) != size + 2:
+            raise ConnectionError("connection closed")
+        return data[:-2]
+    if kind == b"*":
+        size = int(body)
+        if size < 0:
+            return None
+        return [read_reply(stream) for _ in range(size)]
+    raise ConnectionError(f"unexpected reply {line[:32]!r}")
+
+
+class RedisConnection:
+    """Minimal blocking RESP2 client, enough for the session store and event relay without a redis dependency.
+
+    Not thread-safe: WATCH/MULTI state belongs to the connection, so each
+    thread keeps its own.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", timeout=5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def _call(self, *args):
+        self._sock.sendall(encode_command(*args))
+        reply = read_reply(self._file)
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def execute(self, *args):
+        """Send one command and return its reply; a dropped connection is reopened on the next call"""
+        if self._sock is None:
+            self._connect()
+        try:
+            return self._call(*args)
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+    def subscribe(self, *channels):
+        """SUBSCRIBE, then yield (channel, payload) for every message until the connection closes.
+
+        The connection is given over to the subscription; close() from another
+        thread ends it.
+        """
+        if self._sock is None:
+            self._connect()
+        self._sock.sendall(encode_command("SUBSCRIBE", *channels))
+        # No read timeout: a quiet channel is not a dead connection, keepalive notices those
+        self._sock.settimeout(None)
+        while True:
+            try:
+                reply = read_reply(self._file)
+            except (OSError, ValueError):
+                raise ConnectionError("connection closed")
+            if isinstance(reply, RedisError):
+                raise reply
+            if isinstance(reply, list) and len(reply) == 3 and reply[0] in (b"message", "message"):
+                yield reply[1], reply[2]
+
+    def close(self):
+        # May race with a subscription's own close() in another thread
+        sock, stream = self._sock, self._file
+        self._sock = self._file = None
+        if sock is not None:
+            try:
+                # Wakes a thread blocked reading a subscription
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                if stream is not None:
+                    stream.close()
+                sock.close()
+            except OSError:
+                pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server.store
+        write_lock = threading.Lock()
+
+        def send(reply):
+            # Published messages are written from the publisher's thread
+            with write_lock:
+                self.wfile.write(_encode_reply(reply))
+
+        session = {"watched": None, "queue": None, "send": send}
+        try:
+            while True:
+                try:
+                    command = read_reply(self.rfile)
+                except (ConnectionError, ValueError, OSError):
+                    return
+                if not isinstance(command, list) or not command:
+                    return
+                name = command[0].decode().upper()
+                args = command[1:]
+                try:
+                    reply = server.dispatch(session, name, args)
+                except RedisError as e:
+                    reply = e
+                if reply is not _NO_REPLY:
+                    send(reply)
+        finally:
+            server.unsubscribe(send)
+
+
+def _encode_reply(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, RedisError):
+        return b"-%s\r\n" % str(reply).encode()
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if isinstance(reply, _NullArray):
+        return b"*-1\r\n"
+    return b"*%d\r\n" % len(reply) + b"".join(_encode_reply(item) for item in reply)
+
+
+class _NullArray:
+    """EXEC's reply when a watched key changed"""
+
+
+# dispatch() already sent its replies itself
+_NO_REPLY = object()
+
+
+class _Keyspace:
+    """The stand-in's data: values with expiry, plus a revision per key for WATCH, and pub/sub channels"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.revisions = {}
+        self.channels = {}
+
+    def unsubscribe(self, send):
+        with self.lock:
+            for subscribers in self.channels.values():
+                subscribers.discard(send)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        delivered = 0
+        for send in subscribers:
+            try:
+                send([b"message", channel, message])
+                delivered += 1
+            except OSError:
+                pass
+        return delivered
+
+    def _live(self, key):
+        entry = self.values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.values[key]
+            self.revisions[key] = self.revisions.get(key, 0) + 1
+            return None
+        return entry
+
+    def _write(self, key, entry):
+        if entry is None:
+            existed = self.values.pop(key, None) is not None
+        else:
+            self.values[key] = entry
+            existed = True
+        self.revisions[key] = self.revisions.get(key, 0) + 1
+        return existed
+
+    def dispatch(self, session, name, args):
+        if session["queue"] is not None and name not in ("EXEC", "DISCARD", "MULTI", "WATCH"):
+            session["queue"].append((name, args))
+            return "QUEUED"
+        if name == "MULTI":
+            if session["queue"] is not None:
+                raise RedisError("ERR MULTI calls can not be nested")
+            session["queue"] = []
+            return "OK"
+        if name == "DISCARD":
+            session["queue"] = None
+            session["watched"] = None
+            return "OK"
+        if name == "EXEC":
+            if session["queue"] is None:
+                raise RedisError("ERR EXEC without MULTI")
+            queue, watched = session["queue"], session["watched"]
+            session["queue"] = session["watched"] = None
+            with self.lock:
+                for key in watched or {}:
+                    self._live(key)
+                if watched and any(self.revisions.get(key, 0) != rev for key, rev in watched.items()):
+                    return _NullArray()
+                return [self._run(command, command_args) for command, command_args in queue]
+        if name == "WATCH":
+            if session["queue"] is not None:
+                raise RedisError("ERR WATCH inside MULTI is not allowed")
+            with self.lock:
+                watched = session["watched"] or {}
+                for key in args:
+                    self._live(key)
+                    watched.setdefault(key, self.revisions.get(key, 0))
+                session["watched"] = watched
+            return "OK"
+        if name == "UNWATCH":
+            session["watched"] = None
+            return "OK"
+        if name == "SUBSCRIBE":
+            for channel in args:
+                with self.lock:
+                    self.channels.setdefault(channel, set()).add(session["send"])
+                    count = sum(session["send"] in subscribers for subscribers in self.channels.values())
+                session["send"]([b"subscribe", channel, count])
+            return _NO_REPLY
+        if name == "PUBLISH":
+            return self.publish(args[0], args[1])
+        with self.lock:
+            return self._run(name, args)
+
+    def _run(self, name, args):
+        """One data command; the caller holds the lock"""
+        if name == "PING":
+            return "PONG"
+        if name in ("AUTH", "SELECT"):
+            return "OK"
+        if name == "GET":
+            entry = self._live(args[0])
+            return entry[0] if entry else None
+        if name == "SET":
+            expires = None
+            if len(args) >= 4 and args[2].upper() == b"EX":
+                expires = time.time() + int(args[3])
+            self._write(args[0], (args[1], expires))
+            return "OK"
+        if name == "INCR":
+            entry = self._live(args[0])
+            try:
+                value = int(entry[0]) + 1 if entry else 1
+            except ValueError:
+                return RedisError("ERR value is not an integer or out of range")
+            self._write(args[0], (str(value).encode(), entry[1] if entry else None))
+            return value
+        if name == "DEL":
+            return sum(1 for key in args if self._live(key) is not None and self._write(key, None))
+        if name == "FLUSHDB":
+            for key in list(self.values):
+                self._write(key, None)
+            return "OK"
+        return RedisError(f"ERR unknown command '{name}'")
+
+
+class LocalRedisServer:
+    """In-process stand-in for Redis that speaks enough RESP for the session store.
+
+    Supports GET, SET (with EX), DEL, INCR, WATCH/MULTI/EXEC, PUBLISH/SUBSCRIBE
+    and a few housekeeping commands, so the Redis backends and multi-worker
+    runs can be exercised without a Redis install.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._server = socketserver.ThreadingTCPServer((host, port), _Handler, bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.store = _Keyspace()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="local-redis", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local Redis stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = LocalRedisServer(args.host, args.port).start()
+    logger.info(f"Local Redis stand-in listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
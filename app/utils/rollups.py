@@ -0,0 +1,166 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import func, inspect, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.db import engine, get_session
+from app.models import Appointment, AppointmentSummary, BookingRollup, CallNote, CallRollup
+from app.utils.doctor_cache import bump_cache_version, read_cache_version
+
+
+logger = logging.getLogger(__name__)
+
+booking_table = BookingRollup.__table__
+call_table = CallRollup.__table__
+
+ROLLUP_VERSION_NAME = "rollups"
+
+
+def booking_key(appointment):
+    """Rollup key for an appointment-like dict"""
+    time_str = appointment.get("time") or "00:00"
+    try:
+        hour = int(time_str.split(":")[0])
+    except ValueError:
+        hour = 0
+    return (appointment.get("clinic_id") or "", appointment.get("date") or "", hour,
+            appointment.get("doctor_name") or "", (appointment.get("urgency_level") or "low").lower())
+
+
+def call_key(note):
+    created_at = note.get("created_at") or datetime.utcnow()
+    return note.get("clinic_id") or "", created_at.strftime("%Y-%m-%d"), created_at.hour, note.get("channel") or ""
+
+
+def _upsert(conn, table, key_columns, rows, counters):
+    """Add counter deltas to rollup rows, inserting rows that don't exist yet"""
+    if not rows:
+        return
+    dialect = engine.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: table.c[name] + stmt.excluded[name] for name in counters},
+        )
+        conn.execute(stmt, rows)
+        return
+
+    # Portable fallback: update, then insert rows that didn't exist
+    for row in rows:
+        where = [table.c[name] == row[name] for name in key_columns]
+        result = conn.execute(update(table).where(*where).values(
+            {name: table.c[name] + row[name] for name in counters}))
+        if result.rowcount == 0:
+            conn.execute(table.insert().values(row))
+
+
+def apply_booking_deltas(conn, deltas):
+    """Apply {booking_key: count delta} inside the caller's transaction"""
+    rows = [
+        {"clinic_id": clinic, "date": date, "hour": hour, "doctor_name": doctor, "urgency_level": urgency,
+         "bookings": count}
+        for (clinic, date, hour, doctor, urgency), count in deltas.items() if count
+    ]
+    _upsert(conn, booking_table, ["clinic_id", "date", "hour", "doctor_name", "urgency_level"], rows, ["bookings"])
+
+
+def record_bookings(conn, appointments):
+    """Count new appointments (dicts) into the booking rollup"""
+    apply_booking_deltas(conn, Counter(booking_key(appointment) for appointment in appointments))
+
+
+def record_calls(conn, notes):
+    """Count new call notes (dicts), one per call, into the call rollup"""
+    calls = Counter()
+    booked = Counter()
+    for note in notes:
+        key = call_key(note)
+        calls[key] += 1
+        if note.get("appointment_id"):
+            booked[key] += 1
+    rows = [
+        {"clinic_id": clinic, "date": date, "hour": hour, "channel": channel, "calls": count,
+         "booked_calls": booked[(clinic, date, hour, channel)]}
+        for (clinic, date, hour, channel), count in calls.items()
+    ]
+    _upsert(conn, call_table, ["clinic_id", "date", "hour", "channel"], rows, ["calls", "booked_calls"])
+
+
+def record_call_booked(conn, note):
+    """Count an already rolled-up call (a dict) as booked, e.g. when a resumed session books"""
+    clinic, date, hour, channel = call_key(note)
+    _upsert(conn, call_table, ["clinic_id", "date", "hour", "channel"],
+            [{"clinic_id": clinic, "date": date, "hour": hour, "channel": channel, "calls": 0, "booked_calls": 1}],
+            ["calls", "booked_calls"])
+
+
+def rebuild_rollups():
+    """Recompute every rollup from the base tables (one GROUP BY pass each)"""
+    appointment = Appointment.__table__
+    note = CallNote.__table__
+    with get_session() as session:
+        session.execute(booking_table.delete())
+        session.execute(call_table.delete())
+
+        deltas = Counter()
+        columns = (appointment.c.clinic_id, appointment.c.date, appointment.c.time, appointment.c.doctor_name,
+                   appointment.c.urgency_level)
+        rows = session.execute(
+            select(*columns, func.count())
+            .where(or_(appointment.c.status.is_(None), appointment.c.status != "cancelled"))
+            .group_by(*columns)
+        ).all()
+        for clinic, date, time_str, doctor, urgency, count in rows:
+            deltas[booking_key({"clinic_id": clinic, "date": date, "time": time_str, "doctor_name": doctor,
+                                "urgency_level": urgency})] += count
+        apply_booking_deltas(session, deltas)
+
+        notes = session.execute(
+            select(note.c.created_at, note.c.channel, note.c.appointment_id, note.c.clinic_id)).mappings()
+        batch = []
+        for row in notes:
+            batch.append(dict(row))
+            if len(batch) >= 5000:
+                record_calls(session, batch)
+                batch = []
+        record_calls(session, batch)
+
+        bump_cache_version(session, ROLLUP_VERSION_NAME)
+        session.commit()
+    logger.info(f"Rebuilt analytics rollups from {sum(deltas.values())} appointments")
+
+
+def _keyed_by_clinic():
+    inspector = inspect(engine)
+    return all("clinic_id" in {column["name"] for column in inspector.get_columns(table.name)}
+               for table in (booking_table, call_table))
+
+
+def ensure_rollups():
+    """Startup phase: build the rollups once for databases that predate them"""
+    if not _keyed_by_clinic():
+        # Rollups from before clinic_id joined their keys; they only hold derived counts, so start over
+        for table in (booking_table, call_table):
+            table.drop(engine)
+            table.create(engine)
+        # So does the dashboard summary, which counted every clinic; get_summary() rebuilds it per clinic
+        with engine.begin() as conn:
+            conn.execute(AppointmentSummary.__table__.delete())
+        logger.info("Recreated the analytics rollups and dashboard summary per clinic")
+        rebuild_rollups()
+        return True
+    with get_session() as session:
+        if read_cache_version(session, ROLLUP_VERSION_NAME):
+            return False
+    rebuild_rollups()
+    return True
+
+
+if __name__ == "__main__":
+    from app.db import init_db
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    if not ensure_rollups():
+        rebuild_rollups()
@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from app.utils.metrics import SESSION_CONFLICTS, SESSION_STORE_SECONDS
+from app.utils.redis_protocol import RedisConnection
+
+
+logger = logging.getLogger(__name__)
+
+# "memory" only works with a single worker; "sqlite" shares state between the
+# workers of one node, "redis" between nodes
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory").lower()
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", "./sessions.db")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", "3600"))
+
+# Serialized state starts with a format byte; larger states are deflated
+_RAW, _DEFLATED = b"j", b"z"
+COMPRESS_OVER_BYTES = 512
+
+
+class SessionConflict(Exception):
+    """Another worker saved the session since it was loaded"""
+
+
+class SessionState:
+    """Conversation history and slots for one call or browser session.
+
+    `version` counts saves; a save only succeeds if nobody else saved since
+    this copy was loaded. A session that was never saved has version 0.
+    """
+
+    __slots__ = ("session_id", "history", "slots", "version")
+
+    def __init__(self, session_id, history=None, slots=None, version=0):
+        self.session_id = session_id
+        self.history = history if history is not None else []
+        self.slots = slots if slots is not None else {}
+        self.version = version
+
+
+def encode_state(state):
+    raw = json.dumps({"h": state.history, "s": state.slots}, separators=(",", ":"), ensure_ascii=False).encode()
+    if len(raw) > COMPRESS_OVER_BYTES:
+        return _DEFLATED + zlib.compress(raw, 6)
+    return _RAW + raw
+
+
+def decode_state(session_id, version, blob):
+    blob = bytes(blob)
+    raw = zlib.decompress(blob[1:]) if blob[:1] == _DEFLATED else blob[1:]
+    data = json.loads(raw)
+    return SessionState(session_id, data["h"], data["s"], version)
+
+
+class SessionStore:
+    """Versioned session state. Backends implement _get, _put and delete.
+
+    _put(session_id, expected_version, blob) writes the blob as version
+    expected_version + 1 only if the stored version is still expected_version,
+    and returns whether it did.
+    """
+
+    name = None
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        self.ttl = ttl
+
+    def load(self, session_id):
+        """The stored state, or a fresh one at version 0"""
+        with SESSION_STORE_SECONDS.labels("load").time():
+            row = self._get(session_id)
+        if row is None:
+            return SessionState(session_id)
+        return decode_state(session_id, *row)
+
+    def save(self, state):
+        """Write the state and bump its version; raises SessionConflict if it changed underneath"""
+        blob = encode_state(state)
+        with SESSION_STORE_SECONDS.labels("save").time():
+            saved = self._put(state.session_id, state.version, blob)
+        if not saved:
+            SESSION_CONFLICTS.inc()
+            raise SessionConflict(f"session {state.session_id} changed since version {state.version}")
+        state.version += 1
+        return state
+
+    def update(self, session_id, change, state=None, attempts=5):
+        """Apply change(state) and save it, reloading and reapplying when another worker saved first.
+
+        Pass the state already loaded for this turn to skip the first load.
+        """
+        for _ in range(attempts):
+            if state is None:
+                state = self.load(session_id)
+            change(state)
+            try:
+                return self.save(state)
+            except SessionConflict:
+                state = None
+        raise SessionConflict(f"session {session_id} kept changing; gave up after {attempts} attempts")
+
+    def _get(self, session_id):
+        raise NotImplementedError
+
+    def _put(self, session_id, expected_version, blob):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; state is lost on restart and invisible to other workers"""
+
+    name = "memory"
+    PURGE_EVERY = 1000
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._saves = 0
+
+    def _get(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None or entry[2] <= time.monotonic():
+            return None
+        return entry[0], entry[1]
+
+    def _put(self, session_id, expected_version, blob):
+        with self._lock:
+            now = time.monotonic()
+            current = self._get(session_id)
+            if (current[0] if current else 0) != expected_version:
+                return False
+            self._sessions[session_id] = (expected_version + 1, blob, now + self.ttl)
+            self._saves += 1
+            if self._saves % self.PURGE_EVERY == 0:
+                self._sessions = {key: entry for key, entry in self._sessions.items() if entry[2] > now}
+        return True
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SqliteSessionStore(SessionStore):
+    """State in a SQLite file shared by every worker on the node.
+
+    Compare-and-set is a conditional UPDATE (or an INSERT that only replaces
+    an expired row), so concurrent writers never overwrite each other.
+    """
+
+    name = "sqlite"
+    PURGE_EVERY = 500
+
+    def __init__(self, path=SESSION_STORE_PATH, ttl=SESSION_TTL_SECONDS):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        self._saves = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS session_state ("
+                         "session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+                         "data BLOB NOT NULL, expires_at REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, session_id):
+        return self._connection().execute(
+            "SELECT version, data FROM session_state WHERE session_id = ? AND expires_at > ?",
+            (session_id, time.time()),
+        ).fetchone()
+
+    def _put(self, session_id, expected_version, blob):
+        conn = self._connection()
+        now = time.time()
+        expires = now + self.ttl
+        if expected_version == 0:
+            cursor = conn.execute(
+                "INSERT INTO session_state (session_id, version, data, expires_at) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET version = 1, data = excluded.data, "
+                "expires_at = excluded.expires_at WHERE session_state.expires_at <= ?",
+                (session_id, blob, expires, now),
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE session_state SET version = version + 1, data = ?, expires_at = ? "
+                "WHERE session_id = ? AND version = ? AND expires_at > ?",
+                (blob, expires, session_id, expected_version, now),
+            )
+        self._saves += 1
+        if self._saves % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM session_state WHERE expires_at <= ?", (now,))
+        return cursor.rowcount == 1
+
+    def delete(self, session_id):
+        self._connection().execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+
+class RedisSessionStore(SessionStore):
+    """State in Redis (or anything speaking its protocol), shared by every node.
+
+    Values are "<version>:<blob>" with a TTL; saves use WATCH/MULTI/EXEC so
+    a concurrent save aborts the transaction instead of being overwritten.
+    """
+
+    name = "redis"
+    KEY_PREFIX = "receptionist:session:"
+
+    def __init__(self, url=REDIS_URL, ttl=SESSION_TTL_SECONDS):
+        super().__init__(ttl)
+        self.url = url
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = RedisConnection(self.url)
+        return conn
+
+    @staticmethod
+    def _split(value):
+        version, _, blob = value.partition(b":")
+        return int(version), blob
+
+    def _get(self, session_id):
+        value = self._connection().execute("GET", self.KEY_PREFIX + session_id)
+        return self._split(value) if value is not None else None
+
+    def _put(self, session_id, expected_version, blob):
+        key = self.KEY_PREFIX + session_id
+        conn = self._connection()
+        conn.execute("WATCH", key)
+        current = conn.execute("GET", key)
+        if (self._split(current)[0] if current is not None else 0) != expected_version:
+            conn.execute("UNWATCH")
+            return False
+        conn.execute("MULTI")
+        conn.execute("SET", key, b"%d:" % (expected_version + 1) + blob, "EX", self.ttl)
+        return conn.execute("EXEC") is not None
+
+    def delete(self, session_id):
+        self._connection().execute("DEL", self.KEY_PREFIX + session_id)
+
+
+def create_session_store(backend=SESSION_STORE):
+    if backend == "sqlite":
+        store = SqliteSessionStore()
+        logger.info(f"Session state in SQLite file {store.path}")
+    elif backend == "redis":
+        store = RedisSessionStore()
+        logger.info(f"Session state in Redis at {store.url.rsplit('@', 1)[-1]}")
+    else:
+        if backend != "memory":
+            logger.warning(f"Unknown SESSION_STORE {backend!r}; using memory")
+        store = MemorySessionStore()
+        if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+            logger.warning("SESSION_STORE=memory with several workers: calls will lose their state "
+                           "when webhooks land on another worker. Use sqlite or redis.")
+    return store
+
+
+session_store = create_session_store()
@@ -0,0 +1,411 @@
+import os
+import re
+import logging
+from functools import lru_cache
+from datetime import date as Date, datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.utils.doctor_cache import CLINIC_TIMEZONE, WEEKDAYS
+
+
+logger = logging.getLogger(__name__)
+
+# Confirm and book a fully specified booking without asking the model
+LOCAL_BOOKING = os.environ.get("LOCAL_BOOKING", "true").lower() not in ("0", "false", "no")
+
+# What book_appointment needs, and what the local path reads back before booking
+REQUIRED = ("patient_name", "phone", "date", "time")
+FIELDS = REQUIRED + ("doctor_name", "purpose")
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+          "november", "december"]
+NUMBER_WORDS = {"zero": 0, "oh": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12}
+MINUTE_WORDS = {"o'clock": 0, "fifteen": 15, "thirty": 30, "forty five": 45, "forty-five": 45}
+
+_HOUR_WORD = r"(one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve)"
+_MINUTE_WORD = r"(o'clock|fifteen|thirty|forty[- ]five)"
+_MERIDIEM = r"(a\.?\s?m\.?|p\.?\s?m\.?)(?![a-z])"
+_MONTH = r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?" \
+         r"|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_ORDINAL = r"(\d{1,2})(?:st|nd|rd|th)?"
+_WEEKDAY = r"(monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+
+# Phone numbers: 7 digits, 10 digits, or +1 and 10 digits, with the usual separators
+PHONE = re.compile(r"(?<![\d-])(?:\+?1[\s.-]?)?(?:\(\d{3}\)\s?|\d{3}[\s.-]?)?\d{3}[\s.-]?\d{4}(?![\d-])")
+# Spoken digits ("five five five, oh one four two"), joined before PHONE runs
+DIGIT_WORDS = re.compile(r"\b(?:(?:zero|oh|one|two|three|four|five|six|seven|eight|nine)[\s,-]+){6,}"
+                         r"(?:zero|oh|one|two|three|four|five|six|seven|eight|nine)\b", re.I)
+
+# Names follow an introduction; capitalized words only, except after the unambiguous "my name is"
+NAME = re.compile(r"(?i:\b(?:this is|i am|i'm|it's|call me|name's|patient is|for))\s+"
+                  r"([A-Z][a-z'’-]+(?:\s+[A-Z][a-z'’-]+){0,2})")
+MY_NAME = re.compile(r"\bmy name is\s+([a-z][a-z'’-]+(?:\s+[a-z][a-z'’-]+){0,2})", re.I)
+
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+MONTH_DAY = re.compile(rf"\b{_MONTH}\s+(?:the\s+)?{_ORDINAL}\b(?:,?\s+(\d{{4}}))?", re.I)
+DAY_MONTH = re.compile(rf"\b(?:the\s+)?{_ORDINAL}\s+(?:of\s+)?{_MONTH}(?:,?\s+(\d{{4}}))?", re.I)
+NUMERIC_DATE = re.compile(r"(?<![\d/])(\d{1,2})/(\d{1,2})(?:/(\d{2}|\d{4}))?(?![\d/])")
+DAY_OF_MONTH = re.compile(r"\bthe\s+(\d{1,2})(?:st|nd|rd|th)\b", re.I)
+RELATIVE_DAY = re.compile(r"\b(today|tonight|(?:the\s+)?day after tomorrow|tomorrow)\b", re.I)
+IN_DAYS = re.compile(r"\bin\s+(\d+|a|one|two|three|four|five|six|seven)\s+(days?|weeks?)\b", re.I)
+WEEKDAY = re.compile(rf"\b(?:(this|next|coming|this coming)\s+)?{_WEEKDAY}\b", re.I)
+
+CLOCK_TIME = re.compile(rf"(?<![\d:/.-])(\d{{1,2}})(?::([0-5]\d))?\s*{_MERIDIEM}", re.I)
+TWENTY_FOUR_HOUR = re.compile(r"(?<![\d:/.-])([01]?\d|2[0-3]):([0-5]\d)(?![\d:])")
+AT_HOUR = re.compile(r"\b(?:at|around|by|make it)\s+(\d{1,2})(?!\s*(?:st|nd|rd|th|/|-|\d))\b", re.I)
+WORD_TIME = re.compile(rf"\b{_HOUR_WORD}(?:\s+{_MINUTE_WORD})?\s*{_MERIDIEM}", re.I)
+AT_WORD_TIME = re.compile(rf"\b(?:at|around|by|make it)\s+{_HOUR_WORD}(?:\s+{_MINUTE_WORD})?\b", re.I)
+NOON = re.compile(r"\b(noon|midday)\b", re.I)
+DAYPART = re.compile(r"\b(?:in the\s+)?(morning|afternoon|evening)\b", re.I)
+
+CANCEL = re.compile(r"\bcancel", re.I)
+RESCHEDULE = re.compile(r"\b(?:reschedul\w*|move|change|push)\b.{0,30}\b(?:appointment|booking|it)\b", re.I)
+BOOK = re.compile(r"\b(?:book|schedule|appointment|come in|check-?up|cleaning|see (?:a|the) (?:dentist|doctor)"
+                  r"|see (?:dr\b|doctor\s))", re.I)
+YES = re.compile(r"^\W*(?:yes|yeah|yep|yup|correct|that's (?:right|correct)|right|sure|please do|go ahead|"
+                 r"book it|sounds good|perfect|ok(?:ay)?)\b", re.I)
+NO = re.compile(r"^\W*(?:no|nope|not quite|that's wrong|wrong|actually)\b", re.I)
+# Questions the local path can't answer ("can I book" is fine, "do you take insurance" is not)
+QUESTION = re.compile(r"\b(?:what|where|why|how|which|who|do you|does|is there|are you|insurance|cost|price)\b",
+                      re.I)
+
+PURPOSES = re.compile(r"\b(cleaning|check-?up|toothache|filling|whitening|braces|crown|root canal|extraction|"
+                      r"wisdom tooth|implant|emergency|consultation)\b", re.I)
+
+# Words after "I'm" / "this is" that are not names
+NOT_NAMES = {"calling", "looking", "trying", "interested", "available", "free", "sorry", "not", "just", "here",
+             "fine", "good", "great", "okay", "ok", "also", "so", "still", "actually", "going", "having", "in",
+             "on", "at", "and", "dr", "doctor", "the", "a", "hoping", "wondering", "new", "booking", "an",
+             "afraid", "sure", "ready", "done", "back", "busy", "home", "out", "away", "that", "it", "for", "me",
+             "my", "your", "phone", "number", "tomorrow", "today", "next", "this", "please"} | set(WEEKDAYS) | \
+    set(MONTHS)
+
+
+def clinic_zone(name):
+    """The clinic's timezone; UTC when the name is unknown to this machine"""
+    try:
+        return ZoneInfo(name or CLINIC_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name!r}, resolving dates in UTC")
+        return ZoneInfo("UTC")
+
+
+def clinic_now(doctors=None):
+    """The current time where the clinic is"""
+    return datetime.now(clinic_zone(getattr(doctors, "timezone", None)))
+
+
+def normalize_phone(value):
+    """Digits in the clinic's usual 555-0142 / 555-123-4567 shape; None if it isn't a phone number"""
+    digits = re.sub(r"\D", "", value or "")
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    if len(digits) == 10:
+        return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
+    if len(digits) == 7:
+        return f"{digits[:3]}-{digits[3:]}"
+    return None
+
+
+def _spoken_digits(match):
+    return "".join(str(NUMBER_WORDS[word.lower()]) for word in re.findall(r"[a-z]+", match.group(), re.I))
+
+
+def _month(name):
+    return next(index for index, month in enumerate(MONTHS, 1) if month.startswith(name.lower()[:3]))
+
+
+def _upcoming(today, month, day, year=None):
+    """A month/day on or after today (next year's if this year's has passed); None if no such date"""
+    try:
+        if year:
+            return Date(year if year > 99 else 2000 + year, month, day)
+        resolved = Date(today.year, month, day)
+        return resolved if resolved >= today else Date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def resolve_date(text, today):
+    """The date a caller means, as a date, resolved against `today` in the clinic's timezone.
+
+    A bare or "this" weekday is the next one after today; "next Monday" is
+    the Monday of next week (weeks start on Sunday, as on American
+    calendars), so said on a Tuesday it's six days away, said on a Saturday
+    two. Read-backs name the weekday and date, so the caller can correct
+    either reading.
+    """
+    match = ISO_DATE.search(text)
+    if match:
+        try:
+            return Date(*(int(part) for part in match.groups()))
+        except ValueError:
+            return None
+    match = MONTH_DAY.search(text)
+    if match:
+        return _upcoming(today, _month(match.group(1)), int(match.group(2)), match.group(3) and int(match.group(3)))
+    match = DAY_MONTH.search(text)
+    if match:
+        return _upcoming(today, _month(match.group(2)), int(match.group(1)), match.group(3) and int(match.group(3)))
+    match = NUMERIC_DATE.search(text)
+    if match and int(match.group(1)) <= 12:
+        year = match.group(3) and int(match.group(3))
+        return _upcoming(today, int(match.group(1)), int(match.group(2)), year)
+    match = RELATIVE_DAY.search(text)
+    if match:
+        word = match.group(1).lower()
+        return today + timedelta(days=2 if "after" in word else 1 if word == "tomorrow" else 0)
+    match = IN_DAYS.search(text)
+    if match:
+        count = match.group(1).lower()
+        count = 1 if count == "a" else int(count) if count.isdigit() else NUMBER_WORDS[count]
+        return today + timedelta(days=count * (7 if match.group(2).lower().startswith("week") else 1))
+    match = WEEKDAY.search(text)
+    if match:
+        weekday = WEEKDAYS.index(match.group(2).lower())
+        if (match.group(1) or "").lower() == "next":
+            next_sunday = today + timedelta(days=7 - (today.weekday() + 1) % 7)
+            return next_sunday + timedelta(days=(weekday + 1) % 7)
+        return today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+    match = DAY_OF_MONTH.search(text)
+    if match:
+        # "The 8th": this month's, or next month's once it has passed
+        day = int(match.group(1))
+        month, year = (today.month, today.year) if day >= today.day else \
+            (today.month % 12 + 1, today.year + (today.month == 12))
+        return _upcoming(today, month, day, year)
+    return None
+
+
+def _clock(hour, minute, meridiem=None, daypart=None):
+    """24-hour HH:MM; without am/pm, 1 to 7 o'clock is read as afternoon (clinic hours)"""
+    if hour > 23 or minute > 59:
+        return None
+    meridiem = (meridiem or "").lower().replace(".", "").replace(" ", "")
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    elif hour <= 12:
+        if daypart in ("afternoon", "evening") and hour < 12:
+            hour += 12
+        elif daypart != "morning" and 1 <= hour <= 7:
+            hour += 12
+    return f"{hour:02d}:{minute:02d}"
+
+
+def resolve_time(text):
+    """The time a caller means, as 24-hour HH:MM, or None"""
+    daypart = DAYPART.search(text)
+    daypart = daypart.group(1).lower() if daypart else None
+    match = CLOCK_TIME.search(text)
+    if match:
+        return _clock(int(match.group(1)), int(match.group(2) or 0), match.group(3))
+    match = WORD_TIME.search(text)
+    if match:
+        return _clock(NUMBER_WORDS[match.group(1).lower()], MINUTE_WORDS.get((match.group(2) or "o'clock").lower(), 0),
+                      match.group(3))
+    match = TWENTY_FOUR_HOUR.search(text)
+    if match:
+        return _clock(int(match.group(1)), int(match.group(2)), daypart=daypart)
+    if NOON.search(text):
+        return "12:00"
+    match = AT_HOUR.search(text)
+    if match:
+        return _clock(int(match.group(1)), 0, daypart=daypart)
+    match = AT_WORD_TIME.search(text)
+    if match:
+        return _clock(NUMBER_WORDS[match.group(1).lower()],
+                      MINUTE_WORDS.get((match.group(2) or "o'clock").lower(), 0), daypart=daypart)
+    return None
+
+
+def resolve_name(text):
+    match = MY_NAME.search(text)
+    candidates = [match.group(1)] if match else []
+    candidates += [match.group(1) for match in NAME.finditer(text)]
+    for candidate in candidates:
+        words = []
+        for word in candidate.split():
+            if word.lower().strip(".'’") in NOT_NAMES:
+                break
+            words.append(word[0].upper() + word[1:])
+        if words:
+            return " ".join(words)
+    return None
+
+
+@lru_cache(maxsize=256)
+def _doctor_pattern(names):
+    """One pattern matching any of these doctors by surname, with or without "Dr."/"doctor" in front"""
+    surnames = {}
+    for name in names:
+        surname = name.replace("Dr.", "").split()[-1] if name.replace("Dr.", "").split() else name
+        surnames.setdefault(surname.lower(), name)
+    if not surnames:
+        return None, {}
+    alternatives = "|".join(re.escape(surname) for surname in sorted(surnames, key=len, reverse=True))
+    return re.compile(rf"\b(?:dr\.?\s+|doctor\s+)?({alternatives})\b", re.I), surnames
+
+
+def resolve_doctor(text, doctors):
+    """Which of the clinic's doctors the caller named, as their listed name"""
+    if doctors is None or not doctors.doctors:
+        return None
+    pattern, surnames = _doctor_pattern(tuple(doctor["name"] for doctor in doctors.doctors))
+    match = pattern.search(text)
+    return surnames[match.group(1).lower()] if match else None
+
+
+def extract(text, doctors=None, today=None):
+    """Every slot one utterance gives, e.g. {"phone": "555-0142", "date": "2030-01-07", "intent": "book"}.
+
+    Dates are resolved against `today` (the clinic's today when omitted) and
+    times are 24-hour HH:MM, the formats book_appointment takes.
+    """
+    today = today or clinic_now(doctors).date()
+    found = {}
+    text = DIGIT_WORDS.sub(_spoken_digits, text)
+
+    # Phone numbers first, so their digits aren't read as dates or times
+    for match in PHONE.finditer(text):
+        phone = normalize_phone(match.group())
+        if phone:
+            found["phone"] = phone
+    rest = PHONE.sub(" ", text)
+
+    name = resolve_name(rest)
+    if name:
+        found["patient_name"] = name
+        # "This is John Smith" names the caller, not Dr. Smith
+        rest = re.sub(rf"\b{re.escape(name)}\b", " ", rest, flags=re.I)
+    doctor = resolve_doctor(rest, doctors)
+    if doctor:
+        found["doctor_name"] = doctor
+    resolved = resolve_date(rest, today)
+    if resolved is not None:
+        found["date"] = resolved.isoformat()
+    clock = resolve_time(rest)
+    if clock:
+        found["time"] = clock
+    purpose = PURPOSES.search(rest)
+    if purpose:
+        found["purpose"] = purpose.group(1).lower()
+
+    if CANCEL.search(rest):
+        found["intent"] = "cancel"
+    elif RESCHEDULE.search(rest):
+        found["intent"] = "reschedule"
+    elif BOOK.search(rest):
+        found["intent"] = "book"
+    if YES.search(rest):
+        found["answer"] = "yes"
+    elif NO.search(rest):
+        found["answer"] = "no"
+    if QUESTION.search(rest):
+        found["question"] = True
+    return found
+
+
+def spoken_date(value):
+    day = datetime.strptime(value, "%Y-%m-%d")
+    return f"{day.strftime('%A, %B')} {day.day}"
+
+
+def spoken_time(value):
+    hour, minute = (int(part) for part in value.split(":"))
+    suffix = "AM" if hour < 12 else "PM"
+    hour = hour % 12 or 12
+    return f"{hour}:{minute:02d} {suffix}" if minute else f"{hour} {suffix}"
+
+
+def context_note(booking, now):
+    """The booking details gathered so far, appended to the caller's message for the model"""
+    known = [f"{field}: {booking[field]}" + (f" ({datetime.strptime(booking[field], '%Y-%m-%d'):%A})"
+                                              if field == "date" else "")
+             for field in FIELDS if booking.get(field)]
+    if not known and booking.get("intent") != "book":
+        return ""
+    missing = [field for field in REQUIRED if not booking.get(field)]
+    note = f"[Details so far, resolved by the system; today is {now.strftime('%A %Y-%m-%d')}: " + \
+        ("; ".join(known) or "none")
+    if missing and booking.get("intent") == "book":
+        note += f". Still needed: {', '.join(missing)}"
+    return note + "]"
+
+
+def with_context(message, booking, now):
+    note = context_note(booking, now)
+    return f"{message}\n\n{note}" if note else message
+
+
+def _confirmation(booking):
+    doctor = f" with {booking['doctor_name']}" if booking.get("doctor_name") else ""
+    return (f"Just to confirm: {booking['patient_name']}, phone {booking['phone']}, on "
+            f"{spoken_date(booking['date'])} at {spoken_time(booking['time'])}{doctor}. Shall I book it?")
+
+
+def _doctor_question(doctors):
+    names = [f"{doctor['name']} for {doctor['specialty']}" for doctor in doctors.doctors]
+    listed = names[0] if len(names) == 1 else ", ".join(names[:-1]) + f"{',' if len(names) > 2 else ''} and {names[-1]}"
+    return f"Which dentist would you prefer to see? We have {listed}."
+
+
+def _bookable(booking, doctors, now):
+    """Whether the gathered details can be read back as they are; anything odd goes to the model"""
+    if booking["date"] < now.date().isoformat() or \
+            booking["date"] == now.date().isoformat() and booking["time"] <= now.strftime("%H:%M"):
+        return False
+    doctor = booking.get("doctor_name")
+    return not doctor or doctors is None or doctors.is_available(doctor, booking["date"], booking["time"])
+
+
+def plan(booking, text, doctors=None, caller_phone=None, now=None):
+    """Fold one utterance into the booking slots and decide whether the turn needs the model.
+
+    Returns (booking, local). `local` is None when the model should answer
+    (with context_note() added to the message), else (action, reply, calls):
+    "ask_doctor" when only the doctor is missing, "confirm" to read the
+    details back, and "book" once the caller said yes to that read-back.
+    """
+    now = now or clinic_now(doctors)
+    found = extract(text, doctors, now.date())
+    booking = dict(booking or {})
+    confirming = booking.pop("confirming", False)
+    changed = {field: found[field] for field in FIELDS if found.get(field) and found[field] != booking.get(field)}
+    booking.update(changed)
+    if found.get("intent"):
+        booking["intent"] = found["intent"]
+    if caller_phone and not booking.get("phone"):
+        booking["phone"] = normalize_phone(caller_phone) or caller_phone
+
+    complete = all(booking.get(field) for field in REQUIRED)
+    if not LOCAL_BOOKING or booking.get("intent") != "book" or not complete or found.get("question"):
+        return booking, None
+    if confirming and not changed:
+        if found.get("answer") == "yes":
+            args = {field: booking[field] for field in FIELDS if booking.get(field)}
+            return booking, ("book", "", [("book_appointment", args)])
+        # A "no" without the correction, or something else entirely: the model sorts it out
+        return booking, None
+    # Only answer locally when this utterance moved the booking along; anything else is for the model
+    if not changed and found.get("intent") != "book" or not _bookable(booking, doctors, now):
+        return booking, None
+    if not booking.get("doctor_name") and doctors is not None and doctors.doctors:
+        if booking.get("asked_doctor"):
+            # Asked once already and still no doctor; the model handles "anyone is fine"
+            return booking, None
+        booking["asked_doctor"] = True
+        return booking, ("ask_doctor", _doctor_question(doctors), [])
+    booking["confirming"] = True
+    return booking, ("confirm", _confirmation(booking), [])
+
+
+def settle(booking, results):
+    """The booking slots after a turn's actions: a successful booking starts over, keeping who the caller is"""
+    for name, result in results:
+        if name in ("book_appointment", "reschedule_appointment", "cancel_appointment") and result["ok"]:
+            return {field: booking[field] for field in ("patient_name", "phone") if booking.get(field)}
+        if name == "book_appointment":
+            booking = {key: value for key, value in booking.items() if key != "confirming"}
+    return booking
@@ -0,0 +1,217 @@
+import re
+import json
+
+
+# Where speech can stop being speech: a JSON object or a backtick (code fence or inline code)
+_SPEECH_BREAK = re.compile(r"[{`]")
+# Inside a JSON object: a whole string, a brace, or a string that runs past the chunk
+_JSON_TOKEN = re.compile(r'"(?:[^"\\]++|\\.)*+"|[{}]|"', re.S)
+# The rest of a string that started in an earlier chunk
+_STRING_REST = re.compile(r'(?:[^"\\]++|\\.)*+', re.S)
+_FENCE_INFO = re.compile(r"[A-Za-z0-9_+.-]*")
+_SENTENCE_END = re.compile(r"[.!?](?=\s)")
+
+SPEECH, JSON_BLOCK, FENCE = "speech", "json", "fence"
+MAX_BLOCK_CHARS = 64 * 1024
+
+
+class SpeechStreamParser:
+    """Single-pass splitter for streamed model output.
+
+    feed() takes text chunks as they arrive and returns a list of events:
+    ("speech", text) for words that can go straight to TTS, ("json", obj) as
+    soon as a JSON object or fenced JSON block closes, and ("code", text) for
+    any other fenced block or JSON that doesn't parse. Each character is
+    examined once, chunk boundaries can fall anywhere (including inside a
+    run of backticks or a string escape), and diverted blocks are only
+    joined once, when they close.
+    """
+
+    def __init__(self):
+        self.state = SPEECH
+        self._ticks = 0  # backticks seen at the end of the last chunk, not yet classified
+        self._block = []
+        self._block_chars = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        events = []
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if self.state == JSON_BLOCK:
+                pos = self._json(chunk, pos, events)
+            elif self._ticks or chunk[pos] == "`":
+                pos = self._backticks(chunk, pos, events)
+            elif self.state == SPEECH:
+                pos = self._speech(chunk, pos, events)
+            else:
+                pos = self._fence(chunk, pos)
+        return events
+
+    def finish(self):
+        """Flush at end of stream; an unclosed block is reported as code and never spoken"""
+        events = []
+        if self.state == FENCE and self._ticks >= 3:
+            self._ticks = 0
+            self._close_fence(events)
+        elif self.state != SPEECH:
+            events.append(("code", "".join(self._block)))
+        self._open(SPEECH)
+        self._ticks = 0
+        return events
+
+    def _speech(self, chunk, pos, events):
+        match = _SPEECH_BREAK.search(chunk, pos)
+        stop = match.start() if match else len(chunk)
+        if stop > pos:
+            events.append(("speech", chunk[pos:stop]))
+        if match and chunk[stop] == "{":
+            self._open(JSON_BLOCK)
+            self._depth = 1
+            self._append("{")
+            return stop + 1
+        return stop
+
+    def _json(self, chunk, pos, events):
+        start = pos
+        if self._in_string:
+            pos = self._string_rest(chunk, pos)
+        if not self._in_string:
+            for match in _JSON_TOKEN.finditer(chunk, pos):
+                token = match.group()
+                if token == "{":
+                    self._depth += 1
+                elif token == "}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._append(chunk[start:match.end()])
+                        self._emit_block("".join(self._block), events)
+                        self.state = SPEECH
+                        return match.end()
+                elif len(token) == 1:
+                    # An unterminated string: it continues in the next chunk
+                    self._in_string = True
+                    self._string_rest(chunk, match.end())
+                    break
+        self._append(chunk[start:])
+        if self._block_chars > MAX_BLOCK_CHARS:
+            # Not JSON after all (or runaway output); give up on it rather than buffer forever
+            events.append(("code", "".join(self._block)))
+            self.state = SPEECH
+        return len(chunk)
+
+    def _string_rest(self, chunk, pos):
+        """Skip to the end of the current string; returns where JSON structure resumes"""
+        if self._escape:
+            # The character after a backslash that ended the last chunk
+            self._escape = False
+            pos += 1
+        pos = _STRING_REST.match(chunk, pos).end() if pos < len(chunk) else pos
+        if pos >= len(chunk):
+            return len(chunk)
+        if chunk[pos] == "\\":
+            # A backslash as the last character; its escaped character is in the next chunk
+            self._escape = True
+            return len(chunk)
+        self._in_string = False
+        return pos + 1
+
+    def _fence(self, chunk, pos):
+        stop = chunk.find("`", pos)
+        stop = len(chunk) if stop == -1 else stop
+        self._append(chunk[pos:stop])
+        return stop
+
+    def _backticks(self, chunk, pos, events):
+        """Count a run of backticks, which may continue from the previous chunk"""
+        start = pos
+        while pos < len(chunk) and chunk[pos] == "`":
+            pos += 1
+        self._ticks += pos - start
+        if pos == len(chunk):
+            return pos  # the run might continue in the next chunk
+        ticks, self._ticks = self._ticks, 0
+        if self.state == FENCE:
+            if ticks >= 3:
+                self._close_fence(events)
+            else:
+                self._append("`" * ticks)
+        elif ticks >= 3:
+            self._open(FENCE)
+        # Shorter runs in speech are inline-code marks; the text between them is still speech
+        return pos
+
+    def _open(self, state):
+        self.state = state
+        self._block = []
+        self._block_chars = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def _append(self, text):
+        if text:
+            self._block.append(text)
+            self._block_chars += len(text)
+
+    def _close_fence(self, events):
+        body = "".join(self._block)
+        # Drop an info string such as "json" on the opening line
+        newline = body.find("\n")
+        if newline != -1 and _FENCE_INFO.fullmatch(body[:newline].strip()):
+            body = body[newline + 1:]
+        self._emit_block(body.strip(), events)
+        self.state = SPEECH
+
+    @staticmethod
+    def _emit_block(text, events):
+        if text[:1] in "{[":
+            try:
+                events.append(("json", json.loads(text)))
+                return
+            except ValueError:
+                pass
+        events.append(("code", text))
+
+
+class SentenceSplitter:
+    """Groups streamed speech into whole sentences so each one can be synthesized as soon as it ends"""
+
+    def __init__(self):
+        self._pending = []
+
+    def feed(self, text):
+        """Return the sentences completed by this text"""
+        self._pending.append(text)
+        if not _SENTENCE_END.search(text) and not text[:1].isspace():
+            return []
+        buffered = "".join(self._pending)
+        last = None
+        for last in _SENTENCE_END.finditer(buffered):
+            pass
+        if last is None:
+            return []
+        self._pending = [buffered[last.end():]]
+        sentences = clean_speech(buffered[:last.end()])
+        return [sentences] if sentences else []
+
+    def finish(self):
+        rest = clean_speech("".join(self._pending))
+        self._pending = []
+        return [rest] if rest else []
+
+
+def clean_speech(text):
+    """Collapse the whitespace left behind where blocks were cut out"""
+    return " ".join(text.split())
+
+
+def split_reply(text):
+    """Run a complete reply through the parser: returns (speech, [json objects])"""
+    parser = SpeechStreamParser()
+    events = parser.feed(text) + parser.finish()
+    speech = clean_speech("".join(value for kind, value in events if kind == "speech"))
+    return speech, [value for kind, value in events if kind == "json"]
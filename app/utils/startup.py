@@ -0,0 +1,64 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupState:
+    """Tracks each startup dependency's state and warm-up timing for the health probes"""
+
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self.ready_at = None
+        self.dependencies = {}
+
+    def set(self, name, state, duration_ms=None, detail=None):
+        entry = self.dependencies.setdefault(name, {})
+        entry["state"] = state
+        if duration_ms is not None:
+            entry["duration_ms"] = round(duration_ms, 1)
+        if detail is not None:
+            entry["detail"] = detail
+
+    def state(self, name):
+        return self.dependencies.get(name, {}).get("state", "pending")
+
+
+startup_state = StartupState()
+
+
+async def run_phase(name, fn, budget, *args):
+    """Run one blocking startup phase in a thread with a time budget.
+
+    A phase that overruns its budget is reported as "timeout" and startup moves
+    on; if it finishes later its final state still replaces the timeout.
+    """
+    startup_state.set(name, "running")
+    started = time.perf_counter()
+
+    def target():
+        try:
+            result = fn(*args)
+        except Exception as e:
+            elapsed = (time.perf_counter() - started) * 1000
+            startup_state.set(name, "failed", elapsed, str(e))
+            logger.error(f"Startup phase {name} failed after {elapsed:.0f}ms: {e}")
+            raise
+        elapsed = (time.perf_counter() - started) * 1000
+        state = "skipped" if result is False else "ok"
+        startup_state.set(name, state, elapsed)
+        logger.info(f"Startup phase {name}: {state} in {elapsed:.0f}ms")
+        return result
+
+    task = asyncio.ensure_future(asyncio.to_thread(target))
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), budget)
+    except asyncio.TimeoutError:
+        startup_state.set(name, "timeout", budget * 1000, f"still running after {budget}s budget")
+        logger.warning(f"Startup phase {name} exceeded its {budget}s budget; continuing in background")
+    except Exception:
+        pass
+    return None
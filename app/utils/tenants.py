@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import delete, insert
+from sqlmodel import select
+from app.db import get_session
+from app.models import Clinic, Doctor
+from app.utils.doctor_cache import DoctorCache, bump_cache_version, cache_name, doctor_cache
+from app.utils.metrics import TENANT_CACHE, TENANTS_CACHED
+
+
+logger = logging.getLogger(__name__)
+
+# Clinics whose doctor caches are kept per worker; the least recently used is dropped beyond this
+TENANT_CACHE_SIZE = int(os.environ.get("TENANT_CACHE_SIZE", "100"))
+# Dialed numbers remembered (including ones that belong to no clinic), and for how long
+TENANT_NUMBER_CACHE_SIZE = int(os.environ.get("TENANT_NUMBER_CACHE_SIZE", "1000"))
+TENANT_NUMBER_TTL = float(os.environ.get("TENANT_NUMBER_TTL", "300"))
+
+DEFAULT_CLINIC = "default"
+
+
+class TenantRegistry:
+    """Per-clinic doctor caches for one process, evicted least recently used first.
+
+    The default clinic (rows without a clinic_id) uses the process-wide
+    doctor_cache and is never evicted. Everything else a turn needs, such
+    as the model client, TTS pool and database pool, is shared by all
+    clinics; a clinic costs one DoctorCache while it is warm.
+    """
+
+    def __init__(self, max_tenants=TENANT_CACHE_SIZE, max_numbers=TENANT_NUMBER_CACHE_SIZE):
+        self.max_tenants = max_tenants
+        self.max_numbers = max_numbers
+        self._caches = OrderedDict()
+        self._numbers = OrderedDict()
+        self._lock = threading.Lock()
+        TENANTS_CACHED.set_function(lambda: len(self._caches))
+
+    def cache(self, clinic_id):
+        """The doctor cache of a clinic; None when no such clinic exists"""
+        if clinic_id in (None, DEFAULT_CLINIC):
+            return doctor_cache
+        with self._lock:
+            cache = self._caches.get(clinic_id)
+            if cache is not None:
+                self._caches.move_to_end(clinic_id)
+                TENANT_CACHE.labels("hit").inc()
+                return cache
+        # Unknown ids are never cached, so made-up paths can't push real clinics out
+        with get_session() as session:
+            if session.get(Clinic, clinic_id) is None:
+                TENANT_CACHE.labels("unknown").inc()
+                return None
+        TENANT_CACHE.labels("load").inc()
+        with self._lock:
+            cache = self._caches.setdefault(clinic_id, DoctorCache(clinic_id))
+            self._caches.move_to_end(clinic_id)
+            while len(self._caches) > self.max_tenants:
+                evicted, _ = self._caches.popitem(last=False)
+                TENANT_CACHE.labels("evict").inc()
+                logger.info(f"Evicted clinic {evicted} from the tenant cache")
+        return cache
+
+    def snapshot(self, clinic_id):
+        """The current doctor snapshot of a clinic, or None for an unknown clinic"""
+        cache = self.cache(clinic_id)
+        return cache.get() if cache is not None else None
+
+    def for_number(self, number):
+        """The clinic id a dialed number belongs to; None (the default clinic) when it belongs to none"""
+        if not number:
+            return None
+        with self._lock:
+            entry = self._numbers.get(number)
+            if entry is not None and time.monotonic() - entry[1] < TENANT_NUMBER_TTL:
+                self._numbers.move_to_end(number)
+                return entry[0]
+        with get_session() as session:
+            clinic_id = session.exec(select(Clinic.id).where(Clinic.phone_number == number)).first()
+        with self._lock:
+            self._numbers[number] = (clinic_id, time.monotonic())
+            self._numbers.move_to_end(number)
+            while len(self._numbers) > self.max_numbers:
+                self._numbers.popitem(last=False)
+        return clinic_id
+
+    def for_call(self, number):
+        """(clinic id, doctor snapshot) of the clinic a dialed number reaches; may read the database"""
+        clinic_id = self.for_number(number)
+        doctors = self.snapshot(clinic_id)
+        if doctors is None:
+            # Deleted since its number was looked up
+            clinic_id, doctors = None, self.snapshot(None)
+        return clinic_id, doctors
+
+    def forget(self, clinic_id):
+        """Drop a clinic's cache and number mapping in this process"""
+        with self._lock:
+            self._caches.pop(clinic_id, None)
+            for number in [number for number, (owner, _) in self._numbers.items() if owner == clinic_id]:
+                del self._numbers[number]
+
+    def clear(self):
+        with self._lock:
+            self._caches.clear()
+            self._numbers.clear()
+
+
+tenants = TenantRegistry()
+
+
+def resolve_clinic(clinic_id):
+    """(clinic id, doctor snapshot) for a clinic named in a request; DEFAULT_CLINIC and None give the default clinic.
+
+    Raises LookupError for a clinic that doesn't exist.
+    """
+    clinic_id = None if clinic_id in (None, DEFAULT_CLINIC) else clinic_id
+    doctors = tenants.snapshot(clinic_id)
+    if doctors is None:
+        raise LookupError(f"unknown clinic {clinic_id!r}")
+    return clinic_id, doctors
+
+
+def save_clinic(clinic_id, name, phone_number=None, prompt=None, doctors=None, timezone=None):
+    """Create or update a clinic; `doctors` (name, specialty, availability dicts) replaces its doctor list.
+
+    Other workers pick the change up through the clinic's cache version, like
+    doctor changes of the default clinic, and a new phone number within
+    TENANT_NUMBER_TTL.
+    """
+    if clinic_id == DEFAULT_CLINIC:
+        raise ValueError(f"{DEFAULT_CLINIC!r} is the clinic of rows without a clinic id")
+    if timezone:
+        try:
+            ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"unknown timezone {timezone!r}")
+    with get_session() as session:
+        clinic = session.get(Clinic, clinic_id) or Clinic(id=clinic_id, name=name)
+        clinic.name, clinic.phone_number, clinic.prompt, clinic.timezone = name, phone_number, prompt, timezone
+        session.add(clinic)
+        if doctors is not None:
+            session.execute(delete(Doctor).where(Doctor.clinic_id == clinic_id))
+            rows = [{
+                "name": doctor["name"],
+                "specialty": doctor["specialty"],
+                "availability": doctor["availability"] if isinstance(doctor["availability"], str)
+                else json.dumps(doctor["availability"]),
+                "clinic_id": clinic_id,
+                "created_at": datetime.utcnow(),
+            } for doctor in doctors]
+            if rows:
+                session.execute(insert(Doctor), rows)
+        bump_cache_version(session, cache_name(clinic_id))
+        session.commit()
+    tenants.forget(clinic_id)
+    logger.info(f"Saved clinic {clinic_id} ({name})")
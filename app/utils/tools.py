@@ -0,0 +1,201 @@
+import logging
+from datetime import datetime
+from app.models import Appointment
+from app.utils.booking import cancel_appointment, create_appointment, reschedule_appointment
+from app.utils.bulk import validate_record
+
+
+logger = logging.getLogger(__name__)
+
+_DATE = {"type": "string", "description": "Appointment date, YYYY-MM-DD"}
+_TIME = {"type": "string", "description": "Appointment time, 24-hour HH:MM"}
+_PHONE = {"type": "string", "description": "The patient's phone number"}
+
+# Gemini function declarations. The model returns spoken text and these calls
+# as separate parts, so nothing has to be scraped out of the reply.
+TOOL_DECLARATIONS = [{"function_declarations": [
+    {
+        "name": "book_appointment",
+        "description": "Book a new appointment once the patient has confirmed every detail.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "patient_name": {"type": "string"},
+                "phone": _PHONE,
+                "date": _DATE,
+                "time": _TIME,
+                "purpose": {"type": "string", "description": "Reason for the visit"},
+                "urgency_level": {"type": "string", "enum": ["low", "medium", "high"]},
+                "doctor_name": {"type": "string", "description": "Preferred doctor, e.g. Dr. Smith"},
+            },
+            "required": ["patient_name", "phone", "date", "time"],
+        },
+    },
+    {
+        "name": "reschedule_appointment",
+        "description": "Move the patient's existing appointment to a new date and time.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "phone": _PHONE,
+                "date": {"type": "string", "description": "Current appointment date, if the patient said it"},
+                "time": {"type": "string", "description": "Current appointment time, if the patient said it"},
+                "new_date": _DATE,
+                "new_time": _TIME,
+                "doctor_name": {"type": "string", "description": "New doctor, only if the patient asked to change"},
+            },
+            "required": ["phone", "new_date", "new_time"],
+        },
+    },
+    {
+        "name": "cancel_appointment",
+        "description": "Cancel the patient's existing appointment.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "phone": _PHONE,
+                "date": {"type": "string", "description": "Date of the appointment to cancel, if the patient said it"},
+                "time": {"type": "string", "description": "Time of the appointment to cancel, if the patient said it"},
+            },
+            "required": ["phone"],
+        },
+    },
+    {
+        "name": "save_call_notes",
+        "description": "Record a short summary of the call when it ends or when asked to summarize.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "english_notes": {"type": "string", "description": "Short summary in English"},
+                "bangla_notes": {"type": "string", "description": "The same summary in Bangla"},
+            },
+            "required": ["english_notes"],
+        },
+    },
+]}]
+
+
+def _slot(appointment):
+    doctor = f" with {appointment.doctor_name}" if appointment.doctor_name else ""
+    return f"{appointment.date} at {appointment.time}{doctor}"
+
+
+def _book(args, clinic_id):
+    # The call's clinic decides where the booking goes, never the model's arguments
+    args = {key: value for key, value in args.items() if key != "clinic_id"}
+    row = validate_record(args, datetime.utcnow(), clinic_id)
+    appointment = create_appointment(Appointment(**row))
+    return {"ok": True, "appointment_id": appointment.id,
+            "message": f"Your appointment on {_slot(appointment)} is confirmed."}
+
+
+def _reschedule(args, clinic_id):
+    datetime.strptime(args["new_date"], "%Y-%m-%d")
+    datetime.strptime(args["new_time"], "%H:%M")
+    appointment = reschedule_appointment(args["phone"], args["new_date"], args["new_time"], args.get("date"),
+                                         args.get("time"), args.get("doctor_name"), clinic_id)
+    if appointment is None:
+        return {"ok": False, "message": "I couldn't find an appointment under that phone number."}
+    return {"ok": True, "appointment_id": appointment.id,
+            "message": f"Your appointment has been moved to {_slot(appointment)}."}
+
+
+def _cancel(args, clinic_id):
+    appointment = cancel_appointment(args["phone"], args.get("date"), args.get("time"), clinic_id)
+    if appointment is None:
+        return {"ok": False, "message": "I couldn't find an appointment under that phone number."}
+    return {"ok": True, "appointment_id": appointment.id,
+            "message": f"Your appointment on {_slot(appointment)} has been cancelled."}
+
+
+def _save_notes(args, clinic_id):
+    return {"ok": True, "message": "", "english_notes": args.get("english_notes"),
+            "bangla_notes": args.get("bangla_notes")}
+
+
+HANDLERS = {
+    "book_appointment": _book,
+    "reschedule_appointment": _reschedule,
+    "cancel_appointment": _cancel,
+    "save_call_notes": _save_notes,
+}
+
+
+def run_tool_calls(calls, defaults=None, clinic_id=None):
+    """Execute the model's function calls in order and return one result dict per call.
+
+    `defaults` fills arguments the model left out, e.g. the caller's phone
+    number on a phone call. Bookings are made and looked up at `clinic_id`
+    (None for the default clinic), which the model can't override. A
+    failing call returns ok=False with a message that can be spoken to the
+    caller instead of raising.
+    """
+    results = []
+    for name, args in calls:
+        args = {**(defaults or {}), **{key: value for key, value in args.items() if value not in ("", None)}}
+        handler = HANDLERS.get(name)
+        try:
+            if handler is None:
+                raise ValueError(f"unknown function {name}")
+            result = handler(args, clinic_id)
+        except (KeyError, ValueError) as e:
+            logger.warning(f"Rejected {name} call {args}: {e}")
+            result = {"ok": False, "message": "Sorry, some of those details weren't valid. Could you repeat them?",
+                      "error": str(e)}
+        except Exception as e:
+            logger.error(f"Error running {name}: {e}")
+            result = {"ok": False, "message": "Sorry, I couldn't update the schedule just now. Please try again.",
+                      "error": str(e)}
+        results.append((name, result))
+    return results
+
+
+def calls_from_json(block):
+    """Function calls for a JSON block the model wrote into its text instead of calling a function"""
+    calls = []
+    if isinstance(block, dict):
+        if isinstance(block.get("appointment_data"), dict):
+            calls.append(("book_appointment", block["appointment_data"]))
+        notes = {key: block[key] for key in ("english_notes", "bangla_notes") if block.get(key)}
+        if notes:
+            calls.append(("save_call_notes", notes))
+    return calls
+
+
+def spoken_reply(text, results):
+    """What to say for a turn: the model's words, unless an action failed or it said nothing"""
+    failures = [result["message"] for _, result in results if not result["ok"]]
+    if failures:
+        # The model may already have promised success; the caller hears what actually happened
+        return " ".join(failures)
+    if text:
+        return text
+    return " ".join(result["message"] for _, result in results if result["message"]) or \
+        "Is there anything else I can help you with?"
+
+
+def function_response_parts(results):
+    """History parts that tell the model how its calls turned out on the next turn"""
+    return [{"function_response": {"name": name, "response": result}} for name, result in results]
+
+
+def history_entries(reply_text, calls, results, display_text):
+    """Conversation history for one model turn: its calls and their results, then what was said"""
+    entries = []
+    if calls:
+        model_parts = [{"text": reply_text}] if reply_text else []
+        model_parts += [{"function_call": {"name": name, "args": args}} for name, args in calls]
+        entries.append({"role": "model", "parts": model_parts})
+        entries.append({"role": "user", "parts": function_response_parts(results)})
+    entries.append({"role": "model", "parts": [display_text]})
+    return entries
+
+
+def apply_results(slots, results):
+    """Remember the latest booking and call summaries from a turn's results in the session slots"""
+    for _, result in results:
+        if result.get("appointment_id"):
+            slots["appointment_id"] = result["appointment_id"]
+        for key in ("english_notes", "bangla_notes"):
+            if result.get(key):
+                slots[key] = result[key]
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import hashlib
+import logging
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+# none (default), file or otlp
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none").lower()
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "dental-receptionist")
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/")
+
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL = 1.0
+EXPORT_MAX_QUEUE = 10000
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def trace_id_for(key):
+    """A stable 128-bit trace id, so every webhook of one call lands in the same trace"""
+    if key:
+        return hashlib.sha256(str(key).encode()).hexdigest()[:32]
+    return f"{random.getrandbits(128):032x}"
+
+
+def is_sampled(trace_id, rate=None):
+    """Head sampling keyed on the trace id: a call is either traced in full or not at all"""
+    rate = TRACE_SAMPLE_RATE if rate is None else rate
+    return rate >= 1.0 or int(trace_id[:8], 16) / 0xFFFFFFFF < rate
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "trace_key", "start_ns", "end_ns",
+                 "attributes", "status", "_token")
+
+    def __init__(self, name, trace_id, parent_id=None, trace_key=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.trace_key = trace_key
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+        self.status = "ok"
+        self._token = None
+
+    def set(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def error(self, exc):
+        self.status = "error"
+        self.attributes["error"] = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended from another context (e.g. a dependency teardown); nothing to restore
+                pass
+            self._token = None
+        exporter.export(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "trace_key": self.trace_key,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def enabled():
+    return TRACE_EXPORTER in ("file", "otlp")
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_trace(name, key=None, **attributes):
+    """Open the root span of a request and make it current; returns None when not traced.
+
+    `key` is the CallSid or WebSocket session id; it sets the trace id and is
+    added to every log line written while the span is current.
+    """
+    if not enabled():
+        return None
+    trace_id = trace_id_for(key)
+    if not is_sampled(trace_id):
+        return None
+    span = Span(name, trace_id, trace_key=key, attributes=attributes)
+    span._token = _current_span.set(span)
+    return span
+
+
+def start_span(name, **attributes):
+    """Open a child of the current span and make it current; returns None outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    span = Span(name, parent.trace_id, parent.span_id, parent.trace_key, attributes)
+    span._token = _current_span.set(span)
+    return span
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span around a block; costs one context lookup when tracing is off"""
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    try:
+        yield child
+    except BaseException as e:
+        child.error(e)
+        raise
+    finally:
+        child.end()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans):
+    """OTLP/HTTP JSON body for a batch of spans"""
+    otlp_spans = []
+    for item in spans:
+        attributes = dict(item["attributes"])
+        if item["trace_key"]:
+            attributes["session.id"] = item["trace_key"]
+        otlp_spans.append({
+            "traceId": item["trace_id"],
+            "spanId": item["span_id"],
+            "parentSpanId": item["parent_id"] or "",
+            "name": item["name"],
+            "kind": 2 if item["parent_id"] is None else 1,
+            "startTimeUnixNano": str(item["start_ns"]),
+            "endTimeUnixNano": str(item["end_ns"]),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 2 if item["status"] == "error" else 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "app.utils.tracing"}, "spans": otlp_spans}],
+    }]}
+
+
+class SpanExporter:
+    """Ships finished spans from a background thread so request handlers never wait on I/O"""
+
+    def __init__(self, max_queue=EXPORT_MAX_QUEUE):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"exported": 0, "dropped": 0, "failed_batches": 0}
+
+    def export(self, span):
+        if not self._thread or not self._thread.is_alive():
+            self.start()
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout=5.0):
+        """Export everything queued so far"""
+        if not self._thread or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = []
+            waiters = []
+            item = self._queue.get()
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, batch):
+        try:
+            if TRACE_EXPORTER == "otlp":
+                request = urllib.request.Request(f"{OTLP_ENDPOINT}/v1/traces", data=json.dumps(to_otlp(batch)).encode(),
+                                                 headers={"Content-Type": "application/json"}, method="POST")
+                urllib.request.urlopen(request, timeout=5).close()
+            else:
+                with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(item) + "\n" for item in batch))
+            self.stats["exported"] += len(batch)
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            self.stats["dropped"] += len(batch)
+            logger.warning(f"Exporting {len(batch)} spans failed: {e}")
+
+
+exporter = SpanExporter()
+
+
+def install_log_correlation():
+    """Prefix log messages written inside a trace with its CallSid or session id"""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "traced", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        current = _current_span.get()
+        if current is not None and current.trace_key and isinstance(record.msg, str):
+            record.msg = f"[{current.trace_key}] {record.msg}"
+        return record
+
+    record_factory.traced = True
+    logging.setLogRecordFactory(record_factory)
+
+
+def print_timeline(path, key):
+    """Print every span of one call or session from a trace file, in time order"""
+    trace_id = trace_id_for(key)
+    with open(path, encoding="utf-8") as f:
+        spans = [item for item in map(json.loads, f) if item["trace_id"] == trace_id]
+    if not spans:
+        print(f"No spans for {key} in {path}")
+        return
+    spans.sort(key=lambda item: item["start_ns"])
+    by_id = {item["span_id"]: item for item in spans}
+    origin = spans[0]["start_ns"]
+    for item in spans:
+        depth = 0
+        parent = by_id.get(item["parent_id"])
+        while parent is not None:
+            depth += 1
+            parent = by_id.get(parent["parent_id"])
+        attributes = " ".join(f"{k}={v}" for k, v in item["attributes"].items())
+        offset = (item["start_ns"] - origin) / 1e6
+        flag = " ERROR" if item["status"] == "error" else ""
+        print(f"{offset:>10.1f}ms {item['duration_ms']:>9.1f}ms  {'  ' * depth}{item['name']}{flag} {attributes}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m app.utils.tracing <CallSid or session id> [trace file]")
+        sys.exit(1)
+    print_timeline(sys.argv[2] if len(sys.argv) > 2 else TRACE_FILE, sys.argv[1])
@@ -0,0 +1,162 @@
+import os
+import zlib
+import struct
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are serialized by the in-process lock only
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_DIR = os.environ.get("TRANSCRIPT_DIR", "./transcripts")
+TRANSCRIPT_SEGMENT_MAX_BYTES = int(os.environ.get("TRANSCRIPT_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+TRANSCRIPT_COMPRESSION_LEVEL = int(os.environ.get("TRANSCRIPT_COMPRESSION_LEVEL", "6"))
+
+# Record header: magic, dictionary id, compressed length, raw length, crc32 of raw bytes
+RECORD_MAGIC = b"TRS1"
+RECORD_HEADER = struct.Struct("<4sBIII")
+
+# Shared zlib dictionaries, keyed by the id stored in each record header. Never
+# change an existing entry - add a new id and point CURRENT_DICTIONARY_ID at it.
+# zlib favours matches near the end of the dictionary, so the most common
+# phrases come last.
+DICTIONARIES = {
+    1: "\n".join([
+        "Urgency level: low medium high. Purpose: cleaning checkup filling root canal crown extraction whitening braces",
+        "January February March April May June July August September October November December",
+        "Sunday Saturday Friday Thursday Wednesday Tuesday Monday tomorrow today next week this morning afternoon",
+        "Dr. Brown Cosmetic Dentistry Dr. Williams Pediatric Dentistry Dr. Johnson Orthodontics Dr. Smith General Dentistry",
+        "AI: Is there anything else I can help you with?",
+        "AI: Thank you for calling. Have a great day!",
+        "AI: Could you please provide the specific date for the appointment?",
+        "AI: Which dentist would you prefer to see?",
+        "AI: What date and time would you prefer for your appointment?",
+        "AI: May I have your name and phone number, please?",
+        "AI: Great! Your appointment has been confirmed.",
+        "AI: Hello! I'm the dental clinic's voice receptionist. How can I help you today?",
+        "Caller: I want to book an appointment. My name is and my phone number is",
+        "Caller: Yes, that works. Thank you. ",
+        "\nCaller: \nAI: ",
+    ]).encode("utf-8"),
+}
+CURRENT_DICTIONARY_ID = 1
+
+
+class TranscriptStore:
+    """Append-only, zlib-compressed transcript storage in segment files.
+
+    Each transcript is written once as a compressed record at the end of the
+    current segment and addressed by a "segment:offset" reference, which is
+    all the database keeps. Records are only decompressed when read.
+    """
+
+    def __init__(self, directory=TRANSCRIPT_DIR, segment_max_bytes=TRANSCRIPT_SEGMENT_MAX_BYTES,
+                 level=TRANSCRIPT_COMPRESSION_LEVEL):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.level = level
+        self._lock = threading.Lock()
+        self._segment = None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.log")
+
+    def _current_segment(self):
+        """Return the newest segment number, rolling over when it is full"""
+        if self._segment is None:
+            os.makedirs(self.directory, exist_ok=True)
+            segments = [int(name[8:14]) for name in os.listdir(self.directory)
+                        if name.startswith("segment-") and name.endswith(".log")]
+            self._segment = max(segments) if segments else 1
+        path = self._segment_path(self._segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+            self._segment += 1
+        return self._segment
+
+    def compress(self, text, dictionary_id=CURRENT_DICTIONARY_ID):
+        """Compress text into a self-describing record"""
+        raw = text.encode("utf-8")
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=DICTIONARIES[dictionary_id])
+        payload = compressor.compress(raw) + compressor.flush()
+        header = RECORD_HEADER.pack(RECORD_MAGIC, dictionary_id, len(payload), len(raw), zlib.crc32(raw))
+        return header + payload
+
+    def append(self, text):
+        """Append one transcript and return its reference"""
+        record = self.compress(text)
+        with self._lock:
+            segment = self._current_segment()
+            with open(self._segment_path(segment), "ab") as f:
+                if fcntl:
+                    # Other workers may append to the same segment
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(record)
+                    f.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+        return f"{segment}:{offset}"
+
+    def read(self, ref):
+        """Read and decompress the transcript behind a reference"""
+        segment, offset = (int(part) for part in ref.split(":"))
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            magic, dictionary_id, size, raw_size, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            if magic != RECORD_MAGIC:
+                raise ValueError(f"No transcript record at {ref}")
+            payload = f.read(size)
+
+        decompressor = zlib.decompressobj(-15, zdict=DICTIONARIES[dictionary_id])
+        raw = decompressor.decompress(payload) + decompressor.flush()
+        if len(raw) != raw_size or zlib.crc32(raw) != crc:
+            raise ValueError(f"Corrupt transcript record at {ref}")
+        return raw.decode("utf-8")
+
+
+transcript_store = TranscriptStore()
+
+
+def load_transcript(note):
+    """Return a CallNote's transcript, reading the store only when asked"""
+    if note.transcript_ref:
+        return transcript_store.read(note.transcript_ref)
+    return note.raw_transcript
+
+
+def migrate_call_notes(batch_size=500):
+    """Move legacy CallNote.raw_transcript text into the store, keeping only a reference"""
+    from sqlmodel import select
+    from app.db import get_session
+    from app.models import CallNote
+
+    moved = 0
+    while True:
+        with get_session() as session:
+            notes = session.exec(
+                select(CallNote).where(CallNote.raw_transcript.is_not(None), CallNote.transcript_ref.is_(None))
+                .limit(batch_size)
+            ).all()
+            if not notes:
+                break
+            for note in notes:
+                note.transcript_ref = transcript_store.append(note.raw_transcript)
+                note.raw_transcript = None
+                session.add(note)
+            session.commit()
+            moved += len(notes)
+    logger.info(f"Moved {moved} call note transcripts into {transcript_store.directory}")
+    return moved
+
+
+if __name__ == "__main__":
+    from app.db import init_db
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    print(f"Migrated {migrate_call_notes()} transcripts")
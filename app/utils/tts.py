@@ -0,0 +1,106 @@
+import io
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from gtts import gTTS
+from app.utils import recorder
+from app.utils.metrics import QUEUE_WAIT_SECONDS, TTS_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+TTS_POOL_SIZE = int(os.environ.get("TTS_POOL_SIZE", "4"))
+# "stub" skips gTTS and returns placeholder audio after a fixed delay, for load tests
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "gtts").lower()
+STUB_TTS_LATENCY_MS = float(os.environ.get("STUB_TTS_LATENCY_MS", "150"))
+# Extra stub latency per character, so replays can model longer sentences taking longer
+STUB_TTS_MS_PER_CHAR = float(os.environ.get("STUB_TTS_MS_PER_CHAR", "0"))
+STUB_TTS_BYTES = int(os.environ.get("STUB_TTS_BYTES", "12000"))
+
+# gTTS does blocking HTTP requests; keep them off the event loop
+_executor = None
+_pending = 0
+_pending_lock = threading.Lock()
+
+# Audio of fixed messages (the greeting, the holding message), rendered once per process
+_prerendered = {}
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=TTS_POOL_SIZE, thread_name_prefix="tts")
+    return _executor
+
+
+def synthesize(text, lang="en"):
+    """Render text to MP3 bytes with gTTS"""
+    with TTS_SECONDS.labels("synthesize").time():
+        if TTS_BACKEND == "stub":
+            time.sleep((STUB_TTS_LATENCY_MS + STUB_TTS_MS_PER_CHAR * len(text)) / 1000.0)
+            return bytes(STUB_TTS_BYTES)
+        tts = gTTS(text=text, lang=lang)
+        audio_buffer = io.BytesIO()
+        tts.write_to_fp(audio_buffer)
+        return audio_buffer.getvalue()
+
+
+def _synthesize_queued(text, lang, submitted):
+    started = time.perf_counter()
+    QUEUE_WAIT_SECONDS.labels("tts").observe(started - submitted)
+    audio = synthesize(text, lang)
+    return audio, time.perf_counter() - started
+
+
+def _job_done(future):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+def pending():
+    """Jobs queued or running on the TTS pool, for the overload controller"""
+    return _pending
+
+
+async def synthesize_async(text, lang="en"):
+    """Render text to MP3 bytes on the TTS thread pool"""
+    global _pending
+    with _pending_lock:
+        _pending += 1
+    future = get_executor().submit(_synthesize_queued, text, lang, time.perf_counter())
+    # Also called when the job is cancelled before it runs
+    future.add_done_callback(_job_done)
+    audio, seconds = await asyncio.wrap_future(future)
+    record = recorder.current()
+    if record is not None:
+        record.synthesized(text, seconds)
+    return audio
+
+
+async def prerendered(text):
+    """MP3 for a fixed message; rendered on first use unless warm_up() already did"""
+    audio = _prerendered.get(text)
+    if audio is None:
+        audio = _prerendered[text] = await synthesize_async(text)
+    return audio
+
+
+def warm_up(messages=()):
+    """Render the fixed messages once, which also opens the TTS connection path for the first caller"""
+    total = 0
+    for text in messages or ("Hello.",):
+        _prerendered[text] = synthesize(text)
+        total += len(_prerendered[text])
+    logger.info(f"TTS warm-up produced {total} bytes")
+    return total
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
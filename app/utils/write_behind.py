@@ -0,0 +1,168 @@
+import os
+import time
+import queue
+import logging
+import threading
+from sqlalchemy import insert
+from app.db import engine
+from app.utils.metrics import DB_WRITE_SECONDS, QUEUE_WAIT_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_INTERVAL_MS = float(os.environ.get("WRITE_BEHIND_INTERVAL_MS", "5"))
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_MAX_QUEUE = int(os.environ.get("WRITE_BEHIND_MAX_QUEUE", "10000"))
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Buffer non-critical inserts and write them in group commits from a background thread.
+
+    Rows are collected until `max_batch` rows are waiting or `interval` seconds
+    have passed since the first one arrived, then every pending row is inserted
+    in a single transaction with one executemany per table. A group commit
+    that fails is retried once, then its rows are written one at a time so a
+    single bad row only loses itself.
+    """
+
+    def __init__(self, interval=WRITE_BEHIND_INTERVAL_MS / 1000.0, max_batch=WRITE_BEHIND_BATCH_SIZE,
+                 max_queue=WRITE_BEHIND_MAX_QUEUE):
+        self.interval = interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_hooks = []
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "batches": 0, "failed_batches": 0,
+                      "row_fallbacks": 0}
+
+    def add_flush_hook(self, hook):
+        """Register hook(conn, rows_by_table), run inside every group commit's transaction"""
+        if hook not in self._flush_hooks:
+            self._flush_hooks.append(hook)
+
+    def start(self):
+        """Start the writer thread if it is not already running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+            logger.info(f"Write-behind queue started (interval={self.interval * 1000:.0f}ms, batch={self.max_batch})")
+
+    def enqueue(self, model, row):
+        """Queue one row for `model`'s table without blocking the caller"""
+        if not self._thread or not self._thread.is_alive():
+            self.start()
+        try:
+            self._queue.put_nowait((model.__table__, row, time.perf_counter()))
+            self.stats["enqueued"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+            logger.warning(f"Write-behind queue full, dropping {model.__name__} row")
+
+    def flush(self, timeout=5.0):
+        """Block until every row queued so far has been written (or timeout)"""
+        if not self._thread or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put((None, done, None))
+        done.wait(timeout)
+
+    def stop(self, timeout=10.0):
+        """Write everything still queued and stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if not thread or not thread.is_alive():
+            return
+        self._queue.put((_STOP, None, None))
+        thread.join(timeout)
+        logger.info(f"Write-behind queue stopped: {self.stats}")
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        running = True
+        while running:
+            table, row, queued_at = self._queue.get()
+            batch = []
+            waiters = []
+            oldest = None
+            deadline = time.monotonic() + self.interval
+
+            while True:
+                if table is _STOP:
+                    running = False
+                elif table is None:
+                    waiters.append(row)
+                else:
+                    batch.append((table, row))
+                    oldest = oldest or queued_at
+
+                if not running or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    table, row, queued_at = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if not running:
+                # Drain anything queued behind the stop marker
+                while True:
+                    try:
+                        table, row, queued_at = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if table is None:
+                        waiters.append(row)
+                    elif table is not _STOP:
+                        batch.append((table, row))
+
+            if batch:
+                # The oldest row's wait is the worst latency this group commit added
+                QUEUE_WAIT_SECONDS.labels("write_behind").observe(time.perf_counter() - oldest)
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _commit(self, batch):
+        rows_by_table = {}
+        for table, row in batch:
+            rows_by_table.setdefault(table, []).append(row)
+        with DB_WRITE_SECONDS.labels("write_behind").time(), engine.begin() as conn:
+            for table, rows in rows_by_table.items():
+                conn.execute(insert(table), rows)
+            for hook in self._flush_hooks:
+                hook(conn, rows_by_table)
+
+    def _write(self, batch):
+        for attempt in range(2):
+            try:
+                self._commit(batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                return
+            except Exception as e:
+                self.stats["failed_batches"] += 1
+                logger.error(f"Write-behind group commit of {len(batch)} rows failed (attempt {attempt + 1}): {e}")
+                if attempt == 0:
+                    # Usually transient (a locked database, a dropped connection)
+                    time.sleep(max(self.interval, 0.05))
+
+        # Still failing: most likely one row the database rejects, so write rows on their own
+        self.stats["row_fallbacks"] += 1
+        for item in batch:
+            try:
+                self._commit([item])
+                self.stats["written"] += 1
+            except Exception as e:
+                self.stats["dropped"] += 1
+                logger.error(f"Write-behind dropped a {item[0].name} row: {e}")
+
+
+write_behind = WriteBehindQueue()
@@ -0,0 +1,93 @@
+import os
+import json
+import struct
+
+
+# /ws/ai protocol versions. v1 is the original line protocol ("User: ", "AI: ",
+# "DOCTORS: " text plus bare MP3 frames). A client opts into v2 by offering the
+# subprotocol below in Sec-WebSocket-Protocol, or with ?protocol=2.
+PROTOCOL_V2 = "receptionist.v2"
+
+# v2 client -> server binary frames are microphone audio (raw PCM16 little-endian
+# mono, or one Opus packet per frame) between audio.start and audio.stop.
+# v2 server -> client: JSON text frames with a "type", and binary audio frames.
+# Each audio frame is this header followed by a slice of the turn's MP3 stream:
+# protocol version, turn id, sequence number (from 0 within the turn).
+AUDIO_FRAME_HEADER = struct.Struct("!BII")
+AUDIO_FORMAT = "audio/mpeg"
+WS_AUDIO_CHUNK_BYTES = int(os.environ.get("WS_AUDIO_CHUNK_BYTES", str(16 * 1024)))
+MAX_USER_MESSAGE_CHARS = int(os.environ.get("MAX_USER_MESSAGE_CHARS", "4000"))
+
+# v2 client -> server message types and the fields each one needs
+CLIENT_MESSAGES = {
+    "user": ("text",),       # a user utterance; optional "id" is echoed back on turn.start
+    "cancel": (),            # stop the running turn; optional "turn" must match it
+    "configure": ("audio",),  # switch audio on or off for the following turns
+    "audio.start": (),       # binary frames that follow are microphone audio; optional sample_rate, codec
+    "audio.stop": (),        # end of microphone audio; an utterance in progress is finalized
+    "ping": (),
+}
+
+
+class ProtocolError(ValueError):
+    """A client frame that doesn't follow the v2 protocol"""
+
+
+def negotiate(websocket):
+    """Return (protocol version, subprotocol to accept) for a connecting client"""
+    if PROTOCOL_V2 in websocket.scope.get("subprotocols", []):
+        return 2, PROTOCOL_V2
+    if websocket.query_params.get("protocol") == "2":
+        return 2, None
+    return 1, None
+
+
+def control(kind, **fields):
+    """Encode a v2 control frame"""
+    return json.dumps({"type": kind, **fields}, separators=(",", ":"))
+
+
+def audio_frames(turn, data, seq=0, chunk_bytes=WS_AUDIO_CHUNK_BYTES):
+    """Split MP3 bytes into sequenced v2 audio frames; returns (frames, next sequence number)"""
+    frames = []
+    for start in range(0, len(data), chunk_bytes):
+        frames.append(AUDIO_FRAME_HEADER.pack(2, turn, seq) + data[start:start + chunk_bytes])
+        seq += 1
+    return frames, seq
+
+
+def parse_audio_frame(frame):
+    """(turn, seq, payload) of a v2 audio frame; for clients and tests"""
+    version, turn, seq = AUDIO_FRAME_HEADER.unpack_from(frame)
+    if version != 2:
+        raise ProtocolError(f"unknown audio frame version {version}")
+    return turn, seq, frame[AUDIO_FRAME_HEADER.size:]
+
+
+def parse_client_message(raw):
+    """Decode and validate one v2 client frame"""
+    try:
+        message = json.loads(raw)
+    except ValueError:
+        raise ProtocolError("frames must be JSON objects")
+    if not isinstance(message, dict):
+        raise ProtocolError("frames must be JSON objects")
+    kind = message.get("type")
+    if kind not in CLIENT_MESSAGES:
+        raise ProtocolError(f"unknown message type {kind!r}")
+    for field in CLIENT_MESSAGES[kind]:
+        if field not in message:
+            raise ProtocolError(f"{kind} needs {field!r}")
+    if kind == "user":
+        text = message["text"]
+        if not isinstance(text, str) or not text.strip():
+            raise ProtocolError("user text must be a non-empty string")
+        if len(text) > MAX_USER_MESSAGE_CHARS:
+            raise ProtocolError(f"user text is longer than {MAX_USER_MESSAGE_CHARS} characters")
+    if kind == "configure" and not isinstance(message["audio"], bool):
+        raise ProtocolError("audio must be true or false")
+    if kind == "cancel" and message.get("turn") is not None and not isinstance(message["turn"], int):
+        raise ProtocolError("turn must be an integer")
+    if kind == "audio.start" and not isinstance(message.get("sample_rate", 16000), int):
+        raise ProtocolError("sample_rate must be an integer")
+    return message
@@ -0,0 +1,255 @@
+"""End-of-speech to final-transcript latency for microphone input.
+
+Builds synthetic utterances: 16 kHz PCM16 made of voiced tone bursts
+(syllables), short gaps within words, and background noise. The noise is
+quiet by default, or loud with --noise.
+
+In-process: feeds each utterance through SpeechStream in 20 ms chunks. With
+real-time pacing, --streams concurrent streams share the ASR pool. The
+benchmark measures the time from the last voiced chunk being fed to the final
+transcript being returned. That time is the silence the endpointer waits for
+(ENDPOINT_SILENCE_MS) plus the recognizer's finalization plus any queueing.
+Without pacing (--fast) it reports how many times faster than real time one
+stream is processed.
+
+Over the WebSocket (unless --skip-ws): starts the app under uvicorn with the
+stub LLM, TTS and ASR backends and opens --streams v2 sessions. Each session
+speaks its utterance in real time and measures the time from its last voiced
+chunk to transcript.final and then to the reply.
+
+Set ASR_BACKEND=vosk (with VOSK_MODEL_PATH) to measure the real recognizer
+in-process. The WebSocket run always uses the stub.
+
+Usage: python benchmarks/bench_asr.py [--streams 8] [--utterances 5] [--noise] [--fast] [--skip-ws]
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ASR_BACKEND", "stub")
+
+from app.utils import asr
+from app.utils.asr import ENDPOINT_SILENCE_MS, VAD_FRAME_MS, SpeechStream, feed_async, finish_async
+
+RATE = 16000
+CHUNK_BYTES = RATE * VAD_FRAME_MS // 1000 * 2
+
+
+def utterance(rng, words=6, noise=200):
+    """PCM16 for one utterance: lead-in silence, `words` voiced bursts, trailing silence.
+
+    Returns (pcm, byte offset of the end of the last voiced burst).
+    """
+    samples = []
+
+    def add(ms, amplitude=0, pitch=0):
+        for i in range(RATE * ms // 1000):
+            voiced = amplitude * math.sin(2 * math.pi * pitch * i / RATE) if amplitude else 0
+            samples.append(max(-32768, min(32767, int(voiced + rng.gauss(0, noise)))))
+
+    add(400)
+    for word in range(words):
+        for _ in range(rng.randint(1, 3)):
+            add(rng.randint(120, 220), rng.randint(4000, 9000), rng.randint(110, 260))
+            speech_end = len(samples) * 2
+            add(rng.randint(20, 60))
+        add(rng.randint(60, 140))
+    add(ENDPOINT_SILENCE_MS + 600)
+    return b"".join(sample.to_bytes(2, "little", signed=True) for sample in samples), speech_end
+
+
+def chunks(pcm):
+    return [pcm[start:start + CHUNK_BYTES] for start in range(0, len(pcm), CHUNK_BYTES)]
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    pick = lambda pct: values[min(len(values) - 1, int(len(values) * pct / 100))]
+    return {"count": len(values), "p50": round(pick(50), 1), "p95": round(pick(95), 1), "max": round(values[-1], 1)}
+
+
+async def speak(pcm, speech_end, paced):
+    """Feed one utterance; returns (ms from last voiced chunk to final, final event fields, splits) or None.
+
+    splits counts finals that came before the end of speech: a pause the
+    endpointer took for the end of the utterance.
+    """
+    stream = SpeechStream(RATE)
+    last_voiced_fed = None
+    splits = 0
+    offset = 0
+    started = time.perf_counter()
+    for index, chunk in enumerate(chunks(pcm)):
+        if paced:
+            # Real time: chunk n is not available before n * 20 ms
+            await asyncio.sleep(max(0.0, started + index * VAD_FRAME_MS / 1000 - time.perf_counter()))
+        offset += len(chunk)
+        if last_voiced_fed is None and offset >= speech_end:
+            last_voiced_fed = time.perf_counter()
+        for kind, fields in await feed_async(stream, [chunk]):
+            if kind == "final" and last_voiced_fed is None:
+                splits += 1
+            elif kind == "final":
+                return (time.perf_counter() - last_voiced_fed) * 1000, fields, splits
+    for kind, fields in await finish_async(stream):
+        if kind == "final":
+            return (time.perf_counter() - last_voiced_fed) * 1000, fields, splits
+    return None
+
+
+async def run_in_process(args, utterances):
+    latencies, endpoint_ms, missed, splits = [], [], 0, 0
+    for batch in range(args.utterances):
+        picked = [utterances[(batch * args.streams + index) % len(utterances)] for index in range(args.streams)]
+        results = await asyncio.gather(*(speak(pcm, end, paced=True) for pcm, end in picked))
+        for result in results:
+            if result is None:
+                missed += 1
+                continue
+            latencies.append(result[0])
+            endpoint_ms.append(result[1]["endpoint_ms"])
+            splits += result[2]
+    return {
+        "streams": args.streams,
+        "end_of_speech_to_final_ms": percentiles(latencies),
+        "reported_endpoint_ms": percentiles(endpoint_ms),
+        "endpoint_silence_ms": ENDPOINT_SILENCE_MS,
+        "missed_utterances": missed,
+        "split_utterances": splits,
+    }
+
+
+async def run_fast(utterances):
+    audio_seconds = sum(len(pcm) for pcm, _ in utterances) / (RATE * 2)
+    started = time.perf_counter()
+    for pcm, end in utterances:
+        await speak(pcm, end, paced=False)
+    elapsed = time.perf_counter() - started
+    return {"audio_seconds": round(audio_seconds, 1), "real_time_factor": round(audio_seconds / elapsed, 1)}
+
+
+async def ws_session(url, pcm, speech_end, results):
+    import websockets
+    async with websockets.connect(url + "?audio=0", subprotocols=["receptionist.v2"], max_size=None) as ws:
+        while json.loads(await ws.recv())["type"] != "turn.end":
+            pass  # hello and the greeting
+        await ws.send(json.dumps({"type": "audio.start", "sample_rate": RATE, "codec": "pcm16"}))
+        last_voiced_sent = None
+        offset = 0
+        started = time.perf_counter()
+
+        async def send_audio():
+            nonlocal last_voiced_sent, offset
+            for index, chunk in enumerate(chunks(pcm)):
+                await asyncio.sleep(max(0.0, started + index * VAD_FRAME_MS / 1000 - time.perf_counter()))
+                await ws.send(chunk)
+                offset += len(chunk)
+                if last_voiced_sent is None and offset >= speech_end:
+                    last_voiced_sent = time.perf_counter()
+            await ws.send(json.dumps({"type": "audio.stop"}))
+
+        sender = asyncio.create_task(send_audio())
+        final_at = None
+        while True:
+            message = json.loads(await asyncio.wait_for(ws.recv(), 30))
+            if message["type"] == "transcript.final" and last_voiced_sent is not None:
+                final_at = time.perf_counter()
+            elif message["type"] == "reply" and final_at is not None:
+                results["final"].append((final_at - last_voiced_sent) * 1000)
+                results["reply"].append((time.perf_counter() - last_voiced_sent) * 1000)
+                break
+            elif message["type"] == "audio.stopped" and final_at is None:
+                # Every final came before the end of speech: the tail was too short or quiet to count
+                results["missed"] += 1
+                break
+            elif message["type"] == "error" and message["code"] == "busy" and final_at is not None:
+                # A split utterance: its first part's turn is still running
+                results["final"].append((final_at - last_voiced_sent) * 1000)
+                results["busy"] += 1
+                break
+            elif message["type"] == "error" and message["code"] != "busy":
+                results["errors"] += 1
+                break
+        await sender
+
+
+async def run_ws(args, utterances):
+    import httpx
+    workdir = tempfile.mkdtemp(prefix="asr-bench-")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'asr.db')}",
+               TRANSCRIPT_DIR=os.path.join(workdir, "transcripts"), LLM_BACKEND="stub", TTS_BACKEND="stub",
+               TTS_WARMUP="false", ASR_BACKEND="stub", STUB_LLM_LATENCY_MS="0")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(workdir, "server.log"), "w") as log:
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                                   "--port", str(port), "--log-level", "warning"],
+                                  cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    if (await client.get("/health/ready")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError("server did not become ready")
+                await asyncio.sleep(0.2)
+        results = {"final": [], "reply": [], "busy": 0, "missed": 0, "errors": 0}
+        url = f"ws://127.0.0.1:{port}/ws/ai"
+        await asyncio.gather(*(ws_session(url, *utterances[index % len(utterances)], results)
+                               for index in range(args.streams)))
+        return {
+            "sessions": args.streams,
+            "end_of_speech_to_final_ms": percentiles(results["final"]),
+            "end_of_speech_to_reply_ms": percentiles(results["reply"]),
+            "busy": results["busy"],
+            "missed_utterances": results["missed"],
+            "errors": results["errors"],
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    utterances = [utterance(rng, noise=1000 if args.noise else 200) for _ in range(max(args.streams, 8))]
+    report = {"backend": asr.ASR_BACKEND, "vad": asr.VAD_BACKEND, "noise": args.noise}
+    report["in_process"] = await run_in_process(args, utterances)
+    if args.fast:
+        report["faster_than_real_time"] = await run_fast(utterances)
+    if not args.skip_ws:
+        report["websocket"] = await run_ws(args, utterances)
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=8, help="Concurrent microphone streams")
+    parser.add_argument("--utterances", type=int, default=5, help="Utterances per stream in-process")
+    parser.add_argument("--noise", action="store_true", help="Loud background noise (about -30 dBFS)")
+    parser.add_argument("--fast", action="store_true", help="Also measure unpaced processing speed")
+    parser.add_argument("--skip-ws", action="store_true", help="Skip the end-to-end WebSocket run")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+    asr.shutdown()
+
+
+if __name__ == "__main__":
+    main()
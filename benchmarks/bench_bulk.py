@@ -0,0 +1,85 @@
+"""Measure bulk appointment import/export throughput against a scratch database.
+
+Usage: python benchmarks/bench_bulk.py [--rows 50000] [--chunk-size 1000]
+"""
+import os
+import sys
+import csv
+import io
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_rows(count, seed=7):
+    rng = random.Random(seed)
+    first = ["John", "Mary", "Ahmed", "Linda", "Carlos", "Priya", "Wei", "Fatima"]
+    last = ["Smith", "Garcia", "Khan", "Brown", "Nguyen", "Lopez", "Rahman", "Miller"]
+    doctors = ["Dr. Smith", "Dr. Johnson", "Dr. Williams", "Dr. Brown"]
+    for _ in range(count):
+        yield {
+            "patient_name": f"{rng.choice(first)} {rng.choice(last)}",
+            "phone": f"555-{rng.randint(1000, 9999)}",
+            "date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "time": f"{rng.randint(8, 18):02d}:{rng.choice(['00', '30'])}",
+            "purpose": rng.choice(["Cleaning", "Checkup", "Filling", "Braces adjustment", ""]),
+            "urgency_level": rng.choice(["low", "low", "medium", "high"]),
+            "doctor_name": rng.choice(doctors),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--baseline-rows", type=int, default=2000,
+                        help="Rows to insert one-at-a-time for comparison (0 to skip)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_bulk_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from app.db import init_db, get_session
+    from app.models import Appointment
+    from app.utils.bulk import APPOINTMENT_FIELDS, iter_records, import_appointments, export_appointments
+    init_db()
+
+    rows = list(make_rows(args.rows))
+    csv_text = io.StringIO()
+    writer = csv.DictWriter(csv_text, fieldnames=APPOINTMENT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    ndjson_text = "".join(json.dumps(row) + "\n" for row in rows)
+
+    results = {}
+    for fmt, text in (("csv", csv_text.getvalue()), ("ndjson", ndjson_text)):
+        result = import_appointments(iter_records(io.StringIO(text), fmt), args.chunk_size)
+        results[f"import_{fmt}"] = result["rows_per_second"]
+
+    if args.baseline_rows:
+        started = time.perf_counter()
+        for row in rows[:args.baseline_rows]:
+            with get_session() as session:
+                session.add(Appointment(**row))
+                session.commit()
+        elapsed = time.perf_counter() - started
+        results["baseline_row_by_row"] = round(args.baseline_rows / elapsed, 1)
+
+    total = args.rows * 2 + args.baseline_rows
+    for fmt in ("csv", "ndjson"):
+        started = time.perf_counter()
+        size = sum(len(chunk) for chunk in export_appointments(fmt, args.chunk_size))
+        elapsed = time.perf_counter() - started
+        results[f"export_{fmt}"] = round(total / elapsed, 1)
+        results[f"export_{fmt}_bytes"] = size
+
+    print(json.dumps({"rows_per_import": args.rows, "rows_per_export": total,
+                      "chunk_size": args.chunk_size, "rows_per_second": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Fan-out benchmark for the appointment event bus behind /dashboard/events.
+
+Starts N subscribers that consume events exactly like the SSE stream does
+(encoding each event once and sharing it), publishes M booking events from a
+worker thread, and reports delivery latency and server-side cost per event.
+
+Usage: python benchmarks/bench_event_fanout.py [--subscribers 500] [--events 200]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.events import EventBus
+from app.routes.dashboard import encode_dashboard_event
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def subscriber(bus, expected, latencies, ready):
+    subscription = bus.subscribe()
+    ready.release()
+    received = 0
+    while received < expected:
+        event = await subscription.get()
+        frame = event.encoded("dashboard", encode_dashboard_event)
+        latencies.append(time.perf_counter() - event.data["sent_at"])
+        received += 1
+        assert frame
+    subscription.close()
+
+
+async def run(subscribers, events, interval):
+    bus = EventBus()
+    latencies = []
+    ready = asyncio.Semaphore(0)
+    tasks = [asyncio.create_task(subscriber(bus, events, latencies, ready)) for _ in range(subscribers)]
+    for _ in range(subscribers):
+        await ready.acquire()
+
+    def publisher():
+        for i in range(events):
+            bus.publish("appointment.created", {
+                "sent_at": time.perf_counter(),
+                "new_patient": False,
+                "appointment": {
+                    "id": i + 1, "patient_name": "John Smith", "phone": "555-1234", "date": "2025-06-02",
+                    "time": "10:00", "purpose": "Cleaning", "urgency_level": "low",
+                    "doctor_name": "Dr. Smith", "status": "booked", "clinic_id": None,
+                    "created_at": "2025-06-01T09:00:00",
+                },
+            })
+            time.sleep(interval)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    thread = threading.Thread(target=publisher)
+    thread.start()
+    await asyncio.gather(*tasks)
+    thread.join()
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    deliveries = subscribers * events
+    return {
+        "subscribers": subscribers,
+        "events": events,
+        "deliveries": deliveries,
+        "deliveries_per_second": round(deliveries / elapsed, 1),
+        "cpu_ms_per_event": round(cpu * 1000 / events, 3),
+        "cpu_us_per_delivery": round(cpu * 1e6 / deliveries, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "mean": round(statistics.mean(latencies) * 1000, 3),
+        },
+        "overflows": bus.stats["overflows"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=1.0, help="Delay between published events")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(n, args.events, args.interval_ms / 1000)) for n in args.subscribers]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Prompt size and stored state over long conversations, with and without history folding.
+
+Plays a scripted conversation through the same path the routes use. Each turn
+builds the prompt history, counts its estimated tokens, saves the turn to the
+session store and lets any due fold run. Every few turns books, reschedules or
+cancels something, so the function calls and results are in the history too.
+The unbounded numbers are what the old code sent: the system prompt plus the
+whole saved history.
+
+Summaries come from the extractive fallback unless --gemini is given with
+GEMINI_API_KEY set, in which case the configured Gemini model writes them.
+
+Usage: python benchmarks/bench_history.py [--turns 200] [--gemini]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import history, llm
+from app.utils.history import count_prompt, estimate_tokens, prompt_history, schedule_fold
+from app.utils.session_store import MemorySessionStore, encode_state
+from app.utils.tools import apply_results, history_entries
+
+SYSTEM_PROMPT = "You are the voice receptionist of a dental clinic. " * 40
+
+SCRIPT = [
+    ("Hi, I'd like to come in for a cleaning sometime next week.", "Sure. Which day suits you best?", None),
+    ("Tuesday afternoon if Dr. Smith is free.", "Dr. Smith has 2 PM and 3:30 PM on Tuesday. Which do you prefer?", None),
+    ("Two o'clock please. My name is Maria Lopez, 555-0142.", "You're booked with Dr. Smith on Tuesday at 2 PM.",
+     ("book_appointment", {"patient_name": "Maria Lopez", "phone": "555-0142", "date": "2030-01-08", "time": "14:00",
+                           "purpose": "Cleaning", "doctor_name": "Dr. Smith"},
+      {"ok": True, "appointment_id": 17, "message": "Your appointment on 2030-01-08 at 14:00 is confirmed."})),
+    ("Actually, can we move that to Thursday at the same time?", "Done, it's now Thursday at 2 PM.",
+     ("reschedule_appointment", {"phone": "555-0142", "date": "2030-01-10", "time": "14:00"},
+      {"ok": True, "appointment_id": 17, "message": "Your appointment is moved to 2030-01-10 at 14:00."})),
+    ("Do you take Delta Dental insurance?", "Yes, we accept Delta Dental. Bring your card to the visit.", None),
+    ("And how long does a cleaning usually take?", "About 45 minutes to an hour.", None),
+    ("Could my son come in too? He's eight.", "Of course. Dr. Lee sees children on Thursdays too.", None),
+    ("Never mind Thursday, please cancel it for now.", "Your Thursday appointment is cancelled.",
+     ("cancel_appointment", {"phone": "555-0142"}, {"ok": True, "appointment_id": 17,
+                                                    "message": "Your appointment on 2030-01-10 is cancelled."})),
+]
+
+
+def play_turn(store, session_id, turn):
+    user, reply, action = SCRIPT[(turn - 1) % len(SCRIPT)]
+    calls, results = ([(action[0], action[1])], [(action[0], action[2])]) if action else ([], [])
+    entries = [{"role": "user", "parts": [user]}] + history_entries(reply, calls, results, reply)
+
+    def add_turn(current):
+        current.history.extend(entries)
+        current.slots["turn"] = turn
+        apply_results(current.slots, results)
+
+    return store.update(session_id, add_turn)
+
+
+async def run(turns):
+    store = MemorySessionStore()
+    history.session_store = store
+    unbounded = []
+    state = store.load("long-call")
+    rows = []
+    build_seconds = []
+    checkpoints = {1, 5, 10, 20, 50, 100, 200, 500, 1000, turns}
+    for turn in range(1, turns + 1):
+        user = SCRIPT[(turn - 1) % len(SCRIPT)][0]
+        started = time.perf_counter()
+        window = prompt_history(state)
+        tokens = count_prompt("bench", SYSTEM_PROMPT, window, user)
+        build_seconds.append(time.perf_counter() - started)
+        full = estimate_tokens(SYSTEM_PROMPT, user, *unbounded)
+
+        state = play_turn(store, "long-call", turn)
+        unbounded.extend(state.history[history.turn_starts(state.history)[-1]:])
+        task = schedule_fold("long-call", state)
+        if task is not None:
+            await task
+            state = store.load("long-call")
+        if turn in checkpoints:
+            rows.append({
+                "turn": turn,
+                "prompt_tokens": tokens,
+                "unbounded_prompt_tokens": full,
+                "stored_turns": len(history.turn_starts(state.history)),
+                "stored_bytes": len(encode_state(state)),
+                "summary_tokens": estimate_tokens(state.slots.get("summary", "")),
+            })
+    return rows, build_seconds, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=200, help="Length of the conversation")
+    parser.add_argument("--gemini", action="store_true", help="Summarize with Gemini (needs GEMINI_API_KEY)")
+    args = parser.parse_args()
+    if args.gemini and llm.init_model() is None:
+        parser.error("no Gemini model could be initialized")
+
+    rows, build_seconds, state = asyncio.run(run(args.turns))
+    for row in rows:
+        print(json.dumps(row))
+    build_seconds.sort()
+    print(json.dumps({
+        "recent_turns": history.HISTORY_RECENT_TURNS,
+        "fold_turns": history.HISTORY_FOLD_TURNS,
+        "token_budget": history.HISTORY_TOKEN_BUDGET,
+        "folded_turns": state.slots.get("folded_turns", 0),
+        "prompt_build_p50_us": round(build_seconds[len(build_seconds) // 2] * 1e6, 1),
+        "prompt_build_max_us": round(build_seconds[-1] * 1e6, 1),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""Load-generation benchmark for browser voice sessions and Twilio call flows.
+
+Starts the app under uvicorn with the stub LLM and TTS backends (or targets a
+running server with --url), then drives N concurrent /ws/ai sessions speaking
+the "User: " / "AI: " protocol (or v2 with --protocol 2) and M simulated phone calls through
+/api/voice -> /api/process_speech. Reports throughput, p50/p95/p99 turn
+latency and event-loop lag, and writes everything as JSON so runs can be
+compared with --compare.
+
+Needs the `websockets` package (installed with uvicorn[standard]) and `httpx`.
+
+Usage: python benchmarks/bench_load.py [--sessions 50] [--calls 20] [--turns 4]
+           [--llm-latency-ms 400] [--tts-latency-ms 150] [--workers 1] [--session-store sqlite]
+           [--protocol 2] [--text-only] [--output run.json] [--compare baseline.json]
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+UTTERANCES = [
+    "Hi, I have a toothache on the left side.",
+    "What times does Dr. Smith have next week?",
+    "Monday morning would be good.",
+    "Please book me in for Monday at ten.",
+]
+
+# Acknowledgements /ws/ai v1 sends before the reply itself
+V1_ACKS = ("AI: I've received your message", "AI: I'm processing your request")
+# A session gives up (and counts as failed) when the server sends nothing for this long
+RECV_TIMEOUT_SECONDS = 30.0
+
+# Percentiles that count as a regression when they grow by more than --tolerance
+COMPARED_METRICS = [
+    ("websocket", "turn_latency_ms", "p50"),
+    ("websocket", "turn_latency_ms", "p95"),
+    ("websocket", "turn_latency_ms", "p99"),
+    ("websocket", "first_audio_ms", "p95"),
+    ("phone", "webhook_latency_ms", "p50"),
+    ("phone", "webhook_latency_ms", "p95"),
+    ("phone", "webhook_latency_ms", "p99"),
+    ("event_loop_lag_ms", "server", "p99"),
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(values):
+    """p50/p95/p99/mean/max in milliseconds for a list of seconds"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p95": round(percentile(values, 95) * 1000, 2),
+        "p99": round(percentile(values, 99) * 1000, 2),
+        "mean": round(statistics.mean(values) * 1000, 2),
+        "max": round(max(values) * 1000, 2),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, workdir, extra_env=None):
+    """Run the app under uvicorn with stub backends and a scratch database; `extra_env` overrides any of it"""
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        "TRANSCRIPT_DIR": os.path.join(workdir, "transcripts"),
+        "LLM_BACKEND": "stub",
+        "STUB_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "TTS_BACKEND": "stub",
+        "STUB_TTS_LATENCY_MS": str(args.tts_latency_ms),
+        "TTS_WARMUP": "false",
+        # The webhooks only build TwiML, so placeholder credentials are enough
+        "TWILIO_ACCOUNT_SID": env.get("TWILIO_ACCOUNT_SID", "ACloadtest"),
+        "TWILIO_AUTH_TOKEN": env.get("TWILIO_AUTH_TOKEN", "loadtest"),
+        # Webhooks of one call land on any worker, so several workers need a shared store
+        "SESSION_STORE": args.session_store or ("memory" if args.workers == 1 else "sqlite"),
+        "SESSION_STORE_PATH": os.path.join(workdir, "sessions.db"),
+        "WEB_CONCURRENCY": str(args.workers),
+    })
+    env.update(extra_env or {})
+    if env["SESSION_STORE"] == "redis" and "REDIS_URL" not in os.environ:
+        sys.path.insert(0, ROOT)
+        from app.utils.redis_protocol import LocalRedisServer
+        env["REDIS_URL"] = LocalRedisServer().start().url
+    log = open(os.path.join(workdir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--workers", str(args.workers)],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(client, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/health/ready")
+            if response.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+async def recv(ws, timeout):
+    return await asyncio.wait_for(ws.recv(), timeout)
+
+
+async def run_session(ws_url, turns, think_time, results, timeout=RECV_TIMEOUT_SECONDS):
+    """One browser session: greeting, then `turns` user messages"""
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        # Greeting audio, its text and the doctor list
+        for _ in range(3):
+            await recv(ws, timeout)
+        for turn in range(turns):
+            sent = time.perf_counter()
+            await ws.send(f"User: {UTTERANCES[turn % len(UTTERANCES)]}")
+            first_audio = None
+            while True:
+                message = await recv(ws, timeout)
+                if isinstance(message, bytes):
+                    first_audio = first_audio or time.perf_counter()
+                    continue
+                if message.startswith("Error"):
+                    results["errors"] += 1
+                elif message.startswith("AI: ") and not message.startswith(V1_ACKS):
+                    # The reply text ends the turn: after its audio, or alone when overload made it text-only
+                    break
+            replied = time.perf_counter()
+            results["turn_latency"].append(replied - sent)
+            results["first_audio"].append((first_audio or replied) - sent)
+            results["turns"] += 1
+            if think_time:
+                await asyncio.sleep(think_time)
+
+
+async def run_call(client, call_index, turns, think_time, results):
+    """One phone call: the incoming-call webhook, one speech webhook per turn, then the status callback"""
+    call_sid = f"CA{call_index:032d}"
+    form = {"CallSid": call_sid, "From": f"+1555{call_index:07d}"}
+    for turn in range(-1, turns):
+        started = time.perf_counter()
+        if turn < 0:
+            response = await client.post("/api/voice", data=form)
+        else:
+            response = await client.post("/api/process_speech",
+                                         data={**form, "SpeechResult": UTTERANCES[turn % len(UTTERANCES)]})
+        results["webhook_latency"].append(time.perf_counter() - started)
+        results["webhooks"] += 1
+        if response.status_code != 200 or "<Response>" not in response.text:
+            results["errors"] += 1
+        if think_time:
+            await asyncio.sleep(think_time)
+    # The caller hangs up; Twilio's status callback logs the call
+    response = await client.post("/api/call_status", data={**form, "CallStatus": "completed"})
+    if response.status_code != 204:
+        results["errors"] += 1
+
+
+async def run_session_v2(ws_url, turns, think_time, results, audio=True, timeout=RECV_TIMEOUT_SECONDS):
+    """One browser session on the v2 protocol; with audio off the server skips TTS"""
+    async with websockets.connect(ws_url + ("" if audio else "?audio=0"), subprotocols=["receptionist.v2"],
+                                  max_size=None) as ws:
+        # The hello frame, then the greeting as turn 0
+        while True:
+            message = await recv(ws, timeout)
+            if isinstance(message, str) and json.loads(message)["type"] == "turn.end":
+                break
+        for turn in range(turns):
+            sent = time.perf_counter()
+            await ws.send(json.dumps({"type": "user", "id": str(turn), "text": UTTERANCES[turn % len(UTTERANCES)]}))
+            first_audio = replied = None
+            while True:
+                message = await recv(ws, timeout)
+                if isinstance(message, bytes):
+                    first_audio = first_audio or time.perf_counter()
+                    continue
+                frame = json.loads(message)
+                if frame["type"] == "reply":
+                    replied = time.perf_counter()
+                    if not audio:
+                        first_audio = replied
+                if frame["type"] == "error":
+                    results["errors"] += 1
+                    first_audio = first_audio or time.perf_counter()
+                if frame["type"] in ("turn.end", "error"):
+                    break
+            results["turn_latency"].append(time.perf_counter() - sent)
+            # Overloaded servers reply without audio; the reply is then the first thing heard
+            results["first_audio"].append((first_audio or replied) - sent)
+            results["turns"] += 1
+            if think_time:
+                await asyncio.sleep(think_time)
+
+
+async def probe_loop_lag(client, stop, samples, interval=0.05):
+    """Time a trivial request repeatedly; it can only be slow if the server's loop is busy"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/health/live")
+            samples.append(time.perf_counter() - started)
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(interval)
+
+
+def parse_histogram(text, name):
+    """Cumulative {le: count} buckets for an unlabelled histogram in Prometheus text format"""
+    buckets = {}
+    pattern = re.compile(rf'^{name}_bucket\{{le="([^"]+)"\}} (\S+)$', re.MULTILINE)
+    for le, count in pattern.findall(text):
+        buckets[float("inf") if le == "+Inf" else float(le)] = float(count)
+    return buckets
+
+
+def histogram_quantile(quantile, before, after):
+    """Estimate a quantile from the bucket increase between two scrapes, as PromQL does"""
+    bounds = sorted(after)
+    counts = [after[bound] - before.get(bound, 0) for bound in bounds]
+    if not counts or counts[-1] <= 0:
+        return None
+    rank = quantile * counts[-1]
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, count in zip(bounds, counts):
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / max(count - previous_count, 1e-9)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+async def scrape_lag(client):
+    try:
+        response = await client.get("/metrics")
+        return parse_histogram(response.text, "receptionist_event_loop_lag_seconds")
+    except httpx.TransportError:
+        return {}
+
+
+async def run_load(base_url, args):
+    ws_url = base_url.replace("http", "ws", 1) + "/ws/ai"
+    limits = httpx.Limits(max_connections=max(args.calls, 1) + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        await wait_ready(client)
+        lag_before = await scrape_lag(client)
+
+        ws_results = {"turns": 0, "errors": 0, "turn_latency": [], "first_audio": []}
+        phone_results = {"webhooks": 0, "errors": 0, "webhook_latency": []}
+        probe_samples = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_loop_lag(client, stop, probe_samples))
+
+        started = time.perf_counter()
+        if args.protocol == 2:
+            tasks = [run_session_v2(ws_url, args.turns, args.think_time_ms / 1000, ws_results, not args.text_only,
+                                    args.recv_timeout) for _ in range(args.sessions)]
+        else:
+            tasks = [run_session(ws_url, args.turns, args.think_time_ms / 1000, ws_results, args.recv_timeout)
+                     for _ in range(args.sessions)]
+        tasks += [run_call(client, index, args.turns, args.think_time_ms / 1000, phone_results)
+                  for index in range(args.calls)]
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+        failures = [repr(outcome) for outcome in outcomes if isinstance(outcome, Exception)]
+        lag_after = await scrape_lag(client)
+
+    server_lag = {}
+    for name, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        value = histogram_quantile(quantile, lag_before, lag_after)
+        server_lag[name] = round(value * 1000, 2) if value is not None else None
+
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "failed_tasks": len(failures),
+        "failures": failures[:10],
+        "websocket": {
+            "sessions": args.sessions,
+            "turns": ws_results["turns"],
+            "errors": ws_results["errors"],
+            "turns_per_second": round(ws_results["turns"] / elapsed, 2),
+            "turn_latency_ms": summarize(ws_results["turn_latency"]),
+            "first_audio_ms": summarize(ws_results["first_audio"]),
+        },
+        "phone": {
+            "calls": args.calls,
+            "webhooks": phone_results["webhooks"],
+            "errors": phone_results["errors"],
+            "webhooks_per_second": round(phone_results["webhooks"] / elapsed, 2),
+            "webhook_latency_ms": summarize(phone_results["webhook_latency"]),
+        },
+        "event_loop_lag_ms": {
+            # Server-side: the app's own lag histogram over the run
+            "server": server_lag,
+            # Client-side: latency of /health/live probes sent during the run
+            "probe": summarize(probe_samples),
+        },
+    }
+
+
+def lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(baseline, current, tolerance):
+    """Print percentile changes against a previous run; returns the regressed metrics"""
+    regressions = []
+    print(f"{'metric':<45}{'baseline':>12}{'current':>12}{'change':>10}")
+    for path in COMPARED_METRICS:
+        before, after = lookup(baseline, path), lookup(current, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(".".join(path))
+        print(f"{'.'.join(path):<45}{before:>12.2f}{after:>12.2f}{change * 100:>9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50, help="Concurrent /ws/ai sessions")
+    parser.add_argument("--calls", type=int, default=20, help="Concurrent simulated phone calls")
+    parser.add_argument("--turns", type=int, default=4, help="User turns per session or call")
+    parser.add_argument("--think-time-ms", type=float, default=0, help="Pause between a reply and the next turn")
+    parser.add_argument("--llm-latency-ms", type=float, default=400, help="Stub LLM latency per reply")
+    parser.add_argument("--tts-latency-ms", type=float, default=150, help="Stub TTS latency per utterance")
+    parser.add_argument("--protocol", type=int, choices=[1, 2], default=1, help="/ws/ai protocol version")
+    parser.add_argument("--text-only", action="store_true",
+                        help="With --protocol 2, ask for text replies only (first_audio_ms is then time to reply text)")
+    parser.add_argument("--recv-timeout", type=float, default=RECV_TIMEOUT_SECONDS,
+                        help="Seconds a session waits for the next server frame before it fails")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    parser.add_argument("--session-store", choices=["memory", "sqlite", "redis"],
+                        help="Session backend for the local server (default: memory for one worker, else sqlite; "
+                             "redis uses REDIS_URL or an in-process stand-in)")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--label", default="", help="Free-form label stored with the results")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative increase in a compared percentile that counts as a regression")
+    args = parser.parse_args()
+
+    process = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            process, base_url = start_server(args, workdir)
+        try:
+            results = asyncio.run(run_load(base_url, args))
+        finally:
+            if process:
+                process.terminate()
+                process.wait(10)
+
+    report = {
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "sessions": args.sessions, "calls": args.calls, "turns": args.turns,
+            "think_time_ms": args.think_time_ms, "llm_latency_ms": args.llm_latency_ms,
+            "tts_latency_ms": args.tts_latency_ms, "workers": args.workers, "url": args.url,
+            "session_store": args.session_store, "protocol": args.protocol, "text_only": args.text_only,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline["results"], results, args.tolerance)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
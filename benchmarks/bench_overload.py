@@ -0,0 +1,157 @@
+"""Turn latency of admitted sessions at normal and twice-normal load, with and without overload control.
+
+Starts the app under uvicorn with the stub LLM and TTS backends, once per
+run, and opens v2 /ws/ai sessions as an open-loop arrival process: a new
+session every 1/--rate seconds for --duration seconds, whether or not earlier
+ones have finished, each speaking --turns turns with --think-time between
+them. Runs 1x and 2x the rate, with OVERLOAD_CONTROL off and on.
+
+For every run it reports the sessions refused ("overloaded"), turn latency
+percentiles over the admitted sessions, how many replies were the holding
+message or came without audio, the worst mode seen on /health/ready, and
+the mode changes counted in /metrics.
+
+Needs the `websockets` package (installed with uvicorn[standard]) and `httpx`.
+
+Usage: python benchmarks/bench_overload.py [--rate 4] [--duration 20] [--turns 3] [--llm-latency-ms 400]
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+import httpx
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import RECV_TIMEOUT_SECONDS, UTTERANCES, recv, start_server, summarize, wait_ready
+
+MODES = ("normal", "short_prompt", "fast_model", "text_only", "holding", "shed")
+HOLDING_PREFIX = "Sorry, we're helping a lot of patients"
+
+
+async def run_session(ws_url, args, results):
+    """One v2 session: the greeting, then --turns turns; returns early when refused"""
+    async with websockets.connect(ws_url, subprotocols=["receptionist.v2"], max_size=None) as ws:
+        while True:
+            message = await recv(ws, RECV_TIMEOUT_SECONDS)
+            if isinstance(message, bytes):
+                continue
+            frame = json.loads(message)
+            if frame["type"] == "error" and frame["code"] == "overloaded":
+                results["refused"] += 1
+                return
+            if frame["type"] == "turn.end":
+                break
+        results["admitted"] += 1
+        for turn in range(args.turns):
+            await asyncio.sleep(args.think_time)
+            sent = time.perf_counter()
+            await ws.send(json.dumps({"type": "user", "text": UTTERANCES[turn % len(UTTERANCES)]}))
+            audio = False
+            while True:
+                message = await recv(ws, RECV_TIMEOUT_SECONDS)
+                if isinstance(message, bytes):
+                    audio = True
+                    continue
+                frame = json.loads(message)
+                if frame["type"] == "reply" and frame["text"].startswith(HOLDING_PREFIX):
+                    results["holding"] += 1
+                if frame["type"] == "error":
+                    results["errors"] += 1
+                if frame["type"] in ("turn.end", "error"):
+                    break
+            results["turn_latency"].append(time.perf_counter() - sent)
+            results["no_audio"] += not audio
+
+
+async def watch_mode(client, seen):
+    while True:
+        try:
+            mode = (await client.get("/health/ready")).json()["overload"]["mode"]
+            seen[0] = max(seen[0], MODES.index(mode))
+        except (httpx.TransportError, KeyError, ValueError):
+            pass
+        await asyncio.sleep(0.25)
+
+
+def mode_changes(metrics_text):
+    found = re.findall(r'^\w*overload_mode_changes_total\{mode="(\w+)"\} (\S+)$', metrics_text, re.M)
+    return {mode: int(float(count)) for mode, count in found}
+
+
+async def run_load(args, rate, control):
+    workdir = tempfile.mkdtemp(prefix="overload-bench-")
+    os.environ["OVERLOAD_CONTROL"] = "true" if control else "false"
+    process, base_url = start_server(args, workdir)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+            await wait_ready(client)
+            results = {"admitted": 0, "refused": 0, "holding": 0, "no_audio": 0, "errors": 0, "turn_latency": []}
+            seen = [0]
+            watcher = asyncio.create_task(watch_mode(client, seen))
+            ws_url = base_url.replace("http", "ws", 1) + "/ws/ai"
+            sessions = []
+            started = time.perf_counter()
+            for index in range(int(args.duration * rate)):
+                # Open loop: arrivals don't wait for earlier sessions
+                await asyncio.sleep(max(0.0, started + index / rate - time.perf_counter()))
+                sessions.append(asyncio.create_task(run_session(ws_url, args, results)))
+            outcomes = await asyncio.gather(*sessions, return_exceptions=True)
+            watcher.cancel()
+            changes = mode_changes((await client.get("/metrics")).text)
+        return {
+            "overload_control": control,
+            "rate_per_second": rate,
+            "sessions": len(sessions),
+            "admitted": results["admitted"],
+            "refused": results["refused"],
+            "failed": sum(isinstance(outcome, Exception) for outcome in outcomes),
+            "turn_latency_ms": summarize(results["turn_latency"]),
+            "holding_replies": results["holding"],
+            "replies_without_audio": results["no_audio"],
+            "errors": results["errors"],
+            "worst_mode": MODES[seen[0]],
+            "mode_changes": changes,
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def run(args):
+    runs = []
+    for control in ([True] if args.skip_off else [False, True]):
+        for factor in (1, 2):
+            report = await run_load(args, args.rate * factor, control)
+            print(json.dumps(report), flush=True)
+            runs.append(report)
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=4.0, help="New sessions per second at normal load")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of arrivals per run")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Seconds between a reply and the next turn")
+    parser.add_argument("--llm-latency-ms", type=int, default=400, help="Stub model latency")
+    parser.add_argument("--tts-latency-ms", type=int, default=150, help="Stub TTS latency")
+    parser.add_argument("--skip-off", action="store_true", help="Only run with overload control on")
+    parser.add_argument("--output", help="Also write the runs to this JSON file")
+    args = parser.parse_args()
+    # start_server() from bench_load reads these
+    args.workers, args.session_store = 1, None
+    runs = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""What Twilio synthesizes and downloads per call with <Say> against pre-rendered <Play> clips.
+
+Starts the app twice under uvicorn with the stub backends, once with
+PHONE_AUDIO=say and once with PHONE_AUDIO=play. Each time it runs --calls
+simulated calls of --turns turns: /api/voice, /api/process_speech, then
+/api/voicemail. It counts the characters each call leaves to Twilio's <Say>
+and the <Play> clips it links to.
+
+Every <Play> is then fetched the way a media cache would:
+- a plain GET the first time a URL is seen
+- an If-None-Match revalidation or a Range request afterwards
+
+This checks that the cache headers are what a cache needs. It reports the
+bytes a cache that honours them downloads, against fetching every play.
+
+Needs `httpx`.
+
+Usage: python benchmarks/bench_phone_audio.py [--calls 50] [--turns 3] [--tts-latency-ms 150]
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import start_server, summarize, wait_ready
+
+SAY = re.compile(r"<Say[^>]*>(.*?)</Say>", re.S)
+PLAY = re.compile(r"<Play[^>]*>(.*?)</Play>", re.S)
+UTTERANCES = [
+    "Hi, I have a toothache on the left side.",
+    "What times does Dr. Smith have next week?",
+    "Monday morning would be good.",
+]
+
+
+def tally(results, twiml):
+    results["say_chars"] += sum(len(text) for text in SAY.findall(twiml))
+    results["plays"].extend(PLAY.findall(twiml))
+
+
+async def run_call(client, index, turns, results):
+    call_sid = f"CA{index:032d}"
+    form = {"CallSid": call_sid, "From": f"+1555{index:07d}"}
+    response = await client.post("/api/voice", data=form)
+    tally(results, response.text)
+    for turn in range(turns):
+        response = await client.post("/api/process_speech",
+                                     data={**form, "SpeechResult": UTTERANCES[turn % len(UTTERANCES)]})
+        tally(results, response.text)
+    response = await client.get("/api/voicemail", params={"CallSid": call_sid})
+    tally(results, response.text)
+
+
+async def fetch_clips(client, plays):
+    """Fetch each play like a cache: the first one in full, later ones conditionally or by range"""
+    seen = {}
+    stats = {"full": [], "not_modified": [], "range": [], "bytes_cached": 0, "bytes_uncached": 0, "problems": []}
+    for index, url in enumerate(plays):
+        headers = {}
+        if url in seen and index % 2:
+            headers["If-None-Match"] = seen[url]["etag"]
+        elif url in seen:
+            headers["Range"] = "bytes=0-1023"
+        started = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        elapsed = time.perf_counter() - started
+        if url not in seen:
+            if response.status_code != 200 or "immutable" not in response.headers.get("cache-control", ""):
+                stats["problems"].append(f"{url}: {response.status_code} {response.headers.get('cache-control')}")
+            seen[url] = {"etag": response.headers.get("etag"), "size": len(response.content)}
+            stats["bytes_cached"] += len(response.content)
+            stats["full"].append(elapsed)
+        elif response.status_code == 304:
+            stats["not_modified"].append(elapsed)
+        elif response.status_code == 206:
+            stats["range"].append(elapsed)
+        else:
+            stats["problems"].append(f"{url}: {response.status_code} for {headers}")
+        stats["bytes_uncached"] += seen[url]["size"]
+    return seen, stats
+
+
+async def run_mode(base_url, args):
+    results = {"say_chars": 0, "plays": []}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await wait_ready(client)
+        await asyncio.gather(*(run_call(client, index, args.turns, results) for index in range(args.calls)))
+        clips, fetches = await fetch_clips(client, results["plays"])
+    return {
+        "say_chars_per_call": round(results["say_chars"] / args.calls, 1),
+        "plays_per_call": round(len(results["plays"]) / args.calls, 2),
+        "distinct_clips": len(clips),
+        "clip_full_ms": summarize(fetches["full"]),
+        "clip_not_modified_ms": summarize(fetches["not_modified"]),
+        "clip_range_ms": summarize(fetches["range"]),
+        "clip_bytes_every_play": fetches["bytes_uncached"],
+        "clip_bytes_with_cache": fetches["bytes_cached"],
+        "problems": fetches["problems"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=50, help="Simulated calls per mode")
+    parser.add_argument("--turns", type=int, default=3, help="Speech turns per call")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0, help="Stub model latency")
+    parser.add_argument("--tts-latency-ms", type=float, default=150.0, help="Stub TTS latency per clip")
+    parser.add_argument("--clip-bytes", type=int, default=24000, help="Size of each stub clip")
+    args = parser.parse_args()
+    # start_server() from bench_load reads these
+    args.workers, args.session_store = 1, None
+
+    summary = {}
+    for mode in ("say", "play"):
+        with tempfile.TemporaryDirectory() as workdir:
+            process, base_url = start_server(args, workdir, {"PHONE_AUDIO": mode, "TTS_WARMUP": "true",
+                                                             "STUB_TTS_BYTES": str(args.clip_bytes)})
+            try:
+                summary[mode] = asyncio.run(run_mode(base_url, args))
+            finally:
+                process.terminate()
+                process.wait(10)
+        print(json.dumps({"mode": mode, **summary[mode]}))
+    say, play = summary["say"], summary["play"]
+    print(json.dumps({
+        "say_chars_saved_per_call": round(say["say_chars_per_call"] - play["say_chars_per_call"], 1),
+        "clip_bytes_saved_by_cache": play["clip_bytes_every_play"] - play["clip_bytes_with_cache"],
+    }))
+    if any(result["problems"] for result in summary.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Correctness and throughput check for the session state backends.
+
+Runs the same checks against the memory, SQLite and Redis-protocol stores
+(the Redis one against the in-process stand-in unless --redis-url is given):
+versions start at 0 and go up by one per save, a stale copy can't be saved,
+update() reapplies its change after a conflict, deleted and expired state is
+gone, and large histories round-trip through compression. Then several
+processes append turns to the same sessions at once; every turn must survive.
+Finally it measures load+save round trips per second with 1..N processes.
+
+Usage: python benchmarks/bench_session_store.py [--processes 4] [--turns 200] [--redis-url redis://...]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.redis_protocol import LocalRedisServer
+from app.utils.session_store import (MemorySessionStore, RedisSessionStore, SessionConflict, SessionState,
+                                     SqliteSessionStore, encode_state)
+
+# One turn as the routes save it: the caller's words, a function call and its result, the reply
+TURN = [
+    {"role": "user", "parts": ["Please book me in with Dr. Smith on Monday at ten, my number is 555-1234."]},
+    {"role": "model", "parts": [{"function_call": {"name": "book_appointment", "args": {
+        "patient_name": "John Smith", "phone": "555-1234", "date": "2030-01-07", "time": "10:00"}}}]},
+    {"role": "user", "parts": [{"function_response": {"name": "book_appointment", "response": {
+        "ok": True, "appointment_id": 42, "message": "Your appointment on 2030-01-07 at 10:00 is confirmed."}}}]},
+    {"role": "model", "parts": ["Your appointment on Monday at ten with Dr. Smith is confirmed."]},
+]
+
+
+def make_store(backend, target, ttl=3600):
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl)
+    if backend == "sqlite":
+        return SqliteSessionStore(target, ttl=ttl)
+    return RedisSessionStore(target, ttl=ttl)
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def conformance(store):
+    fresh = store.load("call-a")
+    check(fresh.version == 0 and fresh.history == [] and fresh.slots == {}, "a new session starts empty at version 0")
+
+    fresh.history.extend(TURN)
+    fresh.slots["turn"] = 1
+    store.save(fresh)
+    check(fresh.version == 1, "save bumps the version")
+
+    first, second = store.load("call-a"), store.load("call-a")
+    check(first.version == 1 and first.history == TURN and first.slots == {"turn": 1}, "state round-trips")
+    store.save(first)
+    try:
+        store.save(second)
+        check(False, "saving a stale copy must fail")
+    except SessionConflict:
+        pass
+    try:
+        store.save(SessionState("call-a"))
+        check(False, "creating a session that already exists must fail")
+    except SessionConflict:
+        pass
+
+    calls = []
+
+    def change(state):
+        calls.append(state.version)
+        state.slots["turn"] = state.slots.get("turn", 0) + 1
+
+    updated = store.update("call-a", change, state=second)
+    check(calls == [1, 2] and updated.version == 3 and updated.slots["turn"] == 2,
+          f"update reloads after a conflict (saw versions {calls})")
+
+    big = store.load("call-big")
+    big.history = TURN * 50
+    check(encode_state(big)[:1] == b"z", "large state is compressed")
+    store.save(big)
+    check(store.load("call-big").history == TURN * 50, "compressed state round-trips")
+
+    store.delete("call-a")
+    check(store.load("call-a").version == 0, "deleted state is gone")
+    recreated = store.load("call-a")
+    store.save(recreated)
+    check(recreated.version == 1, "a deleted session can start again")
+
+
+def expiry(store):
+    state = store.load("call-ttl")
+    store.save(state)
+    time.sleep(store.ttl + 1.1)
+    check(store.load("call-ttl").version == 0, "expired state is gone")
+    again = store.load("call-ttl")
+    store.save(again)
+    check(again.version == 1, "an expired session can start again")
+
+
+def append_turns(args):
+    backend, target, worker, sessions, turns = args
+    store = make_store(backend, target)
+    for turn in range(turns):
+        session_id = f"shared-{turn % sessions}"
+
+        def add(state):
+            state.history.append({"role": "user", "parts": [f"worker {worker} turn {turn}"]})
+            state.slots["turn"] = state.slots.get("turn", 0) + 1
+
+        store.update(session_id, add, attempts=1000)
+    return turns
+
+
+def contention(backend, target, processes, turns, sessions=4):
+    with multiprocessing.Pool(processes) as pool:
+        pool.map(append_turns, [(backend, target, worker, sessions, turns) for worker in range(processes)])
+    store = make_store(backend, target)
+    total = 0
+    for index in range(sessions):
+        state = store.load(f"shared-{index}")
+        check(len(state.history) == state.slots.get("turn") == state.version,
+              f"shared-{index}: history, turn count and version disagree")
+        total += len(state.history)
+    check(total == processes * turns, f"lost updates: {total} of {processes * turns} turns saved")
+
+
+def round_trips(args):
+    backend, target, worker, turns = args
+    store = make_store(backend, target)
+    started = time.perf_counter()
+    for turn in range(turns):
+        # One phone webhook: load the call, add a turn, save it
+        session_id = f"rt-{worker}-{turn % 20}"
+        state = store.load(session_id)
+        state.history.extend(TURN)
+        del state.history[:-40]
+        state.slots["turn"] = state.slots.get("turn", 0) + 1
+        store.save(state)
+    return turns, time.perf_counter() - started
+
+
+def throughput(backend, target, processes, turns):
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        done = pool.map(round_trips, [(backend, target, worker, turns) for worker in range(processes)])
+    elapsed = time.perf_counter() - started
+    per_process = [count / seconds for count, seconds in done]
+    return {
+        "processes": processes,
+        "turns_per_second": round(sum(count for count, _ in done) / elapsed, 1),
+        "per_process_turns_per_second": round(sum(per_process) / len(per_process), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=4, help="Largest number of concurrent processes")
+    parser.add_argument("--turns", type=int, default=200, help="Turns saved per process")
+    parser.add_argument("--redis-url", help="Check a real Redis instead of the in-process stand-in")
+    parser.add_argument("--skip-expiry", action="store_true", help="Skip the TTL checks, which sleep")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="session-bench-")
+    redis = None
+    if not args.redis_url:
+        redis = LocalRedisServer().start()
+    redis_url = args.redis_url or redis.url
+    targets = {
+        "memory": None,
+        "sqlite": os.path.join(workdir, "sessions.db"),
+        "redis": redis_url,
+    }
+    results = {}
+    try:
+        for backend, target in targets.items():
+            if backend == "redis":
+                make_store(backend, target)._connection().execute("FLUSHDB")
+            conformance(make_store(backend, target if backend != "sqlite" else target + ".conformance"))
+            if not args.skip_expiry:
+                expiry(make_store(backend, target if backend != "sqlite" else target + ".expiry", ttl=1))
+            result = {"conformance": "ok"}
+            if backend != "memory":
+                # Memory state is per process, so only the shared backends can be contended
+                contention(backend, target, args.processes, args.turns)
+                result["contention"] = f"ok ({args.processes} processes x {args.turns} turns, no lost updates)"
+                counts = sorted({1, 2, args.processes} | ({4} if args.processes >= 4 else set()))
+                result["throughput"] = [throughput(backend, target, count, args.turns) for count in counts]
+            else:
+                result["throughput"] = [throughput(backend, target, 1, args.turns)]
+            results[backend] = result
+            print(json.dumps({backend: result}))
+    except AssertionError as e:
+        print(f"FAILED: {e}")
+        sys.exit(1)
+    finally:
+        if redis is not None:
+            redis.stop()
+
+
+if __name__ == "__main__":
+    main()
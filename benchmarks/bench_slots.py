@@ -0,0 +1,301 @@
+"""Turns and model calls per booking with and without the local slot extractor, plus its accuracy and speed.
+
+Plays scripted booking conversations twice. The receptionist is a
+deterministic stand-in for the model that follows the prompt's rules: it
+asks for the name and phone number first, then the date and time, asks for
+the specific date when it only heard a weekday or "tomorrow" (it has no
+calendar), asks which doctor, reads the details back and books after a yes.
+
+- Without the extractor every turn is a model turn.
+- With it, each utterance goes through app.utils.slots.plan() first, the
+  real code the routes run. Turns it answers locally cost no model call,
+  and the stand-in sees the resolved details note like the model would.
+
+Either way the booking itself goes through app.utils.tools.run_tool_calls()
+into a scratch database, so "booked" means an appointment row was saved.
+
+Callers answer each question from their script, so both runs hear the same
+words. The summary estimates caller waiting time from --model-ms per model
+turn.
+
+It also checks the extractor against a labelled set of utterances and times
+it.
+
+Usage: python benchmarks/bench_slots.py [--model-ms 1500] [--repeat 2000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Bookings are real; keep them out of the app's own database
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_slots.db')}")
+
+from app.db import init_db
+from app.utils.doctor_cache import DoctorSnapshot, parse_availability
+from app.utils.slots import REQUIRED, extract, plan
+from app.utils.tools import run_tool_calls
+
+# A fixed "now" (a Monday morning) so relative dates resolve the same on every run
+NOW = datetime(2026, 10, 19, 10, 0, tzinfo=ZoneInfo("America/New_York"))
+WEEKDAY_HOURS = json.dumps({day: ["09:00-12:00", "13:00-17:00"] for day in
+                            ("monday", "tuesday", "wednesday", "thursday", "friday")})
+DOCTORS = DoctorSnapshot([
+    {"id": index, "name": name, "specialty": specialty, "availability": parse_availability(WEEKDAY_HOURS)}
+    for index, (name, specialty) in enumerate([("Dr. Smith", "General Dentistry"), ("Dr. Johnson", "Orthodontics"),
+                                               ("Dr. Williams", "Pediatric Dentistry"),
+                                               ("Dr. Brown", "Cosmetic Dentistry")])
+], 1, 0.0)
+
+# (utterance, expected slots); only the listed keys are checked
+LABELLED = [
+    ("My name is John Smith and my phone number is 555-1234", {"patient_name": "John Smith", "phone": "555-1234"}),
+    ("Hi, I'm Maria Lopez, 555 123 4567", {"patient_name": "Maria Lopez", "phone": "555-123-4567"}),
+    ("This is Ana Perez calling", {"patient_name": "Ana Perez"}),
+    ("it's five five five oh one four two", {"phone": "555-0142"}),
+    ("You can reach me at (555) 987-6543", {"phone": "555-987-6543"}),
+    ("+1 555 222 3333", {"phone": "555-222-3333"}),
+    ("Monday at 4 PM", {"date": "2026-10-26", "time": "16:00"}),
+    ("next Monday", {"date": "2026-10-26"}),
+    ("this Friday at 2:30 pm", {"date": "2026-10-23", "time": "14:30"}),
+    ("tomorrow at 10 am", {"date": "2026-10-20", "time": "10:00"}),
+    ("the day after tomorrow at noon", {"date": "2026-10-21", "time": "12:00"}),
+    ("October 28th at 3", {"date": "2026-10-28", "time": "15:00"}),
+    ("on the 3rd of November at 9:15", {"date": "2026-11-03", "time": "09:15"}),
+    ("2026-12-01 at 16:30", {"date": "2026-12-01", "time": "16:30"}),
+    ("11/4 at eleven", {"date": "2026-11-04", "time": "11:00"}),
+    ("in two weeks, in the morning at 10", {"date": "2026-11-02", "time": "10:00"}),
+    ("three thirty pm works", {"time": "15:30"}),
+    ("January 5 at 8 in the morning", {"date": "2027-01-05", "time": "08:00"}),
+    ("I'd like to see Dr. Johnson", {"doctor_name": "Dr. Johnson", "intent": "book"}),
+    ("doctor williams please", {"doctor_name": "Dr. Williams"}),
+    ("I need a cleaning", {"purpose": "cleaning", "intent": "book"}),
+    ("I want to cancel my appointment", {"intent": "cancel"}),
+    ("Can I move my appointment to Thursday?", {"intent": "reschedule", "date": "2026-10-22"}),
+    ("Yes, that's right", {"answer": "yes"}),
+    ("No, make it 11", {"answer": "no", "time": "11:00"}),
+    ("I'm looking for a dentist", {"patient_name": None}),
+    ("My name is John Smith", {"patient_name": "John Smith", "doctor_name": None}),
+]
+
+# Each caller: what they say first, then one phrase per thing they are asked for.
+# Phrase facts say what a listener learns; "date_relative" is a date the
+# stand-in can't turn into a calendar date by itself. "booking" is what the
+# stand-in books when the model turn makes the booking.
+CALLERS = [
+    {
+        "name": "all_at_once",
+        "booking": {"patient_name": "Maria Lopez", "phone": "555-123-4567",
+                    "date": "2026-10-26", "time": "16:00", "doctor_name": "Dr. Smith", "purpose": "cleaning"},
+        "opening": ["intro"],
+        "phrases": {
+            "intro": ("Hi, I'm Maria Lopez, my number is 555 123 4567. Can I book a cleaning with Dr. Smith "
+                      "next Monday at 4 pm?", {"intent", "patient_name", "phone", "doctor_name", "date_relative",
+                                                "time"}),
+            "date": ("October 26th", {"date"}),
+            "yes": ("Yes, that's right", {"yes"}),
+        },
+    },
+    {
+        "name": "piecemeal",
+        "booking": {"patient_name": "John Smith", "phone": "555-867-5309",
+                    "date": "2026-10-20", "time": "10:00", "doctor_name": "Dr. Johnson"},
+        "opening": ["book"],
+        "phrases": {
+            "book": ("I'd like to book an appointment", {"intent"}),
+            "patient_name": ("My name is John Smith", {"patient_name"}),
+            "phone": ("my number is 555-867-5309", {"phone"}),
+            "when": ("Tomorrow at 10 am", {"date_relative", "time"}),
+            "date": ("October 20th", {"date"}),
+            "doctor": ("Dr. Johnson please", {"doctor_name"}),
+            "yes": ("Yes please", {"yes"}),
+        },
+    },
+    {
+        "name": "weekday_first",
+        "booking": {"patient_name": "Ana Perez", "phone": "555-0142",
+                    "date": "2026-10-23", "time": "14:30", "doctor_name": "Dr. Johnson", "purpose": "braces"},
+        "opening": ["ask"],
+        "phrases": {
+            "ask": ("Can I come in Friday at 2:30 pm to see Dr. Johnson for braces?", {"intent", "date_relative",
+                                                                                      "time", "doctor_name"}),
+            "patient_name": ("This is Ana Perez", {"patient_name"}),
+            "phone": ("555 0142", {"phone"}),
+            "date": ("October 23rd", {"date"}),
+            "yes": ("Yep", {"yes"}),
+        },
+    },
+    {
+        "name": "phone_caller_id",
+        "booking": {"patient_name": "Sam Lee", "phone": "555-222-4444",
+                    "date": "2026-10-21", "time": "11:00", "doctor_name": "Dr. Williams", "purpose": "checkup"},
+        "caller_phone": "+15552224444",
+        "opening": ["ask"],
+        "phrases": {
+            "ask": ("Hi, this is Sam Lee, I need a checkup", {"intent", "patient_name"}),
+            "phone": ("It's 555 222 4444", {"phone"}),
+            "when": ("The day after tomorrow at 11 in the morning", {"date_relative", "time"}),
+            "date": ("October 21st", {"date"}),
+            "doctor": ("Doctor Williams", {"doctor_name"}),
+            "yes": ("Correct", {"yes"}),
+        },
+    },
+    {
+        "name": "spoken_numbers",
+        "booking": {"patient_name": "Lee Wong", "phone": "555-333-9999",
+                    "date": "2026-10-28", "time": "15:30", "doctor_name": "Dr. Brown", "purpose": "filling"},
+        "opening": ["book"],
+        "phrases": {
+            "book": ("I want to schedule a filling", {"intent"}),
+            "patient_name": ("my name is lee wong", {"patient_name"}),
+            "phone": ("five five five three three three nine nine nine nine", {"phone"}),
+            "when": ("next Wednesday at three thirty pm", {"date_relative", "time"}),
+            "date": ("October 28th", {"date"}),
+            "doctor": ("Dr. Brown", {"doctor_name"}),
+            "yes": ("Sounds good", {"yes"}),
+        },
+    },
+    {
+        "name": "typed_lowercase",
+        "booking": {"patient_name": "Dana Kim", "phone": "555-444-1212",
+                    "date": "2026-10-22", "time": "09:00", "doctor_name": "Dr. Smith"},
+        "opening": ["ask"],
+        "phrases": {
+            "ask": ("hi it's dana kim, can i get an appointment thursday at 9", {"intent", "patient_name",
+                                                                                 "date_relative", "time"}),
+            "phone": ("555-444-1212", {"phone"}),
+            "patient_name": ("dana kim", {"patient_name"}),
+            "date": ("10/22", {"date"}),
+            "doctor": ("smith", {"doctor_name"}),
+            "yes": ("yes", {"yes"}),
+        },
+    },
+]
+
+
+def receptionist(known):
+    """The stand-in model's next move from what it knows: ("ask", phrase keys), ("confirm",) or ("book",)"""
+    who = [field for field in ("patient_name", "phone") if field not in known]
+    if who:
+        return "ask", who
+    if "date" not in known and "date_relative" in known and "time" in known:
+        return "ask", ["date"]
+    if "date" not in known or "time" not in known:
+        return "ask", ["when"]
+    if "doctor_name" not in known:
+        return "ask", ["doctor"]
+    if "yes" not in known:
+        return "confirm",
+    return "book",
+
+
+def answer(caller, keys):
+    phrases = [caller["phrases"][key] for key in keys if key in caller["phrases"]]
+    return ". ".join(text for text, _ in phrases), set().union(*(facts for _, facts in phrases))
+
+
+def book(calls):
+    """Run booking calls like the routes do; whether every one was saved"""
+    return all(result["ok"] for _, result in run_tool_calls(calls))
+
+
+def converse(caller, local, max_turns=12):
+    """Play one caller to a booking; returns turns, model turns and local turns by action"""
+    keys = caller["opening"]
+    heard = set()  # what the model understood from the words so far
+    booking = {}
+    confirmed_by = None
+    report = {"caller": caller["name"], "turns": 0, "model_turns": 0, "local": {}, "booked": False}
+    while report["turns"] < max_turns:
+        text, facts = answer(caller, keys)
+        report["turns"] += 1
+        heard |= facts
+        # The model hears "yes" as agreement only to a read-back it can see in the history
+        if "yes" in facts and confirmed_by is None:
+            heard.discard("yes")
+        if local:
+            booking, move = plan(booking, text, DOCTORS, caller.get("caller_phone"), NOW)
+            if move is not None:
+                action = move[0]
+                report["local"][action] = report["local"].get(action, 0) + 1
+                if action == "book":
+                    report["booked"] = book(move[2])
+                    return report
+                confirmed_by = confirmed_by or (action == "confirm")
+                keys = ["doctor"] if action == "ask_doctor" else ["yes"]
+                continue
+            # The model also reads the resolved details note
+            heard |= {field for field in REQUIRED + ("doctor_name",) if booking.get(field)}
+        report["model_turns"] += 1
+        move = receptionist(heard)
+        if move[0] == "book":
+            # The stand-in understood every word, so it books what the caller meant
+            report["booked"] = book([("book_appointment", caller["booking"])])
+            return report
+        if move[0] == "confirm":
+            confirmed_by = "model"
+            keys = ["yes"]
+        else:
+            keys = move[1]
+            if "patient_name" in keys and "phone" in keys and caller.get("caller_phone") and local:
+                keys = ["patient_name"]
+    return report
+
+
+def check_accuracy():
+    correct = total = 0
+    misses = []
+    for text, expected in LABELLED:
+        found = extract(text, DOCTORS, NOW.date())
+        for key, value in expected.items():
+            total += 1
+            if found.get(key) == value:
+                correct += 1
+            else:
+                misses.append({"text": text, "slot": key, "expected": value, "found": found.get(key)})
+    return correct, total, misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model-ms", type=float, default=1500.0,
+                        help="Model plus TTS time of one model turn, for the waiting-time estimate")
+    parser.add_argument("--repeat", type=int, default=2000, help="Passes over the labelled set for the timing")
+    args = parser.parse_args()
+    init_db()
+
+    correct, total, misses = check_accuracy()
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for text, _ in LABELLED:
+            extract(text, DOCTORS, NOW.date())
+    per_utterance_us = (time.perf_counter() - started) / (args.repeat * len(LABELLED)) * 1e6
+    print(json.dumps({"slot_accuracy": round(correct / total, 3), "slots_checked": total, "misses": misses,
+                      "extract_us_per_utterance": round(per_utterance_us, 1)}))
+
+    summary = {}
+    for local in (False, True):
+        mode = "extractor" if local else "model_only"
+        reports = [converse(caller, local) for caller in CALLERS]
+        for report in reports:
+            print(json.dumps({"mode": mode, **report}))
+        turns = sum(report["turns"] for report in reports)
+        model_turns = sum(report["model_turns"] for report in reports)
+        summary[mode] = {
+            "bookings": sum(report["booked"] for report in reports),
+            "turns_per_booking": round(turns / len(reports), 2),
+            "model_turns_per_booking": round(model_turns / len(reports), 2),
+            "est_model_wait_s_per_booking": round(model_turns / len(reports) * args.model_ms / 1000, 2),
+        }
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Throughput check for the streaming speech/JSON parser.
+
+Parses a long mixed input of speech, JSON objects, fenced JSON and fenced
+code in streaming chunks (MB/s), and a typical reply chunk by chunk. The
+typical reply is compared with the old whole-response cleanup (first "{" to
+last "}" plus the fence-removal loop) rerun on everything received after
+each chunk. That is what getting speech out early would cost with the old
+code. The parser's correctness checks live in tests/test_speech_stream.py.
+
+Usage: python benchmarks/bench_speech_stream.py [--seed 1] [--size-kb 256] [--chunk-size 8 64 512]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.speech_stream import SpeechStreamParser
+
+SPEECH = ["Sure, your appointment with Dr. Smith is confirmed for Monday at 10:30.",
+          "Anything else? It's `100%` covered (see below).", "Thanks! Okay, \"quoted\" text here."]
+BLOCKS = [json.dumps({"english_notes": "Asked {about} fees", "urgency_level": "low", "tags": ["a\\b", "```"]}),
+          json.dumps({"appointment_data": {"patient_name": "Jos\u00e9", "time": "10:30"}}, indent=2),
+          "```json\n" + json.dumps({"doctor_name": "Dr. Smith", "notes": "brace } and \"quote\""}) + "\n```",
+          "```python\nprint({'x': 1})\n```"]
+
+
+def mixed_input(size_kb, rng):
+    """Speech and blocks in random order, like a long run of model replies"""
+    pieces, total = [], 0
+    while total < size_kb * 1024:
+        piece = rng.choice(SPEECH) if rng.random() < 0.5 else rng.choice(BLOCKS)
+        pieces.append(piece + rng.choice([" ", "\n", "  "]))
+        total += len(pieces[-1])
+    return "".join(pieces)
+
+
+def legacy_cleanup(text):
+    """The pre-streaming cleanup: needs the whole response and rescans it several times"""
+    display_text = text
+    start = text.find("{")
+    end = text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            json.loads(text[start:end + 1])
+        except ValueError:
+            pass
+        display_text = (text[:start].strip() + " " + text[end + 1:].strip()).strip()
+    while "```" in display_text:
+        first = display_text.find("```")
+        last = display_text.find("```", first + 3)
+        if last == -1:
+            break
+        display_text = display_text[:first] + display_text[last + 3:]
+    return display_text.replace("```", "").strip()
+
+
+def stream(chunks):
+    parser = SpeechStreamParser()
+    events = 0
+    for chunk in chunks:
+        events += len(parser.feed(chunk))
+    return events + len(parser.finish())
+
+
+def throughput(size_kb, chunk_size, seed):
+    """Bulk MB/s on a long mixed input, plus per-reply cost on a typical reply"""
+    text = mixed_input(size_kb, random.Random(seed))
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    started = time.perf_counter()
+    events = stream(chunks)
+    bulk = time.perf_counter() - started
+
+    # A spoken reply with a trailing booking block, as Gemini streams it
+    reply = ("Great, your cleaning with Dr. Smith is booked for Monday, June 2nd at 10:30 in the morning. "
+             "Please arrive ten minutes early. Is there anything else I can help you with? " * 3) + \
+        json.dumps({"english_notes": "Booked a cleaning.", "bangla_notes": "",
+                    "appointment_data": {"patient_name": "John Smith", "phone": "555-1234", "date": "2025-06-02",
+                                         "time": "10:30", "purpose": "Cleaning", "urgency_level": "low",
+                                         "doctor_name": "Dr. Smith"}})
+    reply_chunks = [reply[i:i + chunk_size] for i in range(0, len(reply), chunk_size)]
+    rounds = 200
+    started = time.perf_counter()
+    for _ in range(rounds):
+        stream(reply_chunks)
+    per_reply = (time.perf_counter() - started) / rounds
+    # The old cleanup only works on a complete response, so getting speech out
+    # early with it means rerunning it on everything received so far
+    started = time.perf_counter()
+    for _ in range(rounds):
+        received = ""
+        for chunk in reply_chunks:
+            received += chunk
+            legacy_cleanup(received)
+    legacy_per_reply = (time.perf_counter() - started) / rounds
+
+    return {
+        "chunk_size": chunk_size,
+        "bulk_bytes": len(text.encode()),
+        "bulk_events": events,
+        "bulk_mb_per_s": round(len(text.encode()) / 1e6 / bulk, 2),
+        "reply_bytes": len(reply),
+        "reply_chunks": len(reply_chunks),
+        "reply_streaming_us": round(per_reply * 1e6, 1),
+        "reply_legacy_rescan_us": round(legacy_per_reply * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--size-kb", type=int, default=256, help="Size of the throughput input")
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[8, 64, 512])
+    args = parser.parse_args()
+
+    results = [throughput(args.size_kb, size, args.seed) for size in args.chunk_size]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Memory per added clinic when clinics share one process, against one deployment per clinic.
+
+Creates --clinics clinics with --doctors doctors each in a scratch SQLite
+database, then warms their doctor caches through the tenant registry one by
+one. tracemalloc measures the Python heap after each checkpoint, so the
+slope is what one more warm clinic costs. A second pass runs with the LRU
+capped at --cache-size and shows memory levelling off once cold clinics
+are evicted. It also times a cold load and a warm lookup.
+
+For comparison it starts the app once in a subprocess (stub backends,
+startup warm-ups included) and reports its peak RSS: the floor for every
+extra single-clinic deployment.
+
+Usage: python benchmarks/bench_tenants.py [--clinics 500] [--doctors 6] [--cache-size 100]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix="tenant-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'tenants.db')}"
+
+from app.db import init_db
+from app.utils.tenants import TenantRegistry, save_clinic
+
+SPECIALTIES = ["General Dentistry", "Orthodontics", "Pediatric Dentistry", "Cosmetic Dentistry", "Endodontics",
+               "Periodontics", "Oral Surgery", "Prosthodontics"]
+
+APP_RSS = """
+import resource, sys
+from fastapi.testclient import TestClient
+from app.main import app
+with TestClient(app):
+    pass
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(rss * (1 if sys.platform == "darwin" else 1024))
+"""
+
+
+def create_clinics(count, doctors):
+    for index in range(count):
+        save_clinic(f"clinic-{index}", f"Clinic {index}", f"+1555{index:07d}", doctors=[{
+            "name": f"Dr. Doctor{index}x{number}",
+            "specialty": SPECIALTIES[number % len(SPECIALTIES)],
+            "availability": {day: ["09:00-12:00", "13:00-17:00"] for day in
+                             ("monday", "tuesday", "wednesday", "thursday", "friday")},
+        } for number in range(doctors)])
+
+
+def heap():
+    return tracemalloc.get_traced_memory()[0]
+
+
+def warm(registry, count, checkpoints):
+    """Warm `count` clinics in order; returns [(clinics warmed, heap bytes)] at the checkpoints"""
+    rows = []
+    for index in range(count):
+        registry.snapshot(f"clinic-{index}")
+        if index + 1 in checkpoints:
+            rows.append((index + 1, heap()))
+    return rows
+
+
+def app_rss():
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(WORKDIR, 'app.db')}",
+               TRANSCRIPT_DIR=os.path.join(WORKDIR, "transcripts"), LLM_BACKEND="stub", TTS_BACKEND="stub",
+               ASR_BACKEND="stub")
+    result = subprocess.run([sys.executable, "-c", APP_RSS], cwd=ROOT, env=env, capture_output=True, text=True)
+    try:
+        return int(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        sys.stderr.write(result.stderr[-2000:])
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clinics", type=int, default=500, help="Clinics to create and warm")
+    parser.add_argument("--doctors", type=int, default=6, help="Doctors per clinic")
+    parser.add_argument("--cache-size", type=int, default=100, help="LRU size for the capped pass")
+    parser.add_argument("--skip-app", action="store_true", help="Skip measuring a whole app process")
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    create_clinics(args.clinics, args.doctors)
+    print(json.dumps({"clinics": args.clinics, "doctors_per_clinic": args.doctors,
+                      "create_seconds": round(time.perf_counter() - started, 2)}))
+
+    checkpoints = {1, 10, 50, 100, 200, 500, 1000, args.clinics}
+    tracemalloc.start()
+
+    # Uncapped: every clinic stays warm, so the heap grows by one clinic per step
+    registry = TenantRegistry(max_tenants=args.clinics)
+    registry.snapshot(None)
+    base = heap()
+    uncapped = warm(registry, args.clinics, checkpoints)
+    for clinics, used in uncapped:
+        print(json.dumps({"cache": "uncapped", "warm_clinics": clinics, "heap_bytes": used - base,
+                          "bytes_per_clinic": (used - base) // clinics}))
+    per_clinic = (uncapped[-1][1] - base) // args.clinics
+
+    cold = []
+    for index in range(min(50, args.clinics)):
+        registry.forget(f"clinic-{index}")
+        started = time.perf_counter()
+        registry.snapshot(f"clinic-{index}")
+        cold.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    for _ in range(10000):
+        registry.snapshot("clinic-0")
+    warm_us = (time.perf_counter() - started) / 10000 * 1e6
+    del registry
+
+    # Capped: memory stops growing at --cache-size warm clinics
+    registry = TenantRegistry(max_tenants=args.cache_size)
+    registry.snapshot(None)
+    base = heap()
+    for clinics, used in warm(registry, args.clinics, checkpoints):
+        print(json.dumps({"cache": f"lru_{args.cache_size}", "warm_clinics": min(clinics, args.cache_size),
+                          "clinics_seen": clinics, "heap_bytes": used - base}))
+    tracemalloc.stop()
+
+    cold.sort()
+    summary = {
+        "bytes_per_clinic": per_clinic,
+        "cold_load_p50_ms": round(cold[len(cold) // 2] * 1000, 2),
+        "warm_lookup_us": round(warm_us, 2),
+    }
+    if not args.skip_app:
+        rss = app_rss()
+        summary["app_process_rss_bytes"] = rss
+        if rss:
+            # What the same clinics would take as separate single-clinic deployments
+            summary["separate_deployments_bytes"] = rss * args.clinics
+            summary["shared_process_bytes"] = rss + per_clinic * args.clinics
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Measure transcript store compression ratio and write/read throughput.
+
+Generates a corpus of synthetic receptionist calls shaped like the ones the
+voice paths record, then appends and reads them back through TranscriptStore.
+
+Usage: python benchmarks/bench_transcripts.py [--calls 5000]
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.call_log import format_transcript
+from app.utils.transcript_store import TranscriptStore
+
+
+FIRST = ["John", "Mary", "Ahmed", "Linda", "Carlos", "Priya", "Wei", "Fatima", "Oliver", "Grace"]
+LAST = ["Smith", "Garcia", "Khan", "Brown", "Nguyen", "Lopez", "Rahman", "Miller", "Davis", "Wilson"]
+DOCTORS = ["Dr. Smith", "Dr. Johnson", "Dr. Williams", "Dr. Brown"]
+REASONS = ["a cleaning", "a checkup", "a toothache", "my braces adjusted", "a chipped tooth", "whitening"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+
+def make_call(rng):
+    name = f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+    phone = f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+    day = rng.choice(DAYS)
+    hour = rng.randint(8, 17)
+    turns = [
+        ("model", "Hello! I'm the dental clinic's voice receptionist. How can I help you today?"),
+        ("user", f"Hi, I'd like to book an appointment for {rng.choice(REASONS)}."),
+        ("model", "Great! I'd be happy to help you book an appointment. May I have your name and phone number, please?"),
+        ("user", f"Sure, my name is {name} and my phone number is {phone}."),
+        ("model", f"Thank you, {name.split()[0]}. What date and time would you prefer for your appointment?"),
+        ("user", f"{day} at {hour % 12 or 12} {'AM' if hour < 12 else 'PM'} if possible."),
+        ("model", "Okay. Could you please provide the specific date for the appointment?"),
+        ("user", f"Next {day}, the {rng.randint(1, 28)}th."),
+        ("model", "Got it. Which dentist would you prefer to see?"),
+        ("user", f"{rng.choice(DOCTORS)} please."),
+        ("model", "Great! Your appointment has been confirmed. Is there anything else I can help you with?"),
+    ]
+    for _ in range(rng.randint(0, 4)):
+        turns.insert(-1, ("user", rng.choice(["Do you take insurance?", "How long will it take?", "Is parking available?"])))
+        turns.insert(-1, ("model", rng.choice(["Yes, we accept most major insurance plans.",
+                                               "It usually takes about forty five minutes.",
+                                               "Yes, there is free parking behind the clinic."])))
+    turns.append(("user", "No, that's all. Thank you."))
+    turns.append(("model", "Thank you for calling. Have a great day!"))
+    return format_transcript(turns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    corpus = [make_call(rng) for _ in range(args.calls)]
+    raw_bytes = sum(len(text.encode("utf-8")) for text in corpus)
+
+    store = TranscriptStore(directory=tempfile.mkdtemp(prefix="bench_transcripts_"))
+
+    started = time.perf_counter()
+    refs = [store.append(text) for text in corpus]
+    write_elapsed = time.perf_counter() - started
+
+    stored_bytes = sum(os.path.getsize(os.path.join(store.directory, name)) for name in os.listdir(store.directory))
+    plain_zlib_bytes = sum(len(zlib.compress(text.encode("utf-8"), 6)) for text in corpus)
+
+    started = time.perf_counter()
+    for ref, text in zip(refs, corpus):
+        assert store.read(ref) == text
+    read_elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "calls": args.calls,
+        "raw_mb": round(raw_bytes / 1e6, 2),
+        "stored_mb": round(stored_bytes / 1e6, 2),
+        "compression_ratio": round(raw_bytes / stored_bytes, 2),
+        "compression_ratio_without_dictionary": round(raw_bytes / plain_zlib_bytes, 2),
+        "write_per_second": round(args.calls / write_elapsed, 1),
+        "write_mb_per_second": round(raw_bytes / 1e6 / write_elapsed, 2),
+        "read_per_second": round(args.calls / read_elapsed, 1),
+        "read_mb_per_second": round(raw_bytes / 1e6 / read_elapsed, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Replay recorded conversations through the app offline and compare latency distributions.
+
+Record real traffic by running the app with RECORD_FILE set (see
+app/utils/recorder.py). Every sampled /ws/ai and phone turn is saved with
+the caller's words, the model's output, what was spoken and the stage
+timings.
+
+This script starts the app with LLM_BACKEND=replay. The model's recorded
+replies come back after their recorded latency, times --latency-scale, plus
+--ms-per-token for each prompt token more or fewer than when recorded. TTS
+is the stub, with a per-character latency fitted to the recorded synthesis
+times. Each session is sent again under its recorded id, /ws/ai sessions
+over protocol v2 and phone turns as /api/process_speech webhooks. Session
+start times and the pauses between turns are kept, scaled by --time-scale
+(0 plays every turn back to back).
+
+Everything else runs as it does now: the prompt, history handling, slot
+extraction, booking and the session store. Pass a changed setting with
+--env KEY=VALUE, or run against another checkout. The report puts replayed
+turn latency next to the recorded one, counts replies that came out
+different from the recording, and gives the mean prompt size. Save a run
+with --output and check another against it with --compare, like
+bench_load.py.
+
+Everything is replayed against the default clinic in a scratch database.
+Recorded appointment dates may therefore be in the past, or taken by an
+earlier booking in the same run.
+
+Needs the `websockets` package (installed with uvicorn[standard]) and `httpx`.
+
+Usage: python benchmarks/replay.py recordings.jsonl [--latency-scale 1.0] [--ms-per-token 0]
+           [--time-scale 1.0] [--env KEY=VALUE] [--output run.json] [--compare baseline.json]
+"""
+import os
+import re
+import sys
+import html
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils import recorder
+from bench_load import RECV_TIMEOUT_SECONDS, compare, recv, start_server, summarize, wait_ready
+
+PROCESSING = "I'm processing your request"
+SAY = re.compile(r"<Say[^>]*>(.*?)</Say>", re.S)
+# Longest pause between two turns of a session that is replayed as recorded
+MAX_GAP_SECONDS = 60.0
+
+
+def fit_tts(sessions):
+    """(base ms, ms per character) for the stub TTS, least squares over the recorded sentences"""
+    points = [(chars, ms) for turns in sessions.values() for turn in turns for chars, ms in turn.get("tts", [])]
+    if len(points) < 2:
+        return (points[0][1] if points else 150.0), 0.0
+    mean_chars = statistics.mean(chars for chars, _ in points)
+    mean_ms = statistics.mean(ms for _, ms in points)
+    spread = sum((chars - mean_chars) ** 2 for chars, _ in points)
+    slope = sum((chars - mean_chars) * (ms - mean_ms) for chars, ms in points) / spread if spread else 0.0
+    slope = max(slope, 0.0)
+    return max(mean_ms - slope * mean_chars, 0.0), slope
+
+
+def gaps(turns):
+    """Seconds to wait before each turn: the caller's pause after the previous reply"""
+    waits = [0.0]
+    for previous, turn in zip(turns, turns[1:]):
+        if "ts" not in previous or "ts" not in turn:
+            waits.append(0.0)
+            continue
+        ended = previous["ts"] + previous.get("ms", {}).get("total", 0) / 1000
+        waits.append(min(max(turn["ts"] - ended, 0.0), MAX_GAP_SECONDS))
+    return waits
+
+
+def recorded_results(sessions):
+    """The recorded latencies in the shape of the replay results, for side-by-side reading"""
+    web = [turn for (channel, _), turns in sessions.items() if channel == "web" for turn in turns if "ms" in turn]
+    phone = [turn for (channel, _), turns in sessions.items() if channel == "phone" for turn in turns if "ms" in turn]
+    tokens = {}
+    for channel, turns in (("web", web), ("phone", phone)):
+        counts = [turn["tok"] for turn in turns if turn.get("tok") is not None]
+        if counts:
+            tokens[channel] = round(statistics.mean(counts), 1)
+    return {
+        "websocket": {
+            "turn_latency_ms": summarize([turn["ms"]["total"] / 1000 for turn in web]),
+            "first_audio_ms": summarize([turn["ms"]["first_audio"] / 1000 for turn in web
+                                         if turn["ms"].get("first_audio") is not None]),
+        },
+        "phone": {"webhook_latency_ms": summarize([turn["ms"]["total"] / 1000 for turn in phone])},
+        "prompt_tokens_mean": tokens,
+    }
+
+
+def note_reply(results, turn, said):
+    if said is not None and turn.get("say") is not None and said.strip() != turn["say"].strip():
+        results["changed"] += 1
+        if len(results["changed_examples"]) < 5:
+            results["changed_examples"].append({"sid": turn["sid"], "turn": turn["turn"], "in": turn["in"],
+                                                "recorded": turn["say"], "replayed": said})
+
+
+async def replay_web(ws_url, session_id, turns, args, results):
+    async with websockets.connect(f"{ws_url}?session={session_id}", subprotocols=["receptionist.v2"],
+                                  max_size=None) as ws:
+        # The hello frame, then the greeting as turn 0
+        while True:
+            message = await recv(ws, RECV_TIMEOUT_SECONDS)
+            if isinstance(message, str) and json.loads(message)["type"] == "turn.end":
+                break
+        for turn, wait in zip(turns, gaps(turns)):
+            await asyncio.sleep(wait * args.time_scale)
+            sent = time.perf_counter()
+            await ws.send(json.dumps({"type": "user", "id": str(turn["turn"]), "text": turn["in"]}))
+            first_audio = said = None
+            while True:
+                message = await recv(ws, RECV_TIMEOUT_SECONDS)
+                if isinstance(message, bytes):
+                    first_audio = first_audio or time.perf_counter()
+                    continue
+                frame = json.loads(message)
+                if frame["type"] == "reply":
+                    said = frame["text"]
+                if frame["type"] == "error":
+                    results["errors"] += 1
+                if frame["type"] in ("turn.end", "error"):
+                    break
+            results["web_latency"].append(time.perf_counter() - sent)
+            if first_audio is not None:
+                results["web_first_audio"].append(first_audio - sent)
+            note_reply(results, turn, said)
+
+
+async def replay_call(client, call_sid, turns, args, results):
+    for turn, wait in zip(turns, gaps(turns)):
+        await asyncio.sleep(wait * args.time_scale)
+        sent = time.perf_counter()
+        response = await client.post("/api/process_speech", data={
+            "SpeechResult": turn["in"], "CallSid": call_sid, "From": turn.get("caller", ""),
+            "To": turn.get("dialed", ""),
+        })
+        results["phone_latency"].append(time.perf_counter() - sent)
+        if response.status_code != 200:
+            results["errors"] += 1
+            continue
+        said = next((html.unescape(text) for text in SAY.findall(response.text) if not text.startswith(PROCESSING)),
+                    None)
+        note_reply(results, turn, said)
+
+
+def prompt_token_means(metrics_text):
+    sums = dict(re.findall(r'^\w*prompt_tokens_sum\{channel="(\w+)"\} (\S+)$', metrics_text, re.M))
+    counts = dict(re.findall(r'^\w*prompt_tokens_count\{channel="(\w+)"\} (\S+)$', metrics_text, re.M))
+    return {channel: round(float(sums[channel]) / float(count), 1) for channel, count in counts.items()
+            if float(count) and channel in sums}
+
+
+async def replay(base_url, sessions, args):
+    results = {"web_latency": [], "web_first_audio": [], "phone_latency": [], "errors": 0, "changed": 0,
+               "changed_examples": []}
+    ws_url = base_url.replace("http", "ws", 1) + "/ws/ai"
+    starts = [turns[0]["ts"] for turns in sessions.values() if "ts" in turns[0]]
+    origin = min(starts, default=0.0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await wait_ready(client)
+
+        async def run(key, turns):
+            await asyncio.sleep((turns[0].get("ts", origin) - origin) * args.time_scale)
+            channel, session_id = key
+            if channel == "web":
+                await replay_web(ws_url, session_id, turns, args, results)
+            else:
+                await replay_call(client, session_id, turns, args, results)
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(run(key, turns) for key, turns in sessions.items()), return_exceptions=True)
+        duration = time.perf_counter() - started
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                results["errors"] += 1
+                print(f"Session failed: {outcome!r}", file=sys.stderr)
+        tokens = prompt_token_means((await client.get("/metrics")).text)
+    turns = len(results["web_latency"]) + len(results["phone_latency"])
+    return {
+        "duration_s": round(duration, 2),
+        "turns": turns,
+        "websocket": {"turn_latency_ms": summarize(results["web_latency"]),
+                      "first_audio_ms": summarize(results["web_first_audio"])},
+        "phone": {"webhook_latency_ms": summarize(results["phone_latency"])},
+        "prompt_tokens_mean": tokens,
+        "replies_changed": results["changed"],
+        "replies_changed_examples": results["changed_examples"],
+        "errors": results["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", help="RECORD_FILE written by the app (.jsonl or .jsonl.gz)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply recorded model latencies")
+    parser.add_argument("--ms-per-token", type=float, default=0.0,
+                        help="Model latency added per prompt token above the recorded prompt size")
+    parser.add_argument("--tts-scale", type=float, default=1.0, help="Multiply the fitted TTS latency")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="Multiply session start times and pauses between turns (0: back to back)")
+    parser.add_argument("--limit", type=int, help="Replay only the first N sessions")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the app, e.g. LOCAL_BOOKING=false (repeatable)")
+    parser.add_argument("--label", default="", help="Free-form label stored with the results")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative increase in a compared percentile that counts as a regression")
+    args = parser.parse_args()
+
+    sessions = recorder.load(args.recordings)
+    sessions = {key: turns for key, turns in sessions.items() if turns}
+    if args.limit:
+        sessions = dict(sorted(sessions.items(), key=lambda item: item[1][0].get("ts", 0))[:args.limit])
+    if not sessions:
+        sys.exit(f"No recorded turns in {args.recordings}")
+    tts_base, tts_per_char = fit_tts(sessions)
+    extra_env = {
+        "LLM_BACKEND": "replay",
+        "REPLAY_FILE": os.path.abspath(args.recordings),
+        "REPLAY_LATENCY_SCALE": str(args.latency_scale),
+        "REPLAY_MS_PER_TOKEN": str(args.ms_per_token),
+        "STUB_TTS_LATENCY_MS": str(round(tts_base * args.tts_scale, 2)),
+        "STUB_TTS_MS_PER_CHAR": str(round(tts_per_char * args.tts_scale, 4)),
+        "RECORD_FILE": "",
+    }
+    for setting in args.env:
+        key, _, value = setting.partition("=")
+        extra_env[key] = value
+    # start_server() from bench_load reads these
+    args.workers, args.session_store, args.llm_latency_ms, args.tts_latency_ms = 1, None, 0, tts_base
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process, base_url = start_server(args, workdir, extra_env)
+        try:
+            results = asyncio.run(replay(base_url, sessions, args))
+        finally:
+            process.terminate()
+            process.wait(10)
+
+    report = {
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "recordings": args.recordings, "sessions": len(sessions), "latency_scale": args.latency_scale,
+            "ms_per_token": args.ms_per_token, "time_scale": args.time_scale,
+            "tts_ms": round(tts_base * args.tts_scale, 2), "tts_ms_per_char": round(tts_per_char * args.tts_scale, 4),
+            "env": args.env,
+        },
+        "recorded": recorded_results(sessions),
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline["results"], results, args.tolerance)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,4 +17,4 @@ python -c "from seed_doctors import seed_doctors; seed_doctors()"
 
 # Start the application
 echo "Starting application..."
-uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000}
\ No newline at end of file
+uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000} --ws-max-size ${WS_MAX_MESSAGE_BYTES:-65536}
\ No newline at end of file
@@ -1,112 +1,123 @@
 import json
-from app.models import Doctor
+from datetime import datetime
+from sqlalchemy import delete, insert
+from sqlmodel import select
+from app.models import Doctor, clinic_scope
 from app.db import get_session
+from app.utils.doctor_cache import bump_cache_version, doctor_cache, lock_cache_version
+
+
+DOCTORS_DATA = [
+    {
+        "name": "Dr. Smith",
+        "specialty": "General Dentistry",
+        "availability": json.dumps({
+            "monday": ["09:00-12:00", "14:00-17:00"],
+            "tuesday": ["09:00-12:00", "14:00-17:00"],
+            "wednesday": ["09:00-12:00", "14:00-17:00"],
+            "thursday": ["09:00-12:00", "14:00-17:00"],
+            "friday": ["09:00-12:00", "14:00-17:00"],
+            "saturday": ["09:00-12:00"],
+            "sunday": []
+        })
+    },
+    {
+        "name": "Dr. Johnson",
+        "specialty": "Orthodontics",
+        "availability": json.dumps({
+            "monday": ["10:00-13:00", "15:00-18:00"],
+            "tuesday": ["10:00-13:00", "15:00-18:00"],
+            "wednesday": ["10:00-13:00"],
+            "thursday": ["10:00-13:00", "15:00-18:00"],
+            "friday": ["10:00-13:00", "15:00-18:00"],
+            "saturday": ["10:00-14:00"],
+            "sunday": []
+        })
+    },
+    {
+        "name": "Dr. Williams",
+        "specialty": "Pediatric Dentistry",
+        "availability": json.dumps({
+            "monday": ["08:00-12:00"],
+            "tuesday": ["08:00-12:00", "14:00-17:00"],
+            "wednesday": ["08:00-12:00"],
+            "thursday": ["08:00-12:00", "14:00-17:00"],
+            "friday": ["08:00-12:00"],
+            "saturday": ["08:00-12:00"],
+            "sunday": []
+        })
+    },
+    {
+        "name": "Dr. Brown",
+        "specialty": "Cosmetic Dentistry",
+        "availability": json.dumps({
+            "monday": ["11:00-15:00", "16:00-19:00"],
+            "tuesday": ["11:00-15:00"],
+            "wednesday": ["11:00-15:00", "16:00-19:00"],
+            "thursday": ["11:00-15:00"],
+            "friday": ["11:00-15:00", "16:00-19:00"],
+            "saturday": ["11:00-16:00"],
+            "sunday": []
+        })
+    }
+]
+
+
+# Doctors from an earlier deployment that are replaced by the current list
+OLD_DOCTOR_NAMES = ["Dr. Firoz", "Dr. Rahman", "Dr. Akter", "Dr. Begum"]
+
 
 def seed_doctors(force_replace=False):
-    """Seed the database with American doctors"""
-    doctors_data = [
-        {
-            "name": "Dr. Smith",
-            "specialty": "General Dentistry",
-            "availability": json.dumps({
-                "monday": ["09:00-12:00", "14:00-17:00"],
-                "tuesday": ["09:00-12:00", "14:00-17:00"],
-                "wednesday": ["09:00-12:00", "14:00-17:00"],
-                "thursday": ["09:00-12:00", "14:00-17:00"],
-                "friday": ["09:00-12:00", "14:00-17:00"],
-                "saturday": ["09:00-12:00"],
-                "sunday": []
-            })
-        },
-        {
-            "name": "Dr. Johnson",
-            "specialty": "Orthodontics",
-            "availability": json.dumps({
-                "monday": ["10:00-13:00", "15:00-18:00"],
-                "tuesday": ["10:00-13:00", "15:00-18:00"],
-                "wednesday": ["10:00-13:00"],
-                "thursday": ["10:00-13:00", "15:00-18:00"],
-                "friday": ["10:00-13:00", "15:00-18:00"],
-                "saturday": ["10:00-14:00"],
-                "sunday": []
-            })
-        },
-        {
-            "name": "Dr. Williams",
-            "specialty": "Pediatric Dentistry",
-            "availability": json.dumps({
-                "monday": ["08:00-12:00"],
-                "tuesday": ["08:00-12:00", "14:00-17:00"],
-                "wednesday": ["08:00-12:00"],
-                "thursday": ["08:00-12:00", "14:00-17:00"],
-                "friday": ["08:00-12:00"],
-                "saturday": ["08:00-12:00"],
-                "sunday": []
-            })
-        },
-        {
-            "name": "Dr. Brown",
-            "specialty": "Cosmetic Dentistry",
-            "availability": json.dumps({
-                "monday": ["11:00-15:00", "16:00-19:00"],
-                "tuesday": ["11:00-15:00"],
-                "wednesday": ["11:00-15:00", "16:00-19:00"],
-                "thursday": ["11:00-15:00"],
-                "friday": ["11:00-15:00", "16:00-19:00"],
-                "saturday": ["11:00-16:00"],
-                "sunday": []
-            })
-        }
-    ]
-    
+    """Seed the database with American doctors.
+
+    Idempotent bulk upsert keyed by doctor name: missing doctors are inserted in
+    one executemany, changed ones are updated, the old Bangladeshi doctors are
+    removed, and the cache version is only bumped when something changed.
+    With force_replace every existing doctor is deleted first. Only the
+    default clinic's doctors are touched; other clinics manage their own.
+    Workers starting together seed one after another, and the later ones
+    find nothing to do.
+    """
+    default_clinic = clinic_scope(Doctor.clinic_id, None)
     with get_session() as session:
-        # Check if doctors already exist
-        existing_doctors = session.query(Doctor).all()
-        if existing_doctors and not force_replace:
-            # Check if the existing doctors are the old Bangladeshi ones
-            old_doctor_names = ["Dr. Firoz", "Dr. Rahman", "Dr. Akter", "Dr. Begum"]
-            existing_names = [doctor.name for doctor in existing_doctors]
-            
-            # If we have the old doctors, replace them with the new American ones
-            if any(name in existing_names for name in old_doctor_names):
-                print("Replacing old Bangladeshi doctors with new American doctors...")
-                # Delete all existing doctors
-                for doctor in existing_doctors:
-                    session.delete(doctor)
-                session.commit()
-                
-                # Add new American doctors
-                for doctor_data in doctors_data:
-                    doctor = Doctor(**doctor_data)
-                    session.add(doctor)
-                
-                session.commit()
-                print("Successfully replaced doctors in the database.")
-            else:
-                print("Doctors already exist in the database. Skipping seed.")
-                return
-        elif existing_doctors and force_replace:
-            print("Force replacing doctors with new American doctors...")
-            # Delete all existing doctors
-            for doctor in existing_doctors:
-                session.delete(doctor)
-            session.commit()
-            
-            # Add new American doctors
-            for doctor_data in doctors_data:
-                doctor = Doctor(**doctor_data)
-                session.add(doctor)
-            
-            session.commit()
-            print("Successfully replaced doctors in the database.")
-        else:
-            # No doctors exist, add the new American ones
-            for doctor_data in doctors_data:
-                doctor = Doctor(**doctor_data)
+        lock_cache_version(session)
+        existing = {doctor.name: doctor for doctor in session.exec(select(Doctor).where(default_clinic)).all()}
+        changed = 0
+
+        stale = list(existing) if force_replace else [name for name in existing if name in OLD_DOCTOR_NAMES]
+        if stale:
+            session.execute(delete(Doctor).where(default_clinic, Doctor.name.in_(stale)))
+            changed += len(stale)
+            for name in stale:
+                existing.pop(name)
+
+        new_rows = []
+        for doctor_data in DOCTORS_DATA:
+            doctor = existing.get(doctor_data["name"])
+            if doctor is None:
+                new_rows.append({**doctor_data, "created_at": datetime.utcnow()})
+            elif (doctor.specialty, doctor.availability) != (doctor_data["specialty"], doctor_data["availability"]):
+                doctor.specialty = doctor_data["specialty"]
+                doctor.availability = doctor_data["availability"]
                 session.add(doctor)
-            
-            session.commit()
-            print("Successfully seeded doctors database.")
+                changed += 1
+
+        if new_rows:
+            session.execute(insert(Doctor), new_rows)
+            changed += len(new_rows)
+
+        if not changed:
+            print("Doctors already up to date. Skipping seed.")
+            return 0
+
+        bump_cache_version(session)
+        session.commit()
+        print(f"Seeded doctors database ({changed} changes).")
+    
+    # Drop this process's snapshot too; other workers see the version bump
+    doctor_cache.invalidate()
+    return changed
+
 
 if __name__ == "__main__":
     seed_doctors(force_replace=True)
\ No newline at end of file
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+# Point the app at a throwaway database and transcript store before anything imports it
+_scratch = tempfile.mkdtemp(prefix="receptionist-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'appointments.db')}")
+os.environ.setdefault("TRANSCRIPT_DIR", os.path.join(_scratch, "transcripts"))
+for backend in ("LLM_BACKEND", "TTS_BACKEND", "ASR_BACKEND"):
+    os.environ.setdefault(backend, "stub")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A fresh schema for each test"""
+    from sqlmodel import SQLModel
+    from app.db import engine, init_db
+    init_db()
+    yield engine
+    SQLModel.metadata.drop_all(engine)
@@ -0,0 +1,26 @@
+import threading
+from app.models import Clinic
+from app.db import get_session
+from app.utils.appointment_stats import get_summary
+
+
+def test_clinics_building_summaries_at_once_all_get_one(db):
+    with get_session() as session:
+        for i in range(8):
+            session.add(Clinic(id=f"clinic-{i}", name=f"Clinic {i}"))
+        session.commit()
+
+    results, start = {}, threading.Barrier(8)
+
+    def build(clinic_id):
+        with db.connect() as conn:
+            start.wait()
+            results[clinic_id] = get_summary(conn, clinic_id)
+
+    threads = [threading.Thread(target=build, args=(f"clinic-{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {f"clinic-{i}": (0, 0, 1) for i in range(8)}
@@ -0,0 +1,41 @@
+from sqlalchemy import func, select
+from app.models import CallNote, CallRollup
+from app.utils.call_log import record_call, record_turn_event
+from app.utils.transcript_store import load_transcript
+from app.db import get_session
+
+
+def call_totals(engine):
+    rollup = CallRollup.__table__
+    with engine.connect() as conn:
+        return tuple(conn.execute(select(func.sum(rollup.c.calls), func.sum(rollup.c.booked_calls))).one())
+
+
+def notes():
+    with get_session() as session:
+        return session.exec(select(CallNote)).scalars().all()
+
+
+def test_call_without_booking_is_logged_and_counted(db):
+    record_turn_event("CA1", "phone", 1, "user", "How much is a cleaning?")
+    record_turn_event("CA1", "phone", 1, "model", "About eighty dollars.")
+    record_call("CA1", "phone", slots={})
+
+    [note] = notes()
+    assert note.appointment_id is None
+    assert load_transcript(note) == "Caller: How much is a cleaning?\nAI: About eighty dollars."
+    assert call_totals(db) == (1, 0)
+
+
+def test_logging_a_call_again_updates_its_one_note(db):
+    record_turn_event("web-1", "web", 1, "user", "hi")
+    record_call("web-1", "web", slots={})
+    # Resumed later, and booked this time
+    record_turn_event("web-1", "web", 2, "user", "book me in")
+    record_call("web-1", "web", slots={"appointment_id": 7, "english_notes": "Booked a cleaning."})
+    record_call("web-1", "web", slots={})
+
+    [note] = notes()
+    assert (note.appointment_id, note.english_text) == (7, "Booked a cleaning.")
+    assert load_transcript(note) == "Caller: hi\nCaller: book me in"
+    assert call_totals(db) == (1, 1)
@@ -0,0 +1,120 @@
+import json
+import random
+import pytest
+from app.utils.speech_stream import SentenceSplitter, SpeechStreamParser, clean_speech, split_reply
+
+WORDS = ["Sure", "your", "appointment", "with", "Dr.", "Smith", "is", "confirmed", "for", "Monday", "at",
+         "10:30", "thanks!", "Anything", "else?", "okay.", "(see", "below)", "100%", "it's", "\"quoted\""]
+TRICKY = ['{', '}', '"', '\\', '`', '```', '\\"', '\n', 'é', '{"a": 1}', '\\\\', ' ']
+
+
+def random_string(rng):
+    return "".join(rng.choice(TRICKY + ["x", "y", "Dr. Smith", "10:00"]) for _ in range(rng.randint(0, 8)))
+
+
+def random_value(rng, depth=0):
+    kind = rng.randint(0, 5 if depth < 3 else 2)
+    if kind in (0, 2):
+        return random_string(rng)
+    if kind == 1:
+        return rng.choice([rng.randint(-5, 10_000), 3.5, True, False, None])
+    if kind == 3:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return random_object(rng, depth + 1)
+
+
+def random_object(rng, depth=0):
+    return {random_string(rng) or "k": random_value(rng, depth) for _ in range(rng.randint(0, 4))}
+
+
+def random_speech(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(1, 12))]
+    if rng.random() < 0.2:
+        # Inline code marks are dropped but the words between them are spoken
+        i = rng.randrange(len(words))
+        words[i] = f"`{words[i]}`"
+    return " ".join(words)
+
+
+def random_reply(rng):
+    """Speech mixed with JSON objects (strings full of braces, quotes, escapes and backticks), fenced JSON,
+    fenced code and inline code marks. Returns (reply text, expected speech, expected JSON payloads)"""
+    pieces, speech, payloads = [], [], []
+    for _ in range(rng.randint(1, 6)):
+        roll = rng.random()
+        if roll < 0.5:
+            text = random_speech(rng)
+            pieces.append(text)
+            speech.append(text.replace("`", ""))
+        elif roll < 0.75:
+            obj = random_object(rng)
+            payloads.append(obj)
+            pieces.append(json.dumps(obj, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2])))
+        elif roll < 0.9:
+            obj = random_object(rng)
+            payloads.append(obj)
+            info = rng.choice(["json", "JSON", ""])
+            # A JSON string may contain ``` only when escaped; real fences can't nest them
+            body = json.dumps(obj).replace("`", "\\u0060")
+            pieces.append(f"```{info}\n{body}\n```")
+        else:
+            pieces.append("```python\nprint({'x': 1})\n```")
+        pieces.append(rng.choice([" ", "\n", "  "]))
+    return "".join(pieces), clean_speech(" ".join(speech)), payloads
+
+
+def parse_chunks(chunks):
+    """Returns (speech, JSON payloads, speech as the sentence splitter grouped it)"""
+    parser = SpeechStreamParser()
+    splitter = SentenceSplitter()
+    events, sentences = [], []
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            events.append(event)
+            if event[0] == "speech":
+                sentences.extend(splitter.feed(event[1]))
+    events.extend(parser.finish())
+    sentences.extend(splitter.finish())
+    speech = clean_speech("".join(value for kind, value in events if kind == "speech"))
+    payloads = [value for kind, value in events if kind == "json"]
+    return speech, payloads, clean_speech(" ".join(sentences))
+
+
+def random_chunks(text, rng):
+    chunks, pos = [], 0
+    while pos < len(text):
+        size = rng.choice([1, 1, 2, 3, 7, 16, 64, 512])
+        chunks.append(text[pos:pos + size])
+        pos += size
+    return chunks
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chunking_recovers_speech_and_json(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        text, expected_speech, expected_payloads = random_reply(rng)
+        speech, payloads, sentences = parse_chunks(random_chunks(text, rng))
+        assert (speech, payloads, sentences) == (expected_speech, expected_payloads, expected_speech), repr(text)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_every_split_point_matches_the_whole_reply(seed):
+    rng = random.Random(seed)
+    for _ in range(20):
+        text, _, _ = random_reply(rng)
+        expected = split_reply(text)
+        for i in range(len(text) + 1):
+            speech, payloads, sentences = parse_chunks([text[:i], text[i:]])
+            assert (speech, payloads) == expected, f"split at {i}: {text!r}"
+            assert sentences == expected[0], f"split at {i}: {text!r}"
+
+
+def test_chunk_by_chunk_matches_the_whole_reply():
+    reply = ("Your cleaning with Dr. Smith is booked for Monday at 10:30. Anything else? " +
+             json.dumps({"appointment_data": {"patient_name": "John {Smith}", "notes": "a \"quoted\" ``` }"}}) +
+             "\n```python\nprint({'x': 1})\n```\nBye `now`.")
+    speech, payloads, sentences = parse_chunks(list(reply))
+    assert (speech, payloads) == split_reply(reply)
+    assert speech == sentences == "Your cleaning with Dr. Smith is booked for Monday at 10:30. Anything else? Bye now."
+    assert payloads[0]["appointment_data"]["patient_name"] == "John {Smith}"
@@ -0,0 +1,53 @@
+from sqlmodel import select
+from app.db import get_session
+from app.models import Appointment, Clinic
+from app.utils.tools import run_tool_calls
+
+
+BOOKING = {"patient_name": "Maria Lopez", "phone": "555-123-4567", "date": "2030-01-07", "time": "16:00",
+           "purpose": "cleaning", "doctor_name": "Dr. Smith"}
+
+
+def appointments():
+    with get_session() as session:
+        return session.exec(select(Appointment)).all()
+
+
+def test_book_appointment_is_saved(db):
+    [(name, result)] = run_tool_calls([("book_appointment", BOOKING)])
+
+    assert name == "book_appointment"
+    assert result["ok"], result
+    [saved] = appointments()
+    assert saved.id == result["appointment_id"]
+    assert (saved.patient_name, saved.date, saved.time, saved.status) == ("Maria Lopez", "2030-01-07", "16:00", "booked")
+    assert saved.clinic_id is None
+
+
+def test_booking_goes_to_the_calls_clinic(db):
+    with get_session() as session:
+        session.add(Clinic(id="north", name="North"))
+        session.commit()
+
+    # The model can't move a booking to another clinic
+    [(_, result)] = run_tool_calls([("book_appointment", {**BOOKING, "clinic_id": "default"})], clinic_id="north")
+
+    assert result["ok"], result
+    [saved] = appointments()
+    assert saved.clinic_id == "north"
+
+
+def test_invalid_booking_is_rejected(db):
+    [(_, result)] = run_tool_calls([("book_appointment", {**BOOKING, "time": "4pm"})])
+
+    assert not result["ok"]
+    assert "time" in result["error"]
+    assert appointments() == []
+
+
+def test_caller_phone_fills_in_a_missing_number(db):
+    booking = {key: value for key, value in BOOKING.items() if key != "phone"}
+    [(_, result)] = run_tool_calls([("book_appointment", booking)], defaults={"phone": "555-222-4444"})
+
+    assert result["ok"], result
+    assert appointments()[0].phone == "555-222-4444"